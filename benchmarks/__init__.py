@@ -0,0 +1,6 @@
+# Módulo benchmarks
+# Este módulo contiene el generador de corpus sintéticos y la suite de mediciones
+
+from .synthetic_corpus import generar_corpus, generar_cfdi_xml, generar_pdf_paginas
+
+__all__ = ['generar_corpus', 'generar_cfdi_xml', 'generar_pdf_paginas']
@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+"""
+Suite de mediciones de rendimiento de extremo a extremo.
+
+Genera corpus sintéticos de 10, 100 y 1,000 facturas y mide cada etapa del
+proceso (lectura de XML, llenado de plantillas por factura, formato por
+estilos contra formato por runs, plantillas de partida, combinación de PDFs
+y el flujo completo de controladores).
+Los resultados se guardan en un JSON que puede compararse entre versiones.
+
+Uso:
+    python -m benchmarks.benchmark_suite --escalas 10 100 --salida resultados.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import logging
+import argparse
+import platform
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_corpus import generar_corpus, generar_pdf_paginas
+
+logger = logging.getLogger("benchmarks")
+
+ESCALAS_PREDETERMINADAS = [10, 100, 1000]
+
+# Páginas del original grande con que se mide la memoria del armado del expediente
+PAGINAS_ORIGINAL_GRANDE = 300
+
+ETAPAS = [
+    'xml_processor',
+    'creacion_documentos',
+    'formato_documentos',
+    'plantillas_partidas',
+    'pdf_merge',
+    'pipeline',
+]
+
+
+class UISimulada:
+    """Interfaz mínima que cumple el contrato de la UI usado por los controladores"""
+
+    def __init__(self):
+        self.root = None
+        self.mensajes = {'info': 0, 'warning': 0, 'error': 0, 'success': 0, 'time': 0}
+        self.ultimos_errores = []
+
+    def update_status(self, message, level="info"):
+        """Cuenta los mensajes por nivel y conserva los últimos errores"""
+        self.mensajes[level] = self.mensajes.get(level, 0) + 1
+        if level == "error":
+            self.ultimos_errores = (self.ultimos_errores + [message])[-10:]
+
+    def set_processing_state(self, is_processing, message="Procesando..."):
+        """No hay interfaz que actualizar"""
+        pass
+
+
+def _convertir_docx_simulado(docx_path, pdf_path):
+    """
+    Sustituto de docx2pdf que escribe un PDF de una página.
+
+    Permite medir el resto del flujo en equipos sin Microsoft Word.
+    """
+    generar_pdf_paginas(pdf_path, 1, titulo=os.path.basename(docx_path))
+
+
+def _descargar_verificacion_simulada(data, carpeta):
+    """Sustituto de la descarga de la verificación del SAT (no hay navegador en la medición)"""
+    return None
+
+
+@contextmanager
+def _pico_rss(intervalo=0.005):
+    """
+    Mide el incremento máximo de la memoria residente mientras se ejecuta el bloque.
+
+    Un hilo muestrea el RSS del proceso; el resultado se deja en el dict
+    entregado ('incremento_mb', None si no se puede medir el RSS).
+    """
+    from utils.memory_profiler import obtener_rss_mb
+
+    resultado = {}
+    base = obtener_rss_mb()
+    maximo = [base]
+    detener = threading.Event()
+
+    def muestrear():
+        while not detener.wait(intervalo):
+            maximo[0] = max(maximo[0], obtener_rss_mb())
+
+    hilo = None
+    if base is not None:
+        hilo = threading.Thread(target=muestrear, daemon=True)
+        hilo.start()
+    try:
+        yield resultado
+    finally:
+        if hilo is not None:
+            detener.set()
+            hilo.join()
+            resultado['incremento_mb'] = max(maximo[0], obtener_rss_mb()) - base
+
+
+@contextmanager
+def _entorno_medicion(simular_conversion=True):
+    """
+    Prepara el entorno para ejecutar el flujo sin intervención del usuario.
+
+    Desactiva el editor de conceptos, la descarga de la verificación del SAT
+    y los cuadros de diálogo; opcionalmente sustituye la conversión a PDF.
+    El índice de UUID se mantiene solo en memoria y las cachés de imágenes de
+    los PDF y de conversiones se crean en un directorio temporal.
+    """
+    from config import APP_CONFIG, UUID_CONFIG, CONVERSION_CACHE_CONFIG
+    from utils.pdf_image_optimizer import pdf_image_optimizer
+
+    cache_imagenes = tempfile.TemporaryDirectory()
+    parches = [
+        mock.patch.dict(APP_CONFIG, {'usar_editor_conceptos': False}),
+        mock.patch.dict(UUID_CONFIG, {'archivo_indice': None}),
+        mock.patch('core.document_generator.descargar_verificacion', _descargar_verificacion_simulada),
+        mock.patch('controllers.process_controller.messagebox'),
+        mock.patch.object(pdf_image_optimizer, 'directorio_cache', cache_imagenes.name),
+        mock.patch.dict(CONVERSION_CACHE_CONFIG, {'directorio': os.path.join(cache_imagenes.name, "conversion")}),
+    ]
+    if simular_conversion:
+        parches.append(mock.patch('utils.pdf_manager.docx2pdf_convert', _convertir_docx_simulado))
+
+    for parche in parches:
+        parche.start()
+    try:
+        yield
+    finally:
+        for parche in reversed(parches):
+            parche.stop()
+        cache_imagenes.cleanup()
+
+
+def _datos_comunes(corpus):
+    """Construye los datos comunes tal como los entrega la interfaz"""
+    from config import PERSONAL_RECIBE, PERSONAL_VISTO_BUENO
+    from utils.formatters import convert_fecha_to_texto
+
+    return {
+        'excel_path': corpus['excel_path'],
+        'fecha_documento': "2025-03-31",
+        'fecha_documento_texto': convert_fecha_to_texto("2025-03-31"),
+        'mes_asignado': "marzo",
+        'personal_recibio': PERSONAL_RECIBE[0],
+        'personal_vobo': PERSONAL_VISTO_BUENO[0],
+        'base_dir': corpus['base_dir'],
+    }
+
+
+def _partida_de(corpus, numero):
+    """Obtiene la partida del corpus con el formato que produce ExcelReader"""
+    for partida in corpus['partidas']:
+        if partida['numero'] == numero:
+            return {**partida, 'monto': float(partida['monto'])}
+    return None
+
+
+def medir_xml_processor(corpus, salida_dir):
+    """Mide la lectura de todos los XML del corpus"""
+    from core.xml_processor import XMLProcessor
+
+    procesador = XMLProcessor()
+    inicio = time.perf_counter()
+    for factura in corpus['facturas']:
+        procesador.read_xml(factura['xml_path'])
+    return {'segundos': time.perf_counter() - inicio, 'conceptos': corpus['total_conceptos']}
+
+
+def _preparar_datos_plantillas(corpus):
+    """Lee los XML y arma los datos de plantilla de cada factura (fuera de la medición)"""
+    from controllers.factura_controller import FacturaController
+    from core.xml_processor import XMLProcessor
+
+    controlador = FacturaController(UISimulada())
+    procesador = XMLProcessor()
+    datos_comunes = _datos_comunes(corpus)
+
+    preparados = []
+    for factura in corpus['facturas']:
+        xml_data = procesador.read_xml(factura['xml_path'])
+        partida = _partida_de(corpus, factura['partida'])
+        data = controlador._crear_diccionario_datos_completo(
+            xml_data, partida, "$ {:,.2f}".format(factura['total']), datos_comunes)
+        data['Empleo_recurso'] = controlador._formatear_conceptos_automatico(data['Conceptos'])
+        preparados.append(data)
+    return preparados
+
+
+def _llenar_plantillas_factura(preparados, salida_dir):
+    """Llena las cuatro plantillas por factura y devuelve las rutas generadas"""
+    from generators.creacionDocumentos import creacionDocumentos
+
+    templates_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plantillas")
+    plantillas = ['legalizacion_factura.docx', 'legalizacion_verificacion.docx',
+                  'legalizacion_xmls.docx', 'xml.docx']
+
+    generados = []
+    for i, data in enumerate(preparados):
+        destino = os.path.join(salida_dir, f"factura_{i:05d}")
+        os.makedirs(destino, exist_ok=True)
+        for plantilla in plantillas:
+            generados.append(creacionDocumentos(os.path.join(templates_dir, plantilla), destino, data,
+                                                plantilla.replace('.docx', '').replace('_', ' ')))
+    return generados
+
+
+def medir_creacion_documentos(corpus, salida_dir):
+    """Mide el llenado de las cuatro plantillas por factura"""
+    preparados = _preparar_datos_plantillas(corpus)
+
+    inicio = time.perf_counter()
+    documentos = len(_llenar_plantillas_factura(preparados, salida_dir))
+    return {'segundos': time.perf_counter() - inicio, 'documentos': documentos}
+
+
+def medir_formato_documentos(corpus, salida_dir):
+    """Compara el formato por estilos (con caché de plantillas) contra el recorrido run por run"""
+    import zipfile
+    from config import FORMATO_CONFIG
+    from utils.template_cache import template_cache
+
+    preparados = _preparar_datos_plantillas(corpus)
+
+    modos = {}
+    for modo in ('runs', 'estilos'):
+        template_cache.limpiar()
+        with mock.patch.dict(FORMATO_CONFIG, {'modo': modo}):
+            inicio = time.perf_counter()
+            generados = _llenar_plantillas_factura(preparados, os.path.join(salida_dir, modo))
+            segundos = time.perf_counter() - inicio
+
+        # Tamaño del XML principal: los runs con w:rPr propio lo inflan
+        bytes_xml = 0
+        for ruta in generados:
+            with zipfile.ZipFile(ruta) as docx_zip:
+                bytes_xml += docx_zip.getinfo('word/document.xml').file_size
+        modos[modo] = {
+            'segundos': segundos,
+            'documentos': len(generados),
+            'bytes_document_xml': bytes_xml,
+            'cache_plantillas': template_cache.get_stats(),
+        }
+
+    return {
+        'segundos': modos['estilos']['segundos'],
+        'modos': modos,
+        'aceleracion': modos['runs']['segundos'] / modos['estilos']['segundos'] if modos['estilos']['segundos'] else None,
+    }
+
+
+def medir_plantillas_partidas(corpus, salida_dir):
+    """Mide la generación de los documentos de cada partida"""
+    from generators.plantillas_partidas import procesar_plantillas_partida
+
+    datos_comunes = _datos_comunes(corpus)
+    facturas_por_partida = {}
+    for factura in corpus['facturas']:
+        facturas_por_partida.setdefault(factura['partida'], []).append({
+            'serie_numero': f"{factura['serie']}{factura['folio']}",
+            'fecha': "1 de marzo del 2025",
+            'fecha_factura': "01/03/2025",
+            'emisor': "Proveedor simulado, S.A. de C.V.",
+            'rfc_emisor': "PSI010101AAA",
+            'monto': "$ {:,.2f}".format(factura['total']),
+            'monto_decimal': factura['total'],
+            'conceptos': "Conceptos simulados",
+        })
+
+    inicio = time.perf_counter()
+    for numero, facturas_info in facturas_por_partida.items():
+        destino = os.path.join(salida_dir, numero)
+        os.makedirs(destino, exist_ok=True)
+        procesar_plantillas_partida(_partida_de(corpus, numero), facturas_info, destino, dict(datos_comunes))
+    return {'segundos': time.perf_counter() - inicio, 'partidas': len(facturas_por_partida)}
+
+
+def medir_pdf_merge(corpus, salida_dir):
+    """Mide el armado del expediente PDF de cada factura"""
+    from utils.pdf_manager import PDFManager
+
+    # Documentos de legalización y XML compartidos por todas las facturas
+    legal_factura = generar_pdf_paginas(os.path.join(salida_dir, "legal_factura.pdf"), 1, "Legalización")
+    verificacion = generar_pdf_paginas(os.path.join(salida_dir, "verificacion.pdf"), 1, "Verificación SAT")
+    legal_verificacion = generar_pdf_paginas(os.path.join(salida_dir, "legal_verif.pdf"), 1, "Legalización")
+    xml_pdf = generar_pdf_paginas(os.path.join(salida_dir, "xml.pdf"), 2, "XML")
+    legal_xml = generar_pdf_paginas(os.path.join(salida_dir, "legal_xml.pdf"), 1, "Legalización")
+
+    manager = PDFManager()
+    inicio = time.perf_counter()
+    for i, factura in enumerate(corpus['facturas']):
+        original = os.path.join(os.path.dirname(factura['xml_path']), "factura.pdf")
+        manager.create_factura_legal_document(
+            os.path.join(salida_dir, f"documento_completo_{i:05d}.pdf"),
+            original, legal_factura, verificacion, legal_verificacion, xml_pdf, legal_xml
+        )
+    segundos = time.perf_counter() - inicio
+    paginas = manager.paginas_escritas
+
+    # Expediente con un original grande: mide el pico de memoria frente al tamaño del archivo
+    original_grande = generar_pdf_paginas(
+        os.path.join(salida_dir, "original_grande.pdf"), PAGINAS_ORIGINAL_GRANDE, "Original")
+    paginas_antes = manager.paginas_escritas
+    with _pico_rss() as pico:
+        inicio_grande = time.perf_counter()
+        manager.create_factura_legal_document(
+            os.path.join(salida_dir, "documento_completo_grande.pdf"),
+            original_grande, legal_factura, verificacion, legal_verificacion, xml_pdf, legal_xml
+        )
+        segundos_grande = time.perf_counter() - inicio_grande
+    paginas_grande = manager.paginas_escritas - paginas_antes
+
+    return {
+        'segundos': segundos,
+        'paginas_escritas': paginas,
+        'paginas_por_segundo': paginas / segundos if segundos > 0 else None,
+        'original_grande': {
+            'paginas_original': PAGINAS_ORIGINAL_GRANDE,
+            'tamano_original_mb': os.path.getsize(original_grande) / (1024 * 1024),
+            'segundos': segundos_grande,
+            'paginas_por_segundo': paginas_grande / segundos_grande if segundos_grande > 0 else None,
+            'incremento_rss_mb': pico.get('incremento_mb'),
+        },
+    }
+
+
+def medir_pipeline(corpus, salida_dir):
+    """Mide el flujo completo de ProcessController sobre una copia del corpus"""
+    from controllers.process_controller import ProcessController
+    from utils.conversion_cache import conversion_cache
+    from utils.scratch_space import scratch_space
+    from utils.staging import staging
+    from utils.watchdog import watchdog
+
+    # Trabajar sobre una copia para no contaminar el corpus con los documentos generados
+    copia = os.path.join(salida_dir, "corpus")
+    shutil.copytree(corpus['base_dir'], copia)
+    corpus_copia = {**corpus, 'base_dir': copia,
+                    'excel_path': os.path.join(copia, os.path.basename(corpus['excel_path']))}
+
+    ui_simulada = UISimulada()
+    controlador = ProcessController(ui_simulada)
+    datos_interfaz = _datos_comunes(corpus_copia)
+    del datos_interfaz['fecha_documento_texto']
+
+    inicio = time.perf_counter()
+    controlador.iniciar_procesamiento(datos_interfaz)
+    segundos = time.perf_counter() - inicio
+
+    return {
+        'segundos': segundos,
+        'partidas_procesadas': controlador.partidas_procesadas,
+        'facturas_procesadas': controlador.facturas_procesadas,
+        'facturas_con_error': controlador.facturas_con_error,
+        'errores': ui_simulada.ultimos_errores,
+        'tiempos_operaciones': controlador.tiempos_operaciones,
+        'supervision': watchdog.resumen(),
+        'espacio_temporal': scratch_space.resumen(),
+        'red': staging.resumen(),
+        'cache_conversion': conversion_cache.resumen(),
+    }
+
+
+MEDICIONES = {
+    'xml_processor': medir_xml_processor,
+    'creacion_documentos': medir_creacion_documentos,
+    'formato_documentos': medir_formato_documentos,
+    'plantillas_partidas': medir_plantillas_partidas,
+    'pdf_merge': medir_pdf_merge,
+    'pipeline': medir_pipeline,
+}
+
+
+def _revision_codigo():
+    """Obtiene el commit actual del repositorio, si existe"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def ejecutar_benchmarks(escalas=None, etapas=None, salida="resultados_benchmark.json",
+                        directorio=None, simular_conversion=True, semilla=2025, etiqueta=None):
+    """
+    Ejecuta la suite completa y guarda los resultados en JSON.
+
+    Args:
+        escalas (list): Números de facturas a medir
+        etapas (list): Etapas a medir (por defecto todas)
+        salida (str): Ruta del archivo JSON de resultados
+        directorio (str, optional): Directorio de trabajo; si es None se usa uno temporal
+        simular_conversion (bool): Sustituir docx2pdf por un conversor simulado
+        semilla (int): Semilla del corpus sintético
+        etiqueta (str, optional): Nombre de la versión medida
+
+    Returns:
+        dict: Resultados de la medición
+    """
+    escalas = escalas or ESCALAS_PREDETERMINADAS
+    etapas = etapas or ETAPAS
+    directorio_temporal = directorio is None
+    directorio = directorio or tempfile.mkdtemp(prefix="benchmark_partidas_")
+
+    resultados = {
+        'etiqueta': etiqueta,
+        'revision': _revision_codigo(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'conversion_simulada': simular_conversion,
+        'semilla': semilla,
+        'escalas': {},
+    }
+
+    try:
+        with _entorno_medicion(simular_conversion):
+            for escala in escalas:
+                logger.info(f"=== Escala: {escala} facturas ===")
+                escala_dir = os.path.join(directorio, f"escala_{escala}")
+                inicio = time.perf_counter()
+                corpus = generar_corpus(os.path.join(escala_dir, "corpus"), escala, semilla=semilla)
+                resultado_escala = {
+                    'facturas': len(corpus['facturas']),
+                    'partidas': len(corpus['partidas']),
+                    'conceptos': corpus['total_conceptos'],
+                    'paginas_originales': corpus['total_paginas'],
+                    'generacion_corpus_segundos': time.perf_counter() - inicio,
+                    'etapas': {},
+                }
+
+                for etapa in etapas:
+                    salida_dir = os.path.join(escala_dir, etapa)
+                    os.makedirs(salida_dir, exist_ok=True)
+                    try:
+                        medicion = MEDICIONES[etapa](corpus, salida_dir)
+                        if medicion.get('segundos'):
+                            medicion['facturas_por_segundo'] = len(corpus['facturas']) / medicion['segundos']
+                        logger.info(f"  - {etapa}: {medicion['segundos']:.2f} segundos")
+                    except Exception as e:
+                        logger.exception(f"Error al medir la etapa {etapa}")
+                        medicion = {'error': str(e)}
+                    resultado_escala['etapas'][etapa] = medicion
+
+                resultados['escalas'][str(escala)] = resultado_escala
+    finally:
+        if directorio_temporal:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultados, archivo, indent=2, ensure_ascii=False, default=str)
+
+    logger.info(f"Resultados guardados en: {salida}")
+    return resultados
+
+
+def main():
+    """Punto de entrada de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Suite de mediciones de rendimiento")
+    parser.add_argument('--escalas', type=int, nargs='+', default=ESCALAS_PREDETERMINADAS,
+                        help="Número de facturas por escala (por defecto: 10 100 1000)")
+    parser.add_argument('--etapas', nargs='+', choices=ETAPAS, default=ETAPAS,
+                        help="Etapas a medir")
+    parser.add_argument('--salida', default="resultados_benchmark.json",
+                        help="Archivo JSON de resultados")
+    parser.add_argument('--directorio', default=None,
+                        help="Directorio de trabajo (se conserva al terminar)")
+    parser.add_argument('--conversion-real', action='store_true',
+                        help="Usar docx2pdf real (requiere Microsoft Word)")
+    parser.add_argument('--semilla', type=int, default=2025)
+    parser.add_argument('--etiqueta', default=None, help="Nombre de la versión medida")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    ejecutar_benchmarks(
+        escalas=args.escalas,
+        etapas=args.etapas,
+        salida=args.salida,
+        directorio=args.directorio,
+        simular_conversion=not args.conversion_real,
+        semilla=args.semilla,
+        etiqueta=args.etiqueta,
+    )
+
+
+if __name__ == "__main__":
+    main()
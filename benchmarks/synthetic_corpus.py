@@ -0,0 +1,282 @@
+"""
+Generador de corpus sintéticos para las mediciones de rendimiento.
+
+Crea árboles de partidas con la misma estructura que usa la aplicación:
+un Excel con la hoja 'base datos', carpetas de partida con un solo XML
+o con una subcarpeta por compra, XMLs CFDI 4.0 y PDFs originales.
+"""
+import os
+import random
+import uuid
+import logging
+from decimal import Decimal
+from datetime import datetime, timedelta
+from xml.sax.saxutils import quoteattr
+
+logger = logging.getLogger(__name__)
+
+# Catálogo de descripciones para los conceptos simulados
+DESCRIPCIONES_CONCEPTOS = [
+    "Hojas blancas tamaño carta", "Tóner para impresora láser", "Bolígrafos tinta azul",
+    "Carpetas de archivo", "Engrapadora de escritorio", "Cinta adhesiva transparente",
+    "Aceite para motor 15W40", "Filtro de aire", "Llanta 215/75 R16", "Batería 12V",
+    "Limpiador multiusos", "Escoba de plástico", "Bolsas para basura", "Cable UTP cat. 6",
+    "Memoria USB 32 GB", "Mouse óptico", "Teclado alámbrico", "Foco LED 9W",
+]
+
+EMISORES = [
+    ("Papelería del Centro, S.A. de C.V.", "PCE940101AB1"),
+    ("Refacciones y Servicios del Norte, S.A. de C.V.", "RSN010203CD2"),
+    ("Distribuidora de Limpieza Integral, S. de R.L.", "DLI990505EF3"),
+    ("Tecnología y Cómputo Empresarial, S.A. de C.V.", "TCE120707GH4"),
+]
+
+RECEPTOR = ("Secretaría de la Defensa Nacional", "SDN371231AB1")
+
+# Partidas presupuestales de ejemplo
+PARTIDAS_SIMULADAS = [
+    ("21101", "Materiales y útiles de oficina"),
+    ("21601", "Material de limpieza"),
+    ("26102", "Combustibles, lubricantes y aditivos"),
+    ("29601", "Refacciones y accesorios menores de equipo de transporte"),
+    ("21401", "Materiales y útiles para el procesamiento en equipos informáticos"),
+]
+
+NS_CFDI = "http://www.sat.gob.mx/cfd/4"
+NS_TFD = "http://www.sat.gob.mx/TimbreFiscalDigital"
+
+
+def _numero_conceptos(rng, minimo=1, maximo=5000):
+    """
+    Elige el número de conceptos de una factura.
+
+    La distribución está sesgada hacia facturas pequeñas, como en los
+    expedientes reales, pero incluye ocasionalmente facturas enormes.
+
+    Args:
+        rng (random.Random): Generador de números aleatorios
+        minimo (int): Número mínimo de conceptos
+        maximo (int): Número máximo de conceptos
+
+    Returns:
+        int: Número de conceptos
+    """
+    sorteo = rng.random()
+    if sorteo < 0.80:
+        return rng.randint(minimo, min(maximo, 10))
+    if sorteo < 0.97:
+        return rng.randint(min(maximo, 10), min(maximo, 200))
+    return rng.randint(min(maximo, 200), maximo)
+
+
+def generar_cfdi_xml(ruta_salida, num_conceptos, rng=None, fecha=None):
+    """
+    Genera un XML CFDI 4.0 timbrado con el número de conceptos indicado.
+
+    Args:
+        ruta_salida (str): Ruta del archivo XML a crear
+        num_conceptos (int): Número de conceptos de la factura
+        rng (random.Random, optional): Generador de números aleatorios
+        fecha (datetime, optional): Fecha de emisión
+
+    Returns:
+        dict: Resumen de la factura generada (uuid, total, serie, folio)
+    """
+    rng = rng or random.Random()
+    fecha = fecha or datetime(2025, 3, 1) + timedelta(days=rng.randint(0, 27), seconds=rng.randint(0, 86399))
+    nombre_emisor, rfc_emisor = rng.choice(EMISORES)
+    serie = rng.choice(["A", "B", "F", "FAC"])
+    folio = str(rng.randint(1, 999999))
+    folio_fiscal = str(uuid.UUID(int=rng.getrandbits(128))).upper()
+
+    conceptos_xml = []
+    subtotal = Decimal('0.00')
+    for _ in range(num_conceptos):
+        cantidad = Decimal(rng.randint(1, 50))
+        valor_unitario = Decimal(rng.randint(100, 500000)) / 100
+        importe = (cantidad * valor_unitario).quantize(Decimal('0.01'))
+        subtotal += importe
+        descripcion = rng.choice(DESCRIPCIONES_CONCEPTOS)
+        base = importe
+        iva = (base * Decimal('0.16')).quantize(Decimal('0.01'))
+        conceptos_xml.append(
+            f'<cfdi:Concepto ClaveProdServ="44121600" Cantidad="{cantidad}" ClaveUnidad="H87" '
+            f'Unidad="Pieza" Descripcion={quoteattr(descripcion)} ValorUnitario="{valor_unitario:.2f}" '
+            f'Importe="{importe:.2f}" ObjetoImp="02">'
+            f'<cfdi:Impuestos><cfdi:Traslados><cfdi:Traslado Base="{base:.2f}" Impuesto="002" '
+            f'TipoFactor="Tasa" TasaOCuota="0.160000" Importe="{iva:.2f}"/></cfdi:Traslados></cfdi:Impuestos>'
+            f'</cfdi:Concepto>'
+        )
+
+    iva_total = (subtotal * Decimal('0.16')).quantize(Decimal('0.01'))
+    total = subtotal + iva_total
+
+    contenido = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<cfdi:Comprobante xmlns:cfdi="{NS_CFDI}" xmlns:tfd="{NS_TFD}" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://www.sat.gob.mx/cfd/4 http://www.sat.gob.mx/sitio_internet/cfd/4/cfdv40.xsd" '
+        f'Version="4.0" Serie="{serie}" Folio="{folio}" Fecha="{fecha.strftime("%Y-%m-%dT%H:%M:%S")}" '
+        f'FormaPago="03" NoCertificado="00001000000509846663" SubTotal="{subtotal:.2f}" Moneda="MXN" '
+        f'Total="{total:.2f}" TipoDeComprobante="I" Exportacion="01" MetodoPago="PUE" LugarExpedicion="06000" '
+        f'Sello="{"A" * 344}" Certificado="{"B" * 1500}">'
+        f'<cfdi:Emisor Rfc="{rfc_emisor}" Nombre={quoteattr(nombre_emisor)} RegimenFiscal="601"/>'
+        f'<cfdi:Receptor Rfc="{RECEPTOR[1]}" Nombre={quoteattr(RECEPTOR[0])} DomicilioFiscalReceptor="06000" '
+        'RegimenFiscalReceptor="603" UsoCFDI="G03"/>'
+        f'<cfdi:Conceptos>{"".join(conceptos_xml)}</cfdi:Conceptos>'
+        f'<cfdi:Impuestos TotalImpuestosTrasladados="{iva_total:.2f}"><cfdi:Traslados>'
+        f'<cfdi:Traslado Base="{subtotal:.2f}" Impuesto="002" TipoFactor="Tasa" TasaOCuota="0.160000" '
+        f'Importe="{iva_total:.2f}"/></cfdi:Traslados></cfdi:Impuestos>'
+        '<cfdi:Complemento>'
+        f'<tfd:TimbreFiscalDigital Version="1.1" UUID="{folio_fiscal}" '
+        f'FechaTimbrado="{fecha.strftime("%Y-%m-%dT%H:%M:%S")}" RfcProvCertif="SAT970701NN3" '
+        f'SelloCFD="{"C" * 344}" NoCertificadoSAT="00001000000505142236" SelloSAT="{"D" * 344}"/>'
+        '</cfdi:Complemento>'
+        '</cfdi:Comprobante>'
+    )
+
+    with open(ruta_salida, 'w', encoding='utf-8') as archivo:
+        archivo.write(contenido)
+
+    return {
+        'uuid': folio_fiscal,
+        'total': total,
+        'serie': serie,
+        'folio': folio,
+        'conceptos': num_conceptos,
+    }
+
+
+def generar_pdf_paginas(ruta_salida, num_paginas, titulo="Factura"):
+    """
+    Genera un PDF con el número de páginas indicado.
+
+    Args:
+        ruta_salida (str): Ruta del PDF a crear
+        num_paginas (int): Número de páginas
+        titulo (str): Texto que se imprime en cada página
+
+    Returns:
+        str: Ruta al PDF generado
+    """
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_font("Arial", size=10)
+    for numero in range(1, num_paginas + 1):
+        pdf.add_page()
+        pdf.cell(0, 10, txt=f"{titulo} - página {numero} de {num_paginas}", ln=True)
+        for linea in range(40):
+            pdf.cell(0, 5, txt=f"Renglón {linea + 1}: contenido simulado del documento original.", ln=True)
+    pdf.output(ruta_salida)
+    return ruta_salida
+
+
+def generar_excel_partidas(ruta_salida, partidas):
+    """
+    Genera el Excel de partidas con la hoja 'base datos'.
+
+    Args:
+        ruta_salida (str): Ruta del Excel a crear
+        partidas (list): Lista de diccionarios con numero, descripcion, monto y numero_adicional
+
+    Returns:
+        str: Ruta al Excel generado
+    """
+    import pandas as pd
+
+    df = pd.DataFrame([
+        {
+            'PARTIDA': int(partida['numero']),
+            'CONCEPTO': partida['descripcion'],
+            'MONTO': float(partida['monto']),
+            'NUMERO': partida['numero_adicional'],
+        }
+        for partida in partidas
+    ])
+    df.to_excel(ruta_salida, sheet_name='base datos', index=False)
+    return ruta_salida
+
+
+def generar_corpus(base_dir, num_facturas, semilla=2025, max_conceptos=5000, max_paginas=20,
+                   con_pdf=True):
+    """
+    Genera un árbol de partidas completo con el número de facturas indicado.
+
+    La primera partida usa la estructura de un solo XML directamente en la
+    carpeta; las demás reparten sus facturas en subcarpetas de compra.
+
+    Args:
+        base_dir (str): Directorio donde se creará el corpus
+        num_facturas (int): Número total de facturas
+        semilla (int): Semilla para que el corpus sea reproducible
+        max_conceptos (int): Máximo de conceptos por factura
+        max_paginas (int): Máximo de páginas del PDF original
+        con_pdf (bool): Si se generan los PDFs originales de cada factura
+
+    Returns:
+        dict: Descripción del corpus (excel_path, partidas, facturas y estadísticas)
+    """
+    rng = random.Random(semilla)
+    os.makedirs(base_dir, exist_ok=True)
+
+    num_partidas = min(len(PARTIDAS_SIMULADAS), max(1, num_facturas))
+    partidas = []
+    facturas = []
+
+    # Repartir las facturas: la primera partida lleva un solo XML
+    reparto = [1] + [0] * (num_partidas - 1)
+    for i in range(num_facturas - 1):
+        reparto[1 + i % (num_partidas - 1) if num_partidas > 1 else 0] += 1
+
+    total_conceptos = 0
+    total_paginas = 0
+
+    for indice, (numero, descripcion) in enumerate(PARTIDAS_SIMULADAS[:num_partidas]):
+        partida_dir = os.path.join(base_dir, numero)
+        os.makedirs(partida_dir, exist_ok=True)
+        monto_partida = Decimal('0.00')
+
+        for n in range(reparto[indice]):
+            if indice == 0 and reparto[indice] == 1:
+                factura_dir = partida_dir
+            else:
+                factura_dir = os.path.join(partida_dir, f"compra_{n + 1:04d}")
+                os.makedirs(factura_dir, exist_ok=True)
+
+            num_conceptos = _numero_conceptos(rng, maximo=max_conceptos)
+            resumen = generar_cfdi_xml(os.path.join(factura_dir, "factura.xml"), num_conceptos, rng)
+            monto_partida += resumen['total']
+            total_conceptos += num_conceptos
+
+            if con_pdf:
+                num_paginas = rng.randint(1, max_paginas)
+                generar_pdf_paginas(os.path.join(factura_dir, "factura.pdf"), num_paginas)
+                resumen['paginas'] = num_paginas
+                total_paginas += num_paginas
+
+            resumen['xml_path'] = os.path.join(factura_dir, "factura.xml")
+            resumen['partida'] = numero
+            facturas.append(resumen)
+
+        partidas.append({
+            'numero': numero,
+            'descripcion': descripcion,
+            # El monto asignado queda por debajo del total para que exista aportación
+            'monto': (monto_partida * Decimal('0.9')).quantize(Decimal('0.01')),
+            'numero_adicional': f"{100 + indice}/2025",
+        })
+
+    excel_path = generar_excel_partidas(os.path.join(base_dir, "partidas.xlsx"), partidas)
+
+    logger.info(f"Corpus generado en {base_dir}: {len(facturas)} facturas, "
+                f"{total_conceptos} conceptos, {total_paginas} páginas")
+
+    return {
+        'base_dir': base_dir,
+        'excel_path': excel_path,
+        'partidas': partidas,
+        'facturas': facturas,
+        'total_conceptos': total_conceptos,
+        'total_paginas': total_paginas,
+    }
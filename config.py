@@ -8,11 +8,13 @@ APP_CONFIG = {
     'usar_editor_conceptos': True,  # Activa o desactiva el editor de conceptos
     'formato_fecha': '%Y-%m-%d',    # Formato de fecha esperado en la interfaz
     'debug_mode': False,            # Modo de depuración
-    'templates_dirs': [             # Directorios donde buscar plantillas
-        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plantillas"),
-        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates"),
+    'perfil_memoria': False,        # Activa las instantáneas de tracemalloc y el RSS por etapa
+    'perfil_memoria_top': 10,       # Número de asignadores principales en el reporte de memoria
+    'templates_dirs': [             # Directorios donde buscar plantillas (primero los del proyecto)
         os.path.join(os.path.dirname(os.path.abspath(__file__)), "plantillas"),
-        os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"),
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plantillas"),
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
     ]
 }
 
@@ -21,8 +23,180 @@ PDF_CONFIG = {
     'generar_pdf_combinado': True,  # Activa o desactiva la generación del PDF combinado
     'verificacion_sat_requerida': False,  # Si es True, mostrará un error cuando no se pueda obtener la verificación
     'incluir_xml_en_combinado': True,  # Si es False, el XML no se incluirá en el PDF combinado
-    'aplicar_rotacion_pdf': False,  # Si es True, aplicará rotación a los PDFs según sea necesario
-    'rotacion_grados': 90  # Ángulos de rotación (90, 180, 270)
+    'aplicar_rotacion_pdf': False,  # Normaliza orientación y tamaño de las páginas de la factura original y la verificación del SAT al combinarlas
+    'rotacion_grados': 90,  # Rotación que se aplica a las páginas horizontales (90 o 270)
+    'tamano_pagina': (612, 792),  # Tamaño vertical de las páginas normalizadas en puntos (carta)
+    'tolerancia_tamano': 0.1,  # Diferencia relativa de tamaño aceptada sin escalar (A4 no se escala)
+    'optimizar_pdf': True,  # Deduplica fuentes/imágenes/contenidos y comprime en object streams los PDF combinados
+    'linearizar_pdf': False,  # Linealiza los PDF optimizados (vista rápida al abrirlos desde la red)
+    'procesos_optimizacion': None,  # Procesos para optimizar los PDF de una partida (None = núcleos disponibles)
+    'optimizar_imagenes': False,  # Reduce las imágenes sobredimensionadas de la factura original y la verificación del SAT (con pérdida: son documentos probatorios)
+    'dpi_imagenes': 150,  # Resolución objetivo de las imágenes reducidas
+    'calidad_jpeg': 85,  # Calidad de las imágenes que ya eran JPEG al recomprimirlas (las demás nunca se convierten a JPEG: se comprimen sin pérdida)
+    'tamano_minimo_imagen_kb': 200,  # Las imágenes más pequeñas no se revisan
+    'cache_imagenes': None,  # Directorio de la caché de PDF optimizados (None = 'cache_imagenes_pdf' junto a la aplicación)
+    'tamano_maximo_cache_imagenes_mb': 1024  # Al superarlo se eliminan los PDF optimizados usados hace más tiempo (None = sin límite)
+}
+
+# Caché de conversiones DOCX -> PDF por contenido del documento
+CONVERSION_CACHE_CONFIG = {
+    'habilitado': True,  # Reutiliza el PDF de un documento idéntico ya convertido (en esta u otra corrida)
+    'directorio': None,  # Directorio de la caché (None = 'cache_conversion_pdf' junto a la aplicación)
+    'tamano_maximo_mb': 512  # Al superarlo se eliminan los PDF usados hace más tiempo (None = sin límite)
+}
+
+# Supervisión de etapas externas (Word/docx2pdf y Selenium) en procesos que se pueden terminar
+WATCHDOG_CONFIG = {
+    'habilitado': True,  # Ejecuta las conversiones y verificaciones en un proceso trabajador por etapa (reutilizado en la corrida) con tiempo límite
+    'metodo_inicio': None,  # Método de multiprocessing (None = el del sistema: fork en Linux, spawn en Windows)
+    'espera_base': 2,  # Segundos de espera antes del primer reintento (se duplica en cada reintento)
+    'espera_maxima': 30,  # Espera máxima entre reintentos
+    'etapas': {
+        'conversion_pdf': {'timeout': 120, 'reintentos': 2},  # Conversión de cada DOCX con docx2pdf
+        'verificacion_sat': {'timeout': 300, 'reintentos': 1}  # Descarga de la verificación con Selenium
+    }
+}
+
+# Espacio temporal de la corrida compartido por todas las etapas
+SCRATCH_CONFIG = {
+    'directorio': None,  # Directorio base del espacio temporal (p. ej. un disco RAM); None = temporal del sistema
+    'usar_memoria': False,  # En Linux usa /dev/shm (tmpfs) si no se indicó un directorio
+    'tamano_maximo_mb': 2048,  # Al superarlo los archivos nuevos se crean en el temporal del sistema (None = sin límite)
+    'pdfs_intermedios': True  # Convierte los DOCX a PDF en el espacio temporal en lugar de la carpeta 'pdfs' de cada factura
+}
+
+# Generación local de cada partida y publicación en la carpeta compartida
+STAGING_CONFIG = {
+    'habilitado': False,  # Copia las entradas al espacio temporal, genera ahí y publica al terminar cada partida
+    'hilos_copia': 4,  # Hilos para copiar las entradas y publicar los documentos
+    'extensiones_entrada': ['.xml', '.pdf'],  # Archivos de la partida que se copian para generar
+    'excluir': ['documento_completo*.pdf']  # Salidas de corridas anteriores que no se copian (patrones)
+}
+
+# Nombres por UUID, bloqueo por carpeta y registro de los archivos generados de cada factura
+ARTEFACTOS_CONFIG = {
+    'archivo_registro': '.artefactos.json',  # Registro de los artefactos completos de cada carpeta de factura
+    'archivo_bloqueo': '.artefactos.lock',  # Archivo de bloqueo de la carpeta (se crea en exclusiva)
+    'espera_bloqueo': 120,  # Segundos máximos de espera si otro trabajador tiene la carpeta bloqueada
+    'bloqueo_abandonado': 900,  # Antigüedad a partir de la cual un bloqueo de otro equipo se considera abandonado
+    'espera_descarga': 60  # Segundos máximos de espera a que termine la descarga de la verificación del SAT
+}
+
+# Configuración de la conciliación de montos previa a la generación
+RECONCILIACION_CONFIG = {
+    'conciliar_antes_de_generar': True,  # Escanea los XML y concilia montos antes de generar documentos
+    'accion_discrepancia': 'preguntar',  # 'preguntar', 'abortar' o 'continuar' cuando hay discrepancias
+    'tolerancia_centavos': 0  # Diferencia máxima (en centavos) aceptada entre facturas y monto asignado
+}
+
+# Índice de UUID para detectar facturas duplicadas o reutilizadas de otro periodo
+UUID_CONFIG = {
+    'habilitado': True,  # Registra el UUID de cada XML durante el escaneo y revisa duplicados antes de generar
+    'archivo_indice': 'indice_uuid.json',  # Índice persistente entre meses (nombre en el directorio base o ruta absoluta; None = solo en memoria)
+    'accion_duplicado': 'preguntar'  # 'preguntar', 'omitir' (no procesa las copias), 'abortar' o 'continuar'
+}
+
+# Diario de avance para reanudar corridas interrumpidas
+DIARIO_CONFIG = {
+    'habilitado': True,  # Registra cada etapa de partidas y facturas en un SQLite dentro del directorio base
+    'archivo': 'diario_proceso.sqlite',  # Nombre del diario en el directorio base
+    'reanudar': False  # Valor inicial de la opción "Reanudar": omite lo terminado y reintenta lo fallido o en curso
+}
+
+# Configuración del formato de fuente de los documentos generados
+FORMATO_CONFIG = {
+    'modo': 'runs',  # 'runs': fuente fijada run por run; 'estilos': una vez en los estilos que usan los párrafos formateados
+    'motor_partidas': 'ooxml'  # 'ooxml': reescribe solo word/document.xml de las plantillas de partida; 'python-docx'
+}
+
+# Configuración del listado del XML de cada factura (plantilla xml.docx)
+LISTADO_XML_CONFIG = {
+    'habilitado': True,  # Usa el generador de listado (párrafos acotados) en lugar de un solo párrafo
+    'formatear': True,  # Formatea el XML con un elemento por línea y sangría
+    'ancho_linea': 120,  # Caracteres máximos por línea antes de cortar
+    'lineas_por_parrafo': 50,  # Líneas máximas por párrafo del documento
+    'monoespaciado': False,  # Usa la fuente monoespaciada en lugar de Geomanist
+    'fuente': 'Geomanist',
+    'fuente_monoespaciada': 'Courier New',
+    'tamano_pt': 6,  # Tamaño de la fuente del listado
+    'salida_pdf_directa': False  # Genera el listado directamente en PDF (sin conversión de Word)
+}
+
+# Configuración de las hojas de legalización de cada factura (plantillas legalizacion_*.docx)
+LEGALIZACION_PDF_CONFIG = {
+    'salida_pdf_directa': False  # Genera las hojas directamente en PDF: la parte fija se renderiza una vez por corrida y por factura solo los campos variables
+}
+
+# Configuración de la relación de facturas por partida
+RELACION_CONFIG = {
+    'paginado': False,  # Divide la relación en hojas con encabezado repetido y subtotal por hoja
+    'facturas_por_pagina': 25,  # Número de facturas por hoja en el modo paginado
+    'facturas_primera_pagina': 15,  # Facturas de la primera hoja (comparte la hoja con el encabezado del documento)
+    'salida_pdf_directa': False,  # Genera además la relación directamente en PDF (sin conversión de Word)
+    'procesos_pdf': None  # Procesos para renderizar las hojas del PDF (None = núcleos disponibles)
+}
+
+# Libros Excel de cada partida (se llenan con el motor Excel sobre las plantillas .xlsx)
+EXCEL_CONFIG = {
+    'generar_libros': False,  # Genera además la relación de facturas y el resumen de ingresos/egresos en Excel
+    'plantillas': {  # Archivos buscados en los directorios de plantillas
+        'ingresos': 'Ingresos y Egresos.xlsx',
+        'facturas': 'Relacion Facturas.xlsx'
+    },
+    'fila_facturas': 10  # Fila prototipo de la tabla de facturas en la plantilla de relación
+}
+
+# Registro de plantillas: archivo, grupo y marcadores que necesita cada generador
+PLANTILLAS_CONFIG = {
+    'verificar_cambios': True,  # Recarga una plantilla si cambia su fecha de modificación (se revisa por partida)
+    'plantillas': {
+        # Documentos por factura (en el orden en que se generan)
+        'legalizacion_factura': {
+            'archivo': 'legalizacion_factura.docx',
+            'grupo': 'factura',
+            'marcadores': ['{{SERIE_NUMERO}}', '{{FECHA_FACTURA}}', '{{MONTO}}']
+        },
+        'legalizacion_verificacion': {
+            'archivo': 'legalizacion_verificacion.docx',
+            'grupo': 'factura',
+            'marcadores': ['{{SERIE_NUMERO}}', '{{FECHA_FACTURA}}']
+        },
+        'legalizacion_xmls': {
+            'archivo': 'legalizacion_xmls.docx',
+            'grupo': 'factura',
+            'marcadores': ['{{SERIE_NUMERO}}', '{{FECHA_FACTURA}}']
+        },
+        'xml': {
+            'archivo': 'xml.docx',
+            'grupo': 'factura',
+            'marcadores': ['{{XML}}']
+        },
+        # Documentos por partida
+        'ingresos_egresos': {
+            'archivo': 'ingresos_egresos.docx',
+            'grupo': 'partida',
+            'marcadores': ['{{PARTIDA}}', '{{MONTO}}', '{{APORTACION}}', '{{SUMA_INGRESOS}}', '{{EGRESOS}}', '{{SALDO}}']
+        },
+        'relacion_facturas': {
+            'archivo': 'relcion_facturas.docx',
+            'grupo': 'partida',
+            'marcadores': ['{{PARTIDA}}', '{{MES}}']
+        },
+        'oficio': {
+            'archivo': 'Oficio.docx',
+            'grupo': 'partida',
+            'marcadores': ['{{PARTIDA}}', '{{MES}}']
+        }
+    }
+}
+
+# Exportación consolidada de las facturas procesadas en cada corrida
+EXPORTACION_CONFIG = {
+    'habilitado': True,  # Escribe cada factura procesada en un archivo consolidado mientras avanza el proceso
+    'formato': 'csv',  # 'csv' o 'parquet' (requiere pyarrow; si no está instalado se usa CSV)
+    'resumen_xlsx': True,  # Genera al final un resumen XLSX por partida con el detalle de las facturas
+    'directorio': None,  # Directorio de la exportación (None = carpeta 'exportacion' dentro del directorio base)
+    'lote_parquet': 500  # Filas por grupo al escribir Parquet
 }
 
 # Información de personal predefinido
@@ -2,15 +2,15 @@
 Controlador para el procesamiento de facturas individuales
 """
 import os
+import time
 import logging
-from datetime import datetime
-from decimal import Decimal
+from contextlib import nullcontext
 
 # Importaciones internas
+from core.models import FacturaResult, VistaPlantilla
 from core.xml_processor import XMLProcessor
 from core.document_generator import DocumentGenerator
-from utils.formatters import format_fecha_mensaje
-from ui.dialogs import editar_conceptos
+from utils.scratch_space import scratch_space
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +27,41 @@ class FacturaController:
         self.ui = ui
         self.xml_processor = XMLProcessor()
         self.document_generator = DocumentGenerator(ui)
+        self.memory_profiler = None
+        self.ultimo_error = None
+        self.diario = None
+
+    def set_memory_profiler(self, memory_profiler):
+        """
+        Asigna el perfilador de memoria a este controlador y al generador de documentos
+        
+        Args:
+            memory_profiler: Instancia de MemoryProfiler o None para desactivarlo
+        """
+        self.memory_profiler = memory_profiler
+        self.document_generator.memory_profiler = memory_profiler
+
+    def set_diario(self, diario):
+        """
+        Asigna el diario donde se registran las etapas de cada factura
+        
+        Args:
+            diario: Instancia de JobJournal o None para desactivarlo
+        """
+        self.diario = diario
+
+    def _registrar_etapa(self, partida, xml_file, etapa):
+        """Registra en el diario que la factura alcanzó una etapa"""
+        if self.diario:
+            self.diario.etapa_factura(partida['numero'], xml_file, etapa)
+
+    def _etapa_memoria(self, etapa):
+        """Devuelve el contexto de medición de memoria de una etapa"""
+        if self.memory_profiler:
+            return self.memory_profiler.medir_etapa(etapa)
+        return nullcontext()
         
-    def procesar_factura(self, xml_file, output_dir, partida, monto_formateado, datos_comunes):
+    def procesar_factura(self, xml_file, output_dir, partida, monto_formateado, datos_comunes, clave_diario=None):
         """
         Procesa una factura individual
         
@@ -38,54 +71,50 @@ class FacturaController:
             partida: Información de la partida
             monto_formateado: Monto formateado de la partida
             datos_comunes: Datos comunes para el procesamiento
+            clave_diario: Ruta con que se registra la factura en el diario
+                          (la de la carpeta compartida en modo staging; por defecto xml_file)
             
         Returns:
-            dict: Información de la factura procesada o None si hay error
+            FacturaResult: Información de la factura procesada o None si hay error
         """
+        self.ultimo_error = None
+        clave_diario = clave_diario or xml_file
+        inicio_factura = time.perf_counter()
+        tiempos = {}
         try:
             self.ui.update_status(f"🔍 Analizando XML: {os.path.basename(xml_file)}...")
 
-            # 1. Extraer información base del XML
-            xml_data = self.xml_processor.read_xml(xml_file)
+            # 1. Extraer información base del XML (registro Factura con montos y fechas precalculados)
+            with self._etapa_memoria("Lectura de XML"):
+                factura = self.xml_processor.read_xml(xml_file)
+            tiempos['lectura_xml'] = time.perf_counter() - inicio_factura
 
-            if not xml_data:
+            if not factura:
+                self.ultimo_error = "No se pudo extraer información del XML"
                 self.ui.update_status(f"Error: No se pudo extraer información del XML", "error")
                 return None
+            self._registrar_etapa(partida, clave_diario, 'lectura_xml')
 
-            # Extraer el monto de la factura correctamente
-            if 'Total' in xml_data:
-                try:
-                    # Convertir el monto a Decimal para cálculos precisos
-                    monto_decimal = Decimal(str(xml_data['Total']))
-                    monto_formateado_factura = "$ {:,.2f}".format(monto_decimal)
-                except:
-                    # Si hay error, usar un valor por defecto
-                    monto_decimal = Decimal('0.00')
-                    monto_formateado_factura = "$ 0.00"
-            else:
-                monto_decimal = Decimal('0.00')
-                monto_formateado_factura = "$ 0.00"
-
-            # 2. Crear el diccionario data completo
+            # 2. Crear la vista de datos completa (sin copiar los campos del XML)
             data = self._crear_diccionario_datos_completo(
-                xml_data,
+                factura,
                 partida,
-                monto_formateado_factura,  # Usar el monto formateado de la factura
+                factura.monto_formateado,  # Usar el monto formateado de la factura
                 datos_comunes
             )
-
-            # Añadir explícitamente el monto decimal para cálculos posteriores
-            data['monto_decimal'] = monto_decimal
             
             # Importante: Guardar la ruta del XML original para su uso posterior
             data['xml_path'] = xml_file
 
             # 3. Pre-procesar conceptos (formatearlos automáticamente)
+            inicio = time.perf_counter()
             conceptos_str = self._formatear_conceptos_automatico(data['Conceptos'])
 
             # 4. Si está habilitado el editor de conceptos, mostrarlo
             from config import APP_CONFIG
             if APP_CONFIG.get('usar_editor_conceptos', True):
+                # Se importa aquí porque el paquete ui importa los controladores
+                from ui.dialogs import editar_conceptos
                 self.ui.update_status(f"✏️ Abriendo editor de conceptos...")
 
                 # Este es un punto crítico donde debemos esperar la interacción del usuario
@@ -99,10 +128,19 @@ class FacturaController:
             else:
                 # Usar el formato automático
                 data['Empleo_recurso'] = conceptos_str
+            tiempos['conceptos'] = time.perf_counter() - inicio
+            self._registrar_etapa(partida, clave_diario, 'conceptos')
 
             # 5. Generar documentos (DOCX y PDF)
             self.ui.update_status(f"📝 Generando documentos...")
             documento_results = self.document_generator.generate_all_documents(data, output_dir)
+            tiempos.update(documento_results.get('tiempos', {}))
+            if documento_results.get('fallida'):
+                # Una etapa supervisada agotó sus reintentos: se registra la factura como fallida
+                self.ultimo_error = documento_results.get('error')
+                self.ui.update_status(f"Error: {self.ultimo_error}", "error")
+                return None
+            self._registrar_etapa(partida, clave_diario, 'documentos')
 
             # 6. Extraer rutas de documentos generados
             docx_files = documento_results.get('docx_files', {})
@@ -111,7 +149,11 @@ class FacturaController:
             
             if documento_results.get('pdf_processed', False):
                 pdf_data = documento_results.get('pdf_files', {})
-                pdf_files = pdf_data.get('generated_pdfs', {})
+                # Los PDF convertidos en el espacio temporal ya se eliminaron al combinarlos
+                pdf_files = {
+                    nombre: ruta for nombre, ruta in pdf_data.get('generated_pdfs', {}).items()
+                    if not scratch_space.contiene(ruta)
+                }
                 pdf_combinado = pdf_data.get('combined_pdf')
 
             # 7. Registro de éxito
@@ -120,24 +162,33 @@ class FacturaController:
                 "success"
             )
 
-            # 8. Retornar información para registro y relación
-            return {
-                'serie_numero': f"{data['Serie']}{data['Numero']}",
-                'fecha': data.get('Fecha_factura_texto', data.get('Fecha_factura', '')),
-                'fecha_factura': data.get('Fecha_factura', ''), 
-                'emisor': data['Nombre_Emisor'],
-                'rfc_emisor': data['Rfc_emisor'],
-                'monto': data['monto'],
-                'monto_decimal': data['monto_decimal'],  # Incluir el valor decimal para sumas posteriores
-                'conceptos': data.get('Empleo_recurso', ''),
-                'documentos': {
+            # 8. Retornar solo lo que necesitan las plantillas de la partida y la exportación
+            #    (el texto del XML ya se liberó tras generar los documentos)
+            tiempos['total'] = time.perf_counter() - inicio_factura
+            return FacturaResult(
+                serie_numero=factura.serie_numero,
+                fecha=factura.fecha_factura_texto or factura.fecha_factura,
+                fecha_factura=factura.fecha_factura,
+                emisor=factura.nombre_emisor,
+                rfc_emisor=factura.rfc_emisor,
+                monto=data['monto'],
+                monto_decimal=factura.monto_decimal,  # Valor decimal para sumas posteriores
+                conceptos=data.get('Empleo_recurso', ''),
+                documentos={
                     **docx_files,  # Documentos DOCX
                     'pdf_files': pdf_files,  # PDFs individuales
                     'pdf_combinado': pdf_combinado  # PDF combinado final
-                }
-            }
+                },
+                uuid=factura.uuid,
+                partida=partida['numero'],
+                xml_path=xml_file,
+                rfc_receptor=factura.rfc_receptor,
+                tiempos=tiempos,
+                errores=list(documento_results.get('errores', []))
+            )
 
         except Exception as e:
+            self.ultimo_error = str(e)
             self.ui.update_status(
                 f"Error al procesar factura {os.path.basename(xml_file)}: {str(e)}",
                 "error"
@@ -147,75 +198,22 @@ class FacturaController:
     
     def _crear_diccionario_datos_completo(self, xml_data, partida, monto_formateado, datos_comunes):
         """
-        Crea un diccionario completo combinando todas las fuentes de datos
+        Crea la vista de datos completa combinando todas las fuentes de datos
         
         Args:
-            xml_data: Datos extraídos del XML
+            xml_data: Registro Factura extraído del XML
             partida: Información de la partida
             monto_formateado: Monto formateado para mostrar
             datos_comunes: Datos comunes del proceso
             
         Returns:
-            dict: Diccionario completo de datos para generar documentos
+            VistaPlantilla: Mapeo con todas las claves que usan las plantillas
         """
-        # Crear un nuevo diccionario
-        data = {}
-
-        # 1. Agregar datos del XML
-        data.update(xml_data)
-
-        # 2. Agregar datos de la interfaz principal
-        data['Fecha_doc'] = datos_comunes['fecha_documento_texto']
-        data['Mes'] = datos_comunes['mes_asignado']
-
-        # 3. Agregar información de la partida
-        data['No_partida'] = partida['numero']
-        data['Descripcion_partida'] = partida['descripcion']
-        data['monto'] = monto_formateado
-
-        # 4. Agregar información del personal seleccionado
-        for key, value in datos_comunes['personal_recibio'].items():
-            data[key] = value
-
-        for key, value in datos_comunes['personal_vobo'].items():
-            data[key] = value
-
-        # 5. Información de fechas formateadas
-        # Convertir ISO fecha a formato legible
-        if 'Fecha_ISO' in data:
-            fecha_obj = datetime.strptime(data['Fecha_ISO'].split('T')[0], '%Y-%m-%d')
-            data['Fecha_original'] = data['Fecha_ISO']
-
-            # Formato numérico para algunas ocasiones donde se necesite
-            data['Fecha_factura'] = fecha_obj.strftime('%d/%m/%Y')
-
-            # Formato textual en español
-            import locale
-            try:
-                locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')  # Intentar configurar locale español
-            except:
-                try:
-                    locale.setlocale(locale.LC_TIME, 'Spanish_Spain.1252')  # Alternativa para Windows
-                except:
-                    pass  # Si no se puede establecer, usar la configuración por defecto
-
-            # Usar format_date de babel para formatear con mes en texto
-            from babel.dates import format_date
-            data['Fecha_factura_texto'] = format_date(fecha_obj, format="d 'de' MMMM 'del' yyyy", locale='es')
-            # Capitalizar primera letra
-            if data['Fecha_factura_texto']:
-                data['Fecha_factura_texto'] = data['Fecha_factura_texto'][0].upper() + data['Fecha_factura_texto'][1:]
-
-        # 6. Información del Folio Fiscal
-        if 'UUid' in data:
-            data['Folio_Fiscal'] = data['UUid']
-
-        # 7. Generar número de oficio
-        data['No_of_remision'] = partida.get('numero_adicional', '')
-
-        # 8. Auto-generar No_mensaje y Fecha_mensaje
-        data['No_mensaje'] = partida.get('numero_adicional', '')
-        data['Fecha_mensaje'] = format_fecha_mensaje(datos_comunes['fecha_documento'])
+        data = VistaPlantilla(xml_data, partida, datos_comunes)
+
+        # Solo se guarda el monto si difiere del precalculado en la factura
+        if monto_formateado != xml_data.monto_formateado:
+            data['monto'] = monto_formateado
 
         return data
     
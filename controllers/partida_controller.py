@@ -3,10 +3,14 @@ Controlador para el procesamiento de partidas
 """
 import os
 import logging
-from decimal import Decimal
+from contextlib import nullcontext
 
 # Importaciones internas
 from controllers.factura_controller import FacturaController
+from config import PDF_CONFIG
+from core.reconciliation import calcular_totales
+from utils.file_utils import localizar_facturas_partida
+from utils.staging import staging
 
 logger = logging.getLogger(__name__)
 
@@ -22,94 +26,172 @@ class PartidaController:
         """
         self.ui = ui
         self.factura_controller = FacturaController(ui)
+        self.pdf_manager = self.factura_controller.document_generator.pdf_processor.pdf_manager
+        self.memory_profiler = None
+        self.exportador = None
+        self.omitidas = set()
+        self.completadas = set()
+        self.diario = None
+        self.reanudar = False
+
+    def set_memory_profiler(self, memory_profiler):
+        """
+        Asigna el perfilador de memoria a este controlador y a los que dependen de él
+        
+        Args:
+            memory_profiler: Instancia de MemoryProfiler o None para desactivarlo
+        """
+        self.memory_profiler = memory_profiler
+        self.factura_controller.set_memory_profiler(memory_profiler)
+
+    def set_exportador(self, exportador):
+        """
+        Asigna el exportador que registra cada factura procesada
+        
+        Args:
+            exportador: Instancia de RunExporter o None para desactivarlo
+        """
+        self.exportador = exportador
+
+    def set_diario(self, diario, reanudar=False):
+        """
+        Asigna el diario de avance de la corrida
+        
+        Args:
+            diario: Instancia de JobJournal o None para desactivarlo
+            reanudar: Si es True se aprovechan las facturas ya completadas en el diario
+        """
+        self.diario = diario
+        self.reanudar = bool(diario) and reanudar
+        self.factura_controller.set_diario(diario)
+
+    def set_omitidas(self, omitidas):
+        """
+        Asigna los XML que no se deben procesar (p. ej. por UUID duplicado)
+        
+        Args:
+            omitidas: Conjunto de rutas de XML a omitir
+        """
+        self.omitidas = omitidas if omitidas is not None else set()
+
+    def set_completadas(self, completadas):
+        """
+        Asigna el conjunto donde se anotan los XML procesados correctamente
+        
+        Args:
+            completadas: Conjunto de rutas de XML (se agrega cada factura completada)
+        """
+        self.completadas = completadas if completadas is not None else set()
     
     def procesar_partida(self, partida, partida_dir, datos_comunes):
         """
         Procesa una partida y todas sus facturas
         
         Args:
-            partida: Diccionario con información de la partida
+            partida: Registro Partida con información de la partida
             partida_dir: Directorio de la partida
             datos_comunes: Datos comunes para el procesamiento
             
         Returns:
             dict: Resultados del procesamiento de la partida o None si hay error
         """
-        # Formatear monto de la partida
-        monto_formateado = "$ {:,.2f}".format(partida['monto'])
+        # Monto de la partida ya formateado en el registro
+        monto_formateado = partida['monto_formateado']
+
+        # Huella de los datos de la corrida y del registro de la partida (se guarda con cada trabajo)
+        huella = self.diario.huella_partida(partida) if self.diario else None
+
+        # Resumen de la partida si ya se completó en una corrida anterior con los mismos datos
+        partida_previa = self.diario.partida_completada(partida['numero'], huella) if self.reanudar else None
+        if self.diario:
+            self.diario.iniciar_partida(partida['numero'])
         
+        # En modo staging la partida se genera en una copia local y se publica al final
+        area = staging.partida(partida_dir) if staging.habilitado else None
         try:
-            # Buscar facturas XML en la partida
-            xml_files_in_partida = [
-                f for f in os.listdir(partida_dir)
-                if f.lower().endswith('.xml') and os.path.isfile(os.path.join(partida_dir, f))
-            ]
+            trabajo_dir = partida_dir
+            if area:
+                self.ui.update_status(f"Copiando la partida {partida['numero']} al área local...")
+                trabajo_dir = area.preparar()
+            
+            # Buscar facturas XML en la partida (XML único o una subcarpeta por compra)
+            facturas_partida = localizar_facturas_partida(trabajo_dir)
 
             facturas_procesadas = 0
             facturas_con_error = 0
+            facturas_reutilizadas = 0
             facturas_info = []
+            pdfs_generados = []
 
-            if xml_files_in_partida:
-                # CASO 1: XML directamente en la carpeta de partida (una sola factura)
+            if len(facturas_partida) == 1 and facturas_partida[0][1] == trabajo_dir:
                 self.ui.update_status(f"📄 Encontrado XML directamente en la carpeta de partida")
+            else:
+                self.ui.update_status(f"📂 Partida {partida['numero']}: {len(facturas_partida)} subcarpetas con XML encontradas.")
 
-                # Procesar la factura única
-                xml_file = os.path.join(partida_dir, xml_files_in_partida[0])
-                resultado = self.factura_controller.procesar_factura(
-                    xml_file, partida_dir, partida, monto_formateado, datos_comunes
-                )
+            for xml_local, factura_dir in facturas_partida:
+                # Ruta del XML en la carpeta de la partida (clave del diario, omisiones y exportación)
+                xml_file = area.remota(xml_local) if area else xml_local
+                if xml_file in self.omitidas:
+                    self.ui.update_status(f"  - Factura omitida por UUID repetido: {os.path.basename(xml_file)}", "warning")
+                    if self.exportador:
+                        self.exportador.registrar_error(partida['numero'], xml_file, "Omitida: UUID repetido")
+                    continue
+
+                # Al reanudar, las facturas completadas se toman del diario sin regenerarse
+                resultado = (self.diario.factura_completada(partida['numero'], xml_file, huella)
+                             if self.reanudar else None)
+                reutilizada = resultado is not None
+                if reutilizada:
+                    self.ui.update_status(f"  - Factura ya completada, se omite: {os.path.basename(xml_file)}")
+                    facturas_reutilizadas += 1
+                else:
+                    if factura_dir != trabajo_dir:
+                        self.ui.update_status(f"  - Procesando factura en {os.path.basename(factura_dir)}...")
+
+                    # Procesar la factura
+                    if self.diario:
+                        self.diario.iniciar_factura(partida['numero'], xml_file)
+                    resultado = self.factura_controller.procesar_factura(
+                        xml_local, factura_dir, partida, monto_formateado, datos_comunes,
+                        clave_diario=xml_file
+                    )
+                    # El PDF combinado se optimiza antes de publicarlo
+                    if resultado and resultado['documentos'].get('pdf_combinado'):
+                        pdfs_generados.append(resultado['documentos']['pdf_combinado'])
+                    if resultado and area:
+                        resultado = area.traducir_resultado(resultado)
+                    if self.diario:
+                        if resultado:
+                            self.diario.completar_factura(partida['numero'], xml_file, resultado, huella)
+                        else:
+                            self.diario.fallar_factura(
+                                partida['numero'], xml_file, self.factura_controller.ultimo_error
+                            )
 
                 if resultado:
                     facturas_procesadas += 1
                     facturas_info.append(resultado)
+                    self.completadas.add(xml_file)
                 else:
                     facturas_con_error += 1
-            else:
-                # CASO 2: Buscar en subcarpetas (múltiples facturas)
-                subdirs = [
-                    d for d in os.listdir(partida_dir)
-                    if os.path.isdir(os.path.join(partida_dir, d))
-                ]
-
-                self.ui.update_status(f"📂 Partida {partida['numero']}: {len(subdirs)} subcarpetas encontradas.")
-
-                # Procesar cada subcarpeta que contenga XML
-                for subdir in subdirs:
-                    factura_dir = os.path.join(partida_dir, subdir)
-                    xml_files = [
-                        f for f in os.listdir(factura_dir)
-                        if f.lower().endswith('.xml') and os.path.isfile(os.path.join(factura_dir, f))
-                    ]
-
-                    if xml_files:
-                        self.ui.update_status(f"  - Procesando factura en {subdir}...")
-
-                        # Procesar la factura
-                        xml_file = os.path.join(factura_dir, xml_files[0])
-                        resultado = self.factura_controller.procesar_factura(
-                            xml_file, factura_dir, partida, monto_formateado, datos_comunes
+
+                # Registrar la factura en la exportación consolidada en cuanto se procesa
+                if self.exportador:
+                    if resultado:
+                        self.exportador.registrar(resultado)
+                    else:
+                        self.exportador.registrar_error(
+                            partida['numero'], xml_file, self.factura_controller.ultimo_error
                         )
 
-                        if resultado:
-                            facturas_procesadas += 1
-                            facturas_info.append(resultado)
-                        else:
-                            facturas_con_error += 1
+            # Optimizar los PDF combinados de la partida en el grupo de procesos
+            if pdfs_generados and PDF_CONFIG.get('optimizar_pdf', True):
+                self._optimizar_pdfs(pdfs_generados)
 
-            # Calcular el total de montos de las facturas
-            monto_total = Decimal('0.00')
-            for factura in facturas_info:
-                if isinstance(factura, dict) and 'monto_decimal' in factura:
-                    monto_total += factura['monto_decimal']
-            
-            # Formatear el monto total
-            monto_total_formateado = "$ {:,.2f}".format(monto_total)
-            
-            # Añadir los datos de montos a los datos comunes para las plantillas
-            datos_partida = {
-                'monto_total': monto_total,
-                'monto_total_formateado': monto_total_formateado
-            }
+            # Calcular el total de montos de las facturas (centavos exactos)
+            info_facturas = calcular_totales(facturas_info)
+            monto_total = info_facturas['monto_total']
+            monto_total_formateado = info_facturas['monto_formateado']
             
             # Mostrar el total calculado
             self.ui.update_status(
@@ -118,8 +200,33 @@ class PartidaController:
             )
 
             # Generar relación de facturas si hay información disponible
-            if facturas_info:
-                self._generar_relacion_facturas(partida, facturas_info, partida_dir, datos_comunes, datos_partida)
+            # (se omite si la partida ya estaba completa y no cambió ninguna factura)
+            sin_cambios = (partida_previa is not None and facturas_con_error == 0
+                           and facturas_reutilizadas == facturas_procesadas)
+            relacion_generada = True
+            documentos_partida = {}
+            if sin_cambios:
+                self.ui.update_status(f"Documentos de la partida {partida['numero']} ya generados, se omiten.")
+                documentos_partida = partida_previa['documentos']
+            elif facturas_info:
+                if self.diario:
+                    self.diario.etapa_partida(partida['numero'], 'relacion')
+                etapa = (self.memory_profiler.medir_etapa("Plantillas de partida")
+                         if self.memory_profiler else nullcontext())
+                with etapa:
+                    archivos_partida = self._generar_relacion_facturas(
+                        partida, facturas_info, trabajo_dir, datos_comunes, info_facturas
+                    )
+                relacion_generada = archivos_partida is not None
+                # Rutas definitivas (en la carpeta compartida si se generaron en el área local)
+                documentos_partida = {
+                    tipo: area.remota(ruta) if area else ruta
+                    for tipo, ruta in (archivos_partida or {}).items()
+                }
+
+            # Publicar en la carpeta compartida todo lo generado en el área local
+            if area:
+                self._publicar_partida(area)
 
             # Resumen de la partida
             self.ui.update_status(
@@ -128,21 +235,73 @@ class PartidaController:
                 "success" if facturas_con_error == 0 else "warning"
             )
 
-            return {
+            resultado_partida = {
                 'numero': partida['numero'],
                 'descripcion': partida['descripcion'],
                 'facturas_procesadas': facturas_procesadas,
                 'facturas_con_error': facturas_con_error,
+                'facturas_reutilizadas': facturas_reutilizadas,
                 'monto_total': monto_total,
-                'monto_total_formateado': monto_total_formateado
+                'monto_total_formateado': monto_total_formateado,
+                'documentos': documentos_partida
             }
+            if self.diario:
+                if relacion_generada:
+                    self.diario.completar_partida(partida['numero'], resultado_partida, huella)
+                else:
+                    self.diario.fallar_partida(partida['numero'], "Error al generar los documentos de la partida")
+            return resultado_partida
 
         except Exception as e:
+            if self.diario:
+                self.diario.fallar_partida(partida['numero'], str(e))
             self.ui.update_status(f"Error al procesar partida {partida['numero']}: {str(e)}", "error")
             logger.exception(f"Error procesando partida {partida['numero']}")
             return None
+        finally:
+            if area:
+                area.cerrar()
     
-    def _generar_relacion_facturas(self, partida, facturas_info, partida_dir, datos_comunes, datos_partida=None):
+    def _publicar_partida(self, area):
+        """
+        Publica los documentos generados en el área local de la partida
+        
+        Args:
+            area: PartidaStaging de la partida
+        """
+        self.ui.update_status("Publicando los documentos de la partida...")
+        publicacion = area.publicar()
+        self.ui.update_status(
+            f"  - {publicacion['archivos']} archivos publicados "
+            f"({publicacion['bytes'] / 1048576:.2f} MB) en {publicacion['segundos']:.2f} segundos",
+            "time"
+        )
+    
+    def _optimizar_pdfs(self, pdf_paths):
+        """
+        Deduplica y comprime los PDF combinados generados en la partida
+        
+        Args:
+            pdf_paths: Rutas de los PDF combinados
+        """
+        try:
+            self.ui.update_status(f"Optimizando {len(pdf_paths)} PDF combinados...")
+            resumen = self.pdf_manager.optimize_pdfs(pdf_paths)
+            if resumen['tamano_original']:
+                reduccion = 100 * (1 - resumen['tamano_final'] / resumen['tamano_original'])
+                self.ui.update_status(
+                    f"  - PDF optimizados: {resumen['tamano_original'] / 1048576:.2f} MB -> "
+                    f"{resumen['tamano_final'] / 1048576:.2f} MB ({reduccion:.1f}% menos) "
+                    f"en {resumen['segundos']:.2f} segundos",
+                    "time"
+                )
+            if resumen['errores']:
+                self.ui.update_status(f"  - {resumen['errores']} PDF no se pudieron optimizar", "warning")
+        except Exception as e:
+            self.ui.update_status(f"Error al optimizar los PDF de la partida: {str(e)}", "warning")
+            logger.exception("Error al optimizar PDF combinados")
+
+    def _generar_relacion_facturas(self, partida, facturas_info, partida_dir, datos_comunes, info_facturas=None):
         """
         Genera un documento de relación de facturas para la partida
 
@@ -151,34 +310,22 @@ class PartidaController:
             facturas_info: Lista de información de facturas procesadas
             partida_dir: Directorio de la partida
             datos_comunes: Datos comunes para las plantillas
-            datos_partida: Datos específicos de la partida, incluidos montos totales
+            info_facturas: Totales ya calculados de la partida (se calculan si no se indican)
         """
         try:
             self.ui.update_status(f"Generando relación de facturas para partida {partida['numero']}...")
 
             # Importar el módulo de plantillas de partidas
-            from generators.plantillas_partidas import procesar_plantillas_partida, calcular_montos_facturas
+            from generators.plantillas_partidas import procesar_plantillas_partida
 
-            # Preparar datos comunes para las plantillas (hacer una copia para no modificar el original)
-            datos_comunes_copia = datos_comunes.copy()
-            
-            # Si se proporcionaron datos específicos de la partida, utilizarlos
-            if datos_partida and 'monto_total' in datos_partida:
-                info_facturas = {
-                    'total_facturas': len(facturas_info),
-                    'monto_total': datos_partida['monto_total'],
-                    'monto_formateado': datos_partida['monto_total_formateado'],
-                    'montos_individuales': [f.get('monto_decimal', Decimal('0.00')) for f in facturas_info if isinstance(f, dict)]
-                }
-                self.ui.update_status(f"  - Usando monto total proporcionado: {datos_partida['monto_total_formateado']}")
-            else:
+            if info_facturas is None:
                 # Calcular información resumida de facturas (totales, montos, etc.)
-                info_facturas = calcular_montos_facturas(facturas_info)
-                self.ui.update_status(f"  - Calculados totales para {info_facturas['total_facturas']} facturas. "
-                                f"Monto total: {info_facturas['monto_formateado']}")
+                info_facturas = calcular_totales(facturas_info)
+            self.ui.update_status(f"  - Calculados totales para {info_facturas['total_facturas']} facturas. "
+                            f"Monto total: {info_facturas['monto_formateado']}")
 
-            # Añadir la información resumida a los datos comunes
-            datos_comunes_copia['info_facturas'] = info_facturas
+            # Añadir la información resumida a una copia ligera de los datos comunes
+            datos_comunes_copia = datos_comunes.con_info_facturas(info_facturas)
 
             # Procesar todas las plantillas de la partida
             self.ui.update_status("Procesando plantillas de documentos...")
@@ -9,8 +9,23 @@ from datetime import datetime
 from decimal import Decimal
 
 # Importaciones internas
-from utils.formatters import convert_fecha_to_texto
+from config import (
+    APP_CONFIG, RECONCILIACION_CONFIG, PLANTILLAS_CONFIG, EXPORTACION_CONFIG, UUID_CONFIG, DIARIO_CONFIG
+)
+from utils.conversion_cache import conversion_cache
+from utils.formatters import convert_fecha_to_texto, format_monto
+from utils.memory_profiler import MemoryProfiler
+from utils.run_export import RunExporter
+from utils.scratch_space import scratch_space
+from utils.staging import staging
+from utils.watchdog import watchdog
 from core.excel_reader import ExcelReader
+from core.job_journal import JobJournal
+from core.models import DatosComunes
+from core.reconciliation import ReconciliationEngine
+from core.template_registry import template_registry
+from core.uuid_index import UUIDIndex, periodo_corrida
+from generators.legalizacion_pdf import fragment_renderer
 from controllers.partida_controller import PartidaController
 
 logger = logging.getLogger(__name__)
@@ -39,6 +54,27 @@ class ProcessController:
         # Variables para tiempo de procesamiento
         self.tiempo_inicio = None
         self.tiempos_operaciones = {}
+        self.cpu_inicio = None
+        
+        # Perfilado de memoria (opcional)
+        self.memory_profiler = None
+        
+        # Exportación consolidada de la corrida
+        self.exportador = None
+        
+        # Diario de avance para reanudar corridas interrumpidas
+        self.diario = None
+        
+        # Conciliación de montos previa a la generación
+        self.reconciliation_engine = ReconciliationEngine()
+        self.conciliacion = None
+        
+        # Índice de UUID de las facturas (duplicados y reutilizadas de otros periodos)
+        self.indice_uuid = None
+        self.omitidas_uuid = set()
+        
+        # Registro de plantillas (se carga al iniciar cada procesamiento)
+        self.template_registry = template_registry
         
     def iniciar_procesamiento(self, datos_interfaz):
         """
@@ -52,20 +88,78 @@ class ProcessController:
         self.facturas_con_error = 0
         self.partidas_procesadas = 0
         
-        # Reiniciar medición de tiempo
+        # Reiniciar medición de tiempo y métricas de supervisión
         self.medir_tiempo(None, True)
+        watchdog.reiniciar_metricas()
+        staging.reiniciar_metricas()
+        conversion_cache.reiniciar_estadisticas()
+        fragment_renderer.reiniciar()
+        self.cpu_inicio = time.process_time()
+        
+        # Espacio temporal de la corrida (se elimina completo al terminar)
+        scratch_space.iniciar()
         
+        # Activar el perfilado de memoria si está configurado
+        if APP_CONFIG.get('perfil_memoria', False):
+            self.memory_profiler = MemoryProfiler(self.ui, top=APP_CONFIG.get('perfil_memoria_top', 10))
+            self.memory_profiler.iniciar()
+        else:
+            self.memory_profiler = None
+        self.partida_controller.set_memory_profiler(self.memory_profiler)
+        
+        # Avisar en la interfaz de las plantillas recargadas solo mientras dura la corrida
+        self.template_registry.agregar_hook_recarga(self._plantilla_recargada)
+        
+        estado_corrida = 'interrumpida'
         try:
             # Completar datos comunes con información procesada
             datos_comunes = self._preparar_datos_comunes(datos_interfaz)
             
+            # Resolver y validar las plantillas una sola vez
+            self._cargar_plantillas()
+            
             # Procesar el archivo Excel
             self.ui.update_status("Leyendo archivo Excel de partidas...")
-            partidas = self.excel_reader.read_partidas(datos_comunes['excel_path'])
+            if self.memory_profiler:
+                with self.memory_profiler.medir_etapa("Lectura de Excel"):
+                    partidas = self.excel_reader.read_partidas(datos_comunes['excel_path'])
+            else:
+                partidas = self.excel_reader.read_partidas(datos_comunes['excel_path'])
             self.medir_tiempo("Lectura de Excel")
             
             self.ui.update_status(f"Se encontraron {len(partidas)} partidas en el archivo.", "success")
             
+            # Abrir la exportación consolidada (se escribe factura por factura)
+            self._iniciar_exportacion(datos_comunes['base_dir'])
+            
+            # Abrir el diario de avance (y reanudar la corrida anterior si se pidió)
+            self._abrir_diario(
+                datos_comunes,
+                datos_interfaz.get('reanudar', DIARIO_CONFIG.get('reanudar', False))
+            )
+            
+            # Escanear los XML una sola vez: índice de UUID y conciliación de montos
+            facturas_escaneadas = None
+            conciliar = RECONCILIACION_CONFIG.get('conciliar_antes_de_generar', True)
+            if conciliar or UUID_CONFIG.get('habilitado', True):
+                facturas_escaneadas = self._escanear_facturas(partidas, datos_comunes)
+            
+            # Revisar UUID duplicados o reutilizados antes de generar cualquier documento
+            if self.indice_uuid is not None:
+                if not self._revisar_uuids():
+                    self.ui.update_status("Procesamiento cancelado por facturas duplicadas.", "error")
+                    estado_corrida = 'cancelada'
+                    return
+                if self.omitidas_uuid:
+                    facturas_escaneadas = [f for f in facturas_escaneadas if f['xml_path'] not in self.omitidas_uuid]
+            
+            # Conciliar montos antes de generar cualquier documento
+            if conciliar:
+                if not self._conciliar_montos(partidas, datos_comunes['base_dir'], facturas_escaneadas):
+                    self.ui.update_status("Procesamiento cancelado por discrepancias en la conciliación.", "error")
+                    estado_corrida = 'cancelada'
+                    return
+            
             # Procesar cada partida secuencialmente
             for i, partida in enumerate(partidas, 1):
                 self.ui.update_status(f"\n--- Procesando partida {i}/{len(partidas)}: {partida['numero']} ---")
@@ -77,17 +171,28 @@ class ProcessController:
                     self.ui.update_status(f"Directorio para partida {partida['numero']} no encontrado.", "warning")
                     continue
                 
+                # Recargar las plantillas que se hayan modificado durante el proceso
+                if PLANTILLAS_CONFIG.get('verificar_cambios', True):
+                    self.template_registry.verificar_cambios()
+                
                 # Procesar la partida
                 resultado_partida = self.partida_controller.procesar_partida(
                     partida, partida_dir, datos_comunes
                 )
                 
+                if self.memory_profiler:
+                    self.memory_profiler.snapshot_partida(partida['numero'])
+                
                 if resultado_partida:
                     self.partidas_procesadas += 1
                     self.facturas_procesadas += resultado_partida.get('facturas_procesadas', 0)
                     self.facturas_con_error += resultado_partida.get('facturas_con_error', 0)
+            
+            # Guardar los UUID del periodo para detectar su reutilización en otros meses
+            self._guardar_indice_uuid()
                     
             # Proceso completado
+            estado_corrida = 'completada'
             self._mostrar_resumen_final()
             
         except Exception as e:
@@ -95,9 +200,267 @@ class ProcessController:
             logger.exception("Error no controlado en el procesamiento")
             messagebox.showerror("Error", f"Error durante el procesamiento: {str(e)}")
         finally:
+            # Cerrar la exportación y generar su resumen
+            self._cerrar_exportacion()
+            
+            # Registrar el fin de la corrida en el diario
+            self._cerrar_diario(estado_corrida)
+            
+            # Eliminar el espacio temporal de la corrida
+            scratch_space.cerrar()
+            
+            # Terminar los procesos trabajadores de las etapas supervisadas
+            watchdog.cerrar()
+            
+            # Quitar el aviso de plantillas recargadas del registro compartido
+            self.template_registry.quitar_hook_recarga(self._plantilla_recargada)
+            
+            # Detener el perfilado de memoria
+            if self.memory_profiler:
+                self.memory_profiler.detener()
+            
             # Restaurar interfaz
             self.ui.set_processing_state(False)
     
+    def _iniciar_exportacion(self, base_dir):
+        """
+        Crea la exportación consolidada de la corrida si está habilitada
+        
+        Args:
+            base_dir: Directorio base de las partidas
+        """
+        self.exportador = None
+        if EXPORTACION_CONFIG.get('habilitado', True):
+            try:
+                self.exportador = RunExporter(
+                    EXPORTACION_CONFIG.get('directorio') or os.path.join(base_dir, "exportacion"),
+                    formato=EXPORTACION_CONFIG.get('formato', 'csv'),
+                    resumen_xlsx=EXPORTACION_CONFIG.get('resumen_xlsx', True),
+                    lote_parquet=EXPORTACION_CONFIG.get('lote_parquet', 500)
+                )
+            except OSError as e:
+                self.ui.update_status(f"No se pudo crear la exportación de facturas: {str(e)}", "warning")
+        self.partida_controller.set_exportador(self.exportador)
+    
+    def _cerrar_exportacion(self):
+        """
+        Cierra la exportación consolidada e informa las rutas generadas
+        """
+        if not self.exportador:
+            return
+        try:
+            resultado = self.exportador.cerrar()
+            self.ui.update_status(f"Exportación de {resultado['filas']} facturas: {resultado['datos']}", "success")
+            if resultado['resumen']:
+                self.ui.update_status(f"Resumen de la exportación: {resultado['resumen']}", "success")
+        except Exception as e:
+            self.ui.update_status(f"Error al cerrar la exportación de facturas: {str(e)}", "warning")
+        finally:
+            self.exportador = None
+            self.partida_controller.set_exportador(None)
+    
+    def _abrir_diario(self, datos_comunes, reanudar=False):
+        """
+        Abre el diario de avance del directorio base
+        
+        Args:
+            datos_comunes: Datos comunes (directorio base y datos que se comparan al reanudar)
+            reanudar: Si es True se omiten las facturas completadas en la corrida anterior
+        """
+        self.diario = None
+        if DIARIO_CONFIG.get('habilitado', True):
+            try:
+                self.diario = JobJournal.en_directorio(datos_comunes['base_dir'], DIARIO_CONFIG.get('archivo', 'diario_proceso.sqlite'))
+                if reanudar:
+                    estado = self.diario.resumen()
+                    self.ui.update_status(
+                        f"Reanudando la corrida anterior: {estado.get(('factura', 'completado'), 0)} facturas completadas "
+                        f"se omitirán si su XML y los datos no cambiaron; {estado.get(('factura', 'error'), 0)} con error y "
+                        f"{estado.get(('factura', 'en_curso'), 0)} interrumpidas se volverán a procesar."
+                    )
+                self.diario.iniciar_corrida(reanudada=reanudar, datos_comunes=datos_comunes)
+            except Exception as e:
+                self.ui.update_status(f"No se pudo abrir el diario de avance: {str(e)}", "warning")
+                self.diario = None
+        self.partida_controller.set_diario(self.diario, reanudar)
+    
+    def _cerrar_diario(self, estado):
+        """
+        Registra el estado final de la corrida y cierra el diario
+        
+        Args:
+            estado: 'completada', 'cancelada' o 'interrumpida'
+        """
+        if not self.diario:
+            return
+        try:
+            self.diario.terminar_corrida(estado)
+            self.diario.cerrar()
+        except Exception as e:
+            logger.warning(f"Error al cerrar el diario de avance: {str(e)}")
+        finally:
+            self.diario = None
+            self.partida_controller.set_diario(None)
+    
+    def _cargar_plantillas(self):
+        """
+        Carga el registro de plantillas e informa las que no son válidas
+        """
+        self.ui.update_status("Cargando plantillas...")
+        self.template_registry.cargar()
+        for estado in self.template_registry.resumen():
+            if estado['error']:
+                self.ui.update_status(f"  - {estado['error']}", "error")
+            elif estado['marcadores_faltantes']:
+                self.ui.update_status(
+                    f"  - La plantilla {os.path.basename(estado['ruta'])} no contiene: "
+                    f"{', '.join(estado['marcadores_faltantes'])}",
+                    "warning"
+                )
+        self.medir_tiempo("Carga de plantillas")
+    
+    def _plantilla_recargada(self, manifiesto):
+        """
+        Informa en la interfaz que una plantilla modificada se volvió a cargar
+        
+        Args:
+            manifiesto: ManifiestoPlantilla recargado
+        """
+        self.ui.update_status(f"Plantilla modificada, se volvió a cargar: {manifiesto.archivo}", "warning")
+    
+    def _escanear_facturas(self, partidas, datos_comunes):
+        """
+        Lee la cabecera de todos los XML y registra sus UUID en el índice
+        
+        Args:
+            partidas: Partidas leídas del Excel
+            datos_comunes: Datos comunes (directorio base, mes asignado y fecha)
+            
+        Returns:
+            list: Filas del escaneo (ver ReconciliationEngine.escanear)
+        """
+        self.indice_uuid = None
+        self.omitidas_uuid = set()
+        self.partida_controller.set_omitidas(self.omitidas_uuid)
+        self.xml_completados = set()
+        self.partida_controller.set_completadas(self.xml_completados)
+        
+        if UUID_CONFIG.get('habilitado', True):
+            # El índice vive en el directorio base, como el diario (una ruta absoluta se usa tal cual)
+            archivo_indice = UUID_CONFIG.get('archivo_indice')
+            if archivo_indice:
+                archivo_indice = os.path.join(datos_comunes['base_dir'], archivo_indice)
+            self.indice_uuid = UUIDIndex(
+                archivo_indice,
+                periodo_corrida(datos_comunes['mes_asignado'], datos_comunes['fecha_documento'])
+            )
+            registrados = self.indice_uuid.cargar()
+            if registrados:
+                self.ui.update_status(f"Índice de UUID cargado: {registrados} facturas de periodos anteriores.")
+        
+        self.ui.update_status("Escaneando facturas XML...")
+        facturas = self.reconciliation_engine.escanear(datos_comunes['base_dir'], partidas, self.indice_uuid)
+        self.medir_tiempo("Escaneo de facturas")
+        return facturas
+    
+    def _revisar_uuids(self):
+        """
+        Informa las facturas duplicadas o reutilizadas y decide si se omiten
+        
+        Returns:
+            bool: True si se debe continuar con la generación de documentos
+        """
+        incidencias = self.indice_uuid.incidencias
+        if not incidencias:
+            self.ui.update_status(f"Sin UUID duplicados: {len(self.indice_uuid)} facturas únicas.", "success")
+            return True
+        
+        self.ui.update_status(f"Se encontraron {len(incidencias)} facturas con UUID repetido:", "warning")
+        for incidencia in incidencias:
+            previo = f"partida {incidencia['partida_previa']}"
+            if incidencia['tipo'] == 'reutilizado':
+                previo += f", periodo {incidencia['periodo_previo']}"
+            self.ui.update_status(
+                f"  - Partida {incidencia['partida']}: {incidencia['descripcion']} "
+                f"({incidencia['uuid']}, {os.path.basename(incidencia['xml_path'])}; antes en {previo})",
+                "warning"
+            )
+        
+        accion = UUID_CONFIG.get('accion_duplicado', 'preguntar')
+        if accion == 'preguntar':
+            respuesta = messagebox.askyesnocancel(
+                "Facturas duplicadas",
+                f"Se encontraron {len(incidencias)} facturas con un UUID que ya aparece en esta corrida "
+                "o en un periodo anterior.\nRevise el registro para ver el detalle.\n\n"
+                "Sí: omitir esas facturas\nNo: procesarlas de todos modos\nCancelar: detener el proceso"
+            )
+            accion = {True: 'omitir', False: 'continuar'}.get(respuesta, 'abortar')
+        
+        if accion == 'abortar':
+            return False
+        if accion == 'omitir':
+            self.omitidas_uuid.update(self.indice_uuid.archivos_con_incidencia())
+            self.ui.update_status(f"Se omitirán {len(self.omitidas_uuid)} facturas con UUID repetido.", "warning")
+        return True
+    
+    def _guardar_indice_uuid(self):
+        """
+        Guarda en el índice persistente los UUID de las facturas procesadas correctamente
+        """
+        if self.indice_uuid is None:
+            return
+        try:
+            self.indice_uuid.guardar(self.xml_completados)
+        except OSError as e:
+            self.ui.update_status(f"No se pudo guardar el índice de UUID: {str(e)}", "warning")
+    
+    def _conciliar_montos(self, partidas, base_dir, facturas):
+        """
+        Concilia los totales de los XML escaneados contra el Excel
+        
+        Args:
+            partidas: Partidas leídas del Excel
+            base_dir: Directorio base con una carpeta por partida
+            facturas: Filas del escaneo de los XML
+            
+        Returns:
+            bool: True si se debe continuar con la generación de documentos
+        """
+        self.ui.update_status("Conciliando montos de partidas y facturas...")
+        self.conciliacion = self.reconciliation_engine.conciliar(partidas, facturas, base_dir)
+        self.medir_tiempo("Conciliación de montos")
+        
+        for resumen in self.conciliacion['partidas']:
+            self.ui.update_status(
+                f"  - Partida {resumen['partida']}: {resumen['num_facturas']} facturas, "
+                f"total {format_monto(resumen['monto_total'])}, asignado {format_monto(resumen['monto_asignado'])}, "
+                f"aportación {format_monto(resumen['aportacion'])}"
+            )
+        
+        discrepancias = self.conciliacion['discrepancias']
+        if not discrepancias:
+            self.ui.update_status(f"Conciliación correcta: {len(facturas)} facturas revisadas.", "success")
+            return True
+        
+        self.ui.update_status(f"Se encontraron {len(discrepancias)} discrepancias en la conciliación:", "warning")
+        for discrepancia in discrepancias:
+            self.ui.update_status(
+                f"  - Partida {discrepancia['partida']}: {discrepancia['descripcion']} "
+                f"(variación {format_monto(discrepancia['variacion'])})",
+                "warning"
+            )
+        
+        accion = RECONCILIACION_CONFIG.get('accion_discrepancia', 'preguntar')
+        if accion == 'continuar':
+            return True
+        if accion == 'abortar':
+            return False
+        return messagebox.askyesno(
+            "Discrepancias en la conciliación",
+            f"Se encontraron {len(discrepancias)} discrepancias entre el Excel y las facturas.\n"
+            "Revise el registro para ver el detalle.\n\n¿Desea continuar con la generación de documentos?"
+        )
+    
     def _preparar_datos_comunes(self, datos_interfaz):
         """
         Prepara y completa los datos comunes para el procesamiento
@@ -106,22 +469,17 @@ class ProcessController:
             datos_interfaz: Datos recopilados de la interfaz
             
         Returns:
-            dict: Datos comunes completos para el procesamiento
+            DatosComunes: Datos comunes completos para el procesamiento
         """
         # Convertir fecha a formato de texto
         try:
             fecha_documento_texto = convert_fecha_to_texto(datos_interfaz['fecha_documento'])
         except ValueError as e:
             self.ui.update_status(f"Error en formato de fecha: {str(e)}", "error")
-            return datos_interfaz
+            fecha_documento_texto = ''
 
-        # Crear diccionario completo
-        datos_comunes = {
-            **datos_interfaz,  # Incluir todos los datos originales
-            'fecha_documento_texto': fecha_documento_texto,
-        }
-        
-        return datos_comunes
+        # Crear el registro de datos comunes (la fecha del mensaje se calcula una sola vez)
+        return DatosComunes.desde_interfaz(datos_interfaz, fecha_documento_texto)
         
     def medir_tiempo(self, operacion, reiniciar=False):
         """
@@ -162,6 +520,16 @@ class ProcessController:
         self.ui.update_status(f"Total facturas procesadas: {self.facturas_procesadas}")
         self.ui.update_status(f"Facturas con error: {self.facturas_con_error}")
         self.ui.update_status(f"Tiempo total de procesamiento: {tiempo_total:.2f} segundos")
+        if self.cpu_inicio is not None:
+            self.ui.update_status(f"Tiempo de CPU del proceso: {time.process_time() - self.cpu_inicio:.2f} segundos")
+        
+        # E/S de red del modo staging (aparte del tiempo de generación)
+        for operacion, valores in staging.resumen().items():
+            self.ui.update_status(
+                f"E/S de red ({operacion}): {valores['archivos']} archivos, "
+                f"{valores['bytes'] / 1048576:.2f} MB en {valores['segundos']:.2f} segundos",
+                "time"
+            )
 
         # Mostrar tiempos por tipo de operación
         if self.tiempos_operaciones:
@@ -171,6 +539,56 @@ class ProcessController:
                     porcentaje = (tiempo / tiempo_total) * 100
                     self.ui.update_status(f"  - {operacion}: {tiempo:.2f} segundos ({porcentaje:.1f}%)", "time")
 
+        # Métricas de la supervisión de etapas externas
+        metricas = watchdog.resumen()
+        if metricas:
+            self.ui.update_status("\nSupervisión de etapas externas:")
+            for etapa, valores in metricas.items():
+                incidencias = valores['timeouts'] or valores['reintentos'] or valores['fallidas']
+                self.ui.update_status(
+                    f"  - {etapa}: {valores['exitos']}/{valores['ejecuciones']} correctas, "
+                    f"{valores['timeouts']} tiempos agotados, {valores['terminados']} procesos terminados, "
+                    f"{valores['reintentos']} reintentos, {valores['fallidas']} fallidas",
+                    "warning" if incidencias else "time"
+                )
+
+        # Caché de conversiones DOCX -> PDF
+        cache = conversion_cache.resumen()
+        if cache['tasa_aciertos'] is not None:
+            self.ui.update_status(
+                f"\nCaché de conversión a PDF: {cache['aciertos']} aciertos, {cache['fallos']} fallos "
+                f"({cache['tasa_aciertos'] * 100:.1f}% de aciertos), {cache['desalojados']} desalojados",
+                "time"
+            )
+        
+        # Hojas de legalización generadas por fragmentos
+        fragmentos = fragment_renderer.resumen()
+        if fragmentos['hojas']:
+            self.ui.update_status(
+                f"\nHojas de legalización en PDF: {fragmentos['hojas']} hojas en {fragmentos['segundos_hojas']:.2f} segundos "
+                f"({fragmentos['fragmentos']} partes fijas en {fragmentos['segundos_fragmentos']:.2f} segundos)",
+                "time"
+            )
+        
+        # Espacio temporal ocupado por etapa
+        espacio = scratch_space.resumen()
+        if espacio:
+            self.ui.update_status("\nEspacio temporal por etapa:")
+            for etapa, valores in sorted(espacio.items()):
+                self.ui.update_status(
+                    f"  - {etapa}: {valores['bytes'] / (1024 * 1024):.1f} MB en {valores['directorios']} directorios "
+                    f"(máximo {valores['pico_bytes'] / (1024 * 1024):.1f} MB)",
+                    "time"
+                )
+            if scratch_space.desbordes:
+                self.ui.update_status(
+                    f"  El espacio temporal superó su límite {scratch_space.desbordes} veces", "warning"
+                )
+        
+        # Mostrar perfil de memoria si está activo
+        if self.memory_profiler:
+            self.memory_profiler.print_summary()
+
         # Mensaje final
         mensaje_final = f"Proceso completado. {self.facturas_procesadas} facturas procesadas en {self.partidas_procesadas} partidas."
         self.ui.update_status(mensaje_final, "success")
@@ -1,8 +1,26 @@
 # Módulo core
 # Este módulo contiene las clases principales que forman el núcleo de la aplicación
 
+from .models import Partida, Factura, FacturaResult, DatosComunes, VistaPlantilla
 from .excel_reader import ExcelReader
 from .xml_processor import XMLProcessor
 from .document_generator import DocumentGenerator
+from .reconciliation import ReconciliationEngine
+from .template_registry import TemplateRegistry
+from .uuid_index import UUIDIndex
+from .job_journal import JobJournal
 
-__all__ = ['ExcelReader', 'XMLProcessor', 'DocumentGenerator']
+__all__ = [
+    'ExcelReader',
+    'XMLProcessor',
+    'DocumentGenerator',
+    'ReconciliationEngine',
+    'TemplateRegistry',
+    'UUIDIndex',
+    'JobJournal',
+    'Partida',
+    'Factura',
+    'FacturaResult',
+    'DatosComunes',
+    'VistaPlantilla'
+]
@@ -2,12 +2,21 @@
 Clase para generar documentos Word y PDF a partir de datos XML procesados.
 """
 import os
+import time
 import logging
+from contextlib import nullcontext
 from pathlib import Path
 
 # Importar las funciones específicas de cada módulo
+from config import LEGALIZACION_PDF_CONFIG, LISTADO_XML_CONFIG, SCRATCH_CONFIG
 from generators.creacionDocumentos import creacionDocumentos
-from utils.web_utils import descargar_verificacion
+from generators.legalizacion_pdf import HOJAS_LEGALIZACION, crear_legalizacion_pdf
+from generators.listado_xml import crear_listado_xml
+from core.template_registry import template_registry
+from utils.artifact_registry import artifact_registry
+from utils.web_utils import descargar_verificacion, limpiar_descargas
+from utils.scratch_space import scratch_space
+from utils.watchdog import watchdog, EtapaAgotadaError
 from factura_pdf_processor import FacturaPDFProcessor 
 
 class DocumentGenerator:
@@ -26,6 +35,7 @@ class DocumentGenerator:
         self.ui = ui
         self.logger = logging.getLogger(__name__)
         self.pdf_processor = FacturaPDFProcessor(ui)
+        self.memory_profiler = None
         
         # Configurar el logging básico si no está configurado
         if not logging.getLogger().handlers:
@@ -51,13 +61,43 @@ class DocumentGenerator:
         else:
             self.logger.info(message)
             
-    def generate_docx_documents(self, data, output_dir):
+    def _etapa_memoria(self, etapa):
+        """
+        Devuelve el contexto de medición de memoria de una etapa.
+        
+        Args:
+            etapa (str): Nombre de la etapa
+        """
+        if self.memory_profiler:
+            return self.memory_profiler.medir_etapa(etapa)
+        return nullcontext()
+    
+    def _directorio_pdfs(self, output_dir):
+        """
+        Devuelve el contexto del directorio donde se convierten los PDF intermedios.
+        
+        Con SCRATCH_CONFIG['pdfs_intermedios'] es un directorio del espacio
+        temporal de la corrida que se elimina al terminar de combinar; si no,
+        la carpeta 'pdfs' junto a los documentos de la factura.
+        
+        Args:
+            output_dir (str): Directorio de los documentos de la factura
+        """
+        if SCRATCH_CONFIG.get('pdfs_intermedios', True):
+            return scratch_space.temporal('pdfs_intermedios')
+        
+        pdf_dir = os.path.join(output_dir, "pdfs")
+        os.makedirs(pdf_dir, exist_ok=True)
+        return nullcontext(pdf_dir)
+            
+    def generate_docx_documents(self, data, output_dir, errores=None):
         """
         Genera documentos DOCX para una factura.
         
         Args:
             data (dict): Datos extraídos del XML
             output_dir (str): Directorio donde se guardarán los documentos
+            errores (list, optional): Lista donde se agregan los errores por plantilla
             
         Returns:
             dict: Diccionario con las rutas a los documentos generados
@@ -70,38 +110,38 @@ class DocumentGenerator:
             # Crear diccionario para guardar las rutas de los documentos generados
             generated_files = {}
             
-            # Lista de nombres de plantillas
-            template_files = [
-                'legalizacion_factura.docx',
-                'legalizacion_verificacion.docx',
-                'legalizacion_xmls.docx',
-                'xml.docx'
-            ]
-            
-            # Directorio base de plantillas
-            templates_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plantillas")
-            
-            # Procesar cada plantilla
-            for template_file in template_files:
-                template_path = os.path.join(templates_dir, template_file)
-                template_name = template_file.replace('.docx', '').replace('_', ' ')
+            # Plantillas de factura resueltas una sola vez en el registro
+            for manifiesto in template_registry.plantillas_grupo('factura'):
+                template_path = manifiesto.ruta
+                template_name = manifiesto.clave.replace('_', ' ')
                 
                 self.logger.info(f"Generando {template_name}...")
                 try:
                     # Verificar que la plantilla existe
-                    if not os.path.exists(template_path):
-                        self.logger.error(f"No se encontró la plantilla: {template_path}")
+                    if not manifiesto.encontrada:
+                        self.logger.error(manifiesto.error)
+                        if errores is not None:
+                            errores.append(manifiesto.error)
                         continue
                         
-                    # Generar el documento usando la misma función para todas las plantillas
-                    generated_file = creacionDocumentos(template_path, output_dir, data, template_name)
+                    # El listado del XML y las hojas de legalización en PDF tienen su propio generador;
+                    # el resto usa la misma función
+                    if manifiesto.clave == 'xml' and LISTADO_XML_CONFIG.get('habilitado', True):
+                        generated_file = crear_listado_xml(template_path, output_dir, data, template_name)
+                    elif (manifiesto.clave in HOJAS_LEGALIZACION
+                          and LEGALIZACION_PDF_CONFIG.get('salida_pdf_directa', False)):
+                        generated_file = crear_legalizacion_pdf(template_path, output_dir, data, template_name, manifiesto.clave)
+                    else:
+                        generated_file = creacionDocumentos(template_path, output_dir, data, template_name)
                     
                     
-                    generated_files[template_file.replace('.docx', '')] = generated_file
+                    generated_files[manifiesto.clave] = generated_file
                     self.logger.info(f"✓ {template_name.capitalize()} generado correctamente")
                     
                 except Exception as e:
                     self.logger.error(f"Error al generar {template_name}: {str(e)}")
+                    if errores is not None:
+                        errores.append(f"Error al generar {template_name}: {str(e)}")
             
             return generated_files
 
@@ -118,23 +158,44 @@ class DocumentGenerator:
             output_dir (str): Directorio donde se guardarán los documentos
             
         Returns:
-            dict: Diccionario con las rutas a los documentos generados
+            dict: Rutas a los documentos generados, más 'errores' y 'tiempos' por etapa
         """
+        errores = []
+        tiempos = {}
         try:
             # Paso 1: Descargar verificación del SAT si está configurado
-            self.update_status("Intentando descargar verificación del SAT...")
-            try:
-                descargar_verificacion(data, output_dir)
-            except Exception as e:
-                self.logger.warning(f"No se pudo descargar verificación del SAT: {str(e)}")
+            # (una corrida anterior o reanudada pudo haberla registrado ya en la carpeta)
+            if artifact_registry.buscar(output_dir, 'verificacion_sat', data['Folio_Fiscal']):
+                self.update_status("Verificación del SAT ya descargada")
+            else:
+                self.update_status("Intentando descargar verificación del SAT...")
+                try:
+                    # Solo los campos del formulario, para enviarlos al proceso supervisado
+                    datos_verificacion = {
+                        clave: data[clave] for clave in ('Serie', 'Numero', 'Folio_Fiscal', 'Rfc_emisor', 'Rfc_receptor')
+                    }
+                    watchdog.ejecutar('verificacion_sat', descargar_verificacion, datos_verificacion, output_dir)
+                except Exception as e:
+                    # Si el intento se mató por tiempo, su directorio de descarga sigue en la carpeta
+                    limpiar_descargas(output_dir, data['Folio_Fiscal'])
+                    self.logger.warning(f"No se pudo descargar verificación del SAT: {str(e)}")
+                    errores.append(f"Verificación del SAT: {str(e)}")
             
             # Paso 2: Generar documentos DOCX
             self.update_status("Generando documentos Word...")
-            docx_files = self.generate_docx_documents(data, output_dir)
+            inicio = time.perf_counter()
+            with self._etapa_memoria("Documentos Word"):
+                docx_files = self.generate_docx_documents(data, output_dir, errores)
+            tiempos['documentos_word'] = time.perf_counter() - inicio
+            
+            # El texto completo del XML solo se necesita para llenar las plantillas;
+            # liberarlo aquí evita retenerlo durante la etapa de PDFs
+            data.pop('xml', None)
             
             if not docx_files:
                 self.update_status("No se generaron documentos Word", "error")
-                return {}
+                errores.append("No se generaron documentos Word")
+                return {'errores': errores, 'tiempos': tiempos}
             
             # Paso 3: Procesar PDFs
             self.update_status("Procesando documentos PDF...")
@@ -145,23 +206,24 @@ class DocumentGenerator:
                 # Si no tenemos la ruta del XML, asumimos que está en el directorio de salida
                 xml_dir = output_dir
                 
-            # Crear directorio para PDFs si no existe
-            pdf_dir = os.path.join(output_dir, "pdfs")
-            if not os.path.exists(pdf_dir):
-                os.makedirs(pdf_dir)
-                
             # Procesar PDFs para generar documento combinado
-            pdf_results = self.pdf_processor.process_factura_pdfs(
-                os.path.join(xml_dir, "factura.xml"),  # Asumimos este nombre si no tenemos la ruta real
-                pdf_dir,
-                docx_files
-            )
+            inicio = time.perf_counter()
+            with self._directorio_pdfs(output_dir) as pdf_dir, self._etapa_memoria("Documentos PDF"):
+                pdf_results = self.pdf_processor.process_factura_pdfs(
+                    os.path.join(xml_dir, "factura.xml"),  # Asumimos este nombre si no tenemos la ruta real
+                    pdf_dir,
+                    docx_files,
+                    uuid=data.get('Folio_Fiscal')
+                )
+            tiempos['documentos_pdf'] = time.perf_counter() - inicio
             
             # Combinar resultados de documentos DOCX y PDF
             results = {
                 'docx_files': docx_files,
                 'pdf_processed': False,
-                'pdf_files': {}
+                'pdf_files': {},
+                'errores': errores,
+                'tiempos': tiempos
             }
             
             if pdf_results:
@@ -170,11 +232,19 @@ class DocumentGenerator:
                 self.update_status("Procesamiento de PDFs completado con éxito", "success")
             else:
                 self.update_status("No se completó el procesamiento de PDFs", "warning")
+                errores.append("No se completó el procesamiento de PDFs")
             
             return results
 
+        except EtapaAgotadaError as e:
+            # Una conversión que sigue colgándose después de los reintentos hace fallar la factura
+            self.logger.error(str(e))
+            errores.append(str(e))
+            return {'error': str(e), 'errores': errores, 'tiempos': tiempos, 'fallida': True}
+
         except Exception as e:
             self.logger.error(f"Error general en la generación de documentos: {str(e)}")
             import traceback
             traceback.print_exc()
-            return {'error': str(e)}
\ No newline at end of file
+            errores.append(str(e))
+            return {'error': str(e), 'errores': errores, 'tiempos': tiempos}
\ No newline at end of file
@@ -2,6 +2,8 @@ import pandas as pd
 import os
 import logging
 
+from core.models import Partida
+
 class ExcelReader:
     """
     Clase para leer archivos Excel con formato específico.
@@ -28,7 +30,7 @@ class ExcelReader:
             excel_path (str): Ruta al archivo Excel
             
         Returns:
-            list: Lista de diccionarios con detalles de partidas
+            list: Lista de registros Partida con detalles de partidas
         """
         try:
             # Verificar que el archivo existe
@@ -93,12 +95,12 @@ class ExcelReader:
                         numero = str(numero).strip()
                     
                     # Crear objeto partida
-                    partida = {
-                        'numero': partida_num,
-                        'descripcion': descripcion,
-                        'monto': float(monto),
-                        'numero_adicional': numero
-                    }
+                    partida = Partida(
+                        numero=partida_num,
+                        descripcion=descripcion,
+                        monto=monto,
+                        numero_adicional=numero
+                    )
                     partidas.append(partida)
                     
                 except Exception as e:
@@ -0,0 +1,434 @@
+"""
+Diario persistente del avance de una corrida (SQLite en el directorio base).
+
+Cada cambio de etapa de una partida o factura se guarda en su propia
+transacción, así que si Word se cuelga o se cierra la aplicación a mitad del
+proceso, el diario conserva qué quedó terminado. Al reanudar, las facturas
+completadas (con sus documentos en disco) se toman del diario sin volver a
+generarse y solo se reintentan las que fallaron o quedaron en curso. Junto
+con cada trabajo completado se guarda la huella de su XML y de los datos que
+usan sus documentos (mes, fecha del documento y personal de la corrida, y el
+registro de la partida en el Excel); si alguna cambió, el trabajo se vuelve
+a procesar.
+"""
+import os
+import json
+import hashlib
+import sqlite3
+import logging
+import threading
+from dataclasses import fields
+from datetime import datetime
+from decimal import Decimal
+
+from core.models import FacturaResult
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_DIARIO = "diario_proceso.sqlite"
+
+# Estados de un trabajo
+EN_CURSO = 'en_curso'
+COMPLETADO = 'completado'
+ERROR = 'error'
+
+# Datos de la corrida que cambian el contenido de los documentos
+CAMPOS_HUELLA_DATOS = ('mes_asignado', 'fecha_documento', 'personal_recibio', 'personal_vobo')
+
+# Campos del registro de la partida (Excel) que usan las plantillas de factura y de partida
+CAMPOS_HUELLA_PARTIDA = ('numero', 'descripcion', 'monto', 'numero_adicional')
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS corridas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    inicio TEXT NOT NULL,
+    fin TEXT,
+    estado TEXT NOT NULL,
+    reanudada INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS trabajos (
+    tipo TEXT NOT NULL,
+    partida TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    etapa TEXT,
+    resultado TEXT,
+    error TEXT,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    corrida INTEGER,
+    actualizado TEXT NOT NULL,
+    huella_xml TEXT,
+    huella_datos TEXT,
+    PRIMARY KEY (tipo, partida, clave)
+);
+CREATE TABLE IF NOT EXISTS transiciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    corrida INTEGER,
+    tipo TEXT NOT NULL,
+    partida TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    etapa TEXT,
+    momento TEXT NOT NULL
+);
+"""
+
+# Columnas agregadas después de la primera versión del esquema
+_COLUMNAS_NUEVAS = {'huella_xml': 'TEXT', 'huella_datos': 'TEXT'}
+
+
+def huella_datos(datos_comunes, partida=None):
+    """
+    Calcula la huella de los datos que usan los documentos.
+
+    Args:
+        datos_comunes: Datos comunes de la corrida
+        partida (optional): Registro de la partida en el Excel
+
+    Returns:
+        str: SHA-256 en hexadecimal de CAMPOS_HUELLA_DATOS y, si se indica la partida, CAMPOS_HUELLA_PARTIDA
+    """
+    datos = {campo: datos_comunes.get(campo) for campo in CAMPOS_HUELLA_DATOS}
+    if partida is not None:
+        datos['partida'] = {campo: partida.get(campo) for campo in CAMPOS_HUELLA_PARTIDA}
+    texto = json.dumps(datos, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def huella_xml(xml_path):
+    """
+    Calcula la huella del contenido de un XML.
+
+    Args:
+        xml_path (str): Ruta del XML
+
+    Returns:
+        str or None: SHA-256 en hexadecimal o None si no se pudo leer
+    """
+    try:
+        with open(xml_path, 'rb') as archivo:
+            return hashlib.sha256(archivo.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def resultado_a_json(resultado):
+    """
+    Serializa el resultado de una factura para guardarlo en el diario.
+
+    Args:
+        resultado: FacturaResult
+
+    Returns:
+        str: JSON con todos los campos (los Decimal como texto)
+    """
+    datos = {f.name: getattr(resultado, f.name) for f in fields(FacturaResult)}
+    return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+def resultado_desde_json(texto):
+    """
+    Reconstruye el resultado de una factura guardado en el diario.
+
+    Args:
+        texto (str): JSON generado por resultado_a_json
+
+    Returns:
+        FacturaResult: Resultado de la factura
+    """
+    datos = json.loads(texto)
+    if datos.get('monto_decimal') is not None:
+        datos['monto_decimal'] = Decimal(datos['monto_decimal'])
+    return FacturaResult(**datos)
+
+
+def _rutas_existen(rutas):
+    """Comprueba que todas las rutas (las vacías se ignoran) sigan en disco"""
+    return all(os.path.exists(ruta) for ruta in rutas if isinstance(ruta, str) and ruta)
+
+
+def _documentos_existen(resultado):
+    """Comprueba que los documentos de un resultado sigan en disco"""
+    rutas = [r for r in resultado.documentos.values() if isinstance(r, str) and r]
+    pdf_files = resultado.documentos.get('pdf_files') or {}
+    rutas.extend(r for r in pdf_files.values() if isinstance(r, str) and r)
+    return _rutas_existen(rutas)
+
+
+class JobJournal:
+    """
+    Diario SQLite de las etapas de cada partida y factura de una corrida.
+    """
+
+    def __init__(self, ruta):
+        """
+        Abre (o crea) el diario
+
+        Args:
+            ruta (str): Ruta del archivo SQLite
+        """
+        self.ruta = ruta
+        self.base_dir = os.path.dirname(os.path.abspath(ruta))
+        self.corrida = None
+        self.huella_datos = None
+        self._datos_comunes = None
+        self._lock = threading.Lock()
+        # Cada "with self._conexion" es una transacción: se confirma completa o se revierte
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        # WAL + synchronous NORMAL: cada transacción sobrevive al cierre de la aplicación
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.executescript(_ESQUEMA)
+        columnas = {fila[1] for fila in self._conexion.execute("PRAGMA table_info(trabajos)")}
+        with self._conexion:
+            for columna, tipo in _COLUMNAS_NUEVAS.items():
+                if columna not in columnas:
+                    self._conexion.execute(f"ALTER TABLE trabajos ADD COLUMN {columna} {tipo}")
+
+    @classmethod
+    def en_directorio(cls, base_dir, nombre=NOMBRE_DIARIO):
+        """
+        Abre el diario del directorio base de una corrida.
+
+        Args:
+            base_dir (str): Directorio base de las partidas
+            nombre (str): Nombre del archivo del diario
+
+        Returns:
+            JobJournal: Diario abierto
+        """
+        return cls(os.path.join(base_dir, nombre))
+
+    def _clave(self, xml_path):
+        """Ruta del XML relativa al directorio base (el diario sigue siendo válido si se mueve la carpeta)"""
+        if not xml_path:
+            return ''
+        try:
+            return os.path.relpath(os.path.abspath(xml_path), self.base_dir)
+        except ValueError:
+            return os.path.abspath(xml_path)
+
+    def _ahora(self):
+        return datetime.now().isoformat(timespec='seconds')
+
+    def iniciar_corrida(self, reanudada=False, datos_comunes=None):
+        """
+        Registra el inicio de una corrida.
+
+        Args:
+            reanudada (bool): True si la corrida reanuda una anterior
+            datos_comunes (optional): Datos de la corrida (su huella, junto con la de la partida,
+                se guarda con cada trabajo completado)
+
+        Returns:
+            int: Identificador de la corrida
+        """
+        self._datos_comunes = datos_comunes
+        self.huella_datos = huella_datos(datos_comunes) if datos_comunes is not None else None
+        with self._lock, self._conexion:
+            cursor = self._conexion.execute(
+                "INSERT INTO corridas (inicio, estado, reanudada) VALUES (?, ?, ?)",
+                (self._ahora(), EN_CURSO, int(reanudada))
+            )
+            self.corrida = cursor.lastrowid
+            if not reanudada:
+                # Una corrida nueva no aprovecha nada de las anteriores
+                self._conexion.execute("DELETE FROM trabajos")
+        return self.corrida
+
+    def huella_partida(self, partida):
+        """
+        Calcula la huella de los datos de la corrida y del registro de una partida.
+
+        Args:
+            partida: Registro de la partida en el Excel
+
+        Returns:
+            str or None: Huella o None si la corrida no tiene datos comunes
+        """
+        if self._datos_comunes is None:
+            return None
+        return huella_datos(self._datos_comunes, partida)
+
+    def terminar_corrida(self, estado='completada'):
+        """
+        Registra el fin de la corrida actual.
+
+        Args:
+            estado (str): Estado final de la corrida
+        """
+        if self.corrida is None:
+            return
+        with self._lock, self._conexion:
+            self._conexion.execute(
+                "UPDATE corridas SET fin = ?, estado = ? WHERE id = ?",
+                (self._ahora(), estado, self.corrida)
+            )
+
+    def marcar(self, tipo, partida, clave, estado, etapa=None, resultado=None, error=None, nuevo_intento=False,
+               huella_xml=None, huella_datos=None):
+        """
+        Registra una transición de etapa en una sola transacción.
+
+        Args:
+            tipo (str): 'partida' o 'factura'
+            partida (str): Número de partida
+            clave (str): Ruta del XML ('' para la partida)
+            estado (str): EN_CURSO, COMPLETADO o ERROR
+            etapa (str, optional): Etapa alcanzada
+            resultado (str, optional): Resultado serializado (solo al completar)
+            error (str, optional): Descripción del error
+            nuevo_intento (bool): Cuenta un intento más del trabajo
+            huella_xml (str, optional): Huella del XML (solo al completar)
+            huella_datos (str, optional): Huella de los datos de la corrida (solo al completar)
+        """
+        clave = self._clave(clave)
+        ahora = self._ahora()
+        with self._lock, self._conexion:
+            self._conexion.execute(
+                """
+                INSERT INTO trabajos (tipo, partida, clave, estado, etapa, resultado, error, intentos, corrida,
+                                      actualizado, huella_xml, huella_datos)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (tipo, partida, clave) DO UPDATE SET
+                    estado = excluded.estado,
+                    etapa = excluded.etapa,
+                    resultado = excluded.resultado,
+                    error = excluded.error,
+                    intentos = trabajos.intentos + excluded.intentos,
+                    corrida = excluded.corrida,
+                    actualizado = excluded.actualizado,
+                    huella_xml = excluded.huella_xml,
+                    huella_datos = excluded.huella_datos
+                """,
+                (tipo, partida, clave, estado, etapa, resultado, error, int(nuevo_intento), self.corrida, ahora,
+                 huella_xml, huella_datos)
+            )
+            self._conexion.execute(
+                "INSERT INTO transiciones (corrida, tipo, partida, clave, estado, etapa, momento) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.corrida, tipo, partida, clave, estado, etapa, ahora)
+            )
+
+    def iniciar_factura(self, partida, xml_path):
+        """Registra el inicio (o reintento) de una factura"""
+        self.marcar('factura', partida, xml_path, EN_CURSO, 'inicio', nuevo_intento=True)
+
+    def etapa_factura(self, partida, xml_path, etapa):
+        """Registra que una factura alcanzó una etapa"""
+        self.marcar('factura', partida, xml_path, EN_CURSO, etapa)
+
+    def completar_factura(self, partida, xml_path, resultado, huella=None):
+        """Registra una factura terminada con su resultado y las huellas de su XML y de los datos (ver huella_partida)"""
+        self.marcar('factura', partida, xml_path, COMPLETADO, 'completada', resultado=resultado_a_json(resultado),
+                    huella_xml=huella_xml(xml_path), huella_datos=huella or self.huella_datos)
+
+    def fallar_factura(self, partida, xml_path, error):
+        """Registra una factura que terminó con error"""
+        self.marcar('factura', partida, xml_path, ERROR, 'error', error=error or "Error al procesar la factura")
+
+    def iniciar_partida(self, partida):
+        """Registra el inicio de una partida"""
+        self.marcar('partida', partida, '', EN_CURSO, 'facturas', nuevo_intento=True)
+
+    def etapa_partida(self, partida, etapa):
+        """Registra que una partida alcanzó una etapa"""
+        self.marcar('partida', partida, '', EN_CURSO, etapa)
+
+    def completar_partida(self, partida, resultado, huella=None):
+        """Registra una partida terminada con su resumen (incluye sus 'documentos') y la huella de los datos"""
+        self.marcar('partida', partida, '', COMPLETADO, 'completada',
+                    resultado=json.dumps(resultado, ensure_ascii=False, default=str),
+                    huella_datos=huella or self.huella_datos)
+
+    def fallar_partida(self, partida, error):
+        """Registra una partida que terminó con error"""
+        self.marcar('partida', partida, '', ERROR, 'error', error=error)
+
+    def _trabajo(self, tipo, partida, clave):
+        with self._lock:
+            return self._conexion.execute(
+                "SELECT estado, resultado, huella_xml, huella_datos FROM trabajos "
+                "WHERE tipo = ? AND partida = ? AND clave = ?",
+                (tipo, partida, self._clave(clave))
+            ).fetchone()
+
+    def factura_completada(self, partida, xml_path, huella=None):
+        """
+        Obtiene el resultado guardado de una factura terminada.
+
+        Solo se aprovecha si el XML y los datos (de la corrida y de la
+        partida) son los mismos con los que se completó y todos sus
+        documentos siguen en disco; si no, la factura se vuelve a procesar.
+
+        Args:
+            partida (str): Número de partida
+            xml_path (str): Ruta del XML
+            huella (str, optional): Huella de los datos actuales (ver huella_partida)
+
+        Returns:
+            FacturaResult or None: Resultado guardado o None si hay que procesarla
+        """
+        fila = self._trabajo('factura', partida, xml_path)
+        if fila is None or fila[0] != COMPLETADO or not fila[1]:
+            return None
+        if fila[2] is None or fila[2] != huella_xml(xml_path):
+            logger.info(f"El XML {xml_path} cambió desde que se completó; se volverá a procesar")
+            return None
+        if fila[3] != (huella or self.huella_datos):
+            logger.info(f"Los datos de la corrida o de la partida cambiaron; {xml_path} se volverá a procesar")
+            return None
+        try:
+            resultado = resultado_desde_json(fila[1])
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Resultado ilegible en el diario para {xml_path}: {str(e)}")
+            return None
+        if not _documentos_existen(resultado):
+            logger.info(f"Faltan documentos de {xml_path}; se volverá a procesar")
+            return None
+        return resultado
+
+    def partida_completada(self, partida, huella=None):
+        """
+        Obtiene el resumen guardado de una partida terminada.
+
+        Solo se aprovecha si se completó con los mismos datos (de la corrida
+        y de la partida) y sus documentos siguen en disco.
+
+        Args:
+            partida (str): Número de partida
+            huella (str, optional): Huella de los datos actuales (ver huella_partida)
+
+        Returns:
+            dict or None: Resumen de la partida o None si hay que procesarla
+        """
+        fila = self._trabajo('partida', partida, '')
+        if fila is None or fila[0] != COMPLETADO or not fila[1] or fila[3] != (huella or self.huella_datos):
+            return None
+        try:
+            resumen = json.loads(fila[1])
+        except ValueError:
+            return None
+        documentos = resumen.get('documentos')
+        if documentos is None or not _rutas_existen(documentos.values()):
+            logger.info(f"Faltan documentos de la partida {partida}; se volverán a generar")
+            return None
+        return resumen
+
+    def resumen(self):
+        """
+        Cuenta los trabajos registrados por tipo y estado.
+
+        Returns:
+            dict: {(tipo, estado): cantidad}
+        """
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT tipo, estado, COUNT(*) FROM trabajos GROUP BY tipo, estado"
+            ).fetchall()
+        return {(tipo, estado): cantidad for tipo, estado, cantidad in filas}
+
+    def cerrar(self):
+        """Cierra la conexión con el diario"""
+        with self._lock:
+            self._conexion.close()
@@ -0,0 +1,309 @@
+"""
+Registros compactos para partidas, facturas, datos comunes y resultados.
+
+Cada registro es una dataclass con __slots__ (sin __dict__ por instancia) que
+además se comporta como un mapeo de solo lectura con las claves que usan las
+plantillas, de modo que el código que hace registro['clave'] o registro.get()
+sigue funcionando sin copiar los datos a diccionarios intermedios.
+"""
+from collections.abc import Mapping, MutableMapping
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from utils.formatters import convert_fecha_to_texto, format_fecha_mensaje, format_monto
+
+
+class _RegistroMapeo(Mapping):
+    """
+    Base que expone un registro como mapeo de solo lectura.
+
+    Las subclases definen _CLAVES: {clave de plantilla: atributo o función}.
+    """
+    __slots__ = ()
+    _CLAVES = {}
+
+    def __getitem__(self, clave):
+        try:
+            origen = self._CLAVES[clave]
+        except KeyError:
+            raise KeyError(clave) from None
+        return origen(self) if callable(origen) else getattr(self, origen)
+
+    def __iter__(self):
+        return iter(self._CLAVES)
+
+    def __len__(self):
+        return len(self._CLAVES)
+
+
+def _decimal_seguro(valor):
+    """Convierte un valor a Decimal, devolviendo 0.00 si no es válido"""
+    try:
+        return Decimal(str(valor)) if valor not in (None, '') else Decimal('0.00')
+    except (InvalidOperation, ValueError):
+        return Decimal('0.00')
+
+
+@dataclass(slots=True)
+class Partida(_RegistroMapeo):
+    """Partida presupuestal leída del Excel"""
+    numero: str
+    descripcion: str
+    monto: Decimal
+    numero_adicional: str = ''
+    monto_formateado: str = field(init=False, default='')
+
+    _CLAVES = {
+        'numero': 'numero',
+        'descripcion': 'descripcion',
+        'monto': 'monto',
+        'numero_adicional': 'numero_adicional',
+        'monto_formateado': 'monto_formateado',
+    }
+
+    def __post_init__(self):
+        self.monto = _decimal_seguro(self.monto)
+        self.monto_formateado = format_monto(self.monto)
+
+
+@dataclass(slots=True)
+class DatosComunes(_RegistroMapeo):
+    """Datos capturados en la interfaz y compartidos por toda la corrida"""
+    excel_path: str
+    fecha_documento: str
+    fecha_documento_texto: str
+    mes_asignado: str
+    personal_recibio: dict
+    personal_vobo: dict
+    base_dir: str
+    fecha_mensaje: str = ''
+    info_facturas: dict = None
+
+    _CLAVES = {
+        'excel_path': 'excel_path',
+        'fecha_documento': 'fecha_documento',
+        'fecha_documento_texto': 'fecha_documento_texto',
+        'mes_asignado': 'mes_asignado',
+        'personal_recibio': 'personal_recibio',
+        'personal_vobo': 'personal_vobo',
+        'base_dir': 'base_dir',
+        'fecha_mensaje': 'fecha_mensaje',
+        'info_facturas': 'info_facturas',
+    }
+
+    def __post_init__(self):
+        if not self.fecha_mensaje and self.fecha_documento:
+            self.fecha_mensaje = format_fecha_mensaje(self.fecha_documento)
+
+    def __getitem__(self, clave):
+        # info_facturas solo "existe" como clave cuando ya se calculó
+        if clave == 'info_facturas' and self.info_facturas is None:
+            raise KeyError(clave)
+        return _RegistroMapeo.__getitem__(self, clave)
+
+    @classmethod
+    def desde_interfaz(cls, datos_interfaz, fecha_documento_texto=None):
+        """
+        Crea los datos comunes a partir del diccionario de la interfaz.
+
+        Args:
+            datos_interfaz (dict): Datos recopilados por la ventana principal
+            fecha_documento_texto (str, optional): Fecha ya convertida a texto
+
+        Returns:
+            DatosComunes: Registro de datos comunes
+        """
+        if fecha_documento_texto is None:
+            fecha_documento_texto = convert_fecha_to_texto(datos_interfaz['fecha_documento'])
+        return cls(
+            excel_path=datos_interfaz.get('excel_path', ''),
+            fecha_documento=datos_interfaz['fecha_documento'],
+            fecha_documento_texto=fecha_documento_texto,
+            mes_asignado=datos_interfaz.get('mes_asignado', ''),
+            personal_recibio=datos_interfaz.get('personal_recibio', {}),
+            personal_vobo=datos_interfaz.get('personal_vobo', {}),
+            base_dir=datos_interfaz.get('base_dir', ''),
+        )
+
+    def con_info_facturas(self, info_facturas):
+        """
+        Devuelve una copia ligera con la información resumida de facturas.
+
+        Args:
+            info_facturas (dict): Totales de la partida
+
+        Returns:
+            DatosComunes: Nuevo registro que comparte el resto de los campos
+        """
+        return replace(self, info_facturas=info_facturas)
+
+
+@dataclass(slots=True)
+class Factura(_RegistroMapeo):
+    """Datos extraídos del XML de una factura, con campos derivados precalculados"""
+    serie: str
+    numero: str
+    fecha_iso: str
+    total: str
+    nombre_emisor: str
+    rfc_emisor: str
+    nombre_receptor: str
+    rfc_receptor: str
+    uuid: str
+    conceptos: dict
+    xml: str = None
+    monto_decimal: Decimal = field(init=False, default=None)
+    monto_formateado: str = field(init=False, default='')
+    fecha_factura: str = field(init=False, default='')
+    fecha_factura_texto: str = field(init=False, default='')
+
+    _CLAVES = {
+        'xml': 'xml',
+        'Serie': 'serie',
+        'Numero': 'numero',
+        'Fecha_ISO': 'fecha_iso',
+        'Fecha_original': 'fecha_iso',
+        'Total': 'total',
+        'Emisor': lambda f: {'Nombre': f.nombre_emisor, 'Rfc': f.rfc_emisor},
+        'Receptor': lambda f: {'Nombre': f.nombre_receptor, 'Rfc': f.rfc_receptor},
+        'Conceptos': 'conceptos',
+        'Rfc_emisor': 'rfc_emisor',
+        'Rfc_receptor': 'rfc_receptor',
+        'UUid': 'uuid',
+        'Folio_Fiscal': 'uuid',
+        'Nombre_Emisor': 'nombre_emisor',
+        'Fecha_factura': 'fecha_factura',
+        'Fecha_factura_texto': 'fecha_factura_texto',
+        'monto_decimal': 'monto_decimal',
+    }
+
+    def __post_init__(self):
+        self.monto_decimal = _decimal_seguro(self.total)
+        self.monto_formateado = format_monto(self.monto_decimal)
+        if self.fecha_iso:
+            fecha = self.fecha_iso.split('T')[0]
+            self.fecha_factura = datetime.strptime(fecha, '%Y-%m-%d').strftime('%d/%m/%Y')
+            self.fecha_factura_texto = convert_fecha_to_texto(fecha)
+
+    @property
+    def serie_numero(self):
+        """Serie y folio concatenados como aparecen en los documentos"""
+        return f"{self.serie}{self.numero}"
+
+
+@dataclass(slots=True)
+class FacturaResult(_RegistroMapeo):
+    """Resultado del procesamiento de una factura, con lo que necesitan las plantillas de partida"""
+    serie_numero: str
+    fecha: str
+    fecha_factura: str
+    emisor: str
+    rfc_emisor: str
+    monto: str
+    monto_decimal: Decimal
+    conceptos: str
+    documentos: dict = field(default_factory=dict)
+    uuid: str = ''
+    partida: str = ''
+    xml_path: str = ''
+    rfc_receptor: str = ''
+    tiempos: dict = field(default_factory=dict)
+    errores: list = field(default_factory=list)
+
+    _CLAVES = {
+        'serie_numero': 'serie_numero',
+        'fecha': 'fecha',
+        'fecha_factura': 'fecha_factura',
+        'emisor': 'emisor',
+        'rfc_emisor': 'rfc_emisor',
+        'monto': 'monto',
+        'monto_decimal': 'monto_decimal',
+        'conceptos': 'conceptos',
+        'documentos': 'documentos',
+        'uuid': 'uuid',
+        'partida': 'partida',
+        'xml_path': 'xml_path',
+        'rfc_receptor': 'rfc_receptor',
+        'tiempos': 'tiempos',
+        'errores': 'errores',
+    }
+
+
+class VistaPlantilla(MutableMapping):
+    """
+    Vista de mapeo que combina factura, partida y datos comunes sin copiarlos.
+
+    Resuelve las claves que esperan las plantillas por factura; los valores
+    agregados durante el proceso (Empleo_recurso, xml_path, etc.) se guardan
+    en un diccionario pequeño de extras.
+    """
+    __slots__ = ('factura', 'partida', 'datos_comunes', 'extras')
+
+    _CLAVES_COMUNES = {
+        'Fecha_doc': lambda v: v.datos_comunes['fecha_documento_texto'],
+        'Mes': lambda v: v.datos_comunes['mes_asignado'],
+        'Fecha_mensaje': lambda v: (v.datos_comunes.get('fecha_mensaje')
+                                    or format_fecha_mensaje(v.datos_comunes['fecha_documento'])),
+        'No_partida': lambda v: v.partida['numero'],
+        'Descripcion_partida': lambda v: v.partida['descripcion'],
+        'No_of_remision': lambda v: v.partida.get('numero_adicional', ''),
+        'No_mensaje': lambda v: v.partida.get('numero_adicional', ''),
+        'monto': lambda v: v.factura.monto_formateado,
+    }
+
+    _CLAVES_PERSONAL = {
+        'Grado_recibio_la_compra': 'personal_recibio',
+        'Nombre_recibio_la_compra': 'personal_recibio',
+        'Matricula_recibio_la_compra': 'personal_recibio',
+        'Grado_Vo_Bo': 'personal_vobo',
+        'Nombre_Vo_Bo': 'personal_vobo',
+        'Matricula_Vo_Bo': 'personal_vobo',
+    }
+
+    def __init__(self, factura, partida, datos_comunes, extras=None):
+        self.factura = factura
+        self.partida = partida
+        self.datos_comunes = datos_comunes
+        self.extras = extras if extras is not None else {}
+
+    def __getitem__(self, clave):
+        if clave in self.extras:
+            return self.extras[clave]
+        if clave in self.factura:
+            return self.factura[clave]
+        if clave in self._CLAVES_COMUNES:
+            return self._CLAVES_COMUNES[clave](self)
+        if clave in self._CLAVES_PERSONAL:
+            return self.datos_comunes[self._CLAVES_PERSONAL[clave]][clave]
+        raise KeyError(clave)
+
+    def __setitem__(self, clave, valor):
+        self.extras[clave] = valor
+
+    def __delitem__(self, clave):
+        if clave in self.extras:
+            del self.extras[clave]
+        elif clave == 'xml':
+            # La factura pertenece a esta vista: soltar el texto del XML
+            self.factura.xml = None
+        else:
+            raise KeyError(clave)
+
+    def __iter__(self):
+        vistas = set()
+        for clave in list(self.extras) + list(self.factura) + list(self._CLAVES_COMUNES) + list(self._CLAVES_PERSONAL):
+            if clave not in vistas:
+                vistas.add(clave)
+                yield clave
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def pop(self, clave, *default):
+        """Elimina una clave; para 'xml' libera el texto aunque la clave siga existiendo"""
+        if clave == 'xml' and clave not in self.extras:
+            valor = self.factura.xml
+            self.factura.xml = None
+            return valor
+        return super().pop(clave, *default)
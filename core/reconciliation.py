@@ -0,0 +1,300 @@
+"""
+Motor de conciliación de montos de partidas y facturas.
+
+Todos los montos se manejan como enteros en centavos (int64 en pandas), de modo
+que las sumas son exactas y no dependen de cómo venga escrito el monto
+(Decimal, float o texto con formato "$ 1,234.56"). Los valores se devuelven
+como Decimal con dos decimales para las plantillas.
+"""
+import os
+import logging
+from collections.abc import Mapping
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+import pandas as pd
+
+from config import RECONCILIACION_CONFIG
+from utils.file_utils import localizar_facturas_partida
+from utils.formatters import format_monto
+
+logger = logging.getLogger(__name__)
+
+CENTAVO = Decimal('0.01')
+
+# Tipos de discrepancia que detecta la conciliación
+DISCREPANCIAS = {
+    'sin_directorio': "No existe la carpeta de la partida",
+    'sin_facturas': "La partida no tiene facturas XML",
+    'xml_ilegible': "No se pudo leer el XML de la factura",
+    'total_invalido': "El XML no tiene un Total válido",
+    'monto_asignado_invalido': "El monto asignado de la partida no es válido",
+    'facturas_menor_asignado': "El total de facturas es menor al monto asignado (aportación negativa)",
+    'sin_partida': "Factura sin partida en el Excel",
+}
+
+
+def a_centavos(valor):
+    """
+    Convierte un monto a centavos enteros con redondeo comercial.
+
+    Args:
+        valor: Monto como Decimal, int, float o texto ("$ 1,234.56")
+
+    Returns:
+        int or None: Monto en centavos o None si no es un monto válido
+    """
+    if valor is None or isinstance(valor, bool):
+        return None
+    try:
+        if isinstance(valor, Decimal):
+            monto = valor
+        elif isinstance(valor, (int, float)):
+            # str() evita arrastrar el error binario del float
+            monto = Decimal(str(valor))
+        else:
+            texto = str(valor).replace('$', '').replace(',', '').strip()
+            if not texto:
+                return None
+            monto = Decimal(texto)
+        if not monto.is_finite():
+            return None
+        return int((monto * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def centavos_a_decimal(centavos):
+    """
+    Convierte centavos enteros a Decimal con dos decimales.
+
+    Args:
+        centavos (int): Monto en centavos
+
+    Returns:
+        Decimal: Monto en pesos
+    """
+    return (Decimal(int(centavos)) / 100).quantize(CENTAVO)
+
+
+def _centavos_factura(factura):
+    """Obtiene los centavos de una factura procesada (monto_decimal o monto en texto)"""
+    if 'monto_decimal' in factura and factura['monto_decimal'] is not None:
+        centavos = a_centavos(factura['monto_decimal'])
+    else:
+        centavos = a_centavos(factura.get('monto', '0'))
+    if centavos is None:
+        logger.warning(f"No se pudo convertir el monto '{factura.get('monto')}' a decimal")
+        return 0
+    return centavos
+
+
+def calcular_totales(facturas_info):
+    """
+    Calcula la información resumida de las facturas procesadas de una partida.
+
+    Args:
+        facturas_info (list): Lista de facturas procesadas
+
+    Returns:
+        dict: total_facturas, monto_total, monto_formateado y montos_individuales
+    """
+    centavos = [_centavos_factura(f) for f in facturas_info if isinstance(f, Mapping)]
+    total_centavos = sum(centavos)
+    monto_total = centavos_a_decimal(total_centavos)
+
+    return {
+        'total_facturas': len(centavos),
+        'monto_total': monto_total,
+        'monto_formateado': format_monto(monto_total),
+        'montos_individuales': [centavos_a_decimal(c) for c in centavos],
+    }
+
+
+def calcular_montos_partida(monto_asignado, monto_total):
+    """
+    Calcula aportación, suma de ingresos y saldo de una partida.
+
+    Args:
+        monto_asignado: Monto asignado a la partida en el Excel
+        monto_total: Total de las facturas de la partida
+
+    Returns:
+        dict: Montos en Decimal y sus versiones formateadas (claves *_str)
+    """
+    asignado = a_centavos(monto_asignado) or 0
+    total = a_centavos(monto_total) or 0
+    aportacion = total - asignado
+    suma_ingresos = asignado + aportacion
+    saldo = suma_ingresos - total
+
+    montos = {
+        'monto_asignado': centavos_a_decimal(asignado),
+        'monto_total': centavos_a_decimal(total),
+        'aportacion': centavos_a_decimal(aportacion),
+        'suma_ingresos': centavos_a_decimal(suma_ingresos),
+        'saldo': centavos_a_decimal(saldo),
+    }
+    for clave in list(montos):
+        montos[f'{clave}_str'] = format_monto(montos[clave])
+    return montos
+
+
+class ReconciliationEngine:
+    """
+    Concilia las partidas del Excel contra los totales de sus CFDI
+    antes de generar cualquier documento.
+    """
+
+    def __init__(self, xml_processor=None, tolerancia_centavos=None):
+        """
+        Inicializa el motor de conciliación
+
+        Args:
+            xml_processor: Procesador de XML con read_resumen (se crea uno si no se indica)
+            tolerancia_centavos: Diferencia máxima aceptada antes de marcar discrepancia
+        """
+        if xml_processor is None:
+            from core.xml_processor import XMLProcessor
+            xml_processor = XMLProcessor()
+        self.xml_processor = xml_processor
+        if tolerancia_centavos is None:
+            tolerancia_centavos = RECONCILIACION_CONFIG.get('tolerancia_centavos', 0)
+        self.tolerancia_centavos = int(tolerancia_centavos)
+
+    def escanear(self, base_dir, partidas, indice_uuid=None):
+        """
+        Lee solo los datos de cabecera de todos los XML de las partidas.
+
+        Args:
+            base_dir (str): Directorio base con una carpeta por partida
+            partidas (list): Partidas leídas del Excel
+            indice_uuid (UUIDIndex, optional): Índice donde se registra el UUID de cada factura
+
+        Returns:
+            list: Una fila por factura (partida, xml_path, uuid, total, centavos, error)
+        """
+        filas = []
+        for partida in partidas:
+            partida_dir = os.path.join(base_dir, partida['numero'])
+            if not os.path.isdir(partida_dir):
+                continue
+            for xml_file, _ in localizar_facturas_partida(partida_dir):
+                fila = {
+                    'partida': partida['numero'],
+                    'xml_path': xml_file,
+                    'uuid': '',
+                    'total': '',
+                    'centavos': None,
+                    'error': '',
+                }
+                try:
+                    resumen = self.xml_processor.read_resumen(xml_file)
+                    fila['uuid'] = resumen['uuid']
+                    fila['total'] = resumen['total']
+                    fila['centavos'] = a_centavos(resumen['total'])
+                except Exception as e:
+                    fila['error'] = str(e)
+                if indice_uuid is not None:
+                    indice_uuid.registrar(fila)
+                filas.append(fila)
+        return filas
+
+    def conciliar(self, partidas, facturas, base_dir=None):
+        """
+        Calcula totales, aportación, saldo y variación por partida en una sola pasada.
+
+        Args:
+            partidas (list): Partidas leídas del Excel
+            facturas (list): Filas de facturas (ver escanear)
+            base_dir (str, optional): Directorio base para marcar carpetas faltantes
+
+        Returns:
+            dict: 'partidas' (resumen por partida), 'discrepancias' y 'total_discrepancias'
+        """
+        df_partidas = pd.DataFrame({
+            'partida': [p['numero'] for p in partidas],
+            'asignado': [a_centavos(p['monto']) for p in partidas],
+        })
+        df_partidas['asignado_valido'] = df_partidas['asignado'].notna() & (df_partidas['asignado'].fillna(0) > 0)
+        df_partidas['asignado'] = df_partidas['asignado'].fillna(0).astype('int64')
+        if base_dir is not None:
+            df_partidas['con_directorio'] = [
+                os.path.isdir(os.path.join(base_dir, numero)) for numero in df_partidas['partida']
+            ]
+        else:
+            df_partidas['con_directorio'] = True
+
+        df_facturas = pd.DataFrame(facturas, columns=['partida', 'xml_path', 'uuid', 'total', 'centavos', 'error'])
+        df_facturas['ilegible'] = df_facturas['error'].fillna('') != ''
+        df_facturas['invalido'] = ~df_facturas['ilegible'] & df_facturas['centavos'].isna()
+        df_facturas['centavos'] = df_facturas['centavos'].fillna(0).astype('int64')
+
+        # Totales por partida en una sola agregación
+        totales = df_facturas.groupby('partida', sort=False).agg(
+            num_facturas=('xml_path', 'size'),
+            total=('centavos', 'sum'),
+            ilegibles=('ilegible', 'sum'),
+            invalidos=('invalido', 'sum'),
+        ).reset_index()
+
+        df = df_partidas.merge(totales, on='partida', how='left')
+        for columna in ('num_facturas', 'total', 'ilegibles', 'invalidos'):
+            df[columna] = df[columna].fillna(0).astype('int64')
+
+        df['aportacion'] = df['total'] - df['asignado']
+        df['suma_ingresos'] = df['asignado'] + df['aportacion']
+        df['saldo'] = df['suma_ingresos'] - df['total']
+
+        # Marcas de discrepancia (vectorizadas)
+        marcas = {
+            'sin_directorio': ~df['con_directorio'],
+            'sin_facturas': df['con_directorio'] & (df['num_facturas'] == 0),
+            'xml_ilegible': df['ilegibles'] > 0,
+            'total_invalido': df['invalidos'] > 0,
+            'monto_asignado_invalido': ~df['asignado_valido'],
+            'facturas_menor_asignado': (df['num_facturas'] > 0) & (df['aportacion'] < -self.tolerancia_centavos),
+        }
+
+        discrepancias = []
+        for tipo, mascara in marcas.items():
+            for fila in df.loc[mascara].itertuples(index=False):
+                discrepancias.append({
+                    'partida': fila.partida,
+                    'tipo': tipo,
+                    'descripcion': DISCREPANCIAS[tipo],
+                    'monto_asignado': centavos_a_decimal(fila.asignado),
+                    'monto_total': centavos_a_decimal(fila.total),
+                    'variacion': centavos_a_decimal(fila.aportacion),
+                })
+
+        # Facturas en carpetas de partidas que no están en el Excel no se escanean,
+        # pero si llegan en la lista se reportan igual
+        huerfanas = df_facturas.loc[~df_facturas['partida'].isin(df_partidas['partida'])]
+        for fila in huerfanas.itertuples(index=False):
+            discrepancias.append({
+                'partida': fila.partida,
+                'tipo': 'sin_partida',
+                'descripcion': f"{DISCREPANCIAS['sin_partida']}: {os.path.basename(fila.xml_path)}",
+                'monto_asignado': Decimal('0.00'),
+                'monto_total': centavos_a_decimal(fila.centavos),
+                'variacion': centavos_a_decimal(fila.centavos),
+            })
+
+        resumen_partidas = [
+            {
+                'partida': fila.partida,
+                'num_facturas': int(fila.num_facturas),
+                'monto_asignado': centavos_a_decimal(fila.asignado),
+                'monto_total': centavos_a_decimal(fila.total),
+                'aportacion': centavos_a_decimal(fila.aportacion),
+                'suma_ingresos': centavos_a_decimal(fila.suma_ingresos),
+                'saldo': centavos_a_decimal(fila.saldo),
+            }
+            for fila in df.itertuples(index=False)
+        ]
+
+        return {
+            'partidas': resumen_partidas,
+            'discrepancias': discrepancias,
+            'total_discrepancias': len(discrepancias),
+        }
@@ -0,0 +1,330 @@
+"""
+Registro de plantillas Word cargado una sola vez al iniciar.
+
+Resuelve la ruta de cada plantilla en los directorios configurados, valida que
+contenga los marcadores que necesita su generador y precalcula el índice de
+marcadores (en qué párrafos y celdas aparece cada uno). Después, obtener la
+plantilla de una factura o partida es una consulta a un diccionario. Si la
+fecha de modificación de un archivo cambia, verificar_cambios() vuelve a leer
+su manifiesto y avisa a los hooks registrados.
+"""
+import os
+import re
+import logging
+import threading
+from dataclasses import dataclass, field
+
+from docx import Document
+
+from config import APP_CONFIG, PLANTILLAS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+PATRON_MARCADOR = re.compile(r'\{\{[A-Z_]+\}\}')
+
+# Directorio de plantillas del proyecto (se agrega al final si la configuración no lo incluye)
+DIRECTORIO_PLANTILLAS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plantillas")
+
+
+@dataclass
+class ManifiestoPlantilla:
+    """Datos precalculados de una plantilla registrada"""
+    clave: str
+    archivo: str
+    grupo: str
+    ruta: str = None
+    mtime: float = None
+    marcadores_requeridos: tuple = ()
+    indice_marcadores: dict = field(default_factory=dict)
+    marcadores_faltantes: tuple = ()
+    error: str = None
+
+    @property
+    def encontrada(self):
+        """True si el archivo de la plantilla existe"""
+        return self.ruta is not None
+
+    @property
+    def valida(self):
+        """True si la plantilla existe, se pudo leer y tiene todos sus marcadores"""
+        return self.encontrada and self.error is None and not self.marcadores_faltantes
+
+    @property
+    def marcadores(self):
+        """Conjunto de marcadores presentes en la plantilla"""
+        return frozenset(self.indice_marcadores)
+
+
+def indexar_marcadores(doc):
+    """
+    Localiza los marcadores {{...}} de un documento.
+
+    Args:
+        doc: Documento Word
+
+    Returns:
+        dict: {marcador: [ubicaciones]}; cada ubicación es ('parrafo', i)
+              o ('tabla', tabla, fila, columna)
+    """
+    indice = {}
+    for i, paragraph in enumerate(doc.paragraphs):
+        for marcador in PATRON_MARCADOR.findall(paragraph.text):
+            indice.setdefault(marcador, []).append(('parrafo', i))
+
+    for t, table in enumerate(doc.tables):
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                for marcador in PATRON_MARCADOR.findall(cell.text):
+                    ubicacion = ('tabla', t, r, c)
+                    # Las celdas combinadas se repiten en row.cells
+                    if ubicacion not in indice.setdefault(marcador, []):
+                        indice[marcador].append(ubicacion)
+    return indice
+
+
+class TemplateRegistry:
+    """
+    Registro de las plantillas de factura y de partida con sus manifiestos.
+    """
+
+    def __init__(self, directorios=None, plantillas=None):
+        """
+        Inicializa el registro (las plantillas se leen en cargar())
+
+        Args:
+            directorios (list, optional): Directorios de búsqueda (por defecto APP_CONFIG['templates_dirs'])
+            plantillas (dict, optional): Definición de plantillas (por defecto PLANTILLAS_CONFIG['plantillas'])
+        """
+        if directorios is None:
+            directorios = list(APP_CONFIG.get('templates_dirs', []))
+        if DIRECTORIO_PLANTILLAS not in directorios:
+            directorios.append(DIRECTORIO_PLANTILLAS)
+        self.directorios = directorios
+        self.definiciones = plantillas if plantillas is not None else PLANTILLAS_CONFIG['plantillas']
+
+        self._manifiestos = {}
+        self._rutas_archivo = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+        self.cargado = False
+
+    def resolver_archivo(self, nombre_archivo):
+        """
+        Busca un archivo de plantilla en los directorios configurados.
+
+        Args:
+            nombre_archivo (str): Nombre del archivo (p. ej. "Oficio.docx")
+
+        Returns:
+            str: Ruta completa o None si no se encuentra
+        """
+        if nombre_archivo in self._rutas_archivo:
+            return self._rutas_archivo[nombre_archivo]
+
+        ruta = None
+        for directorio in self.directorios:
+            ruta_posible = os.path.join(directorio, nombre_archivo)
+            if os.path.exists(ruta_posible):
+                ruta = ruta_posible
+                break
+
+        self._rutas_archivo[nombre_archivo] = ruta
+        return ruta
+
+    def _crear_manifiesto(self, clave, definicion):
+        """
+        Resuelve, lee y valida una plantilla.
+
+        Args:
+            clave (str): Clave de la plantilla en el registro
+            definicion (dict): archivo, grupo y marcadores requeridos
+
+        Returns:
+            ManifiestoPlantilla: Manifiesto de la plantilla
+        """
+        manifiesto = ManifiestoPlantilla(
+            clave=clave,
+            archivo=definicion['archivo'],
+            grupo=definicion.get('grupo', ''),
+            marcadores_requeridos=tuple(definicion.get('marcadores', ())),
+        )
+
+        manifiesto.ruta = self.resolver_archivo(manifiesto.archivo)
+        if manifiesto.ruta is None:
+            manifiesto.error = f"No se encontró la plantilla: {manifiesto.archivo}"
+            return manifiesto
+
+        try:
+            manifiesto.mtime = os.path.getmtime(manifiesto.ruta)
+            manifiesto.indice_marcadores = indexar_marcadores(Document(manifiesto.ruta))
+        except Exception as e:
+            manifiesto.error = f"No se pudo leer la plantilla {manifiesto.ruta}: {str(e)}"
+            return manifiesto
+
+        manifiesto.marcadores_faltantes = tuple(
+            m for m in manifiesto.marcadores_requeridos if m not in manifiesto.indice_marcadores
+        )
+        return manifiesto
+
+    def _registrar_problemas(self, manifiesto):
+        """Escribe en el log los problemas de validación de una plantilla"""
+        if manifiesto.error:
+            logger.error(manifiesto.error)
+        elif manifiesto.marcadores_faltantes:
+            logger.warning(
+                f"La plantilla {manifiesto.archivo} no contiene los marcadores: "
+                f"{', '.join(manifiesto.marcadores_faltantes)}"
+            )
+
+    def cargar(self):
+        """
+        Resuelve y valida todas las plantillas definidas.
+
+        Returns:
+            dict: {clave: ManifiestoPlantilla}
+        """
+        with self._lock:
+            self._rutas_archivo.clear()
+            manifiestos = {}
+            for clave, definicion in self.definiciones.items():
+                manifiesto = self._crear_manifiesto(clave, definicion)
+                self._registrar_problemas(manifiesto)
+                manifiestos[clave] = manifiesto
+            self._manifiestos = manifiestos
+            self.cargado = True
+
+        validas = sum(1 for m in manifiestos.values() if m.valida)
+        logger.info(f"Registro de plantillas cargado: {validas}/{len(manifiestos)} plantillas válidas")
+        return manifiestos
+
+    def _asegurar_carga(self):
+        """Carga el registro la primera vez que se consulta"""
+        if not self.cargado:
+            self.cargar()
+
+    def obtener(self, clave):
+        """
+        Obtiene el manifiesto de una plantilla.
+
+        Args:
+            clave (str): Clave de la plantilla (p. ej. 'oficio')
+
+        Returns:
+            ManifiestoPlantilla: Manifiesto registrado
+
+        Raises:
+            KeyError: Si la clave no está definida
+        """
+        self._asegurar_carga()
+        return self._manifiestos[clave]
+
+    def obtener_ruta(self, clave):
+        """
+        Obtiene la ruta de una plantilla.
+
+        Args:
+            clave (str): Clave de la plantilla
+
+        Returns:
+            str: Ruta de la plantilla o None si no se encontró
+        """
+        return self.obtener(clave).ruta
+
+    def plantillas_grupo(self, grupo):
+        """
+        Obtiene los manifiestos de un grupo en el orden definido.
+
+        Args:
+            grupo (str): 'factura' o 'partida'
+
+        Returns:
+            list: Manifiestos del grupo
+        """
+        self._asegurar_carga()
+        return [m for m in self._manifiestos.values() if m.grupo == grupo]
+
+    def agregar_hook_recarga(self, funcion):
+        """
+        Registra una función que se llama cuando se recarga una plantilla.
+
+        Registrar dos veces la misma función no la duplica.
+
+        Args:
+            funcion: Función que recibe el ManifiestoPlantilla recargado
+        """
+        with self._lock:
+            if funcion not in self._hooks:
+                self._hooks.append(funcion)
+
+    def quitar_hook_recarga(self, funcion):
+        """
+        Quita una función registrada con agregar_hook_recarga.
+
+        Args:
+            funcion: Función registrada
+        """
+        with self._lock:
+            if funcion in self._hooks:
+                self._hooks.remove(funcion)
+
+    def verificar_cambios(self):
+        """
+        Recarga las plantillas cuyo archivo cambió (o apareció) desde la carga.
+
+        Returns:
+            list: Claves de las plantillas recargadas
+        """
+        self._asegurar_carga()
+        recargadas = []
+
+        with self._lock:
+            for clave, manifiesto in list(self._manifiestos.items()):
+                if manifiesto.ruta is None:
+                    # Una plantilla faltante puede haberse copiado después
+                    self._rutas_archivo.pop(manifiesto.archivo, None)
+                    if self.resolver_archivo(manifiesto.archivo) is None:
+                        continue
+                else:
+                    try:
+                        if os.path.getmtime(manifiesto.ruta) == manifiesto.mtime:
+                            continue
+                    except OSError:
+                        self._rutas_archivo.pop(manifiesto.archivo, None)
+
+                nuevo = self._crear_manifiesto(clave, self.definiciones[clave])
+                self._registrar_problemas(nuevo)
+                self._manifiestos[clave] = nuevo
+                recargadas.append(nuevo)
+
+        for manifiesto in recargadas:
+            logger.info(f"Plantilla recargada: {manifiesto.archivo}")
+            for funcion in list(self._hooks):
+                try:
+                    funcion(manifiesto)
+                except Exception as e:
+                    logger.warning(f"Error en el hook de recarga de {manifiesto.archivo}: {str(e)}")
+
+        return [m.clave for m in recargadas]
+
+    def resumen(self):
+        """
+        Obtiene el estado de todas las plantillas registradas.
+
+        Returns:
+            list: Un diccionario por plantilla (clave, ruta, valida, faltantes, error)
+        """
+        self._asegurar_carga()
+        return [
+            {
+                'clave': m.clave,
+                'ruta': m.ruta,
+                'valida': m.valida,
+                'marcadores_faltantes': list(m.marcadores_faltantes),
+                'error': m.error,
+            }
+            for m in self._manifiestos.values()
+        ]
+
+
+# Registro compartido por los generadores del proceso
+template_registry = TemplateRegistry()
@@ -0,0 +1,239 @@
+"""
+Índice de UUID (folio fiscal del TimbreFiscalDigital) de las facturas.
+
+Se llena durante el escaneo masivo de los XML (ReconciliationEngine.escanear),
+así que cada factura se revisa con una consulta a un diccionario: si su UUID
+ya apareció en la corrida es un duplicado (en la misma partida o en otra) y si
+aparece en el índice guardado con otro periodo es una factura reutilizada de
+un mes anterior. Al terminar la corrida se guardan en un archivo JSON los UUID
+de las facturas procesadas correctamente; volver a procesar el mismo periodo
+reemplaza sus registros en lugar de marcarlos como reutilizados.
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+from config import MESES
+from utils.file_utils import escritura_atomica
+
+logger = logging.getLogger(__name__)
+
+VERSION_INDICE = 1
+
+# Tipos de incidencia que detecta el índice
+INCIDENCIAS_UUID = {
+    'duplicado_partida': "La factura está repetida dentro de la misma partida",
+    'duplicado_otra_partida': "La factura ya está en otra partida de esta corrida",
+    'reutilizado': "La factura ya se comprobó en otro periodo",
+}
+
+
+def normalizar_uuid(uuid):
+    """
+    Normaliza un UUID para usarlo como clave (sin espacios y en mayúsculas).
+
+    Args:
+        uuid (str): UUID leído del XML
+
+    Returns:
+        str: UUID normalizado ('' si no hay UUID)
+    """
+    return (uuid or '').strip().upper()
+
+
+def periodo_corrida(mes_asignado, fecha_documento=None):
+    """
+    Obtiene el periodo de una corrida (mes asignado y año del documento).
+
+    Args:
+        mes_asignado (str): Mes seleccionado en la interfaz (p. ej. "enero")
+        fecha_documento (str, optional): Fecha del documento en formato YYYY-MM-DD
+
+    Returns:
+        str: Periodo, p. ej. "2025-01"
+    """
+    anio = None
+    if fecha_documento:
+        try:
+            anio = datetime.strptime(fecha_documento, '%Y-%m-%d').year
+        except ValueError:
+            anio = None
+    if anio is None:
+        anio = datetime.now().year
+
+    mes = (mes_asignado or '').strip().lower()
+    if mes in MESES:
+        return f"{anio}-{MESES.index(mes) + 1:02d}"
+    return f"{anio}-{mes}" if mes else str(anio)
+
+
+class UUIDIndex:
+    """
+    Índice de UUID de la corrida actual y de los periodos ya procesados.
+    """
+
+    def __init__(self, ruta=None, periodo=''):
+        """
+        Inicializa el índice (el archivo se lee en cargar())
+
+        Args:
+            ruta (str, optional): Archivo JSON del índice persistente (None = solo en memoria)
+            periodo (str): Periodo de la corrida actual (ver periodo_corrida)
+        """
+        self.ruta = ruta
+        self.periodo = periodo
+        # UUID -> registro guardado de periodos anteriores
+        self._historico = {}
+        # UUID -> primera fila escaneada en esta corrida
+        self._corrida = {}
+        self.incidencias = []
+        self._lock = threading.Lock()
+
+    def cargar(self):
+        """
+        Lee el índice persistente.
+
+        Returns:
+            int: Número de UUID registrados de corridas anteriores
+        """
+        self._historico = {}
+        if not self.ruta or not os.path.exists(self.ruta):
+            return 0
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as archivo:
+                datos = json.load(archivo)
+            self._historico = dict(datos.get('facturas', {}))
+        except (OSError, ValueError) as e:
+            logger.error(f"No se pudo leer el índice de UUID {self.ruta}: {str(e)}")
+        return len(self._historico)
+
+    def reiniciar_corrida(self, periodo=None):
+        """
+        Descarta los UUID de la corrida actual (p. ej. antes de volver a escanear).
+
+        Args:
+            periodo (str, optional): Nuevo periodo de la corrida
+        """
+        if periodo is not None:
+            self.periodo = periodo
+        self._corrida = {}
+        self.incidencias = []
+
+    def registrar(self, fila):
+        """
+        Registra una factura escaneada y devuelve su incidencia, si la hay.
+
+        Args:
+            fila (dict): Fila del escaneo (partida, xml_path, uuid, total)
+
+        Returns:
+            dict or None: Incidencia detectada (tipo, uuid, partida, xml_path y
+                          la partida, xml_path y periodo del registro previo)
+        """
+        uuid = normalizar_uuid(fila.get('uuid'))
+        if not uuid:
+            return None
+
+        with self._lock:
+            previo = self._corrida.get(uuid)
+            if previo is not None:
+                tipo = 'duplicado_partida' if previo['partida'] == fila['partida'] else 'duplicado_otra_partida'
+                periodo_previo = self.periodo
+            else:
+                self._corrida[uuid] = {
+                    'partida': fila['partida'],
+                    'xml_path': fila['xml_path'],
+                    'total': str(fila.get('total', '')),
+                }
+                previo = self._historico.get(uuid)
+                if previo is None or previo.get('periodo') == self.periodo:
+                    return None
+                tipo = 'reutilizado'
+                periodo_previo = previo.get('periodo', '')
+
+            incidencia = {
+                'tipo': tipo,
+                'descripcion': INCIDENCIAS_UUID[tipo],
+                'uuid': uuid,
+                'partida': fila['partida'],
+                'xml_path': fila['xml_path'],
+                'partida_previa': previo.get('partida', ''),
+                'xml_path_previo': previo.get('xml_path', ''),
+                'periodo_previo': periodo_previo,
+            }
+            self.incidencias.append(incidencia)
+        return incidencia
+
+    def contiene(self, uuid):
+        """
+        Indica si un UUID ya se registró en la corrida actual.
+
+        Args:
+            uuid (str): UUID de la factura
+
+        Returns:
+            bool: True si el UUID está en la corrida
+        """
+        return normalizar_uuid(uuid) in self._corrida
+
+    def archivos_con_incidencia(self):
+        """
+        Obtiene los XML que provocaron una incidencia (las copias, no la primera aparición).
+
+        Returns:
+            set: Rutas de los XML a omitir
+        """
+        return {incidencia['xml_path'] for incidencia in self.incidencias}
+
+    def guardar(self, completados):
+        """
+        Guarda en el índice persistente los UUID del periodo actual.
+
+        Solo se registran las facturas que se procesaron correctamente; las
+        que fallaron, se omitieron o no se alcanzaron a procesar podrán
+        procesarse en otra corrida sin marcarse como reutilizadas. De los
+        registros anteriores del periodo solo se reemplazan los de las
+        facturas revisadas en esta corrida (mismo UUID o mismo XML), de modo
+        que repetir una corrida no marca sus facturas como reutilizadas y
+        una corrida sobre algunas partidas conserva las de las demás; los de
+        otros periodos se conservan.
+
+        Args:
+            completados (set): XML de las facturas procesadas correctamente
+
+        Returns:
+            int: Número de UUID registrados del periodo actual
+        """
+        if not self.ruta:
+            return 0
+        completados = {os.path.normpath(ruta) for ruta in completados}
+
+        with self._lock:
+            revisados = {os.path.normpath(fila['xml_path']) for fila in self._corrida.values()}
+            facturas = {
+                uuid: registro for uuid, registro in self._historico.items()
+                if registro.get('periodo') != self.periodo
+                or (uuid not in self._corrida
+                    and os.path.normpath(registro.get('xml_path', '')) not in revisados)
+            }
+            registrados = 0
+            for uuid, fila in self._corrida.items():
+                if os.path.normpath(fila['xml_path']) not in completados or uuid in facturas:
+                    continue
+                facturas[uuid] = {'periodo': self.periodo, **fila}
+                registrados += 1
+
+            directorio = os.path.dirname(os.path.abspath(self.ruta))
+            os.makedirs(directorio, exist_ok=True)
+            # Se escribe en un archivo temporal y se reemplaza para no dejar el índice a medias
+            with escritura_atomica(self.ruta, 'w') as archivo:
+                json.dump({'version': VERSION_INDICE, 'facturas': facturas}, archivo)
+            self._historico = facturas
+
+        logger.info(f"Índice de UUID guardado: {registrados} facturas del periodo {self.periodo}")
+        return registrados
+
+    def __len__(self):
+        return len(self._corrida)
@@ -1,9 +1,8 @@
 import xml.etree.ElementTree as ET
-from datetime import datetime
-from babel.dates import format_date
-import locale
 import os
 
+from core.models import Factura
+
 class XMLProcessor:
     """
     Clase para procesar archivos XML de facturas.
@@ -16,7 +15,7 @@ class XMLProcessor:
         Args:
             file_path (str): Ruta al archivo XML
         Returns:
-            dict: Diccionario con la información extraída
+            Factura: Registro con la información extraída (accesible como diccionario)
         """
         try:
             tree = ET.parse(file_path)
@@ -88,24 +87,66 @@ class XMLProcessor:
             # Convertir todo el contenido del XML a una cadena de texto
             xml_string = ET.tostring(root, encoding='unicode')
 
-            # Construir y devolver el diccionario de datos
-            factura_data = {
-                'xml': xml_string,
-                'Serie': root.attrib.get('Serie', ''),
-                'Numero': root.attrib.get('Folio', ''),
-                'Fecha_ISO': fecha_original,
-                'Total': root.attrib.get('Total', ''),
-                'Emisor': emisor_info,
-                'Receptor': receptor_info,
-                'Conceptos': agrupados,  # Aquí usamos el diccionario agrupado
-                'Rfc_emisor': emisor_info['Rfc'],
-                'Rfc_receptor': receptor_info['Rfc'],
-                'UUid': folio_fiscal,
-                'Nombre_Emisor': emisor_info['Nombre'],
-            }
+            # Construir y devolver el registro de la factura (se comporta como
+            # un diccionario con las mismas claves que usan las plantillas)
+            factura_data = Factura(
+                serie=root.attrib.get('Serie', ''),
+                numero=root.attrib.get('Folio', ''),
+                fecha_iso=fecha_original,
+                total=root.attrib.get('Total', ''),
+                nombre_emisor=emisor_info['Nombre'],
+                rfc_emisor=emisor_info['Rfc'],
+                nombre_receptor=receptor_info['Nombre'],
+                rfc_receptor=receptor_info['Rfc'],
+                uuid=folio_fiscal,
+                conceptos=agrupados,  # Aquí usamos el diccionario agrupado
+                xml=xml_string,
+            )
 
             return factura_data
 
         except Exception as e:
             raise Exception(f"Error al procesar el archivo XML: {str(e)}")
 
+    def read_resumen(self, file_path):
+        """
+        Lee solo los datos de cabecera de un XML (total, UUID, serie, folio, RFC y fecha).
+
+        Recorre el archivo con iterparse liberando cada elemento al terminar, así
+        que no construye el árbol ni agrupa conceptos; sirve para el escaneo
+        previo de todas las facturas.
+
+        Args:
+            file_path (str): Ruta al archivo XML
+        Returns:
+            dict: Datos de cabecera de la factura
+        """
+        resumen = {
+            'serie': '', 'numero': '', 'fecha_iso': '', 'total': '',
+            'rfc_emisor': '', 'rfc_receptor': '', 'uuid': '',
+        }
+        try:
+            for evento, elemento in ET.iterparse(file_path, events=('start', 'end')):
+                nombre = elemento.tag.rsplit('}', 1)[-1]
+                if evento == 'start':
+                    if nombre == 'Comprobante':
+                        resumen['serie'] = elemento.attrib.get('Serie', '')
+                        resumen['numero'] = elemento.attrib.get('Folio', '')
+                        resumen['fecha_iso'] = elemento.attrib.get('Fecha', '')
+                        resumen['total'] = elemento.attrib.get('Total', '')
+                    elif nombre == 'Emisor':
+                        resumen['rfc_emisor'] = elemento.attrib.get('Rfc', '')
+                    elif nombre == 'Receptor':
+                        resumen['rfc_receptor'] = elemento.attrib.get('Rfc', '')
+                    elif nombre == 'TimbreFiscalDigital':
+                        resumen['uuid'] = elemento.attrib.get('UUID', '')
+                elif nombre != 'Comprobante':
+                    elemento.clear()
+
+            if not resumen['uuid']:
+                raise ValueError("No se encontró el TimbreFiscalDigital en el XML")
+            return resumen
+
+        except Exception as e:
+            raise Exception(f"Error al procesar el archivo XML: {str(e)}")
+
@@ -4,7 +4,12 @@ Módulo para procesar PDFs de facturas y generar documentos combinados
 import os
 import logging
 import shutil
+from config import PDF_CONFIG
 from utils.pdf_manager import PDFManager
+from utils.pdf_image_optimizer import pdf_image_optimizer
+from utils.artifact_registry import artifact_registry, es_artefacto
+from utils.file_utils import escritura_atomica, ruta_temporal
+from utils.watchdog import EtapaAgotadaError
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -70,6 +75,9 @@ class FacturaPDFProcessor:
                 
                 self.update_status(f"PDF generado: {os.path.basename(pdf_path)}", "success")
                 
+            except EtapaAgotadaError:
+                # La conversión se colgó en todos sus intentos: la factura se registra como fallida
+                raise
             except Exception as e:
                 self.update_status(f"Error al convertir {os.path.basename(path)}: {str(e)}", "error")
         
@@ -98,8 +106,9 @@ class FacturaPDFProcessor:
                 os.path.join(xml_dir, "factura.pdf"),
                 # Nombre "Factura.pdf"
                 os.path.join(xml_dir, "Factura.pdf"),
-                # Cualquier archivo .pdf en el directorio
-                *[os.path.join(xml_dir, f) for f in os.listdir(xml_dir) if f.lower().endswith('.pdf')]
+                # Cualquier archivo .pdf en el directorio que no sea un artefacto generado
+                *[os.path.join(xml_dir, f) for f in os.listdir(xml_dir)
+                  if f.lower().endswith('.pdf') and not es_artefacto(f)]
             ]
             
             # Buscar el primer PDF que exista
@@ -115,7 +124,7 @@ class FacturaPDFProcessor:
             self.update_status(f"Error al buscar PDF original: {str(e)}", "error")
             return None
     
-    def process_factura_pdfs(self, xml_path, output_dir, generated_docs):
+    def process_factura_pdfs(self, xml_path, output_dir, generated_docs, uuid=None):
         """
         Procesa los PDFs relacionados con una factura y genera un documento combinado.
         
@@ -123,6 +132,8 @@ class FacturaPDFProcessor:
             xml_path (str): Ruta al archivo XML
             output_dir (str): Directorio de salida
             generated_docs (dict): Diccionario con documentos generados
+            uuid (str, optional): UUID de la factura (nombre de sus artefactos);
+                                  por defecto el nombre del XML
             
         Returns:
             dict: Información sobre los PDFs procesados
@@ -130,6 +141,7 @@ class FacturaPDFProcessor:
         try:
             self.update_status("Procesando PDFs de la factura...")
             path_xml = os.path.dirname(xml_path)
+            uuid = uuid or os.path.splitext(os.path.basename(xml_path))[0]
             # 1. Encontrar el PDF original de la factura
             factura_pdf_path = self.find_original_pdf(xml_path)
             if not factura_pdf_path:
@@ -144,6 +156,12 @@ class FacturaPDFProcessor:
             
             pdf_files = self.convert_word_documents(docx_files, output_dir)
             
+            # Los documentos generados directamente en PDF no necesitan conversión
+            pdf_files.update({
+                name: path for name, path in generated_docs.items()
+                if path.lower().endswith('.pdf')
+            })
+            
             # 3. Verificar que se tienen todos los PDFs necesarios
             required_pdfs = [
                 'legalizacion_factura',
@@ -158,22 +176,29 @@ class FacturaPDFProcessor:
                 return None
             
             # 4. Buscar el PDF de verificación del SAT
-            verificacion_sat_pdf = self.find_verificacion_sat_pdf(path_xml)
+            verificacion_sat_pdf = self.find_verificacion_sat_pdf(path_xml, uuid)
             if not verificacion_sat_pdf:
-                # Crear un PDF vacío como sustituto
+                # Crear un PDF vacío como sustituto (no se registra: no es una verificación)
                 verificacion_sat_pdf = self.create_empty_pdf(
-                    os.path.join(output_dir, "Verificación de Comprobantes Fiscales Digitales por Internet.pdf"),
+                    artifact_registry.ruta(output_dir, 'verificacion_pendiente', uuid),
                     "No se encontró la verificación del SAT"
                 )
             
-            # 5. Crear documento combinado
-            combined_pdf_path = os.path.join(path_xml, "documento_completo.pdf")
+            # 5. Reducir las imágenes sobredimensionadas de los escaneos (versión en caché)
+            factura_pdf_combinar = factura_pdf_path
+            verificacion_sat_combinar = verificacion_sat_pdf
+            if PDF_CONFIG.get('optimizar_imagenes', False):
+                factura_pdf_combinar = pdf_image_optimizer.optimizar(factura_pdf_path)
+                verificacion_sat_combinar = pdf_image_optimizer.optimizar(verificacion_sat_pdf)
+            
+            # 6. Crear documento combinado (nombre por UUID)
+            combined_pdf_path = artifact_registry.ruta(path_xml, 'documento_completo', uuid)
             
             result = self.pdf_manager.create_factura_legal_document(
                 combined_pdf_path,
-                factura_pdf_path,
+                factura_pdf_combinar,
                 pdf_files['legalizacion_factura'],
-                verificacion_sat_pdf,
+                verificacion_sat_combinar,
                 pdf_files['legalizacion_verificacion'],
                 pdf_files['xml'],
                 pdf_files['legalizacion_xmls']
@@ -193,25 +218,41 @@ class FacturaPDFProcessor:
                 self.update_status("No se pudo generar el documento PDF combinado", "error")
                 return None
             
+        except EtapaAgotadaError:
+            raise
         except Exception as e:
             self.update_status(f"Error al procesar PDFs de la factura: {str(e)}", "error")
             logger.exception("Error procesando PDFs de factura")
             return None
     # aqui comienza
 
-    def find_verificacion_sat_pdf(self, xml_path):
+    def find_verificacion_sat_pdf(self, xml_path, uuid=None):
         """
         Busca el PDF de verificación del SAT en el mismo directorio que el XML.
         
+        Primero consulta el registro de artefactos (verificación descargada
+        para este UUID); si no está, busca un PDF colocado a mano ignorando
+        los artefactos generados y los archivos temporales a medias.
+        
         Args:
-            xml_path (str): Ruta al archivo XML de la factura
+            xml_path (str): Directorio del XML de la factura
+            uuid (str, optional): UUID de la factura
             
         Returns:
             str or None: Ruta al PDF encontrado o None si no se encuentra
         """
         try:
-            # Obtener el directorio donde está el XML
+            registrada = artifact_registry.buscar(xml_path, 'verificacion_sat', uuid)
+            if registrada:
+                self.update_status(f"Verificación SAT registrada: {os.path.basename(registrada)}")
+                return registrada
             
+            # Sin registro (p. ej. se perdió), el nombre por UUID solo existe si el archivo ya se renombró completo
+            if uuid:
+                propia = artifact_registry.ruta(xml_path, 'verificacion_sat', uuid)
+                if os.path.exists(propia):
+                    self.update_status(f"Verificación SAT encontrada: {os.path.basename(propia)}")
+                    return propia
             
             # Patrones comunes para archivos de verificación del SAT
             verification_patterns = [
@@ -223,8 +264,11 @@ class FacturaPDFProcessor:
                 "cfdi"
             ]
             
-            # Buscar archivos PDF en el directorio
-            pdf_files = [f for f in os.listdir(xml_path) if f.lower().endswith('.pdf')]
+            # Buscar archivos PDF en el directorio (sin artefactos de otras facturas ni temporales)
+            pdf_files = [
+                f for f in os.listdir(xml_path)
+                if f.lower().endswith('.pdf') and not es_artefacto(f)
+            ]
             
             # Primero buscar por patrones exactos
             for file in pdf_files:
@@ -270,7 +314,8 @@ class FacturaPDFProcessor:
             pdf.add_page()
             pdf.set_font("Arial", size=12)
             pdf.cell(200, 10, txt=text, ln=True, align='C')
-            pdf.output(output_path)
+            with ruta_temporal(output_path) as temporal:
+                pdf.output(temporal)
             
             self.update_status(f"PDF vacío creado: {os.path.basename(output_path)}")
             return output_path
@@ -285,7 +330,7 @@ class FacturaPDFProcessor:
                 writer = PdfWriter()
                 writer.add_blank_page(width=612, height=792)  # Tamaño carta
                 
-                with open(output_path, 'wb') as f:
+                with escritura_atomica(output_path) as f:
                     writer.write(f)
                 
                 return output_path
@@ -1,8 +1,11 @@
 import os
-from docx import Document
 from docx.shared import Pt, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
+from config import FORMATO_CONFIG
+from generators.plantillas_partidas import abrir_plantilla_formateada
+from utils.file_utils import ruta_temporal
+
 def creacionDocumentos(template_path, output_dir, data, template_name):
     """
     Crea un documento basado en una plantilla.
@@ -22,13 +25,19 @@ def creacionDocumentos(template_path, output_dir, data, template_name):
             raise FileNotFoundError(f"No se encontró la plantilla: {template_path}")
 
         # Determinar si estamos trabajando con la plantilla XML
-        es_plantilla_xml = "xml.docx" in template_path.lower() == "xml"
+        es_plantilla_xml = os.path.basename(template_path).lower() == "xml.docx"
 
-        # Cargar la plantilla
-        doc = Document(template_path)
+        # Cargar la plantilla. En modo 'estilos' la fuente ya viene fijada en los
+        # estilos (preparados una vez y guardados en la caché de plantillas) y los
+        # runs creados al sustituir marcadores la heredan sin formato propio.
+        tamano = Pt(6) if es_plantilla_xml else Pt(10)
+        modo_estilos = FORMATO_CONFIG.get('modo', 'runs') == 'estilos'
+        doc = abrir_plantilla_formateada(template_path, tamano)
 
         # Función para aplicar el formato de texto según la plantilla
         def aplicar_formato_texto(paragraph):
+            if modo_estilos:
+                return
             for run in paragraph.runs:
                 run.font.name = "Geomanist"
                 if es_plantilla_xml:
@@ -153,7 +162,8 @@ def creacionDocumentos(template_path, output_dir, data, template_name):
 
         # Guardar el documento
         output_path = os.path.join(output_dir, template_name + ".docx")
-        doc.save(output_path)
+        with ruta_temporal(output_path) as temporal:
+            doc.save(temporal)
 
         return output_path
 
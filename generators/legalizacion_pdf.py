@@ -0,0 +1,404 @@
+"""
+Generación directa en PDF de las hojas de legalización por fragmentos.
+
+Las hojas de legalización (factura, verificación y XML) son casi todas
+texto fijo: título, lugar y fecha, visto bueno, tabla del oficio y firmas.
+Los textos se toman de las plantillas legalizacion_*.docx del registro. La
+parte fija se renderiza una sola vez por corrida para cada tipo de hoja (la
+clave es el tipo, la versión de la plantilla, la fecha del documento y el
+personal) y se guarda como un form XObject. Para cada factura solo se
+renderiza una hoja pequeña con los campos variables (el párrafo con serie y
+folio, fecha y emisor, y el monto), a la que se agrega la parte fija como
+fondo.
+
+El párrafo variable se escribe en un recuadro de alto fijo (si no cabe se
+reduce la fuente), así que la posición de la parte fija no depende de la
+factura.
+"""
+import io
+import os
+import time
+import hashlib
+import logging
+import threading
+
+import pikepdf
+from docx import Document
+from fpdf import FPDF
+
+from utils.file_utils import ruta_temporal
+
+logger = logging.getLogger(__name__)
+
+# Tipos de hoja que se generan directamente en PDF (claves de las plantillas legalizacion_*.docx)
+HOJAS_LEGALIZACION = ('legalizacion_factura', 'legalizacion_verificacion', 'legalizacion_xmls')
+
+# Marcadores de la parte fija y campo de los datos que los llena
+MARCADORES_FIJOS = {
+    '{{FECHA_DOCUMENTO}}': 'Fecha_doc',
+    '{{GRADO_VO_BO}}': 'Grado_Vo_Bo',
+    '{{NOMBRE_VO_BO}}': 'Nombre_Vo_Bo',
+    '{{MATRICULA_VO_BO}}': 'Matricula_Vo_Bo',
+    '{{GRADO_RECIBIO_LA_COMPRA}}': 'Grado_recibio_la_compra',
+    '{{NOMBRE_RECIBIO_LA_COMPRA}}': 'Nombre_recibio_la_compra',
+    '{{MATRICULA_RECIBIO_LA_COMPRA}}': 'Matricula_recibio_la_compra',
+}
+
+# Campos de los datos que forman la parte fija
+CAMPOS_FIJOS = tuple(MARCADORES_FIJOS.values())
+
+# Anchos (mm) de las columnas de la tabla del oficio de radicación; con otro número de columnas se reparten por igual
+ANCHOS_OFICIO = (80, 45, 35)
+
+# Posiciones verticales de la hoja (mm, A4 con márgenes de 3 cm y 2 cm como las plantillas)
+MARGEN_IZQUIERDO = 30
+MARGEN_DERECHO = 20
+Y_TITULO = 22
+Y_CUERPO = 35
+ALTO_CUERPO = 62
+Y_LUGAR = 102
+Y_TABLA = 122
+Y_VISTO_BUENO = 158
+Y_FIRMAS = 205
+
+ALTO_RENGLON = 5.5
+ALTO_CELDA = 5
+TAMANO_CUERPO = 11
+TAMANO_MINIMO_CUERPO = 7
+
+_COMILLAS = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'", '\xa0': ' '})
+
+
+def _texto_pdf(texto):
+    """Adapta un texto a latin-1, la codificación de las fuentes base de FPDF"""
+    return str(texto).translate(_COMILLAS).encode('latin-1', 'replace').decode('latin-1')
+
+
+def _contar_renglones(pdf, texto, ancho):
+    """Número de renglones que ocupa un texto cortado por palabras en un ancho dado"""
+    renglones, actual = 1, ''
+    for palabra in texto.split(' '):
+        propuesta = f"{actual} {palabra}" if actual else palabra
+        if actual and pdf.get_string_width(propuesta) > ancho:
+            renglones += 1
+            actual = palabra
+        else:
+            actual = propuesta
+    return renglones
+
+
+def _nueva_hoja():
+    """Hoja A4 vacía con los márgenes de las plantillas"""
+    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    pdf.set_margins(MARGEN_IZQUIERDO, 20, MARGEN_DERECHO)
+    pdf.set_auto_page_break(False)
+    pdf.add_page()
+    return pdf
+
+
+def _ancho_util(pdf):
+    return pdf.w - MARGEN_IZQUIERDO - MARGEN_DERECHO
+
+
+def _reemplazar(texto, valores):
+    """Sustituye en un texto los marcadores {{...}} por sus valores"""
+    for marcador, valor in valores.items():
+        if marcador in texto:
+            texto = texto.replace(marcador, str(valor))
+    return texto
+
+
+def _valores_variables(data):
+    """Valores de los marcadores que cambian en cada factura (los mismos que usa creacionDocumentos)"""
+    return {
+        '{{SERIE_NUMERO}}': f"{data['Serie']}{data['Numero']}",
+        '{{FECHA_FACTURA}}': data['Fecha_factura_texto'],
+        '{{NOMBRE_EMISOR}}': data['Nombre_Emisor'],
+        '{{PARTIDA}}': data['No_partida'],
+        '{{DESCRIPCION}}': data['Descripcion_partida'],
+        '{{MES}}': data['Mes'],
+        '{{EMPLEO_RECURSO}}': data.get('Empleo_recurso', ''),
+        '{{MONTO}}': data.get('monto', ''),
+    }
+
+
+def leer_textos_plantilla(template_path):
+    """
+    Extrae los textos de una plantilla de legalización para renderizarla en PDF.
+
+    Se toman de la plantilla el título (primer párrafo con texto), el párrafo
+    de la factura (el que lleva {{SERIE_NUMERO}}), el lugar y fecha (el que
+    lleva {{FECHA_DOCUMENTO}}), el bloque del visto bueno (los párrafos que
+    siguen), la tabla del oficio (la fila con {{MONTO}} y la anterior, si
+    existe) y las celdas de firmas (la fila con {{NOMBRE_RECIBIO_LA_COMPRA}}).
+    Los marcadores se conservan y se sustituyen al renderizar.
+
+    Args:
+        template_path (str): Ruta a la plantilla .docx
+
+    Returns:
+        dict: titulo, cuerpo, lugar, visto_bueno (líneas), oficio (lista de
+              (encabezado, valor) o None) y firmas (líneas de cada celda)
+
+    Raises:
+        ValueError: Si la plantilla no tiene el párrafo de la factura o el de lugar y fecha
+    """
+    doc = Document(template_path)
+    parrafos = [p.text.strip() for p in doc.paragraphs]
+    con_texto = [i for i, texto in enumerate(parrafos) if texto]
+    try:
+        indice_cuerpo = next(i for i in con_texto if '{{SERIE_NUMERO}}' in parrafos[i])
+        indice_lugar = next(i for i in con_texto if '{{FECHA_DOCUMENTO}}' in parrafos[i])
+    except StopIteration:
+        raise ValueError(f"La plantilla {os.path.basename(template_path)} no tiene el formato de una legalización")
+
+    # Bloque del visto bueno: del primer párrafo con texto tras el lugar al último de la hoja
+    siguientes = [i for i in con_texto if i > indice_lugar]
+    visto_bueno = parrafos[siguientes[0]:siguientes[-1] + 1] if siguientes else []
+
+    oficio, firmas = None, []
+    for table in doc.tables:
+        filas = [[cell.text.strip() for cell in row.cells] for row in table.rows]
+        for f, fila in enumerate(filas):
+            if oficio is None and any('{{MONTO}}' in celda for celda in fila):
+                encabezados = filas[f - 1] if f > 0 else [''] * len(fila)
+                oficio = list(zip(encabezados, fila))
+            elif not firmas and any('{{NOMBRE_RECIBIO_LA_COMPRA}}' in celda for celda in fila):
+                # Las celdas combinadas se repiten en row.cells
+                celdas = [c for i, c in enumerate(fila) if i == 0 or c != fila[i - 1]]
+                firmas = [[linea.strip() for linea in celda.split('\n')] for celda in celdas]
+
+    return {
+        'titulo': parrafos[con_texto[0]],
+        'cuerpo': parrafos[indice_cuerpo],
+        'lugar': parrafos[indice_lugar],
+        'visto_bueno': visto_bueno,
+        'oficio': oficio,
+        'firmas': firmas,
+    }
+
+
+def _anchos_oficio(oficio, ancho):
+    """Ancho (mm) de cada columna de la tabla del oficio"""
+    if len(oficio) == len(ANCHOS_OFICIO):
+        return list(ANCHOS_OFICIO)
+    return [ancho / len(oficio)] * len(oficio)
+
+
+def _renderizar_parte_fija(textos, datos):
+    """
+    Renderiza la parte fija de una hoja de legalización.
+
+    Args:
+        textos (dict): Textos de la plantilla (ver leer_textos_plantilla)
+        datos (dict): Valores de CAMPOS_FIJOS
+
+    Returns:
+        bytes: PDF de una página
+    """
+    valores = {marcador: datos[campo] for marcador, campo in MARCADORES_FIJOS.items()}
+    pdf = _nueva_hoja()
+    ancho = _ancho_util(pdf)
+
+    pdf.set_font('Arial', 'B', 12)
+    pdf.set_xy(MARGEN_IZQUIERDO, Y_TITULO)
+    pdf.multi_cell(ancho, 6, _texto_pdf(textos['titulo']), 0, 'C')
+
+    pdf.set_font('Arial', '', TAMANO_CUERPO)
+    pdf.set_xy(MARGEN_IZQUIERDO, Y_LUGAR)
+    pdf.multi_cell(ancho, ALTO_RENGLON, _texto_pdf(_reemplazar(textos['lugar'], valores)), 0, 'J')
+
+    if textos['oficio']:
+        anchos = _anchos_oficio(textos['oficio'], ancho)
+        pdf.set_font('Arial', 'B', 9)
+        x = MARGEN_IZQUIERDO
+        for (encabezado, _), ancho_columna in zip(textos['oficio'], anchos):
+            pdf.set_xy(x, Y_TABLA)
+            pdf.multi_cell(ancho_columna, ALTO_CELDA, _texto_pdf(encabezado), 0, 'C')
+            x += ancho_columna
+        pdf.set_font('Arial', '', 9)
+        x = MARGEN_IZQUIERDO
+        for (_, valor), ancho_columna in zip(textos['oficio'], anchos):
+            pdf.rect(x, Y_TABLA, ancho_columna, 5 * ALTO_CELDA)
+            # El monto va en el fragmento variable
+            if valor and '{{MONTO}}' not in valor:
+                pdf.set_xy(x, Y_TABLA + 2 * ALTO_CELDA)
+                pdf.multi_cell(ancho_columna, 4, _texto_pdf(_reemplazar(valor, valores)), 0, 'C')
+            x += ancho_columna
+
+    pdf.set_xy(MARGEN_IZQUIERDO, Y_VISTO_BUENO)
+    for linea in textos['visto_bueno']:
+        pdf.cell(ancho, ALTO_RENGLON, _texto_pdf(_reemplazar(linea, valores)), 0, 1, 'C')
+
+    if textos['firmas']:
+        ancho_firma = ancho / len(textos['firmas'])
+        for columna, lineas in enumerate(textos['firmas']):
+            x = MARGEN_IZQUIERDO + columna * ancho_firma
+            pdf.set_xy(x, Y_FIRMAS)
+            for linea in lineas:
+                pdf.set_x(x)
+                pdf.multi_cell(ancho_firma, ALTO_RENGLON, _texto_pdf(_reemplazar(linea, valores)), 0, 'C')
+
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def _renderizar_parte_variable(textos, data):
+    """
+    Renderiza los campos de una factura en una hoja sin la parte fija.
+
+    Args:
+        textos (dict): Textos de la plantilla (ver leer_textos_plantilla)
+        data (dict): Datos de la factura
+
+    Returns:
+        bytes: PDF de una página
+    """
+    valores = _valores_variables(data)
+    pdf = _nueva_hoja()
+    ancho = _ancho_util(pdf)
+    cuerpo = _texto_pdf(_reemplazar(textos['cuerpo'], valores))
+
+    # Reducir la fuente hasta que el párrafo quepa en su recuadro
+    tamano = TAMANO_CUERPO
+    while True:
+        pdf.set_font('Arial', '', tamano)
+        alto_renglon = ALTO_RENGLON * tamano / TAMANO_CUERPO
+        renglones = _contar_renglones(pdf, cuerpo, ancho - 2 * pdf.c_margin)
+        if renglones * alto_renglon <= ALTO_CUERPO or tamano <= TAMANO_MINIMO_CUERPO:
+            break
+        tamano -= 0.5
+    pdf.set_xy(MARGEN_IZQUIERDO, Y_CUERPO)
+    pdf.multi_cell(ancho, alto_renglon, cuerpo, 0, 'J')
+
+    if textos['oficio']:
+        x = MARGEN_IZQUIERDO
+        pdf.set_font('Arial', 'B', 10)
+        for (_, valor), ancho_columna in zip(textos['oficio'], _anchos_oficio(textos['oficio'], ancho)):
+            if '{{MONTO}}' in valor:
+                pdf.set_xy(x, Y_TABLA + 2 * ALTO_CELDA)
+                pdf.cell(ancho_columna, 8, _texto_pdf(_reemplazar(valor, valores)), 0, 0, 'C')
+            x += ancho_columna
+
+    return pdf.output(dest='S').encode('latin-1')
+
+
+class FragmentRenderer:
+    """
+    Hojas de legalización a partir de la parte fija renderizada una vez por corrida.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fragmentos = {}
+        self._textos = {}
+        self.estadisticas = {}
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Descarta las partes fijas, los textos leídos y las estadísticas (al iniciar una corrida)"""
+        with self._lock:
+            for fragmento, _ in self._fragmentos.values():
+                fragmento.close()
+            self._fragmentos = {}
+            self._textos = {}
+            self.estadisticas = {'fragmentos': 0, 'hojas': 0, 'segundos_fragmentos': 0.0, 'segundos_hojas': 0.0}
+
+    def _textos_plantilla(self, template_path):
+        """
+        Obtiene los textos de una plantilla (se vuelven a leer si cambia su mtime).
+
+        Debe llamarse con el candado tomado.
+
+        Returns:
+            tuple: (clave de la versión de la plantilla, textos)
+        """
+        ruta = os.path.abspath(template_path)
+        version = (ruta, os.path.getmtime(ruta))
+        if self._textos.get(ruta, (None,))[0] != version:
+            self._textos[ruta] = (version, leer_textos_plantilla(ruta))
+        return self._textos[ruta]
+
+    def _clave(self, tipo, version, datos):
+        texto = '\0'.join([tipo, *map(str, version)] + [str(datos[campo]) for campo in CAMPOS_FIJOS])
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def _fragmento(self, tipo, version, textos, data):
+        """
+        Obtiene el form XObject con la parte fija de un tipo de hoja (lo renderiza la primera vez).
+
+        Debe llamarse con el candado tomado.
+        """
+        datos = {campo: data[campo] for campo in CAMPOS_FIJOS}
+        clave = self._clave(tipo, version, datos)
+        if clave not in self._fragmentos:
+            inicio = time.perf_counter()
+            fragmento = pikepdf.open(io.BytesIO(_renderizar_parte_fija(textos, datos)))
+            forma = fragmento.make_indirect(fragmento.pages[0].as_form_xobject())
+            self._fragmentos[clave] = (fragmento, forma)
+            self.estadisticas['fragmentos'] += 1
+            self.estadisticas['segundos_fragmentos'] += time.perf_counter() - inicio
+        return self._fragmentos[clave][1]
+
+    def renderizar(self, template_path, tipo, data, output_path):
+        """
+        Genera la hoja de legalización de una factura.
+
+        Args:
+            template_path (str): Ruta a la plantilla de la que se toman los textos
+            tipo (str): Tipo de hoja (clave en HOJAS_LEGALIZACION)
+            data (dict): Datos de la factura
+            output_path (str): Ruta del PDF generado
+
+        Returns:
+            str: Ruta del PDF generado
+        """
+        inicio = time.perf_counter()
+        with self._lock:
+            version, textos = self._textos_plantilla(template_path)
+        with pikepdf.open(io.BytesIO(_renderizar_parte_variable(textos, data))) as pdf:
+            with self._lock:
+                forma = pdf.copy_foreign(self._fragmento(tipo, version, textos, data))
+            pagina = pdf.pages[0]
+            pagina.add_underlay(forma, pikepdf.Rectangle(*[float(v) for v in pagina.mediabox]))
+            with ruta_temporal(output_path) as temporal:
+                pdf.save(temporal)
+
+        with self._lock:
+            self.estadisticas['hojas'] += 1
+            self.estadisticas['segundos_hojas'] += time.perf_counter() - inicio
+        return output_path
+
+    def resumen(self):
+        """
+        Obtiene las estadísticas de la corrida.
+
+        Returns:
+            dict: fragmentos y hojas renderizados y sus segundos
+        """
+        with self._lock:
+            return dict(self.estadisticas)
+
+
+# Renderizador compartido por todas las facturas de la corrida
+fragment_renderer = FragmentRenderer()
+
+
+def crear_legalizacion_pdf(template_path, output_dir, data, template_name, tipo):
+    """
+    Genera directamente en PDF una hoja de legalización (sin conversión de Word).
+
+    Args:
+        template_path (str): Ruta a la plantilla legalizacion_*.docx
+        output_dir (str): Directorio donde se guardará el documento
+        data (dict): Datos de la factura
+        template_name (str): Nombre de la plantilla (para nombrar el archivo)
+        tipo (str): Tipo de hoja (clave en HOJAS_LEGALIZACION)
+
+    Returns:
+        str: Ruta al PDF generado
+    """
+    try:
+        output_path = os.path.join(output_dir, template_name + ".pdf")
+        return fragment_renderer.renderizar(template_path, tipo, data, output_path)
+    except Exception as e:
+        raise Exception(f"Error al crear la hoja de legalización en PDF: {str(e)}")
@@ -0,0 +1,245 @@
+"""
+Listado del XML de la factura en Word o directamente en PDF.
+
+En lugar de poner todo el CFDI serializado en un solo párrafo, el XML se
+formatea con sangría, las líneas se cortan a un ancho fijo y se agrupan en
+párrafos de tamaño acotado. El corte de líneas se calcula una sola vez, así
+que el tiempo de armado crece de forma lineal con el tamaño del XML.
+"""
+import os
+import logging
+import textwrap
+import xml.etree.ElementTree as ET
+from copy import deepcopy
+
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import Pt
+from fpdf import FPDF
+from lxml import etree
+
+from config import LISTADO_XML_CONFIG
+from generators.relacion_pdf import dividir_en_bloques
+from utils.file_utils import ruta_temporal
+from utils.template_cache import template_cache
+
+logger = logging.getLogger(__name__)
+
+MARCADOR_XML = '{{XML}}'
+
+# Ancho de un carácter de Courier en proporción al tamaño de la fuente
+ANCHO_CARACTER_COURIER = 0.6
+MM_POR_PUNTO = 25.4 / 72
+
+
+def _indentar(elemento, sangria, nivel=0):
+    """Agrega saltos de línea y sangría a un árbol de ElementTree (equivale a ET.indent)"""
+    espacio = "\n" + sangria * nivel
+    if len(elemento):
+        if not elemento.text or not elemento.text.strip():
+            elemento.text = espacio + sangria
+        for hijo in elemento:
+            _indentar(hijo, sangria, nivel + 1)
+        if not hijo.tail or not hijo.tail.strip():
+            hijo.tail = espacio
+    if nivel and (not elemento.tail or not elemento.tail.strip()):
+        elemento.tail = espacio
+
+
+def formatear_xml(xml_texto, sangria="  "):
+    """
+    Formatea el XML con un elemento por línea y sangría por nivel.
+
+    Args:
+        xml_texto (str): XML serializado
+        sangria (str): Texto usado para cada nivel de sangría
+
+    Returns:
+        str: XML formateado (o el texto original si no se puede analizar)
+    """
+    try:
+        raiz = ET.fromstring(xml_texto)
+    except ET.ParseError as e:
+        logger.warning(f"No se pudo formatear el XML, se usará tal cual: {str(e)}")
+        return xml_texto
+    _indentar(raiz, sangria)
+    return ET.tostring(raiz, encoding='unicode')
+
+
+def envolver_lineas(texto, ancho):
+    """
+    Corta cada línea del texto a un ancho máximo conservando su sangría.
+
+    Args:
+        texto (str): Texto con saltos de línea
+        ancho (int): Número máximo de caracteres por línea
+
+    Returns:
+        list: Líneas resultantes
+    """
+    lineas = []
+    for linea in texto.splitlines():
+        if len(linea) <= ancho:
+            lineas.append(linea)
+            continue
+        sangria = linea[:len(linea) - len(linea.lstrip())]
+        lineas.extend(textwrap.wrap(
+            linea,
+            width=ancho,
+            subsequent_indent=sangria + "    ",
+            break_long_words=True,
+            break_on_hyphens=False,
+            drop_whitespace=True,
+        ) or [""])
+    return lineas
+
+
+def _crear_propiedades_run(fuente, tamano):
+    """Crea el w:rPr con la fuente y el tamaño del listado"""
+    rPr = OxmlElement('w:rPr')
+    rFonts = rPr.get_or_add_rFonts()
+    for atributo in ('w:ascii', 'w:hAnsi', 'w:cs'):
+        rFonts.set(qn(atributo), fuente)
+    rPr.sz_val = tamano
+    return rPr
+
+
+def renderizar_listado_docx(template_path, output_path, lineas, lineas_por_parrafo, fuente, tamano):
+    """
+    Sustituye el marcador {{XML}} de la plantilla por párrafos de tamaño acotado.
+
+    Cada párrafo contiene hasta lineas_por_parrafo líneas separadas con w:br;
+    el párrafo prototipo (con las propiedades del párrafo del marcador) se
+    clona para cada bloque.
+
+    Args:
+        template_path (str): Plantilla xml.docx
+        output_path (str): Ruta del documento generado
+        lineas (list): Líneas ya cortadas
+        lineas_por_parrafo (int): Líneas máximas por párrafo
+        fuente (str): Fuente del listado
+        tamano: Tamaño de la fuente
+
+    Returns:
+        str: Ruta del documento generado
+    """
+    doc = template_cache.obtener_documento(template_path)
+    cuerpo = doc.element.body
+
+    parrafo_marcador = None
+    for p in cuerpo.iter(qn('w:p')):
+        if MARCADOR_XML in ''.join(t.text or '' for t in p.iter(qn('w:t'))):
+            parrafo_marcador = p
+            break
+    if parrafo_marcador is None:
+        raise ValueError(f"La plantilla no contiene el marcador {MARCADOR_XML}")
+
+    # Párrafo prototipo: mismas propiedades de párrafo, sin runs
+    prototipo = deepcopy(parrafo_marcador)
+    for hijo in list(prototipo):
+        if hijo.tag != qn('w:pPr'):
+            prototipo.remove(hijo)
+    rPr = _crear_propiedades_run(fuente, tamano)
+
+    # Nombres calificados calculados una vez (SubElement es mucho más rápido que OxmlElement)
+    tag_r, tag_t, tag_br, attr_space = qn('w:r'), qn('w:t'), qn('w:br'), qn('xml:space')
+
+    anterior = parrafo_marcador
+    for bloque in dividir_en_bloques(lineas, lineas_por_parrafo):
+        p = deepcopy(prototipo)
+        r = etree.SubElement(p, tag_r)
+        r.append(deepcopy(rPr))
+        for i, linea in enumerate(bloque):
+            if i:
+                etree.SubElement(r, tag_br)
+            t = etree.SubElement(r, tag_t, {attr_space: 'preserve'})
+            t.text = linea
+        anterior.addnext(p)
+        anterior = p
+
+    cuerpo.remove(parrafo_marcador)
+    with ruta_temporal(output_path) as temporal:
+        doc.save(temporal)
+    return output_path
+
+
+def renderizar_listado_pdf(output_path, texto, tamano_pt, margen_mm=15):
+    """
+    Escribe el listado directamente en PDF con Courier y cortes de línea precalculados.
+
+    Como Courier es monoespaciada, el número de caracteres por línea se
+    calcula a partir del ancho útil de la página y no hace falta medir cada
+    línea.
+
+    Args:
+        output_path (str): Ruta del PDF generado
+        texto (str): XML ya formateado
+        tamano_pt (float): Tamaño de la fuente en puntos
+        margen_mm (float): Margen de la página en milímetros
+
+    Returns:
+        str: Ruta del PDF generado
+    """
+    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    pdf.set_margins(margen_mm, margen_mm, margen_mm)
+    pdf.set_auto_page_break(True, margen_mm)
+    pdf.set_font('Courier', '', tamano_pt)
+
+    ancho_util = pdf.w - 2 * margen_mm
+    caracteres_por_linea = max(20, int(ancho_util / (ANCHO_CARACTER_COURIER * tamano_pt * MM_POR_PUNTO)))
+    alto_linea = tamano_pt * MM_POR_PUNTO * 1.2
+
+    pdf.add_page()
+    for linea in envolver_lineas(texto, caracteres_por_linea):
+        pdf.cell(0, alto_linea, linea.encode('latin-1', 'replace').decode('latin-1'), 0, 1)
+
+    with ruta_temporal(output_path) as temporal:
+        pdf.output(temporal)
+    return output_path
+
+
+def crear_listado_xml(template_path, output_dir, data, template_name):
+    """
+    Genera el documento con el listado del XML de la factura.
+
+    Según LISTADO_XML_CONFIG genera el Word a partir de xml.docx o el PDF
+    directamente (sin pasar por la conversión de Word).
+
+    Args:
+        template_path (str): Plantilla xml.docx
+        output_dir (str): Directorio donde se guardará el documento
+        data (dict): Datos de la factura (usa data['xml'])
+        template_name (str): Nombre de la plantilla (para nombrar el archivo)
+
+    Returns:
+        str: Ruta al documento generado (.docx o .pdf)
+    """
+    try:
+        xml_texto = data['xml'] or ''
+        if LISTADO_XML_CONFIG.get('formatear', True):
+            xml_texto = formatear_xml(xml_texto)
+
+        tamano_pt = LISTADO_XML_CONFIG.get('tamano_pt', 6)
+
+        if LISTADO_XML_CONFIG.get('salida_pdf_directa', False):
+            output_path = os.path.join(output_dir, template_name + ".pdf")
+            return renderizar_listado_pdf(output_path, xml_texto, tamano_pt)
+
+        if LISTADO_XML_CONFIG.get('monoespaciado', False):
+            fuente = LISTADO_XML_CONFIG.get('fuente_monoespaciada', 'Courier New')
+        else:
+            fuente = LISTADO_XML_CONFIG.get('fuente', 'Geomanist')
+
+        lineas = envolver_lineas(xml_texto, LISTADO_XML_CONFIG.get('ancho_linea', 120))
+        output_path = os.path.join(output_dir, template_name + ".docx")
+        return renderizar_listado_docx(
+            template_path,
+            output_path,
+            lineas,
+            LISTADO_XML_CONFIG.get('lineas_por_parrafo', 50),
+            fuente,
+            Pt(tamano_pt)
+        )
+
+    except Exception as e:
+        raise Exception(f"Error al crear el listado del XML: {str(e)}")
@@ -1,6 +1,6 @@
 import os
-import re
-from decimal import Decimal, InvalidOperation
+from collections.abc import Mapping
+from decimal import Decimal
 import logging
 from docx import Document
 from datetime import datetime
@@ -11,6 +11,16 @@ from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.enum.table import WD_CELL_VERTICAL_ALIGNMENT
 
+from config import EXCEL_CONFIG, FORMATO_CONFIG, RELACION_CONFIG
+from core.template_registry import template_registry
+from core.reconciliation import a_centavos, calcular_totales, calcular_montos_partida
+from generators.relacion_pdf import COLUMNA_IMPORTE, dividir_en_bloques, generar_relacion_pdf, valores_fila_total
+from utils.formatters import format_monto
+from utils.file_utils import ruta_temporal
+from utils.ooxml_writer import llenar_docx
+from utils.template_cache import template_cache
+from utils.excel_processor import procesar_libros_excel
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -19,56 +29,16 @@ def calcular_montos_facturas(facturas_info):
     """
     Calcula información resumida de las facturas procesadas.
 
+    Delegado al motor de conciliación para que todos los totales se
+    calculen igual (en centavos exactos).
+
     Args:
         facturas_info (list): Lista de facturas procesadas
 
     Returns:
         dict: Diccionario con información resumida
     """
-    # Inicializar contadores
-    total_facturas = 0
-    monto_total = Decimal('0.00')
-    montos_individuales = []
-
-    # Procesar cada factura
-    for factura in facturas_info:
-        # Saltear elementos que no son diccionarios
-        if not isinstance(factura, dict):
-            continue
-
-        total_facturas += 1
-
-        # Primero intentar usar el valor decimal directo
-        if 'monto_decimal' in factura:
-            monto = factura['monto_decimal']
-        else:
-            # Extraer el monto y convertirlo a Decimal
-            monto_str = factura.get('monto', '0')
-            if isinstance(monto_str, str):
-                # Limpiar el string de monto (eliminar símbolos de moneda y separadores de miles)
-                monto_limpio = re.sub(r'[^\d.]', '', monto_str.replace(',', ''))
-                try:
-                    monto = Decimal(monto_limpio)
-                except InvalidOperation:
-                    logger.warning(f"No se pudo convertir el monto '{monto_str}' a decimal")
-                    monto = Decimal('0.00')
-            elif isinstance(monto_str, (int, float)):
-                monto = Decimal(str(monto_str))
-            else:
-                monto = Decimal('0.00')
-        
-        montos_individuales.append(monto)
-        monto_total += monto
-
-    # Formatear el monto total como string con formato moneda
-    monto_formateado = f"$ {monto_total:,.2f}"
-
-    return {
-        'total_facturas': total_facturas,
-        'monto_total': monto_total,
-        'monto_formateado': monto_formateado,
-        'montos_individuales': montos_individuales
-    }
+    return calcular_totales(facturas_info)
 
 def aplicar_formato_geomanist(paragraph):
     """
@@ -99,6 +69,139 @@ def aplicar_formato_a_documento(doc):
                 for paragraph in cell.paragraphs:
                     aplicar_formato_geomanist(paragraph)
 
+def fijar_fuente_rpr(rPr, fuente, tamano):
+    """
+    Fija fuente y tamaño en un elemento w:rPr, quitando las fuentes de tema.
+
+    Args:
+        rPr: Elemento w:rPr
+        fuente (str): Nombre de la fuente
+        tamano: Tamaño (Length, p. ej. Pt(10))
+    """
+    rFonts = rPr.get_or_add_rFonts()
+    for atributo in ('w:asciiTheme', 'w:hAnsiTheme'):
+        if qn(atributo) in rFonts.attrib:
+            del rFonts.attrib[qn(atributo)]
+    rFonts.set(qn('w:ascii'), fuente)
+    rFonts.set(qn('w:hAnsi'), fuente)
+    rPr.sz_val = tamano
+
+# Párrafos que formatea el modo por runs: los del cuerpo y los de las celdas de sus tablas
+XPATH_PARRAFOS_FORMATEADOS = './w:p | ./w:tbl/w:tr/w:tc/w:p'
+
+def aplicar_fuente_en_estilos(doc, fuente="Geomanist", tamano=Pt(10)):
+    """
+    Aplica la fuente a nivel de estilos en lugar de recorrer cada run.
+
+    Solo toca los párrafos que formatea aplicar_formato_a_documento (los del
+    cuerpo y los de las celdas de sus tablas): fija la fuente y el tamaño en
+    los estilos de párrafo y de carácter que usan y quita la fuente y el
+    tamaño directos de sus runs para que hereden del estilo. Los runs
+    creados al sustituir marcadores ya no necesitan formato propio. Otros
+    párrafos que compartan esos estilos (p. ej. un encabezado con estilo
+    Normal) también los heredan. Pensado para ejecutarse una sola vez por
+    plantilla (ver TemplateCache).
+
+    Args:
+        doc: Documento Word a formatear
+        fuente (str): Nombre de la fuente
+        tamano: Tamaño de la fuente
+    """
+    estilos = doc.styles.element
+    parrafos = doc.element.body.xpath(XPATH_PARRAFOS_FORMATEADOS)
+
+    # Estilos de párrafo (el predeterminado si el párrafo no indica uno) y de carácter usados
+    predeterminado = estilos.xpath(
+        'w:style[@w:type="paragraph"][@w:default="1" or @w:default="true" or @w:default="on"]/@w:styleId'
+    ) or ['Normal']
+    usados = set()
+    for p in parrafos:
+        usados.add((p.xpath('./w:pPr/w:pStyle/@w:val') or predeterminado)[0])
+        usados.update(p.xpath('./w:r/w:rPr/w:rStyle/@w:val'))
+
+    for style_id in usados:
+        estilo = estilos.get_by_id(style_id)
+        if estilo is not None:
+            fijar_fuente_rpr(estilo.get_or_add_rPr(), fuente, tamano)
+
+    # Quitar la fuente y el tamaño directos de los runs de esos párrafos
+    for p in parrafos:
+        for rPr in p.xpath('./w:r/w:rPr'):
+            rFonts = rPr.find(qn('w:rFonts'))
+            if rFonts is not None:
+                for atributo in ('w:ascii', 'w:hAnsi', 'w:asciiTheme', 'w:hAnsiTheme'):
+                    if qn(atributo) in rFonts.attrib:
+                        del rFonts.attrib[qn(atributo)]
+                if not rFonts.attrib:
+                    rPr.remove(rFonts)
+            sz = rPr.find(qn('w:sz'))
+            if sz is not None:
+                rPr.remove(sz)
+
+def abrir_plantilla_formateada(template_path, tamano=Pt(10), fuente="Geomanist"):
+    """
+    Abre una plantilla según el modo de formato configurado.
+
+    En modo 'estilos' la fuente se fija en los estilos una sola vez por
+    plantilla y el resultado queda en la caché de plantillas; en modo 'runs'
+    se abre la plantilla original para formatear run por run.
+
+    Args:
+        template_path (str): Ruta a la plantilla
+        tamano: Tamaño de la fuente
+        fuente (str): Nombre de la fuente
+
+    Returns:
+        Document: Documento listo para llenarse
+    """
+    if FORMATO_CONFIG.get('modo', 'runs') != 'estilos':
+        return Document(template_path)
+    return template_cache.obtener_documento(
+        template_path,
+        preparar=lambda doc: aplicar_fuente_en_estilos(doc, fuente, tamano),
+        variante=('estilos', fuente, tamano)
+    )
+
+def origen_plantilla_formateada(template_path, tamano=Pt(10), fuente="Geomanist"):
+    """
+    Obtiene el origen de una plantilla para el motor OOXML.
+
+    En modo 'estilos' devuelve el contenido ya preparado de la caché de
+    plantillas; en modo 'runs' la ruta del archivo original.
+
+    Args:
+        template_path (str): Ruta a la plantilla
+        tamano: Tamaño de la fuente
+        fuente (str): Nombre de la fuente
+
+    Returns:
+        bytes or str: Contenido .docx preparado o ruta de la plantilla
+    """
+    if FORMATO_CONFIG.get('modo', 'runs') != 'estilos':
+        return template_path
+    return template_cache.obtener_bytes(
+        template_path,
+        preparar=lambda doc: aplicar_fuente_en_estilos(doc, fuente, tamano),
+        variante=('estilos', fuente, tamano)
+    )
+
+def aplicar_formato_runs_xml(raiz, fuente="Geomanist", tamano=Pt(10)):
+    """
+    Fija fuente y tamaño en los runs que formatea aplicar_formato_a_documento (modo 'runs' del motor OOXML).
+
+    Args:
+        raiz: Elemento raíz w:document
+        fuente (str): Nombre de la fuente
+        tamano: Tamaño de la fuente
+    """
+    for p in raiz.body.xpath(XPATH_PARRAFOS_FORMATEADOS):
+        for r in p.r_lst:
+            fijar_fuente_rpr(r.get_or_add_rPr(), fuente, tamano)
+
+def usar_motor_ooxml():
+    """Indica si las plantillas de partida se llenan con el motor OOXML"""
+    return FORMATO_CONFIG.get('motor_partidas', 'ooxml') == 'ooxml'
+
 def aplicar_bordes_celda(celda):
     """
     Aplica bordes a todos los lados de una celda.
@@ -150,6 +253,215 @@ def aplicar_formato_celda(celda, centrar=True, aplicar_bordes=True, fuente_geoma
                 run.font.name = "Geomanist"
                 run.font.size = Pt(10)
 
+def crear_bordes_celda():
+    """
+    Crea el elemento w:tcBorders con borde sencillo en los cuatro lados.
+
+    Returns:
+        Elemento w:tcBorders
+    """
+    tcBorders = OxmlElement('w:tcBorders')
+    for border_type in ['top', 'left', 'bottom', 'right']:
+        border = OxmlElement(f'w:{border_type}')
+        border.set(qn('w:val'), 'single')
+        border.set(qn('w:sz'), '4')
+        border.set(qn('w:space'), '0')
+        border.set(qn('w:color'), '000000')
+        tcBorders.append(border)
+    return tcBorders
+
+def formatear_celda_xml(tc, alineacion=WD_ALIGN_PARAGRAPH.CENTER, negrita=False):
+    """
+    Aplica bordes, alineación y fuente Geomanist 10pt a una celda trabajando
+    directamente sobre su XML (equivale a aplicar_formato_celda sin duplicar
+    el elemento de bordes).
+
+    Args:
+        tc: Elemento w:tc de la celda
+        alineacion: Alineación horizontal de los párrafos
+        negrita: Si los runs deben ir en negrita
+    """
+    tcPr = tc.get_or_add_tcPr()
+
+    # Reemplazar los bordes existentes en lugar de agregar otro elemento
+    bordes = crear_bordes_celda()
+    bordes_actuales = tcPr.find(qn('w:tcBorders'))
+    if bordes_actuales is not None:
+        tcPr.replace(bordes_actuales, bordes)
+    else:
+        tcPr.insert_element_before(
+            bordes, 'w:shd', 'w:noWrap', 'w:tcMar', 'w:textDirection',
+            'w:tcFitText', 'w:vAlign', 'w:hideMark'
+        )
+    tcPr.vAlign_val = WD_CELL_VERTICAL_ALIGNMENT.CENTER
+
+    for p in tc.p_lst:
+        p.get_or_add_pPr().jc_val = alineacion
+        for r in p.r_lst:
+            rPr = r.get_or_add_rPr()
+            rFonts = rPr.get_or_add_rFonts()
+            rFonts.set(qn('w:ascii'), "Geomanist")
+            rFonts.set(qn('w:hAnsi'), "Geomanist")
+            rPr.sz_val = Pt(10)
+            if negrita:
+                rPr._set_bool_val('b', True)
+
+def crear_fila_prototipo(tbl, alineaciones, negritas=None):
+    """
+    Crea una fila w:tr ya formateada con un run vacío por celda.
+
+    El ancho de cada celda se toma de la cuadrícula de la tabla, igual que
+    lo hace add_row().
+
+    Args:
+        tbl: Elemento w:tbl de la tabla
+        alineaciones: Alineación horizontal por columna
+        negritas: Negrita por columna (por defecto ninguna)
+
+    Returns:
+        Elemento w:tr prototipo (no insertado en la tabla)
+    """
+    if negritas is None:
+        negritas = [False] * len(alineaciones)
+
+    tr = OxmlElement('w:tr')
+    for gridCol, alineacion, negrita in zip(tbl.tblGrid.gridCol_lst, alineaciones, negritas):
+        tc = tr.add_tc()
+        tc.width = gridCol.w
+        tc.p_lst[0].add_r().add_t('')
+        formatear_celda_xml(tc, alineacion, negrita)
+    return tr
+
+def clonar_filas(prototipo, valores_filas):
+    """
+    Clona la fila prototipo una vez por registro y solo asigna el texto.
+
+    Args:
+        prototipo: Elemento w:tr creado con crear_fila_prototipo
+        valores_filas: Lista de listas con el texto de cada celda
+
+    Returns:
+        list: Elementos w:tr listos para insertarse en la tabla
+    """
+    filas = []
+    for valores in valores_filas:
+        tr = deepcopy(prototipo)
+        for t, valor in zip(tr.iter(qn('w:t')), valores):
+            t.text = valor
+            if valor != valor.strip():
+                t.set(qn('xml:space'), 'preserve')
+        filas.append(tr)
+    return filas
+
+def valores_fila_factura(factura):
+    """
+    Obtiene el texto de cada columna de la relación para una factura.
+
+    Args:
+        factura: Factura procesada
+
+    Returns:
+        list: [fecha, serie y número, emisor, importe]
+    """
+    # Formatear fecha
+    fecha_factura = factura.get('fecha_factura', '')
+    if isinstance(fecha_factura, str) and '-' in fecha_factura:
+        try:
+            fecha_obj = datetime.strptime(fecha_factura, '%Y-%m-%d')
+            fecha_factura = fecha_obj.strftime('%d/%m/%Y')
+        except ValueError:
+            pass
+
+    # Usar el valor formateado si existe, o formatear el valor decimal
+    if 'monto' in factura and '$' in str(factura['monto']):
+        monto = str(factura['monto'])
+    elif 'monto_decimal' in factura:
+        monto = f"$ {factura['monto_decimal']:,.2f}"
+    else:
+        # Intentar formatear lo que haya
+        monto = str(factura.get('monto', '0'))
+
+    return [
+        str(fecha_factura),
+        str(factura.get('serie_numero', '')),
+        str(factura.get('emisor', '')),
+        monto,
+    ]
+
+def marcar_encabezado_repetido(tr):
+    """
+    Marca una fila para que Word la repita al inicio de cada página (w:tblHeader).
+
+    Args:
+        tr: Elemento w:tr de la fila de encabezado
+    """
+    trPr = tr.get_or_add_trPr()
+    if trPr.find(qn('w:tblHeader')) is None:
+        trPr.insert_element_before(
+            OxmlElement('w:tblHeader'),
+            'w:tblCellSpacing', 'w:jc', 'w:hidden', 'w:ins', 'w:del', 'w:trPrChange'
+        )
+
+def crear_salto_pagina():
+    """
+    Crea un párrafo que solo contiene un salto de página.
+
+    Returns:
+        Elemento w:p
+    """
+    p = OxmlElement('w:p')
+    br = OxmlElement('w:br')
+    br.set(qn('w:type'), 'page')
+    p.add_r().append(br)
+    return p
+
+def agregar_tablas_paginadas(tbl, valores_filas, montos, prototipo_factura, prototipo_total,
+                             facturas_por_pagina, monto_formateado, facturas_primera_pagina=None):
+    """
+    Reparte las facturas en hojas de tamaño fijo.
+
+    La primera hoja lleva además el encabezado del documento, por eso su
+    número de facturas se indica aparte. La tabla original conserva la
+    primera hoja; cada hoja siguiente es una
+    copia de la tabla (solo con el encabezado) precedida por un salto de
+    página. Todas las hojas terminan con su subtotal y la última además con
+    el total de la partida.
+
+    Args:
+        tbl: Elemento w:tbl con solo la fila de encabezado
+        valores_filas (list): Texto de cada fila de factura
+        montos (list): Importe de cada factura (Decimal)
+        prototipo_factura: Fila prototipo para las facturas
+        prototipo_total: Fila prototipo para subtotales y total
+        facturas_por_pagina (int): Número de facturas por hoja
+        monto_formateado (str): Total de la partida ya formateado
+        facturas_primera_pagina (int, optional): Facturas de la primera hoja (por defecto facturas_por_pagina)
+    """
+    if tbl.tr_lst:
+        marcar_encabezado_repetido(tbl.tr_lst[0])
+    tabla_base = deepcopy(tbl)
+
+    num_columnas = len(prototipo_total.tc_lst)
+    bloques = dividir_en_bloques(list(zip(valores_filas, montos)), facturas_por_pagina, facturas_primera_pagina)
+    total_hojas = len(bloques)
+    anterior = tbl
+    for hoja, bloque in enumerate(bloques, 1):
+        tabla = tbl if hoja == 1 else deepcopy(tabla_base)
+        subtotal = sum((monto for _, monto in bloque), Decimal('0.00'))
+
+        filas = clonar_filas(prototipo_factura, [valores for valores, _ in bloque])
+        filas_total = [valores_fila_total(num_columnas, f"SUBTOTAL HOJA {hoja} DE {total_hojas}", format_monto(subtotal))]
+        if hoja == total_hojas:
+            filas_total.append(valores_fila_total(num_columnas, "TOTAL", monto_formateado))
+        filas.extend(clonar_filas(prototipo_total, filas_total))
+        tabla.extend(filas)
+
+        if hoja > 1:
+            salto = crear_salto_pagina()
+            anterior.addnext(salto)
+            salto.addnext(tabla)
+        anterior = tabla
+
 def reemplazar_marcadores_texto(texto, reemplazos):
     """
     Reemplaza marcadores en un texto.
@@ -297,6 +609,9 @@ def encontrar_plantilla(nombre_archivo, base_dir=None):
     """
     Busca una plantilla en diferentes ubicaciones posibles.
 
+    Sin base_dir la búsqueda usa el registro de plantillas (directorios de
+    APP_CONFIG['templates_dirs'], resueltos una sola vez).
+
     Args:
         nombre_archivo: Nombre del archivo de plantilla
         base_dir: Directorio base opcional
@@ -305,7 +620,7 @@ def encontrar_plantilla(nombre_archivo, base_dir=None):
         str: Ruta completa a la plantilla o None si no se encuentra
     """
     if not base_dir:
-        base_dir = os.path.dirname(os.path.abspath(__file__))
+        return template_registry.resolver_archivo(nombre_archivo)
 
     # Lista de posibles ubicaciones de plantillas
     directorios_posibles = [
@@ -342,8 +657,11 @@ def procesar_plantillas_partida(partida, facturas_info, partida_dir, datos_comun
             info_facturas = calcular_montos_facturas(facturas_info)
             logger.info(f"Calculados totales para {info_facturas['total_facturas']} facturas. "
                        f"Monto total: {info_facturas['monto_formateado']}")
-            # Añadir la información resumida a los datos comunes
-            datos_comunes['info_facturas'] = info_facturas
+            # Añadir la información resumida a una copia de los datos comunes
+            if hasattr(datos_comunes, 'con_info_facturas'):
+                datos_comunes = datos_comunes.con_info_facturas(info_facturas)
+            else:
+                datos_comunes = {**datos_comunes, 'info_facturas': info_facturas}
 
         # Procesar plantilla de ingresos-egresos
         ruta_ingresos = procesar_plantilla_ingresos(
@@ -365,6 +683,23 @@ def procesar_plantillas_partida(partida, facturas_info, partida_dir, datos_comun
         archivos_generados["facturas"] = ruta_facturas
         logger.info(f"Plantilla de facturas generada en: {ruta_facturas}")
 
+        # Relación de facturas directamente en PDF (hojas renderizadas en paralelo)
+        if RELACION_CONFIG.get('salida_pdf_directa', False):
+            ruta_facturas_pdf = procesar_relacion_facturas_pdf(
+                partida_dir,
+                partida,
+                facturas_info,
+                datos_comunes
+            )
+            archivos_generados["facturas_pdf"] = ruta_facturas_pdf
+            logger.info(f"Relación de facturas en PDF generada en: {ruta_facturas_pdf}")
+
+        # Libros Excel de la partida (plantillas .xlsx analizadas una sola vez por proceso)
+        if EXCEL_CONFIG.get('generar_libros', False):
+            libros = procesar_libros_excel(partida, facturas_info, partida_dir, datos_comunes)
+            archivos_generados.update(libros)
+            logger.info(f"Libros Excel generados: {', '.join(os.path.basename(r) for r in libros.values())}")
+
         # Procesar plantilla de oficio
         ruta_oficio = procesar_plantilla_oficio(
             partida_dir,
@@ -389,15 +724,12 @@ def procesar_plantilla_ingresos(output_dir, partida, facturas_info, datos_comune
     """
     try:
         # Buscar la plantilla
-        template_path = encontrar_plantilla("ingresos_egresos.docx")
+        template_path = template_registry.obtener_ruta('ingresos_egresos')
         if not template_path:
             raise FileNotFoundError("No se encontró la plantilla de ingresos/egresos")
 
         logger.info(f"Utilizando plantilla: {template_path}")
 
-        # Cargar la plantilla
-        doc = Document(template_path)
-
         # Datos comunes
         mes = datos_comunes.get('mes_asignado', '').capitalize()
         partida_num = partida.get('numero', '')
@@ -410,15 +742,12 @@ def procesar_plantilla_ingresos(output_dir, partida, facturas_info, datos_comune
         monto_total = info_facturas.get('monto_total', Decimal('0.00'))
         monto_formateado = info_facturas.get('monto_formateado', "$ 0.00")
 
-        # Calcular montos específicos
-        monto_asignado = Decimal(str(partida.get('monto', 0)))
-        monto_asignado_str = f"$ {monto_asignado:,.2f}"
-        aportacion = monto_total - monto_asignado
-        aportacion_str = f"$ {aportacion:,.2f}"
-        suma_ingresos = monto_asignado + aportacion
-        suma_ingresos_str = f"$ {suma_ingresos:,.2f}"
-        saldo = suma_ingresos - monto_total
-        saldo_str = f"$ {saldo:,.2f}"
+        # Calcular montos específicos (aritmética exacta en centavos)
+        montos = calcular_montos_partida(partida.get('monto', 0), monto_total)
+        monto_asignado_str = montos['monto_asignado_str']
+        aportacion_str = montos['aportacion_str']
+        suma_ingresos_str = montos['suma_ingresos_str']
+        saldo_str = montos['saldo_str']
 
         # Datos del personal
         personal_vobo = datos_comunes.get('personal_vobo', {})
@@ -444,6 +773,24 @@ def procesar_plantilla_ingresos(output_dir, partida, facturas_info, datos_comune
             '{{MATRICULA_VO_BO}}': matricula_vobo
         }
 
+        output_path = os.path.join(output_dir, f"Ingresos_Egresos_Partida_{partida_num}.docx")
+
+        # Motor OOXML: solo se reescribe word/document.xml, el resto se copia tal cual
+        if usar_motor_ooxml():
+            modo_runs = FORMATO_CONFIG.get('modo', 'runs') != 'estilos'
+            llenar_docx(
+                origen_plantilla_formateada(template_path),
+                output_path,
+                reemplazos,
+                transformar=aplicar_formato_runs_xml if modo_runs else None,
+                nombre="plantilla de ingresos"
+            )
+            logger.info(f"Documento de ingresos/egresos generado: {output_path}")
+            return output_path
+
+        # Cargar la plantilla (con la fuente ya fijada en los estilos si así está configurado)
+        doc = abrir_plantilla_formateada(template_path)
+
         # Reemplazar todos los marcadores utilizando la función mejorada
         reemplazar_marcadores_en_documento(doc, reemplazos)
 
@@ -505,12 +852,13 @@ def procesar_plantilla_ingresos(output_dir, partida, facturas_info, datos_comune
                     logger.warning(f"Marcador {key} no reemplazado en plantilla de ingresos. Intentando nuevo reemplazo.")
                     paragraph.text = paragraph.text.replace(key, str(reemplazos[key]))
 
-        # Aplicar formato Geomanist 10pt a todo el documento
-        aplicar_formato_a_documento(doc)
+        # Aplicar formato Geomanist 10pt a todo el documento (solo en modo por runs)
+        if FORMATO_CONFIG.get('modo', 'runs') != 'estilos':
+            aplicar_formato_a_documento(doc)
 
         # Guardar el documento
-        output_path = os.path.join(output_dir, f"Ingresos_Egresos_Partida_{partida_num}.docx")
-        doc.save(output_path)
+        with ruta_temporal(output_path) as temporal:
+            doc.save(temporal)
 
         logger.info(f"Documento de ingresos/egresos generado: {output_path}")
         return output_path
@@ -522,51 +870,131 @@ def procesar_plantilla_ingresos(output_dir, partida, facturas_info, datos_comune
 
 
 
+def facturas_por_hoja_relacion():
+    """
+    Reparto de las facturas por hoja de la relación, el mismo para el documento Word y el PDF directo.
+
+    Returns:
+        tuple: (facturas por hoja, facturas de la primera hoja)
+    """
+    por_pagina = RELACION_CONFIG.get('facturas_por_pagina', 0)
+    return por_pagina, RELACION_CONFIG.get('facturas_primera_pagina') or por_pagina
+
+def llenar_tabla_relacion(tbl, facturas_validas, monto_formateado):
+    """
+    Llena la tabla de la relación de facturas sobre su XML.
+
+    Deja solo la fila de encabezado, la formatea y agrega las filas de las
+    facturas y el total (en una tabla o paginada, según RELACION_CONFIG).
+
+    Args:
+        tbl: Elemento w:tbl de la tabla de facturas
+        facturas_validas (list): Facturas procesadas
+        monto_formateado (str): Total de la partida ya formateado
+    """
+    # Si hay más de una fila (encabezado + datos), eliminar todas excepto el encabezado
+    for tr in tbl.tr_lst[1:]:
+        tbl.remove(tr)
+
+    # Dar formato a la fila de encabezado directamente sobre su XML
+    if tbl.tr_lst:
+        for tc in tbl.tr_lst[0].tc_lst:
+            formatear_celda_xml(tc, WD_ALIGN_PARAGRAPH.CENTER, negrita=True)
+
+    num_columnas = len(tbl.tblGrid.gridCol_lst)
+    if facturas_validas and num_columnas < 4:  # Fecha, Número, Emisor, Importe
+        logger.warning(f"La tabla tiene {num_columnas} columnas, menos de las 4 esperadas")
+    elif facturas_validas:
+        # Filas de datos: un prototipo con formato, clonado para todas las facturas
+        centrado = [WD_ALIGN_PARAGRAPH.CENTER] * num_columnas
+        prototipo_factura = crear_fila_prototipo(tbl, centrado)
+        valores_filas = [valores_fila_factura(factura) for factura in facturas_validas]
+
+        # Fila de total: rótulo y monto (columnas del importe) alineados a la derecha y en negrita
+        columnas_total = (COLUMNA_IMPORTE - 1, COLUMNA_IMPORTE)
+        alineacion_total = [
+            WD_ALIGN_PARAGRAPH.RIGHT if columna in columnas_total else WD_ALIGN_PARAGRAPH.CENTER
+            for columna in range(num_columnas)
+        ]
+        negrita_total = [columna in columnas_total for columna in range(num_columnas)]
+        prototipo_total = crear_fila_prototipo(tbl, alineacion_total, negrita_total)
+
+        por_pagina, primera_pagina = facturas_por_hoja_relacion()
+        if RELACION_CONFIG.get('paginado', False) and por_pagina and len(valores_filas) > primera_pagina:
+            # Modo paginado: una tabla por hoja con encabezado repetido y subtotal
+            montos = calcular_totales(facturas_validas)['montos_individuales']
+            agregar_tablas_paginadas(
+                tbl, valores_filas, montos, prototipo_factura, prototipo_total,
+                por_pagina, monto_formateado, primera_pagina
+            )
+        else:
+            # Insertar todas las filas en un solo lote
+            filas = clonar_filas(prototipo_factura, valores_filas)
+            filas.extend(clonar_filas(prototipo_total, [valores_fila_total(num_columnas, "TOTAL", monto_formateado)]))
+            tbl.extend(filas)
+
+def reemplazos_relacion(partida, datos_comunes, info_facturas=None):
+    """
+    Marcadores de la plantilla de relación de facturas (documento Word y PDF directo).
+
+    Args:
+        partida: Información de la partida
+        datos_comunes: Datos comunes
+        info_facturas (dict, optional): Totales de la partida (por defecto los de datos_comunes)
+
+    Returns:
+        dict: {marcador: valor}
+    """
+    info_facturas = info_facturas or datos_comunes.get('info_facturas') or {}
+    personal_vobo = datos_comunes.get('personal_vobo', {})
+    return {
+        '{{FECHA_DOCUMENTO}}': datos_comunes.get('fecha_documento_texto', ''),
+        '{{MES}}': datos_comunes.get('mes_asignado', '').capitalize(),
+        '{{PARTIDA}}': partida.get('numero', ''),
+        '{{DESCRIPCION}}': partida.get('descripcion', ''),
+        '{{TOTAL_FACTURAS}}': str(info_facturas.get('total_facturas', 0)),
+        '{{MONTO_TOTAL}}': info_facturas.get('monto_formateado', "$ 0.00"),
+        '{{GRADO_VO_BO}}': personal_vobo.get('Grado_Vo_Bo', ''),
+        '{{NOMBRE_VO_BO}}': personal_vobo.get('Nombre_Vo_Bo', ''),
+        '{{MATRICULA_VO_BO}}': personal_vobo.get('Matricula_Vo_Bo', '')
+    }
+
 def procesar_plantilla_facturas(output_dir, partida, facturas_info, datos_comunes):
     """
     Procesa la plantilla de relación de facturas en formato Word.
     """
     try:
         # Buscar la plantilla
-        template_path = encontrar_plantilla("relcion_facturas.docx")
+        template_path = template_registry.obtener_ruta('relacion_facturas')
         if not template_path:
             raise FileNotFoundError("No se encontró la plantilla de facturas")
 
         logger.info(f"Utilizando plantilla: {template_path}")
 
-        # Cargar la plantilla
-        doc = Document(template_path)
+        # Reemplazar marcadores de texto en todo el documento
+        reemplazos = reemplazos_relacion(partida, datos_comunes)
+        monto_formateado = reemplazos['{{MONTO_TOTAL}}']
 
-        # Datos comunes
-        mes = datos_comunes.get('mes_asignado', '').capitalize()
-        partida_num = partida.get('numero', '')
-        descripcion = partida.get('descripcion', '')
-        fecha_doc = datos_comunes.get('fecha_documento_texto', '')
+        # Filtrar facturas válidas
+        facturas_validas = [f for f in facturas_info if isinstance(f, Mapping)]
 
-        # Información de facturas
-        info_facturas = datos_comunes.get('info_facturas', {})
-        total_facturas = info_facturas.get('total_facturas', 0)
-        monto_total = info_facturas.get('monto_total', Decimal('0.00'))
-        monto_formateado = info_facturas.get('monto_formateado', "$ 0.00")
+        output_path = os.path.join(output_dir, f"Relacion_Facturas_Partida_{partida.get('numero', '')}.docx")
 
-        # Datos del personal
-        personal_vobo = datos_comunes.get('personal_vobo', {})
-        grado_vobo = personal_vobo.get('Grado_Vo_Bo', '')
-        nombre_vobo = personal_vobo.get('Nombre_Vo_Bo', '')
-        matricula_vobo = personal_vobo.get('Matricula_Vo_Bo', '')
+        # Motor OOXML: marcadores y tabla sobre word/document.xml, el resto se copia tal cual
+        if usar_motor_ooxml():
+            def llenar_tabla(raiz):
+                tablas = raiz.body.findall(qn('w:tbl'))
+                if len(tablas) < 2:
+                    raise ValueError("El documento no contiene al menos dos tablas")
+                llenar_tabla_relacion(tablas[1], facturas_validas, monto_formateado)
 
-        # Reemplazar marcadores de texto en todo el documento
-        reemplazos = {
-            '{{FECHA_DOCUMENTO}}': fecha_doc,
-            '{{MES}}': mes,
-            '{{PARTIDA}}': partida_num,
-            '{{DESCRIPCION}}': descripcion,
-            '{{TOTAL_FACTURAS}}': str(total_facturas),
-            '{{MONTO_TOTAL}}': monto_formateado,
-            '{{GRADO_VO_BO}}': grado_vobo,
-            '{{NOMBRE_VO_BO}}': nombre_vobo,
-            '{{MATRICULA_VO_BO}}': matricula_vobo
-        }
+            llenar_docx(template_path, output_path, reemplazos, transformar=llenar_tabla,
+                        nombre="plantilla de facturas")
+            logger.info(f"Documento de relación de facturas generado: {output_path}")
+            return output_path
+
+        # Cargar la plantilla
+        doc = Document(template_path)
 
         # Reemplazar todos los marcadores utilizando la función mejorada
         reemplazar_marcadores_en_documento(doc, reemplazos)
@@ -578,88 +1006,7 @@ def procesar_plantilla_facturas(output_dir, partida, facturas_info, datos_comune
         tabla_facturas = doc.tables[1]
         logger.info(f"Se utilizará la segunda tabla con {len(tabla_facturas.rows)} filas y {len(tabla_facturas.columns)} columnas")
 
-        # Filtrar facturas válidas
-        facturas_validas = [f for f in facturas_info if isinstance(f, dict)]
-
-        # Si hay más de una fila (encabezado + datos), eliminar todas excepto el encabezado
-        while len(tabla_facturas.rows) > 1:
-            tr = tabla_facturas._tbl.tr_lst.pop()
-            tabla_facturas._tbl.remove(tr)
-
-        # Asegurarse que la fila de encabezado tenga formato adecuado
-        if len(tabla_facturas.rows) > 0:
-            fila_encabezado = tabla_facturas.rows[0]
-            for celda in fila_encabezado.cells:
-                aplicar_formato_celda(celda, centrar=True, aplicar_bordes=True, fuente_geomanist=True)
-
-                # Opcional: hacer el texto del encabezado en negrita
-                for paragraph in celda.paragraphs:
-                    for run in paragraph.runs:
-                        run.bold = True
-
-        # Ahora añadir una fila para cada factura
-        for i, factura in enumerate(facturas_validas):
-            # Añadir una nueva fila a la tabla
-            nueva_fila = tabla_facturas.add_row()
-            celdas = nueva_fila.cells
-
-            # Verificar que la tabla tiene las columnas esperadas
-            if len(celdas) >= 4:  # Fecha, Número, Emisor, Importe
-                # Formatear fecha
-                fecha_factura = factura.get('fecha_factura', '')
-                if isinstance(fecha_factura, str) and '-' in fecha_factura:
-                    try:
-                        fecha_obj = datetime.strptime(fecha_factura, '%Y-%m-%d')
-                        fecha_factura = fecha_obj.strftime('%d/%m/%Y')
-                    except:
-                        pass
-
-                # Asignar valores a las celdas
-                celdas[0].text = str(fecha_factura)
-                celdas[1].text = str(factura.get('serie_numero', ''))
-                celdas[2].text = str(factura.get('emisor', ''))
-                
-                # Usar el valor formateado si existe, o formatear el valor decimal
-                if 'monto' in factura and '$' in str(factura['monto']):
-                    celdas[3].text = str(factura['monto'])
-                elif 'monto_decimal' in factura:
-                    celdas[3].text = f"$ {factura['monto_decimal']:,.2f}"
-                else:
-                    # Intentar formatear lo que haya
-                    celdas[3].text = str(factura.get('monto', '0'))
-
-                # Aplicar formato a todas las celdas de la nueva fila
-                for celda in celdas:
-                    aplicar_formato_celda(celda, centrar=True, aplicar_bordes=True, fuente_geomanist=True)
-            else:
-                logger.warning(f"La tabla tiene {len(celdas)} columnas, menos de las 4 esperadas")
-
-        # Añadir fila de total si hay facturas
-        if facturas_validas:
-            fila_total = tabla_facturas.add_row()
-            celdas = fila_total.cells
-
-            # Configurar celdas de total
-            celdas[0].text = ""
-            celdas[1].text = ""
-            celdas[2].text = "TOTAL"
-            celdas[3].text = monto_formateado
-
-            # Aplicar formato a la fila de total
-            # Para las celdas vacías
-            aplicar_formato_celda(celdas[0], centrar=True, aplicar_bordes=True, fuente_geomanist=True)
-            aplicar_formato_celda(celdas[1], centrar=True, aplicar_bordes=True, fuente_geomanist=True)
-
-            # Para las celdas con "TOTAL" y el monto
-            aplicar_formato_celda(celdas[2], centrar=False, aplicar_bordes=True, fuente_geomanist=True)
-            celdas[2].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            for run in celdas[2].paragraphs[0].runs:
-                run.bold = True
-
-            aplicar_formato_celda(celdas[3], centrar=False, aplicar_bordes=True, fuente_geomanist=True)
-            celdas[3].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            for run in celdas[3].paragraphs[0].runs:
-                run.bold = True
+        llenar_tabla_relacion(tabla_facturas._tbl, facturas_validas, monto_formateado)
 
         # Realizar una verificación final para asegurarse que los marcadores se hayan reemplazado
         for paragraph in doc.paragraphs:
@@ -669,8 +1016,8 @@ def procesar_plantilla_facturas(output_dir, partida, facturas_info, datos_comune
                     paragraph.text = paragraph.text.replace(key, str(reemplazos[key]))
 
         # Guardar el documento
-        output_path = os.path.join(output_dir, f"Relacion_Facturas_Partida_{partida.get('numero', '')}.docx")
-        doc.save(output_path)
+        with ruta_temporal(output_path) as temporal:
+            doc.save(temporal)
 
         logger.info(f"Documento de relación de facturas generado: {output_path}")
         return output_path
@@ -682,6 +1029,42 @@ def procesar_plantilla_facturas(output_dir, partida, facturas_info, datos_comune
         raise Exception(f"Error al procesar plantilla de facturas: {str(e)}")
     
 
+def procesar_relacion_facturas_pdf(output_dir, partida, facturas_info, datos_comunes):
+    """
+    Genera la relación de facturas directamente en PDF, por hojas de tamaño fijo.
+    """
+    try:
+        template_path = template_registry.obtener_ruta('relacion_facturas')
+        if not template_path:
+            raise FileNotFoundError("No se encontró la plantilla de facturas")
+
+        facturas_validas = [f for f in facturas_info if isinstance(f, Mapping)]
+        info_facturas = datos_comunes.get('info_facturas') or calcular_totales(facturas_validas)
+        reemplazos = reemplazos_relacion(partida, datos_comunes, info_facturas)
+
+        filas = [valores_fila_factura(factura) for factura in facturas_validas]
+        centavos = [a_centavos(monto) or 0 for monto in calcular_totales(facturas_validas)['montos_individuales']]
+
+        # Mismo reparto por hoja que la relación en Word
+        por_pagina, primera_pagina = facturas_por_hoja_relacion()
+        output_path = os.path.join(output_dir, f"Relacion_Facturas_Partida_{partida.get('numero', '')}.pdf")
+        return generar_relacion_pdf(
+            output_path,
+            template_path,
+            reemplazos,
+            filas,
+            centavos,
+            info_facturas.get('monto_formateado', "$ 0.00"),
+            facturas_por_pagina=por_pagina,
+            facturas_primera_pagina=primera_pagina,
+            procesos=RELACION_CONFIG.get('procesos_pdf')
+        )
+
+    except Exception as e:
+        logger.error(f"Error al generar la relación de facturas en PDF: {str(e)}")
+        raise Exception(f"Error al generar la relación de facturas en PDF: {str(e)}")
+
+
 def procesar_plantilla_oficio(output_dir, partida, facturas_info, datos_comunes):
     """
     Procesa la plantilla de oficio en formato Word preservando formatos originales.
@@ -689,15 +1072,12 @@ def procesar_plantilla_oficio(output_dir, partida, facturas_info, datos_comunes)
     """
     try:
         # Buscar la plantilla
-        template_path = encontrar_plantilla("Oficio.docx")
+        template_path = template_registry.obtener_ruta('oficio')
         if not template_path:
             raise FileNotFoundError("No se encontró la plantilla de oficio")
 
         logger.info(f"Utilizando plantilla: {template_path}")
 
-        # Cargar la plantilla
-        doc = Document(template_path)
-
         # Datos comunes
         mes = datos_comunes.get('mes_asignado', '').capitalize()
         partida_num = partida.get('numero', '')
@@ -732,6 +1112,17 @@ def procesar_plantilla_oficio(output_dir, partida, facturas_info, datos_comunes)
             '{{MATRICULA_VO_BO}}': matricula_vobo
         }
 
+        output_path = os.path.join(output_dir, f"Oficio_Resumen_Partida_{partida_num}.docx")
+
+        # Motor OOXML: las imágenes del encabezado se copian sin cargarse en memoria
+        if usar_motor_ooxml():
+            llenar_docx(template_path, output_path, reemplazos, nombre="plantilla de oficio")
+            logger.info(f"Documento de oficio generado: {output_path}")
+            return output_path
+
+        # Cargar la plantilla
+        doc = Document(template_path)
+
         # Reemplazar todos los marcadores utilizando la función mejorada
         reemplazar_marcadores_en_documento(doc, reemplazos)
 
@@ -794,8 +1185,8 @@ def procesar_plantilla_oficio(output_dir, partida, facturas_info, datos_comunes)
                     paragraph.text = paragraph.text.replace(key, str(reemplazos[key]))
 
         # Guardar el documento
-        output_path = os.path.join(output_dir, f"Oficio_Resumen_Partida_{partida_num}.docx")
-        doc.save(output_path)
+        with ruta_temporal(output_path) as temporal:
+            doc.save(temporal)
 
         logger.info(f"Documento de oficio generado: {output_path}")
         return output_path
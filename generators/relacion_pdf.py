@@ -0,0 +1,359 @@
+"""
+Generación directa en PDF de la relación de facturas por bloques de página.
+
+Los textos, los encabezados de columna y el bloque de firmas se toman de la
+plantilla de relación de facturas (la misma que usa el documento Word). Cada
+hoja se arma de forma independiente (encabezado de la tabla repetido, filas
+del bloque y subtotal de la hoja; la primera lleva además el texto que
+precede a la tabla y la última el total y lo que sigue a la tabla), así que
+las hojas pueden renderizarse en paralelo y después unirse en un solo PDF.
+El tiempo crece de forma lineal con el número de facturas.
+"""
+import os
+import logging
+from docx import Document
+from docx.oxml.ns import qn
+from fpdf import FPDF
+
+from core.reconciliation import centavos_a_decimal
+from utils.formatters import format_monto
+from utils.pdf_manager import PDFManager
+from utils.scratch_space import scratch_space
+from utils.worker_pool import ejecutar_en_paralelo
+
+logger = logging.getLogger(__name__)
+
+# Columna del importe en las filas de factura; el rótulo de subtotales y total va a su izquierda
+COLUMNA_IMPORTE = 3
+
+# Márgenes de la hoja (mm, tamaño carta)
+MARGEN_LATERAL = 18
+MARGEN_SUPERIOR = 15
+ALTO_UTIL = 279.4 - 2 * MARGEN_SUPERIOR
+
+ALTO_FILA = 6
+ALTO_PARRAFO_VACIO = 4
+TAMANO_TEXTO = 10
+
+# Alineación de Word (w:jc) -> alineación de FPDF
+_ALINEACIONES = {'center': 'C', 'right': 'R', 'end': 'R', 'both': 'J', 'distribute': 'J'}
+
+_COMILLAS = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'", '\xa0': ' '})
+
+
+def dividir_en_bloques(elementos, tamano, tamano_primero=None):
+    """
+    Divide una lista en bloques consecutivos de tamaño fijo.
+
+    Args:
+        elementos (list): Elementos a dividir
+        tamano (int): Número de elementos por bloque
+        tamano_primero (int, optional): Tamaño del primer bloque (por defecto `tamano`)
+
+    Returns:
+        list: Lista de bloques (el último puede ser más corto)
+    """
+    if tamano <= 0:
+        return [list(elementos)]
+    if tamano_primero and tamano_primero != tamano:
+        primero = elementos[:tamano_primero]
+        return ([primero] if primero else []) + dividir_en_bloques(elementos[tamano_primero:], tamano)
+    return [elementos[i:i + tamano] for i in range(0, len(elementos), tamano)]
+
+
+def valores_fila_total(num_columnas, rotulo, monto):
+    """
+    Obtiene el texto de cada columna de una fila de subtotal o total.
+
+    Args:
+        num_columnas (int): Número de columnas de la tabla de la plantilla
+        rotulo (str): Texto del rótulo (p. ej. "TOTAL")
+        monto (str): Monto ya formateado
+
+    Returns:
+        list: Una celda por columna, con el rótulo y el monto alineados con el importe
+    """
+    fila = [""] * num_columnas
+    fila[COLUMNA_IMPORTE - 1] = rotulo
+    fila[COLUMNA_IMPORTE] = monto
+    return fila
+
+
+def _texto_pdf(texto):
+    """Adapta un texto a latin-1, la codificación de las fuentes base de FPDF"""
+    return str(texto).translate(_COMILLAS).encode('latin-1', 'replace').decode('latin-1')
+
+
+def _ajustar_ancho(pdf, texto, ancho):
+    """Recorta un texto para que quepa en el ancho de la celda"""
+    texto = _texto_pdf(texto)
+    if pdf.get_string_width(texto) <= ancho - 2:
+        return texto
+    while texto and pdf.get_string_width(texto + "...") > ancho - 2:
+        texto = texto[:-1]
+    return texto + "..."
+
+
+def _texto_xml(elemento):
+    """Texto de un elemento de Word (párrafo o celda)"""
+    return ''.join(t.text or '' for t in elemento.iter(qn('w:t')))
+
+
+def _bloque_parrafo(p):
+    """Describe un párrafo de la plantilla: texto, alineación, negrita y tamaño"""
+    jc = p.find(f"{qn('w:pPr')}/{qn('w:jc')}")
+    negrita = [r.find(f"{qn('w:rPr')}/{qn('w:b')}") for r in p.iter(qn('w:r')) if _texto_xml(r).strip()]
+    sz = p.find(f".//{qn('w:rPr')}/{qn('w:sz')}")
+    return {
+        'tipo': 'parrafo',
+        'texto': _texto_xml(p).strip(),
+        'alineacion': _ALINEACIONES.get(jc.get(qn('w:val')) if jc is not None else None, 'L'),
+        'negrita': bool(negrita) and all(b is not None and b.get(qn('w:val')) not in ('0', 'false') for b in negrita),
+        'tamano': int(sz.get(qn('w:val'))) / 2 if sz is not None else TAMANO_TEXTO,
+    }
+
+
+def _recortar_lineas(lineas):
+    """Quita las líneas vacías del final de una celda"""
+    while lineas and not lineas[-1]:
+        lineas.pop()
+    return lineas
+
+
+def _bloque_tabla(tbl):
+    """Describe una tabla de la plantilla sin bordes (p. ej. las firmas): celdas con sus líneas y anchos"""
+    anchos = [int(g.get(qn('w:w')) or 0) for g in tbl.iter(qn('w:gridCol'))]
+    filas = []
+    for tr in tbl.iter(qn('w:tr')):
+        fila = []
+        for tc in tr.iter(qn('w:tc')):
+            parrafos = tc.findall(qn('w:p'))
+            fila.append({
+                'lineas': _recortar_lineas([_texto_xml(p).strip() for p in parrafos]),
+                'alineacion': _bloque_parrafo(parrafos[0])['alineacion'] if parrafos else 'L',
+            })
+        filas.append(fila)
+    return {'tipo': 'tabla', 'filas': filas, 'anchos': anchos}
+
+
+def _recortar_vacios(bloques):
+    """Quita los párrafos vacíos del final"""
+    while bloques and bloques[-1]['tipo'] == 'parrafo' and not bloques[-1]['texto']:
+        bloques.pop()
+    return bloques
+
+
+def leer_plantilla_relacion(template_path):
+    """
+    Extrae de la plantilla de relación de facturas lo que se renderiza en PDF.
+
+    La tabla de facturas es la segunda tabla del documento (como en el
+    llenado del documento Word); lo que está antes y después de ella se
+    conserva en orden, con los marcadores sin sustituir.
+
+    Args:
+        template_path (str): Ruta a la plantilla .docx
+
+    Returns:
+        dict: antes y despues (bloques de párrafo o tabla) y columnas
+              (encabezado, ancho relativo) de la tabla de facturas
+
+    Raises:
+        ValueError: Si la plantilla no tiene al menos dos tablas
+    """
+    cuerpo = Document(template_path).element.body
+    tablas = cuerpo.findall(qn('w:tbl'))
+    if len(tablas) < 2:
+        raise ValueError("El documento no contiene al menos dos tablas")
+    tabla_facturas = tablas[1]
+
+    antes, despues = [], []
+    destino = antes
+    for elemento in cuerpo:
+        if elemento is tabla_facturas:
+            destino = despues
+        elif elemento.tag == qn('w:p'):
+            destino.append(_bloque_parrafo(elemento))
+        elif elemento.tag == qn('w:tbl'):
+            destino.append(_bloque_tabla(elemento))
+
+    encabezados = [_texto_xml(tc).strip() for tc in tabla_facturas.find(qn('w:tr')).iter(qn('w:tc'))]
+    anchos = [int(g.get(qn('w:w')) or 0) for g in tabla_facturas.iter(qn('w:gridCol'))]
+    if len(anchos) != len(encabezados) or not all(anchos):
+        anchos = [1] * len(encabezados)
+    return {
+        'antes': _recortar_vacios(antes),
+        'despues': _recortar_vacios(despues),
+        'columnas': list(zip(encabezados, anchos)),
+    }
+
+
+def _sustituir(bloques, reemplazos):
+    """Copia de los bloques con los marcadores sustituidos"""
+    def reemplazar(texto):
+        for marcador, valor in reemplazos.items():
+            if marcador in texto:
+                texto = texto.replace(marcador, str(valor))
+        return texto
+
+    resultado = []
+    for bloque in bloques:
+        if bloque['tipo'] == 'parrafo':
+            resultado.append(dict(bloque, texto=reemplazar(bloque['texto'])))
+        else:
+            filas = [[dict(celda, lineas=[reemplazar(l) for l in celda['lineas']]) for celda in fila]
+                     for fila in bloque['filas']]
+            resultado.append(dict(bloque, filas=filas))
+    return resultado
+
+
+def _nueva_hoja():
+    pdf = FPDF(orientation='P', unit='mm', format='Letter')
+    pdf.set_margins(MARGEN_LATERAL, MARGEN_SUPERIOR, MARGEN_LATERAL)
+    pdf.set_auto_page_break(False)
+    pdf.add_page()
+    return pdf
+
+
+def _renderizar_bloques(pdf, bloques):
+    """Escribe párrafos y tablas sin bordes de la plantilla a partir de la posición actual"""
+    ancho = pdf.w - 2 * MARGEN_LATERAL
+    for bloque in bloques:
+        if bloque['tipo'] == 'parrafo':
+            if not bloque['texto']:
+                pdf.ln(ALTO_PARRAFO_VACIO)
+                continue
+            pdf.set_font('Arial', 'B' if bloque['negrita'] else '', bloque['tamano'])
+            pdf.multi_cell(0, bloque['tamano'] / 2, _texto_pdf(bloque['texto']), 0, bloque['alineacion'])
+            continue
+
+        pdf.set_font('Arial', '', TAMANO_TEXTO)
+        for fila in bloque['filas']:
+            y_fila, y_max, x = pdf.get_y(), pdf.get_y(), MARGEN_LATERAL
+            anchos = bloque['anchos'] if len(bloque['anchos']) == len(fila) else [1] * len(fila)
+            total = sum(anchos) or 1
+            for celda, ancho_relativo in zip(fila, anchos):
+                ancho_celda = ancho * ancho_relativo / total
+                pdf.set_xy(x, y_fila)
+                for linea in celda['lineas']:
+                    pdf.set_x(x)
+                    pdf.multi_cell(ancho_celda, TAMANO_TEXTO / 2, _texto_pdf(linea), 0, celda['alineacion'])
+                y_max = max(y_max, pdf.get_y())
+                x += ancho_celda
+            pdf.set_xy(MARGEN_LATERAL, y_max)
+
+
+def _alto_bloques(bloques):
+    """Alto (mm) que ocupan unos bloques, medido renderizándolos en una hoja aparte"""
+    pdf = _nueva_hoja()
+    _renderizar_bloques(pdf, bloques)
+    return pdf.get_y() - MARGEN_SUPERIOR
+
+
+def renderizar_bloque_relacion(tarea):
+    """
+    Renderiza una hoja de la relación de facturas en un PDF independiente.
+
+    Se ejecuta en un proceso del grupo de trabajo, por lo que recibe todos
+    los datos en un diccionario serializable. Si lo que sigue a la tabla no
+    cabe en la última hoja, se pasa a una hoja nueva.
+
+    Args:
+        tarea (dict): ruta, antes, columnas, filas, subtotal, total, despues, hoja y total_hojas
+
+    Returns:
+        str: Ruta del PDF de la hoja
+    """
+    pdf = _nueva_hoja()
+    _renderizar_bloques(pdf, tarea['antes'])
+
+    # Encabezado de la tabla (se repite en cada hoja)
+    ancho = pdf.w - 2 * MARGEN_LATERAL
+    total_relativo = sum(relativo for _, relativo in tarea['columnas'])
+    anchos = [ancho * relativo / total_relativo for _, relativo in tarea['columnas']]
+    for (titulo, _), ancho_columna in zip(tarea['columnas'], anchos):
+        # Los encabezados largos se escriben con letra más chica en lugar de recortarse
+        tamano = TAMANO_TEXTO
+        pdf.set_font('Arial', 'B', tamano)
+        while tamano > 6 and pdf.get_string_width(_texto_pdf(titulo)) > ancho_columna - 2:
+            tamano -= 0.5
+            pdf.set_font('Arial', 'B', tamano)
+        pdf.cell(ancho_columna, ALTO_FILA + 2, _ajustar_ancho(pdf, titulo, ancho_columna), 1, 0, 'C')
+    pdf.ln()
+
+    # Filas del bloque (centradas, como en el documento Word)
+    pdf.set_font('Arial', '', 9)
+    for valores in tarea['filas']:
+        for ancho_columna, valor in zip(anchos, valores + [''] * (len(anchos) - len(valores))):
+            pdf.cell(ancho_columna, ALTO_FILA, _ajustar_ancho(pdf, valor, ancho_columna), 1, 0, 'C')
+        pdf.ln()
+
+    # Subtotal de la hoja y total general en la última, en las columnas del importe
+    filas_total = [valores_fila_total(len(anchos), f"SUBTOTAL HOJA {tarea['hoja']} DE {tarea['total_hojas']}",
+                                      tarea['subtotal'])]
+    if tarea.get('total'):
+        filas_total.append(valores_fila_total(len(anchos), "TOTAL", tarea['total']))
+    pdf.set_font('Arial', 'B', 9)
+    for valores in filas_total:
+        for ancho_columna, valor in zip(anchos, valores):
+            pdf.cell(ancho_columna, ALTO_FILA, _ajustar_ancho(pdf, valor, ancho_columna), 1, 0, 'R' if valor else 'C')
+        pdf.ln()
+
+    if tarea['despues']:
+        if pdf.get_y() + _alto_bloques(tarea['despues']) > MARGEN_SUPERIOR + ALTO_UTIL:
+            pdf.add_page()
+        _renderizar_bloques(pdf, tarea['despues'])
+
+    pdf.output(tarea['ruta'])
+    return tarea['ruta']
+
+
+def generar_relacion_pdf(output_path, template_path, reemplazos, filas, centavos, monto_total_formateado,
+                         facturas_por_pagina=25, facturas_primera_pagina=None, procesos=None):
+    """
+    Genera la relación de facturas directamente en PDF, una hoja por bloque.
+
+    Args:
+        output_path (str): Ruta del PDF final
+        template_path (str): Plantilla de relación de facturas de la que se toman los textos
+        reemplazos (dict): {marcador: valor} para los textos de la plantilla
+        filas (list): Valores de cada fila [fecha, serie_numero, emisor, importe]
+        centavos (list): Importe de cada fila en centavos (para los subtotales)
+        monto_total_formateado (str): Total de la partida ya formateado
+        facturas_por_pagina (int): Número de facturas por hoja
+        facturas_primera_pagina (int, optional): Facturas de la primera hoja (por defecto facturas_por_pagina)
+        procesos (int, optional): Procesos para renderizar las hojas en paralelo
+
+    Returns:
+        str: Ruta del PDF generado
+    """
+    plantilla = leer_plantilla_relacion(template_path)
+    antes = _sustituir(plantilla['antes'], reemplazos)
+    despues = _sustituir(plantilla['despues'], reemplazos)
+
+    bloques_filas = dividir_en_bloques(filas, facturas_por_pagina, facturas_primera_pagina) or [[]]
+    bloques_centavos = dividir_en_bloques(centavos, facturas_por_pagina, facturas_primera_pagina) or [[]]
+    total_hojas = len(bloques_filas)
+
+    # Las hojas se renderizan en el espacio temporal de la corrida y se eliminan al combinarlas
+    with scratch_space.temporal('relacion_pdf') as directorio_hojas:
+        tareas = [
+            {
+                'ruta': os.path.join(directorio_hojas, f"relacion_hoja_{hoja:04d}.pdf"),
+                'antes': antes if hoja == 1 else [],
+                'columnas': plantilla['columnas'],
+                'filas': bloque,
+                'subtotal': format_monto(centavos_a_decimal(sum(bloque_centavos))),
+                'total': monto_total_formateado if hoja == total_hojas else None,
+                'despues': despues if hoja == total_hojas else [],
+                'hoja': hoja,
+                'total_hojas': total_hojas,
+            }
+            for hoja, (bloque, bloque_centavos) in enumerate(zip(bloques_filas, bloques_centavos), 1)
+        ]
+
+        rutas_hojas = ejecutar_en_paralelo(renderizar_bloque_relacion, tareas, procesos)
+        PDFManager().combine_pdfs(output_path, rutas_hojas)
+
+    logger.info(f"Relación de facturas en PDF generada ({total_hojas} hojas): {output_path}")
+    return output_path
@@ -5,6 +5,7 @@ Punto de entrada principal de la aplicación
 import sys
 import os
 import logging
+import multiprocessing
 import tkinter as tk
 
 # Configurar el logging
@@ -48,4 +49,6 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
+    # Necesario en el ejecutable congelado: los procesos supervisados de Windows (spawn) vuelven a cargar este módulo
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
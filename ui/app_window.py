@@ -9,7 +9,7 @@ import logging
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import APP_CONFIG, PERSONAL_RECIBE, PERSONAL_VISTO_BUENO, MESES
+from config import APP_CONFIG, DIARIO_CONFIG, PERSONAL_RECIBE, PERSONAL_VISTO_BUENO, MESES
 from ui.dialogs import DateSelector
 from controllers.process_controller import ProcessController
 
@@ -69,6 +69,11 @@ class AutomatizacionAppWindow:
         option_menu_meses = tk.OptionMenu(self.root, self.mes_asignado_var, *MESES)
         option_menu_meses.grid(row=4, column=1, padx=10, pady=5, sticky='ew')
 
+        # Reanudar una corrida interrumpida (usa el diario del directorio base)
+        self.reanudar_var = tk.BooleanVar(self.root, value=DIARIO_CONFIG.get('reanudar', False))
+        tk.Checkbutton(self.root, text="Reanudar", variable=self.reanudar_var).grid(
+            row=4, column=2, padx=10, pady=5, sticky='w')
+
         # Separador para sección de personal
         ttk.Separator(self.root, orient='horizontal').grid(
             row=5, column=0, columnspan=3, sticky='ew', pady=10)
@@ -217,7 +222,8 @@ class AutomatizacionAppWindow:
             'mes_asignado': mes_asignado, 
             'personal_recibio': personal_recibio,
             'personal_vobo': personal_vobo,
-            'base_dir': os.path.dirname(excel_path)
+            'base_dir': os.path.dirname(excel_path),
+            'reanudar': self.reanudar_var.get()
         }
 
     def obtener_datos_personal_recibio(self):
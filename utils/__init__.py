@@ -1,6 +1,6 @@
 """
 Módulo de utilidades para la aplicación
 """
-from utils.formatters import convert_fecha_to_texto, format_fecha_mensaje, format_monto
+from utils.formatters import convert_fecha_to_texto, format_fecha_mensaje, format_monto, formatear_fecha_texto
 
-__all__ = ['convert_fecha_to_texto', 'format_fecha_mensaje', 'format_monto']
\ No newline at end of file
+__all__ = ['convert_fecha_to_texto', 'format_fecha_mensaje', 'format_monto', 'formatear_fecha_texto']
\ No newline at end of file
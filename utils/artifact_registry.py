@@ -0,0 +1,306 @@
+"""
+Nombres deterministas, bloqueo por carpeta y registro de los artefactos de cada factura.
+
+Los archivos que genera o descarga el proceso para una factura (documento
+combinado y verificación del SAT) se nombran con el UUID de la factura, así
+que dos trabajadores que procesan facturas distintas nunca escriben el mismo
+archivo. Cada archivo se escribe con un nombre temporal ('~...tmp') y se
+renombra al terminar. La verificación del SAT, que las corridas siguientes
+reutilizan, solo entonces se anota en el registro de la carpeta (un JSON
+junto a los archivos); el documento combinado no se registra porque la
+optimización de la partida lo reescribe. Las búsquedas consultan el registro,
+de modo que una corrida paralela o reanudada no toma el archivo a medias de
+otro trabajador. Las modificaciones del registro se hacen con un archivo de
+bloqueo por carpeta, válido también entre procesos.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import socket
+import logging
+from contextlib import contextmanager
+
+from config import ARTEFACTOS_CONFIG
+from utils.file_utils import escritura_atomica
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:  # psutil es opcional: sin él los bloqueos abandonados se detectan por antigüedad
+    psutil = None
+
+# Prefijo del nombre de cada tipo de artefacto
+TIPOS_ARTEFACTO = {
+    'documento_completo': 'documento_completo',
+    'verificacion_sat': 'verificacion_sat',
+    'verificacion_pendiente': 'verificacion_sat_pendiente',
+}
+
+VERSION_REGISTRO = 1
+
+# Intervalo entre intentos de tomar un bloqueo ocupado
+ESPERA_REINTENTO = 0.1
+
+
+class BloqueoOcupadoError(Exception):
+    """No se pudo tomar el bloqueo de una carpeta en el tiempo de espera"""
+
+
+def clave_archivo(clave):
+    """
+    Normaliza la clave de una factura (UUID) para usarla en un nombre de archivo.
+
+    Args:
+        clave (str): UUID o nombre de la factura
+
+    Returns:
+        str: Clave en mayúsculas con solo letras, dígitos y guiones
+    """
+    return re.sub(r'[^A-Za-z0-9-]+', '_', str(clave).strip()).upper()
+
+
+def nombre_artefacto(tipo, clave, extension='.pdf'):
+    """
+    Nombre determinista de un artefacto de factura.
+
+    Args:
+        tipo (str): Tipo en TIPOS_ARTEFACTO
+        clave (str): UUID de la factura
+        extension (str): Extensión del archivo
+
+    Returns:
+        str: Nombre del archivo (p. ej. 'documento_completo_<UUID>.pdf')
+    """
+    return f"{TIPOS_ARTEFACTO[tipo]}_{clave_archivo(clave)}{extension}"
+
+
+def es_artefacto(nombre):
+    """
+    Indica si un nombre de archivo es un artefacto generado o uno temporal a medias.
+
+    Incluye el nombre fijo que usaban las versiones anteriores para el documento combinado.
+
+    Args:
+        nombre (str): Nombre del archivo
+
+    Returns:
+        bool: True si el archivo no es una entrada de la factura
+    """
+    nombre = os.path.basename(nombre).lower()
+    if nombre.startswith('~') or nombre == 'documento_completo.pdf':
+        return True
+    return any(nombre.startswith(prefijo + '_') for prefijo in TIPOS_ARTEFACTO.values())
+
+
+def _firma_bloqueo(ruta):
+    """
+    Lee un archivo de bloqueo para identificarlo.
+
+    Args:
+        ruta (str): Ruta del archivo de bloqueo
+
+    Returns:
+        tuple or None: (contenido, mtime en ns) o None si el archivo no existe
+    """
+    try:
+        with open(ruta, 'r', encoding='utf-8') as archivo:
+            contenido = archivo.read()
+        return contenido, os.stat(ruta).st_mtime_ns
+    except (OSError, ValueError):
+        return None
+
+
+def _bloqueo_abandonado(firma, antiguedad_maxima):
+    """Indica si un bloqueo (ver _firma_bloqueo) pertenece a un proceso que ya terminó"""
+    contenido, mtime_ns = firma
+    try:
+        datos = json.loads(contenido)
+        pid, equipo = int(datos['pid']), datos.get('equipo')
+    except (ValueError, KeyError, TypeError):
+        pid, equipo = None, None
+
+    if psutil is not None and pid is not None and equipo == socket.gethostname():
+        return not psutil.pid_exists(pid)
+    return time.time() - mtime_ns / 1e9 > antiguedad_maxima
+
+
+def _retirar_bloqueo_abandonado(ruta, firma):
+    """
+    Elimina un bloqueo abandonado solo si sigue siendo el mismo que se comprobó.
+
+    El archivo se renombra primero a un nombre único (nadie más puede tomarlo
+    ya) y se compara con la firma leída. Si entre la comprobación y el
+    renombrado otro trabajador retiró el bloqueo y tomó uno nuevo, ese
+    bloqueo vigente se devuelve a su lugar en vez de borrarse.
+
+    Args:
+        ruta (str): Ruta del archivo de bloqueo
+        firma (tuple): Firma del bloqueo abandonado (ver _firma_bloqueo)
+    """
+    temporal = f"{ruta}.{os.getpid()}.{uuid.uuid4().hex}"
+    try:
+        os.rename(ruta, temporal)
+    except OSError:
+        return  # Otro trabajador ya lo retiró
+
+    try:
+        if _firma_bloqueo(temporal) == firma:
+            logger.warning(f"Bloqueo abandonado eliminado: {ruta}")
+            return
+        try:
+            os.link(temporal, ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo restaurar el bloqueo vigente {ruta}: {str(e)}")
+    finally:
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+
+
+class ArtifactRegistry:
+    """
+    Registro de los artefactos completos de cada carpeta de factura.
+    """
+
+    def __init__(self, config=None):
+        """
+        Inicializa el registro
+
+        Args:
+            config (dict, optional): Configuración (por defecto ARTEFACTOS_CONFIG)
+        """
+        self.config = ARTEFACTOS_CONFIG if config is None else config
+
+    @property
+    def archivo_registro(self):
+        return self.config.get('archivo_registro', '.artefactos.json')
+
+    @property
+    def archivo_bloqueo(self):
+        return self.config.get('archivo_bloqueo', '.artefactos.lock')
+
+    def ruta(self, carpeta, tipo, clave):
+        """
+        Ruta determinista de un artefacto dentro de una carpeta.
+
+        Args:
+            carpeta (str): Carpeta de la factura
+            tipo (str): Tipo en TIPOS_ARTEFACTO
+            clave (str): UUID de la factura
+
+        Returns:
+            str: Ruta del artefacto
+        """
+        return os.path.join(carpeta, nombre_artefacto(tipo, clave))
+
+    @contextmanager
+    def bloqueo(self, carpeta):
+        """
+        Toma el bloqueo de una carpeta (archivo creado en exclusiva) mientras dura el bloque.
+
+        Si el bloqueo es de un proceso que ya terminó se retira (ver
+        _retirar_bloqueo_abandonado); si otro trabajador lo tiene se espera
+        hasta ARTEFACTOS_CONFIG['espera_bloqueo'].
+
+        Args:
+            carpeta (str): Carpeta a bloquear
+
+        Raises:
+            BloqueoOcupadoError: Si no se obtuvo el bloqueo a tiempo
+        """
+        ruta = os.path.join(carpeta, self.archivo_bloqueo)
+        limite = time.monotonic() + self.config.get('espera_bloqueo', 120)
+        contenido = json.dumps({'pid': os.getpid(), 'equipo': socket.gethostname(), 'inicio': time.time()})
+        while True:
+            try:
+                descriptor = os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                firma = _firma_bloqueo(ruta)
+                if firma is not None and _bloqueo_abandonado(firma, self.config.get('bloqueo_abandonado', 900)):
+                    _retirar_bloqueo_abandonado(ruta, firma)
+                    continue
+                if time.monotonic() >= limite:
+                    raise BloqueoOcupadoError(f"La carpeta {carpeta} está bloqueada por otro proceso")
+                time.sleep(ESPERA_REINTENTO)
+
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as archivo:
+                archivo.write(contenido)
+            yield ruta
+        finally:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def _leer(self, carpeta):
+        """Lee el registro de una carpeta (vacío si no existe o está dañado)"""
+        ruta = os.path.join(carpeta, self.archivo_registro)
+        try:
+            with open(ruta, 'r', encoding='utf-8') as archivo:
+                registro = json.load(archivo)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Registro de artefactos ilegible en {carpeta}: {str(e)}")
+            return {}
+        if registro.get('version') != VERSION_REGISTRO:
+            return {}
+        return registro.get('artefactos', {})
+
+    def registrar(self, ruta, tipo, clave):
+        """
+        Anota un artefacto ya completo (escrito y renombrado a su nombre final).
+
+        Args:
+            ruta (str): Ruta del artefacto
+            tipo (str): Tipo en TIPOS_ARTEFACTO
+            clave (str): UUID de la factura
+        """
+        carpeta, nombre = os.path.split(os.path.abspath(ruta))
+        estado = os.stat(ruta)
+        with self.bloqueo(carpeta):
+            artefactos = self._leer(carpeta)
+            artefactos.setdefault(clave_archivo(clave), {})[tipo] = {
+                'archivo': nombre,
+                'bytes': estado.st_size,
+            }
+            with escritura_atomica(os.path.join(carpeta, self.archivo_registro), 'w') as archivo:
+                json.dump({'version': VERSION_REGISTRO, 'artefactos': artefactos}, archivo, indent=1)
+
+    def buscar(self, carpeta, tipo, clave):
+        """
+        Busca en el registro un artefacto completo de una factura.
+
+        Solo se devuelve si el archivo sigue en disco con el tamaño registrado.
+
+        Args:
+            carpeta (str): Carpeta de la factura
+            tipo (str): Tipo en TIPOS_ARTEFACTO
+            clave (str): UUID de la factura
+
+        Returns:
+            str or None: Ruta del artefacto o None si no está registrado
+        """
+        if not clave:
+            return None
+        entrada = self._leer(carpeta).get(clave_archivo(clave), {}).get(tipo)
+        if not entrada:
+            return None
+        ruta = os.path.join(carpeta, entrada['archivo'])
+        try:
+            if os.path.getsize(ruta) == entrada['bytes']:
+                return ruta
+        except OSError:
+            pass
+        logger.info(f"El artefacto registrado {ruta} ya no coincide con el registro")
+        return None
+
+
+# Registro compartido por todas las facturas de la corrida
+artifact_registry = ArtifactRegistry()
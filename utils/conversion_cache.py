@@ -0,0 +1,191 @@
+"""
+Caché de conversiones DOCX -> PDF direccionada por contenido.
+
+La clave es el hash del contenido del documento ya llenado (todas las
+partes del paquete DOCX salvo las propiedades docProps, que cambian con la
+fecha de cada guardado), así que dos documentos idénticos, de la misma
+corrida o de corridas distintas, se convierten con Word una sola vez. Los
+PDF se guardan en disco con un límite de tamaño; al superarlo se eliminan
+los menos usados recientemente (cada acierto actualiza la fecha de
+modificación de su entrada).
+"""
+import os
+import shutil
+import hashlib
+import logging
+import threading
+import zipfile
+
+from config import CONVERSION_CACHE_CONFIG
+from utils.file_utils import ruta_temporal
+
+logger = logging.getLogger(__name__)
+
+# Directorio de caché por defecto (junto a la aplicación)
+DIRECTORIO_CACHE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache_conversion_pdf")
+
+# Partes del paquete que no forman parte del contenido (fechas de creación y modificación, estadísticas)
+PREFIJO_METADATOS = 'docProps/'
+
+VERSION_CLAVE = b'1'
+
+
+def hash_contenido_docx(docx_path):
+    """
+    Calcula el hash del contenido de un DOCX sin sus metadatos.
+
+    Args:
+        docx_path (str): Ruta del DOCX
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    sha = hashlib.sha256(VERSION_CLAVE)
+    with zipfile.ZipFile(docx_path) as paquete:
+        for nombre in sorted(paquete.namelist()):
+            if nombre.startswith(PREFIJO_METADATOS):
+                continue
+            sha.update(nombre.encode('utf-8') + b'\0')
+            sha.update(hashlib.sha256(paquete.read(nombre)).digest())
+    return sha.hexdigest()
+
+
+class ConversionCache:
+    """
+    Caché LRU en disco de los PDF convertidos, con clave por contenido del DOCX.
+    """
+
+    def __init__(self, config=None):
+        """
+        Inicializa la caché (el directorio se revisa al primer uso)
+
+        Args:
+            config (dict, optional): Configuración (por defecto CONVERSION_CACHE_CONFIG)
+        """
+        self.config = CONVERSION_CACHE_CONFIG if config is None else config
+        self._lock = threading.Lock()
+        self._tamano_total = None
+        self.estadisticas = {}
+        self.reiniciar_estadisticas()
+
+    @property
+    def habilitado(self):
+        return self.config.get('habilitado', True)
+
+    @property
+    def directorio(self):
+        return self.config.get('directorio') or DIRECTORIO_CACHE
+
+    def reiniciar_estadisticas(self):
+        """Descarta las estadísticas acumuladas (al iniciar una corrida)"""
+        with self._lock:
+            self.estadisticas = {'aciertos': 0, 'fallos': 0, 'guardados': 0, 'desalojados': 0, 'errores': 0}
+
+    def _contar(self, clave, cantidad=1):
+        with self._lock:
+            self.estadisticas[clave] += cantidad
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.pdf")
+
+    def obtener(self, clave, pdf_path):
+        """
+        Copia a pdf_path el PDF guardado para una clave, si existe.
+
+        Args:
+            clave (str): Hash del contenido del DOCX
+            pdf_path (str): Ruta donde se necesita el PDF
+
+        Returns:
+            bool: True si hubo acierto y el PDF se copió
+        """
+        ruta = self._ruta(clave)
+        try:
+            with ruta_temporal(pdf_path) as temporal:
+                shutil.copyfile(ruta, temporal)
+            # Marca la entrada como usada recientemente
+            os.utime(ruta)
+        except FileNotFoundError:
+            self._contar('fallos')
+            return False
+        except OSError as e:
+            logger.warning(f"No se pudo leer la caché de conversión {ruta}: {str(e)}")
+            self._contar('errores')
+            return False
+        self._contar('aciertos')
+        return True
+
+    def guardar(self, clave, pdf_path):
+        """
+        Guarda el PDF convertido de una clave y aplica el límite de tamaño.
+
+        Args:
+            clave (str): Hash del contenido del DOCX
+            pdf_path (str): PDF recién convertido
+        """
+        ruta = self._ruta(clave)
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            with ruta_temporal(ruta) as temporal:
+                shutil.copyfile(pdf_path, temporal)
+            tamano = os.path.getsize(ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar en la caché de conversión: {str(e)}")
+            self._contar('errores')
+            return
+
+        self._contar('guardados')
+        with self._lock:
+            if self._tamano_total is not None:
+                self._tamano_total += tamano
+        self._aplicar_limite()
+
+    def _aplicar_limite(self):
+        """Elimina las entradas menos usadas recientemente hasta quedar bajo el límite"""
+        limite_mb = self.config.get('tamano_maximo_mb')
+        if not limite_mb:
+            return
+        limite = limite_mb * 1024 * 1024
+
+        with self._lock:
+            if self._tamano_total is not None and self._tamano_total <= limite:
+                return
+
+            entradas = []
+            for nombre in os.listdir(self.directorio):
+                if not nombre.endswith('.pdf'):
+                    continue
+                try:
+                    estado = os.stat(os.path.join(self.directorio, nombre))
+                except OSError:
+                    continue
+                entradas.append((estado.st_mtime, estado.st_size, nombre))
+
+            total = sum(tamano for _, tamano, _ in entradas)
+            for _, tamano, nombre in sorted(entradas):
+                if total <= limite:
+                    break
+                try:
+                    os.remove(os.path.join(self.directorio, nombre))
+                except OSError:
+                    continue
+                total -= tamano
+                self.estadisticas['desalojados'] += 1
+            self._tamano_total = total
+
+    def resumen(self):
+        """
+        Obtiene las estadísticas de la caché.
+
+        Returns:
+            dict: aciertos, fallos, guardados, desalojados, errores y tasa_aciertos
+        """
+        with self._lock:
+            resumen = dict(self.estadisticas)
+        consultas = resumen['aciertos'] + resumen['fallos']
+        resumen['tasa_aciertos'] = resumen['aciertos'] / consultas if consultas else None
+        return resumen
+
+
+# Caché compartida por todas las conversiones de la corrida
+conversion_cache = ConversionCache()
@@ -0,0 +1,233 @@
+"""
+Motor de salida Excel para los libros de cada partida.
+
+Las plantillas se leen una sola vez con load_workbook y el libro analizado se
+reutiliza: para cada partida se insertan las filas de datos, se sustituyen los
+marcadores, se guarda el archivo y se deshacen los cambios (valores originales
+y filas insertadas), de modo que la plantilla en caché queda intacta.
+"""
+import os
+import logging
+import threading
+from copy import copy
+from collections import OrderedDict
+
+from openpyxl import load_workbook
+from openpyxl.cell.cell import MergedCell
+from openpyxl.utils.cell import coordinate_to_tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _celdas_con_marcador(ws):
+    """
+    Posiciones de las celdas de texto que contienen marcadores ({{...}}).
+
+    Args:
+        ws: Hoja de la plantilla
+
+    Returns:
+        list: Tuplas (fila, columna)
+    """
+    return [
+        (celda.row, celda.column)
+        for fila in ws.iter_rows()
+        for celda in fila
+        if isinstance(celda.value, str) and '{' in celda.value
+    ]
+
+
+def _desplazar_filas(ws, fila, cantidad):
+    """
+    Inserta (cantidad > 0) o elimina (cantidad < 0) filas justo debajo de `fila`.
+
+    Además de las celdas se desplazan los rangos combinados, la altura de las
+    filas y el área de impresión, que openpyxl no mueve por sí solo.
+
+    Args:
+        ws: Hoja a modificar
+        fila (int): Fila debajo de la cual se insertan o eliminan filas
+        cantidad (int): Número de filas
+    """
+    if cantidad > 0:
+        ws.insert_rows(fila + 1, cantidad)
+    elif cantidad < 0:
+        ws.delete_rows(fila + 1, -cantidad)
+    else:
+        return
+
+    for rango in ws.merged_cells.ranges:
+        if rango.min_row > fila:
+            rango.shift(row_shift=cantidad)
+
+    alturas = ws.row_dimensions
+    if cantidad < 0:
+        for indice in range(fila + 1, fila + 1 - cantidad):
+            alturas.pop(indice, None)
+    for indice in sorted((i for i in alturas if i > fila), reverse=cantidad > 0):
+        dimension = alturas.pop(indice)
+        dimension.index = indice + cantidad
+        alturas[indice + cantidad] = dimension
+
+    for rango in getattr(ws._print_area, 'ranges', ()):
+        if rango.max_row > fila:
+            rango.expand(down=cantidad)
+
+
+class ExcelEngine:
+    """
+    Llena plantillas Excel reutilizando el libro ya analizado.
+    """
+
+    def __init__(self, max_plantillas=8):
+        """
+        Inicializa el motor
+
+        Args:
+            max_plantillas: Número máximo de plantillas analizadas en memoria
+        """
+        self.max_plantillas = max_plantillas
+        self._plantillas = OrderedDict()
+        self._lock = threading.Lock()
+        self.libros_generados = 0
+
+    def _obtener_plantilla(self, template_path):
+        """
+        Obtiene el libro analizado de una plantilla (se recarga si cambia su mtime).
+
+        Args:
+            template_path (str): Ruta a la plantilla .xlsx
+
+        Returns:
+            tuple: (Workbook, Lock, posiciones de las celdas con marcadores) de la plantilla
+        """
+        ruta = os.path.abspath(template_path)
+        mtime = os.path.getmtime(ruta)
+
+        with self._lock:
+            entrada = self._plantillas.get(ruta)
+            if entrada is not None and entrada[0] == mtime:
+                self._plantillas.move_to_end(ruta)
+                return entrada[1:]
+
+            wb = load_workbook(ruta)
+            entrada = (mtime, wb, threading.Lock(), _celdas_con_marcador(wb.active))
+            self._plantillas[ruta] = entrada
+            while len(self._plantillas) > self.max_plantillas:
+                self._plantillas.popitem(last=False)
+
+        logger.debug(f"Plantilla Excel analizada y guardada en caché: {ruta}")
+        return entrada[1:]
+
+    def llenar_plantilla(self, template_path, output_path, celdas=None, filas=None, fila_inicial=None,
+                         reemplazos=None):
+        """
+        Llena la plantilla y guarda el resultado.
+
+        La fila `fila_inicial` de la plantilla es el prototipo de las filas de
+        datos: debajo de ella se insertan las filas que falten, con su formato
+        y altura, y lo que sigue (totales, firmas) se desplaza hacia abajo.
+        Después se sustituyen los marcadores de las celdas de texto: una celda
+        que solo contiene un marcador recibe el valor tal cual (números,
+        fórmulas), en las demás se reemplaza el texto. Al terminar se deshacen
+        todos los cambios para que la plantilla en caché quede intacta.
+
+        Args:
+            template_path (str): Ruta a la plantilla .xlsx
+            output_path (str): Ruta del libro generado
+            celdas (dict, optional): {coordenada: valor} de celdas sueltas (coordenadas del libro generado)
+            filas (list, optional): Filas de datos (listas de valores desde la columna A; None no se escribe)
+            fila_inicial (int, optional): Fila prototipo donde se escribe la primera fila de datos
+            reemplazos (dict, optional): {marcador: valor} para las celdas con marcadores
+
+        Returns:
+            str: Ruta del libro generado
+
+        Raises:
+            ValueError: Si se intenta escribir en una celda combinada que no es la superior izquierda
+        """
+        wb, lock, posiciones_marcadores = self._obtener_plantilla(template_path)
+
+        with lock:
+            ws = wb.active
+            # Valores originales: (fila, columna) -> valor, o None si la celda no existía
+            originales = {}
+            insertadas = max(len(filas) - 1, 0) if filas is not None and fila_inicial else 0
+
+            def escribir(fila, columna, valor):
+                posicion = (fila, columna)
+                existente = ws._cells.get(posicion)
+                if isinstance(existente, MergedCell):
+                    # Solo la celda superior izquierda de un rango combinado admite valor
+                    raise ValueError(
+                        f"La celda {existente.coordinate} de {os.path.basename(template_path)} "
+                        f"forma parte de un rango combinado"
+                    )
+                if posicion not in originales:
+                    originales[posicion] = (existente.value,) if existente is not None else None
+                ws.cell(row=fila, column=columna).value = valor
+
+            try:
+                if insertadas:
+                    _desplazar_filas(ws, fila_inicial, insertadas)
+                    prototipos = [ws.cell(row=fila_inicial, column=c) for c in range(1, ws.max_column + 1)]
+                    altura = ws.row_dimensions[fila_inicial].height
+                    for fila in range(fila_inicial + 1, fila_inicial + 1 + insertadas):
+                        for prototipo in prototipos:
+                            if prototipo.has_style:
+                                ws.cell(row=fila, column=prototipo.column)._style = copy(prototipo._style)
+                        if altura is not None:
+                            ws.row_dimensions[fila].height = altura
+
+                if filas is not None and fila_inicial:
+                    if not filas:
+                        # Sin datos la fila prototipo queda en blanco
+                        for columna in range(1, ws.max_column + 1):
+                            if isinstance(ws.cell(row=fila_inicial, column=columna).value, str):
+                                escribir(fila_inicial, columna, None)
+                    for i, valores in enumerate(filas):
+                        for columna, valor in enumerate(valores, 1):
+                            if valor is not None:
+                                escribir(fila_inicial + i, columna, valor)
+
+                for fila, columna in posiciones_marcadores:
+                    if fila_inicial and fila > fila_inicial:
+                        fila += insertadas
+                    texto = ws.cell(row=fila, column=columna).value
+                    if not isinstance(texto, str):
+                        continue
+                    if texto in (reemplazos or {}):
+                        escribir(fila, columna, reemplazos[texto])
+                        continue
+                    nuevo = texto
+                    for marcador, valor in (reemplazos or {}).items():
+                        if marcador in nuevo:
+                            nuevo = nuevo.replace(marcador, str(valor))
+                    if nuevo != texto:
+                        escribir(fila, columna, nuevo)
+
+                for coordenada, valor in (celdas or {}).items():
+                    fila, columna = coordinate_to_tuple(coordenada)
+                    escribir(fila, columna, valor)
+
+                wb.save(output_path)
+            finally:
+                for posicion, original in originales.items():
+                    if original is None:
+                        del ws._cells[posicion]
+                    else:
+                        ws._cells[posicion].value = original[0]
+                if insertadas:
+                    _desplazar_filas(ws, fila_inicial, -insertadas)
+
+        self.libros_generados += 1
+        return output_path
+
+    def limpiar(self):
+        """Libera las plantillas analizadas"""
+        with self._lock:
+            self._plantillas.clear()
+
+
+# Motor compartido por los generadores del proceso
+excel_engine = ExcelEngine()
@@ -1,4 +1,7 @@
 import os
+import uuid
+from contextlib import contextmanager
+
 import docx2pdf
 
 class FileUtils:
@@ -84,6 +87,99 @@ class FileUtils:
         return None
 
 
+def localizar_facturas_partida(partida_dir):
+    """
+    Localiza los XML de factura de una partida en cualquiera de las dos estructuras.
+    
+    Si hay un XML directamente en la carpeta de la partida se trata como
+    factura única; si no, se toma el primer XML de cada subcarpeta.
+    
+    Args:
+        partida_dir (str): Directorio de la partida
+        
+    Returns:
+        list: Lista de tuplas (ruta_xml, directorio_factura)
+    """
+    xml_files_in_partida = sorted(
+        f for f in os.listdir(partida_dir)
+        if f.lower().endswith('.xml') and os.path.isfile(os.path.join(partida_dir, f))
+    )
+
+    # CASO 1: XML directamente en la carpeta de partida (una sola factura)
+    if xml_files_in_partida:
+        return [(os.path.join(partida_dir, xml_files_in_partida[0]), partida_dir)]
+
+    # CASO 2: Un XML por subcarpeta (múltiples facturas)
+    facturas = []
+    for subdir in sorted(os.listdir(partida_dir)):
+        factura_dir = os.path.join(partida_dir, subdir)
+        if not os.path.isdir(factura_dir):
+            continue
+        xml_files = sorted(
+            f for f in os.listdir(factura_dir)
+            if f.lower().endswith('.xml') and os.path.isfile(os.path.join(factura_dir, f))
+        )
+        if xml_files:
+            facturas.append((os.path.join(factura_dir, xml_files[0]), factura_dir))
+
+    return facturas
+
+
+@contextmanager
+def ruta_temporal(ruta, conservar_extension=False):
+    """
+    Entrega una ruta temporal junto al archivo final y la renombra al terminar.
+    
+    El archivo final solo aparece (con os.replace, que es atómico en el mismo
+    volumen) cuando el bloque termina sin errores; si falla o el proceso se
+    interrumpe, nunca queda un archivo a medias con el nombre definitivo.
+    
+    Args:
+        ruta (str): Ruta final del archivo
+        conservar_extension (bool): Mantiene la extensión al final del nombre
+                                    temporal (para herramientas que la exigen, como docx2pdf)
+        
+    Yields:
+        str: Ruta temporal donde se debe escribir el archivo
+    """
+    directorio, nombre = os.path.split(os.path.abspath(ruta))
+    marca = uuid.uuid4().hex[:8]
+    if conservar_extension:
+        base, extension = os.path.splitext(nombre)
+        temporal = os.path.join(directorio, f"~{base}.{marca}.tmp{extension}")
+    else:
+        temporal = os.path.join(directorio, f"~{nombre}.{marca}.tmp")
+    try:
+        yield temporal
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            try:
+                os.remove(temporal)
+            except OSError:
+                # Un proceso terminado (p. ej. Word) puede retener el archivo unos instantes
+                pass
+
+
+@contextmanager
+def escritura_atomica(ruta, modo='wb'):
+    """
+    Abre un archivo temporal que reemplaza a la ruta final al cerrarse sin errores.
+    
+    Args:
+        ruta (str): Ruta final del archivo
+        modo (str): Modo de apertura ('wb' o 'w')
+        
+    Yields:
+        file: Archivo abierto para escritura
+    """
+    with ruta_temporal(ruta) as temporal:
+        with open(temporal, modo) as archivo:
+            yield archivo
+            archivo.flush()
+            os.fsync(archivo.fileno())
+
+
 def convert_to_pdf(docx_path, output_folder):
     """
     Convierte un archivo DOCX a PDF.
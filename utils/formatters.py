@@ -1,90 +1,120 @@
 """
 Funciones de formateo de datos
+
+Las fechas se formatean con el locale 'es' de babel, que se construye una sola
+vez al importar el módulo; no se modifica locale.setlocale (que es global al
+proceso y no es seguro entre hilos). Las conversiones se memorizan con una
+caché acotada (functools.lru_cache es segura para llamarse desde varios hilos).
 """
 from datetime import datetime
+from functools import lru_cache
+from babel import Locale
 from babel.dates import format_date
-import locale
-import re
 
+# Locale español construido una sola vez para todo el proceso
+LOCALE_ES = Locale.parse('es')
+
+# Número máximo de conversiones memorizadas por función
+TAMANO_CACHE_FORMATOS = 4096
+
+# Abreviaturas de meses para la fecha del mensaje
+# ('SEPT' va antes que 'SEP' porque babel abrevia septiembre como "sept")
+ABREVIATURAS_MESES = [
+    ('SEPT', 'Sep.'), ('ENE', 'Ene.'), ('FEB', 'Feb.'), ('MAR', 'Mar.'), ('ABR', 'Abr.'),
+    ('MAY', 'May.'), ('JUN', 'Jun.'), ('JUL', 'Jul.'), ('AGO', 'Ago.'),
+    ('SEP', 'Sep.'), ('OCT', 'Oct.'), ('NOV', 'Nov.'), ('DIC', 'Dic.')
+]
+
+def _parsear_fecha(fecha_str):
+    """
+    Convierte una fecha YYYY-MM-DD a objeto date.
+
+    Args:
+        fecha_str (str): Fecha en formato YYYY-MM-DD
+
+    Returns:
+        date: Fecha convertida
+    """
+    try:
+        return datetime.strptime(fecha_str, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        raise ValueError("La fecha debe estar en formato YYYY-MM-DD")
+
+@lru_cache(maxsize=TAMANO_CACHE_FORMATOS)
+def formatear_fecha_texto(fecha):
+    """
+    Formatea un objeto date como texto en español ("1 de marzo del 2025").
+
+    Args:
+        fecha (date): Fecha a formatear
+
+    Returns:
+        str: Fecha formateada con la primera letra en mayúscula
+    """
+    fecha_formateada = format_date(fecha, format="d 'de' MMMM 'del' y", locale=LOCALE_ES)
+    return fecha_formateada[0].upper() + fecha_formateada[1:]
+
+@lru_cache(maxsize=TAMANO_CACHE_FORMATOS)
 def convert_fecha_to_texto(fecha_str):
     """
     Convierte una fecha en formato YYYY-MM-DD a texto en español.
-    
+
     Args:
         fecha_str (str): Fecha en formato YYYY-MM-DD
-        
+
     Returns:
         str: Fecha formateada en texto español
     """
-    try:
-        # Convertir la fecha a objeto datetime
-        fecha_dt = datetime.strptime(fecha_str, '%Y-%m-%d')
-        
-        # Establecer la configuración regional a español
-        try:
-            locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
-        except:
-            # Alternativa para Windows
-            try:
-                locale.setlocale(locale.LC_TIME, 'Spanish_Spain.1252')
-            except:
-                pass  # Si no se puede establecer, usar la configuración por defecto
-        
-        # Formatear la fecha en español con la primera letra en mayúscula
-        fecha_formateada = format_date(fecha_dt, format="d 'de' MMMM 'del' y", locale='es')
-        fecha_formateada = fecha_formateada[0].upper() + fecha_formateada[1:]
-        
-        return fecha_formateada
-    except ValueError:
-        raise ValueError("La fecha debe estar en formato YYYY-MM-DD")
+    return formatear_fecha_texto(_parsear_fecha(fecha_str))
 
+@lru_cache(maxsize=TAMANO_CACHE_FORMATOS)
 def format_fecha_mensaje(fecha_str):
     """
     Formatea la fecha del mensaje en un formato especial.
-    
+
     Args:
         fecha_str (str): Fecha en formato YYYY-MM-DD
-        
+
     Returns:
         str: Fecha formateada para mensajes
     """
-    try:
-        # Convertir la fecha a objeto datetime
-        fecha_dt = datetime.strptime(fecha_str, '%Y-%m-%d')
-        
-        # Establecer la configuración regional a español
-        try:
-            locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
-        except:
-            # Alternativa para Windows
-            try:
-                locale.setlocale(locale.LC_TIME, 'Spanish_Spain.1252')
-            except:
-                pass
-        
-        # Formatear la fecha en formato especial
-        fecha_formateada = format_date(fecha_dt, format="d MMM y", locale='es').upper()
-        
-        # Reemplazar abreviaturas de meses
-        for mes_abr, mes_nuevo in [
-            ('ENE', 'Ene.'), ('FEB', 'Feb.'), ('MAR', 'Mar.'), ('ABR', 'Abr.'),
-            ('MAY', 'May.'), ('JUN', 'Jun.'), ('JUL', 'Jul.'), ('AGO', 'Ago.'),
-            ('SEP', 'Sep.'), ('OCT', 'Oct.'), ('NOV', 'Nov.'), ('DIC', 'Dic.')
-        ]:
-            fecha_formateada = fecha_formateada.replace(mes_abr, mes_nuevo)
-        
-        return fecha_formateada
-    except ValueError:
-        raise ValueError("La fecha debe estar en formato YYYY-MM-DD")
+    fecha_dt = _parsear_fecha(fecha_str)
+
+    # Formatear la fecha en formato especial
+    fecha_formateada = format_date(fecha_dt, format="d MMM y", locale=LOCALE_ES).upper()
 
+    # Reemplazar abreviaturas de meses
+    for mes_abr, mes_nuevo in ABREVIATURAS_MESES:
+        fecha_formateada = fecha_formateada.replace(mes_abr, mes_nuevo)
+
+    return fecha_formateada
+
+@lru_cache(maxsize=TAMANO_CACHE_FORMATOS)
 def format_monto(monto):
     """
     Formatea un monto como moneda.
-    
+
     Args:
-        monto (float): Monto a formatear
-        
+        monto (Decimal, float o int): Monto a formatear
+
     Returns:
         str: Monto formateado como moneda
     """
-    return "$ {:,.2f}".format(monto)
\ No newline at end of file
+    return "$ {:,.2f}".format(monto)
+
+def info_cache_formatos():
+    """
+    Obtiene las estadísticas de las cachés de formateo.
+
+    Returns:
+        dict: Aciertos, fallos y tamaño actual por función
+    """
+    return {
+        funcion.__name__: funcion.cache_info()._asdict()
+        for funcion in (formatear_fecha_texto, convert_fecha_to_texto, format_fecha_mensaje, format_monto)
+    }
+
+def limpiar_cache_formatos():
+    """Vacía las cachés de formateo."""
+    for funcion in (formatear_fecha_texto, convert_fecha_to_texto, format_fecha_mensaje, format_monto):
+        funcion.cache_clear()
@@ -3,7 +3,7 @@
 
 from .file_utils import FileUtils, convert_to_pdf
 from .web_utils import descargar_verificacion
-from .formatters import convert_fecha_to_texto, format_fecha_mensaje, format_monto
+from .formatters import convert_fecha_to_texto, format_fecha_mensaje, format_monto, formatear_fecha_texto
 
 __all__ = [
     'FileUtils', 
@@ -11,5 +11,6 @@ __all__ = [
     'descargar_verificacion',
     'convert_fecha_to_texto',
     'format_fecha_mensaje',
-    'format_monto'
+    'format_monto',
+    'formatear_fecha_texto'
 ]
@@ -0,0 +1,219 @@
+"""
+Utilidad para el perfilado de memoria en corridas largas
+"""
+import os
+import sys
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:  # psutil es opcional
+    psutil = None
+
+
+def obtener_rss_mb():
+    """
+    Obtiene la memoria residente (RSS) actual del proceso en MB.
+
+    Usa psutil si está instalado; en caso contrario recurre a /proc en Linux
+    o al máximo histórico de resource en otros sistemas POSIX.
+
+    Returns:
+        float or None: Memoria residente en MB o None si no se puede medir
+    """
+    if psutil is not None:
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+
+    try:
+        with open('/proc/self/statm') as statm:
+            paginas = int(statm.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # En macOS ru_maxrss está en bytes, en Linux en KB
+        return maximo / (1024 * 1024) if sys.platform == 'darwin' else maximo / 1024
+    except ImportError:
+        return None
+
+
+class MemoryProfiler:
+    """Clase para instrumentar el uso de memoria por partida y por etapa"""
+
+    def __init__(self, ui=None, top=10, frames=1, intervalo_rss=0.05):
+        """
+        Inicializa el perfilador de memoria
+
+        Args:
+            ui: Referencia opcional a la interfaz de usuario para reportes
+            top: Número de asignadores principales a reportar
+            frames: Profundidad de la pila registrada por tracemalloc
+            intervalo_rss: Segundos entre muestras del RSS durante las etapas
+        """
+        self.ui = ui
+        self.top = top
+        self.frames = frames
+        self.intervalo_rss = intervalo_rss
+        self.activo = False
+        self.etapas = {}
+        self.partidas = []
+        self._snapshot_base = None
+        self._iniciado_aqui = False
+        # Pico de RSS visto por cada medición de etapa en curso
+        self._picos_rss = {}
+        self._lock_rss = threading.Lock()
+        self._muestreador = None
+        self._detener_muestreo = threading.Event()
+
+    def _muestrear_rss(self):
+        """Hilo que registra el RSS mientras hay etapas en medición"""
+        while not self._detener_muestreo.wait(self.intervalo_rss):
+            with self._lock_rss:
+                if not self._picos_rss:
+                    continue
+            rss = obtener_rss_mb()
+            if rss is None:
+                return
+            with self._lock_rss:
+                for medicion, pico in self._picos_rss.items():
+                    if rss > pico:
+                        self._picos_rss[medicion] = rss
+
+    def iniciar(self):
+        """Activa tracemalloc y toma la instantánea base"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._iniciado_aqui = True
+        self.activo = True
+        self.etapas = {}
+        self.partidas = []
+        self._snapshot_base = tracemalloc.take_snapshot()
+        if self._muestreador is None:
+            self._detener_muestreo.clear()
+            self._muestreador = threading.Thread(target=self._muestrear_rss, name="muestreo-rss", daemon=True)
+            self._muestreador.start()
+
+    def detener(self):
+        """Detiene el muestreo del RSS y tracemalloc si fue iniciado por este perfilador"""
+        if self._muestreador is not None:
+            self._detener_muestreo.set()
+            self._muestreador.join()
+            self._muestreador = None
+        if self._iniciado_aqui and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._iniciado_aqui = False
+        self.activo = False
+        self._snapshot_base = None
+
+    @contextmanager
+    def medir_etapa(self, etapa):
+        """
+        Mide el pico de memoria de Python y el pico de RSS de una etapa
+
+        El pico de RSS es el mayor valor entre el inicio, el final y las
+        muestras que toma el hilo de muestreo cada intervalo_rss segundos.
+
+        Args:
+            etapa: Nombre de la etapa
+        """
+        if not self.activo:
+            yield
+            return
+
+        medicion = object()
+        with self._lock_rss:
+            self._picos_rss[medicion] = obtener_rss_mb() or 0.0
+        tracemalloc.reset_peak()
+        actual_inicio, _ = tracemalloc.get_traced_memory()
+        try:
+            yield
+        finally:
+            _, pico = tracemalloc.get_traced_memory()
+            rss_final = obtener_rss_mb()
+            with self._lock_rss:
+                rss = max(self._picos_rss.pop(medicion), rss_final or 0.0) or None
+            registro = self.etapas.setdefault(etapa, {
+                'ejecuciones': 0,
+                'pico_python_mb': 0.0,
+                'pico_rss_mb': 0.0,
+            })
+            registro['ejecuciones'] += 1
+            registro['pico_python_mb'] = max(
+                registro['pico_python_mb'], (pico - actual_inicio) / (1024 * 1024))
+            if rss is not None:
+                registro['pico_rss_mb'] = max(registro['pico_rss_mb'], rss)
+
+    def snapshot_partida(self, numero_partida):
+        """
+        Toma una instantánea al terminar una partida y registra los
+        asignadores que más crecieron respecto a la instantánea base
+
+        Args:
+            numero_partida: Número de la partida procesada
+        """
+        if not self.activo:
+            return
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        diferencias = snapshot.compare_to(self._snapshot_base, 'lineno')
+        actual, pico = tracemalloc.get_traced_memory()
+
+        self.partidas.append({
+            'partida': numero_partida,
+            'memoria_python_mb': actual / (1024 * 1024),
+            'pico_python_mb': pico / (1024 * 1024),
+            'rss_mb': obtener_rss_mb(),
+            'top_asignadores': [
+                {
+                    'ubicacion': str(diferencia.traceback),
+                    'diferencia_kb': diferencia.size_diff / 1024,
+                    'total_kb': diferencia.size / 1024,
+                }
+                for diferencia in diferencias[:self.top]
+            ],
+        })
+
+    def get_summary(self):
+        """
+        Obtiene el resumen de memoria de la corrida
+
+        Returns:
+            dict: Picos por etapa e instantáneas por partida
+        """
+        return {
+            'etapas': self.etapas,
+            'partidas': self.partidas,
+        }
+
+    def print_summary(self):
+        """Reporta el resumen de memoria en la UI (si existe) y en el log"""
+        def reportar(mensaje, nivel="info"):
+            if self.ui:
+                self.ui.update_status(mensaje, nivel)
+            else:
+                logger.info(mensaje)
+
+        reportar("\n===== PERFIL DE MEMORIA =====")
+        for etapa, registro in sorted(self.etapas.items(), key=lambda x: x[1]['pico_python_mb'], reverse=True):
+            reportar(
+                f"  - {etapa}: pico Python {registro['pico_python_mb']:.1f} MB, "
+                f"RSS {registro['pico_rss_mb']:.1f} MB ({registro['ejecuciones']} ejecuciones)",
+                "time"
+            )
+
+        if self.partidas:
+            ultima = self.partidas[-1]
+            reportar(f"Principales asignadores tras la partida {ultima['partida']}:")
+            for asignador in ultima['top_asignadores']:
+                reportar(f"  - {asignador['ubicacion']}: {asignador['diferencia_kb']:+.1f} KB")
@@ -0,0 +1,170 @@
+"""
+Llenado directo de plantillas .docx a nivel OOXML.
+
+El .docx se trata como un zip: solo se lee y se reescribe word/document.xml;
+el resto de las partes (imágenes del encabezado, estilos, fuentes, etc.) se
+copia por bloques sin interpretarse, de modo que la memoria usada no depende
+del tamaño de las imágenes incrustadas.
+"""
+import io
+import os
+import shutil
+import zipfile
+import logging
+
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from lxml import etree
+
+from utils.file_utils import ruta_temporal
+
+logger = logging.getLogger(__name__)
+
+PARTE_DOCUMENTO = 'word/document.xml'
+
+# Tamaño de bloque al copiar las partes que no se modifican
+TAMANO_BLOQUE = 1024 * 1024
+
+
+def texto_parrafo(p):
+    """
+    Obtiene el texto de un párrafo w:p a partir de sus elementos w:t.
+
+    Args:
+        p: Elemento w:p
+
+    Returns:
+        str: Texto concatenado de los runs del párrafo
+    """
+    return ''.join(t.text or '' for t in p.iter(qn('w:t')))
+
+
+def reemplazar_marcadores_xml(raiz, reemplazos):
+    """
+    Reemplaza marcadores en todos los párrafos del documento (cuerpo y tablas).
+
+    Primero se reemplaza dentro de cada w:t para conservar el formato de cada
+    run. Si un marcador quedó repartido entre varios runs, el texto completo
+    del párrafo se coloca en el primer w:t (con el formato de su run) y los
+    demás se vacían, igual que el método alternativo de python-docx.
+
+    Args:
+        raiz: Elemento raíz w:document
+        reemplazos (dict): Marcadores y sus valores
+
+    Returns:
+        int: Número de párrafos modificados
+    """
+    claves = [(key, str(value)) for key, value in reemplazos.items()]
+    tag_p, tag_t = qn('w:p'), qn('w:t')
+    attr_space = qn('xml:space')
+    modificados = 0
+
+    for p in raiz.iter(tag_p):
+        elementos_t = list(p.iter(tag_t))
+        if not elementos_t:
+            continue
+        texto = ''.join(t.text or '' for t in elementos_t)
+        if '{{' not in texto or not any(key in texto for key, _ in claves):
+            continue
+
+        for t in elementos_t:
+            if t.text and '{{' in t.text:
+                for key, value in claves:
+                    if key in t.text:
+                        t.text = t.text.replace(key, value)
+
+        texto = ''.join(t.text or '' for t in elementos_t)
+        if any(key in texto for key, _ in claves):
+            for key, value in claves:
+                texto = texto.replace(key, value)
+            elementos_t[0].text = texto
+            for t in elementos_t[1:]:
+                t.text = ''
+
+        for t in elementos_t:
+            if t.text and t.text != t.text.strip():
+                t.set(attr_space, 'preserve')
+        modificados += 1
+
+    return modificados
+
+
+def marcadores_pendientes(raiz, reemplazos):
+    """
+    Busca marcadores que sigan presentes después del llenado.
+
+    Args:
+        raiz: Elemento raíz w:document
+        reemplazos (dict): Marcadores esperados
+
+    Returns:
+        set: Marcadores que no se reemplazaron
+    """
+    pendientes = set()
+    for p in raiz.iter(qn('w:p')):
+        texto = texto_parrafo(p)
+        if '{{' in texto:
+            pendientes.update(key for key in reemplazos if key in texto)
+    return pendientes
+
+
+def _abrir_origen(origen):
+    """Abre la plantilla desde una ruta o desde su contenido en bytes"""
+    if isinstance(origen, (bytes, bytearray)):
+        return zipfile.ZipFile(io.BytesIO(origen))
+    return zipfile.ZipFile(origen)
+
+
+def escribir_docx(origen, output_path, transformar):
+    """
+    Genera un .docx reescribiendo solo word/document.xml.
+
+    Args:
+        origen: Ruta de la plantilla o su contenido (bytes)
+        output_path (str): Ruta del documento generado
+        transformar: Función que recibe el elemento raíz w:document y lo modifica
+
+    Returns:
+        str: Ruta del documento generado
+    """
+    # Se escribe en un temporal para no dejar un .docx incompleto con el nombre final
+    with ruta_temporal(output_path) as temporal:
+        with _abrir_origen(origen) as zin, zipfile.ZipFile(temporal, 'w', zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename == PARTE_DOCUMENTO:
+                    # Elementos de python-docx, para poder usar sus propiedades (tr_lst, add_r, ...)
+                    raiz = parse_xml(zin.read(info))
+                    transformar(raiz)
+                    zout.writestr(info, etree.tostring(raiz, encoding='UTF-8', standalone=True))
+                else:
+                    # Copia por bloques con la misma compresión de la plantilla
+                    with zin.open(info) as entrada, zout.open(info, 'w') as salida:
+                        shutil.copyfileobj(entrada, salida, TAMANO_BLOQUE)
+    return output_path
+
+
+def llenar_docx(origen, output_path, reemplazos, transformar=None, nombre=None):
+    """
+    Llena los marcadores de una plantilla y escribe el documento.
+
+    Args:
+        origen: Ruta de la plantilla o su contenido (bytes)
+        output_path (str): Ruta del documento generado
+        reemplazos (dict): Marcadores y sus valores
+        transformar: Función opcional con cambios adicionales sobre w:document
+        nombre (str, optional): Nombre del documento para los mensajes del log
+
+    Returns:
+        str: Ruta del documento generado
+    """
+    nombre = nombre or os.path.basename(output_path)
+
+    def _transformar(raiz):
+        reemplazar_marcadores_xml(raiz, reemplazos)
+        if transformar is not None:
+            transformar(raiz)
+        for key in marcadores_pendientes(raiz, reemplazos):
+            logger.warning(f"Marcador {key} no reemplazado en {nombre}")
+
+    return escribir_docx(origen, output_path, _transformar)
@@ -0,0 +1,307 @@
+"""
+Recompresión de las imágenes de los PDF escaneados (factura original y
+verificación del SAT).
+
+Muchas facturas originales son fotos o escaneos con páginas de varios MB.
+Las imágenes cuya resolución efectiva supera la resolución objetivo se
+reducen y se vuelven a comprimir (JPEG para las que ya eran JPEG, Flate sin
+pérdida para las demás). El PDF optimizado se guarda en una caché cuya
+clave es el hash del archivo de origen y los parámetros, de modo que volver
+a procesar la misma factura no repite el trabajo.
+"""
+import os
+import io
+import time
+import hashlib
+import logging
+import threading
+import zlib
+
+import pikepdf
+from pikepdf import Name, PdfImage
+from PIL import Image
+
+from config import PDF_CONFIG
+from utils.file_utils import ruta_temporal
+
+logger = logging.getLogger(__name__)
+
+# Directorio de caché por defecto (junto a la aplicación)
+DIRECTORIO_CACHE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache_imagenes_pdf")
+
+# Extensión del marcador de los PDF que no tienen imágenes que reducir
+EXTENSION_SIN_CAMBIOS = ".sin_cambios"
+
+TAMANO_BLOQUE_HASH = 1024 * 1024
+
+
+def hash_archivo(ruta):
+    """
+    Calcula el SHA-256 del contenido de un archivo.
+
+    Args:
+        ruta (str): Ruta del archivo
+
+    Returns:
+        str: Hash en hexadecimal
+    """
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE_HASH), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def _dpi_efectivo(ancho_px, alto_px, pagina):
+    """
+    Estima la resolución de una imagen suponiendo que ocupa como máximo la página.
+
+    Si la imagen se dibuja más pequeña su resolución real es mayor, así que la
+    estimación nunca reduce de más.
+    """
+    caja = [float(v) for v in pagina.mediabox]
+    ancho_pt, alto_pt = abs(caja[2] - caja[0]), abs(caja[3] - caja[1])
+    if not ancho_pt or not alto_pt:
+        return 0
+    return max(ancho_px / (ancho_pt / 72), alto_px / (alto_pt / 72))
+
+
+def _filtros(imagen):
+    """Lista de filtros de compresión de un stream de imagen"""
+    filtro = imagen.get('/Filter')
+    if filtro is None:
+        return []
+    if isinstance(filtro, pikepdf.Array):
+        return list(filtro)
+    return [filtro]
+
+
+def _decode_identidad(imagen):
+    """Indica si la imagen no tiene /Decode o si es el de por defecto ([0 1] por componente)"""
+    decode = imagen.get('/Decode')
+    if decode is None:
+        return True
+    valores = [float(v) for v in decode]
+    return all(valores[i:i + 2] == [0.0, 1.0] for i in range(0, len(valores), 2))
+
+
+class PDFImageOptimizer:
+    """
+    Reduce y recomprime las imágenes sobredimensionadas de un PDF, con caché por hash.
+    """
+
+    def __init__(self, directorio_cache=None, dpi=None, calidad_jpeg=None, tamano_minimo_kb=None,
+                 tamano_maximo_cache_mb=None):
+        """
+        Inicializa el optimizador
+
+        Args:
+            directorio_cache (str, optional): Directorio de la caché
+            dpi (int, optional): Resolución objetivo (por defecto PDF_CONFIG['dpi_imagenes'])
+            calidad_jpeg (int, optional): Calidad de las imágenes JPEG recomprimidas
+            tamano_minimo_kb (int, optional): Las imágenes más pequeñas no se tocan
+            tamano_maximo_cache_mb (int, optional): Límite de la caché; al superarlo se eliminan
+                                                    los PDF usados hace más tiempo
+        """
+        self.directorio_cache = directorio_cache or PDF_CONFIG.get('cache_imagenes') or DIRECTORIO_CACHE
+        self.dpi = dpi or PDF_CONFIG.get('dpi_imagenes', 150)
+        self.calidad_jpeg = calidad_jpeg or PDF_CONFIG.get('calidad_jpeg', 85)
+        self.tamano_minimo = 1024 * (tamano_minimo_kb or PDF_CONFIG.get('tamano_minimo_imagen_kb', 200))
+        self.tamano_maximo_cache_mb = tamano_maximo_cache_mb or PDF_CONFIG.get('tamano_maximo_cache_imagenes_mb')
+        self._lock = threading.Lock()
+        self.estadisticas = {'aciertos': 0, 'optimizados': 0, 'sin_cambios': 0, 'errores': 0,
+                             'desalojados': 0, 'bytes_ahorrados': 0, 'segundos': 0.0}
+
+    def _clave(self, pdf_path):
+        """Clave de caché: hash del archivo y parámetros de la optimización"""
+        parametros = f"{self.dpi}-{self.calidad_jpeg}-{self.tamano_minimo}".encode()
+        return hashlib.sha256(hash_archivo(pdf_path).encode() + parametros).hexdigest()
+
+    def _contar(self, clave, cantidad=1):
+        with self._lock:
+            self.estadisticas[clave] += cantidad
+
+    def _reducir_imagen(self, imagen, dpi_actual):
+        """
+        Reduce y recomprime una imagen del PDF si el resultado es más pequeño.
+
+        Args:
+            imagen: Stream de la imagen (pikepdf)
+            dpi_actual (float): Resolución efectiva estimada
+
+        Returns:
+            int: Bytes ahorrados (0 si la imagen no se modificó)
+        """
+        original = len(imagen.read_raw_bytes())
+        pil = PdfImage(imagen).as_pil_image()
+        if pil.mode not in ('RGB', 'L'):
+            pil = pil.convert('RGB')
+
+        escala = self.dpi / dpi_actual
+        nuevo_tamano = (max(1, round(pil.width * escala)), max(1, round(pil.height * escala)))
+        pil = pil.resize(nuevo_tamano, Image.LANCZOS)
+
+        # Solo las imágenes guardadas como JPEG se vuelven a codificar en JPEG
+        if _filtros(imagen) == [Name.DCTDecode]:
+            buffer = io.BytesIO()
+            pil.save(buffer, format='JPEG', quality=self.calidad_jpeg, optimize=True)
+            datos, filtro = buffer.getvalue(), Name.DCTDecode
+        else:
+            # Sin pérdida para las imágenes que no eran JPEG
+            datos, filtro = zlib.compress(pil.tobytes(), 9), Name.FlateDecode
+
+        if len(datos) >= original:
+            return 0
+
+        imagen.write(datos, filter=filtro)
+        imagen.Width, imagen.Height = pil.width, pil.height
+        imagen.BitsPerComponent = 8
+        imagen.ColorSpace = Name.DeviceRGB if pil.mode == 'RGB' else Name.DeviceGray
+        for clave in ('/DecodeParms', '/Decode'):
+            if clave in imagen:
+                del imagen[clave]
+        return original - len(datos)
+
+    def _optimizar_documento(self, pdf):
+        """
+        Optimiza las imágenes de todas las páginas de un documento abierto.
+
+        Args:
+            pdf: Documento abierto con pikepdf
+
+        Returns:
+            int: Bytes ahorrados
+        """
+        ahorro = 0
+        revisadas = set()
+        for pagina in pdf.pages:
+            # get_images (pikepdf >= 9) también encuentra las imágenes dentro de form XObjects
+            imagenes = pagina.get_images() if hasattr(pagina, 'get_images') else pagina.images
+            for imagen in imagenes.values():
+                if imagen.objgen in revisadas:
+                    continue
+                revisadas.add(imagen.objgen)
+
+                # Máscaras, imágenes de 1 bit (CCITT/JBIG2), con transparencia o con /Decode
+                # (p. ej. escaneos CMYK invertidos, que al convertirlas quedarían en negativo) se dejan intactas
+                if (imagen.get('/ImageMask') or imagen.get('/BitsPerComponent', 8) != 8
+                        or '/SMask' in imagen or '/Mask' in imagen or not _decode_identidad(imagen)):
+                    continue
+                if len(imagen.read_raw_bytes()) < self.tamano_minimo:
+                    continue
+                dpi_actual = _dpi_efectivo(int(imagen.Width), int(imagen.Height), pagina)
+                if dpi_actual <= self.dpi * 1.2:
+                    continue
+                try:
+                    ahorro += self._reducir_imagen(imagen, dpi_actual)
+                except Exception as e:
+                    logger.debug(f"No se pudo reducir una imagen: {str(e)}")
+        return ahorro
+
+    def optimizar(self, pdf_path):
+        """
+        Obtiene la versión optimizada de un PDF (de la caché o generándola).
+
+        Args:
+            pdf_path (str): Ruta del PDF escaneado
+
+        Returns:
+            str: Ruta del PDF a usar (el optimizado o el original si no hubo cambios o falló)
+        """
+        if not pdf_path or not os.path.exists(pdf_path):
+            return pdf_path
+
+        inicio = time.perf_counter()
+        try:
+            clave = self._clave(pdf_path)
+            ruta_cache = os.path.join(self.directorio_cache, f"{clave}.pdf")
+            marcador = os.path.join(self.directorio_cache, f"{clave}{EXTENSION_SIN_CAMBIOS}")
+
+            if os.path.exists(ruta_cache):
+                # Marca la entrada como usada recientemente
+                os.utime(ruta_cache)
+                self._contar('aciertos')
+                return ruta_cache
+            if os.path.exists(marcador):
+                os.utime(marcador)
+                self._contar('aciertos')
+                return pdf_path
+
+            os.makedirs(self.directorio_cache, exist_ok=True)
+            with pikepdf.open(pdf_path) as pdf:
+                ahorro = self._optimizar_documento(pdf)
+                if ahorro:
+                    with ruta_temporal(ruta_cache) as temporal:
+                        pdf.save(temporal, compress_streams=True,
+                                 object_stream_mode=pikepdf.ObjectStreamMode.generate)
+
+            if not ahorro:
+                open(marcador, 'wb').close()
+                self._contar('sin_cambios')
+                return pdf_path
+
+            self._contar('optimizados')
+            self._contar('bytes_ahorrados', os.path.getsize(pdf_path) - os.path.getsize(ruta_cache))
+            logger.info(
+                f"Imágenes de {os.path.basename(pdf_path)} reducidas a {self.dpi} DPI: "
+                f"{os.path.getsize(pdf_path)} -> {os.path.getsize(ruta_cache)} bytes"
+            )
+            self._aplicar_limite(conservar=ruta_cache)
+            return ruta_cache
+
+        except Exception as e:
+            self._contar('errores')
+            logger.warning(f"No se pudieron optimizar las imágenes de {pdf_path}: {str(e)}")
+            return pdf_path
+        finally:
+            self._contar('segundos', time.perf_counter() - inicio)
+
+    def _aplicar_limite(self, conservar=None):
+        """
+        Elimina las entradas menos usadas recientemente hasta quedar bajo el límite.
+
+        Args:
+            conservar (str, optional): Entrada recién creada que no se elimina
+        """
+        if not self.tamano_maximo_cache_mb:
+            return
+        limite = self.tamano_maximo_cache_mb * 1024 * 1024
+
+        with self._lock:
+            entradas = []
+            for nombre in os.listdir(self.directorio_cache):
+                ruta = os.path.join(self.directorio_cache, nombre)
+                if nombre.startswith('~') or ruta == conservar:
+                    continue
+                try:
+                    estado = os.stat(ruta)
+                except OSError:
+                    continue
+                entradas.append((estado.st_mtime, estado.st_size, ruta))
+
+            total = sum(tamano for _, tamano, _ in entradas)
+            if conservar and os.path.exists(conservar):
+                total += os.path.getsize(conservar)
+            for _, tamano, ruta in sorted(entradas):
+                if total <= limite:
+                    break
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    continue
+                total -= tamano
+                self.estadisticas['desalojados'] += 1
+
+    def limpiar(self):
+        """Elimina todos los archivos de la caché"""
+        if not os.path.isdir(self.directorio_cache):
+            return
+        for nombre in os.listdir(self.directorio_cache):
+            try:
+                os.remove(os.path.join(self.directorio_cache, nombre))
+            except OSError:
+                pass
+
+
+# Optimizador compartido por el procesamiento de PDF
+pdf_image_optimizer = PDFImageOptimizer()
@@ -2,16 +2,337 @@
 Clase para gestionar operaciones con PDFs, incluyendo conversión, combinación y manipulación
 """
 import os
+import time
+import hashlib
 import logging
-from PyPDF2 import PdfReader, PdfWriter
+import platform
 import pikepdf
-import tempfile
-import shutil
 from docx2pdf import convert as docx2pdf_convert
 
+from config import PDF_CONFIG
+from utils.conversion_cache import conversion_cache, hash_contenido_docx
+from utils.file_utils import ruta_temporal
+from utils.watchdog import watchdog
+from utils.worker_pool import ejecutar_en_paralelo
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+try:
+    import psutil
+except ImportError:  # psutil es opcional: sin él no se cierra Word tras una conversión colgada
+    psutil = None
+
+def _convertir_docx(docx_path, pdf_path):
+    """Convierte un DOCX a PDF (se ejecuta en el proceso supervisado)"""
+    docx2pdf_convert(docx_path, pdf_path)
+
+
+def _cerrar_word(inicio):
+    """
+    Cierra la instancia de Word de automatización que dejó una conversión colgada.
+
+    Solo se terminan los WINWORD.EXE abiertos por COM (línea de comandos con
+    /Automation) después de iniciar el intento; los documentos que el usuario
+    tenga abiertos en Word no se tocan.
+
+    Args:
+        inicio (float): Momento (time.time()) en que empezó el intento terminado
+    """
+    if platform.system() != 'Windows':
+        return
+    if psutil is None:
+        logger.warning("psutil no está instalado: no se puede cerrar la instancia de Word de la conversión")
+        return
+    for proceso in psutil.process_iter(['name', 'cmdline', 'create_time']):
+        try:
+            if (proceso.info['name'] or '').lower() != 'winword.exe':
+                continue
+            linea = ' '.join(proceso.info['cmdline'] or []).lower()
+            if '/automation' not in linea or (proceso.info['create_time'] or 0) < inicio - 1:
+                continue
+            proceso.kill()
+            logger.info(f"Instancia de Word de la conversión terminada (pid {proceso.pid})")
+        except psutil.Error:
+            continue
+
+
+watchdog.registrar_limpieza('conversion_pdf', _cerrar_word)
+
+
+# Objetos de la estructura del documento que no se fusionan aunque sean idénticos
+_TIPOS_NO_FUSIONABLES = {'/Page', '/Pages', '/Catalog'}
+
+# Tamaño carta vertical en puntos (tamaño de los documentos de legalización)
+TAMANO_CARTA = (612, 792)
+
+# Pasadas máximas de deduplicación (al fusionar fuentes, sus descriptores quedan idénticos)
+MAX_PASADAS_DEDUPLICACION = 5
+
+
+def _fusionable(obj):
+    """Indica si un objeto indirecto puede reemplazarse por otro idéntico"""
+    if not isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        return False
+    return obj.get('/Type') not in _TIPOS_NO_FUSIONABLES and '/Parent' not in obj
+
+
+def _clave_objeto(obj):
+    """Huella de un objeto: su diccionario serializado y, si es stream, el hash de su contenido sin decodificar"""
+    if isinstance(obj, pikepdf.Stream):
+        return b'S' + obj.stream_dict.unparse() + hashlib.sha256(obj.read_raw_bytes()).digest()
+    return b'D' + obj.unparse()
+
+
+def _reemplazar_referencias(obj, canonicos):
+    """Apunta las referencias a objetos duplicados hacia su copia canónica (recorre objetos directos anidados)"""
+    if isinstance(obj, pikepdf.Array):
+        for i in range(len(obj)):
+            valor = obj[i]
+            if not isinstance(valor, pikepdf.Object):
+                # Números y booleanos llegan como tipos de Python
+                continue
+            if valor.is_indirect:
+                if valor.objgen in canonicos:
+                    obj[i] = canonicos[valor.objgen]
+            elif isinstance(valor, (pikepdf.Array, pikepdf.Dictionary)):
+                _reemplazar_referencias(valor, canonicos)
+    elif isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        for clave in list(obj.keys()):
+            valor = obj.get(clave)
+            if not isinstance(valor, pikepdf.Object):
+                continue
+            if valor.is_indirect:
+                if valor.objgen in canonicos:
+                    obj[clave] = canonicos[valor.objgen]
+            elif isinstance(valor, (pikepdf.Array, pikepdf.Dictionary)):
+                _reemplazar_referencias(valor, canonicos)
+
+
+def deduplicar_objetos(pdf):
+    """
+    Fusiona fuentes, imágenes, streams de contenido y diccionarios idénticos.
+
+    Los PDF combinados traen una copia de la misma fuente o del mismo sello
+    por cada documento de origen; aquí todas las referencias se apuntan a una
+    sola copia y las demás quedan sin usar (qpdf no las escribe al guardar).
+
+    Args:
+        pdf: Documento abierto con pikepdf
+
+    Returns:
+        int: Número de objetos duplicados eliminados
+    """
+    descartados = set()
+    total = 0
+    for _ in range(MAX_PASADAS_DEDUPLICACION):
+        vistos = {}
+        canonicos = {}
+        for obj in pdf.objects:
+            if obj.objgen in descartados or not _fusionable(obj):
+                continue
+            clave = _clave_objeto(obj)
+            previo = vistos.get(clave)
+            if previo is None:
+                vistos[clave] = obj
+            else:
+                canonicos[obj.objgen] = previo
+        if not canonicos:
+            break
+
+        for obj in pdf.objects:
+            if obj.objgen not in descartados:
+                _reemplazar_referencias(obj, canonicos)
+        _reemplazar_referencias(pdf.trailer, canonicos)
+        descartados.update(canonicos)
+        total += len(canonicos)
+    return total
+
+
+def optimizar_pdf(pdf_path, linearizar=False):
+    """
+    Optimiza un PDF en su lugar: deduplica objetos, comprime en object streams
+    y opcionalmente lo linealiza.
+
+    Args:
+        pdf_path (str): Ruta del PDF
+        linearizar (bool): Linealiza el PDF (vista rápida en web)
+
+    Returns:
+        dict: ruta, tamano_original, tamano_final, duplicados y segundos
+    """
+    inicio = time.perf_counter()
+    tamano_original = os.path.getsize(pdf_path)
+
+    with ruta_temporal(pdf_path) as temporal:
+        # El original se cierra antes de reemplazarlo
+        with pikepdf.open(pdf_path) as pdf:
+            duplicados = deduplicar_objetos(pdf)
+            pdf.save(
+                temporal,
+                compress_streams=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                linearize=linearizar
+            )
+
+    return {
+        'ruta': pdf_path,
+        'tamano_original': tamano_original,
+        'tamano_final': os.path.getsize(pdf_path),
+        'duplicados': duplicados,
+        'segundos': time.perf_counter() - inicio,
+    }
+
+
+def abrir_pdf_origen(pdf_path):
+    """
+    Abre un PDF de origen para copiar sus páginas sin cargarlo en memoria.
+
+    qpdf accede al archivo mediante mmap y solo lee los objetos que se
+    copian; los streams de contenido no se decodifican.
+
+    Args:
+        pdf_path (str): Ruta del PDF
+
+    Returns:
+        pikepdf.Pdf: Documento abierto (debe cerrarse después de guardar el destino)
+    """
+    return pikepdf.open(pdf_path, access_mode=pikepdf.AccessMode.mmap)
+
+
+def guardar_combinado(pdf, output_path):
+    """
+    Guarda un PDF combinado copiando los streams tal como vienen del origen.
+
+    Los orígenes deben seguir abiertos: qpdf lee los datos de los streams
+    directamente de ellos al escribir.
+
+    Args:
+        pdf: Documento destino (pikepdf)
+        output_path (str): Ruta del PDF resultante
+    """
+    with ruta_temporal(output_path) as temporal:
+        pdf.save(temporal, stream_decode_level=pikepdf.StreamDecodeLevel.none)
+
+
+def _caja(valor):
+    """Normaliza un rectángulo de PDF a (x0, y0, x1, y1) con x0 <= x1 e y0 <= y1"""
+    caja = [float(v) for v in valor]
+    return min(caja[0], caja[2]), min(caja[1], caja[3]), max(caja[0], caja[2]), max(caja[1], caja[3])
+
+
+def _caja_visible(pagina):
+    """
+    Región visible de una página: la CropBox recortada a la MediaBox.
+
+    Args:
+        pagina: Página de pikepdf
+
+    Returns:
+        tuple: (x0, y0, x1, y1) en el sistema de coordenadas sin rotar
+    """
+    media = _caja(pagina.mediabox)
+    if '/CropBox' not in pagina.obj:
+        return media
+    crop = _caja(pagina.obj.CropBox)
+    visible = (max(media[0], crop[0]), max(media[1], crop[1]), min(media[2], crop[2]), min(media[3], crop[3]))
+    return visible if visible[0] < visible[2] and visible[1] < visible[3] else media
+
+
+def _escalar_pagina(pagina, escala, dx, dy):
+    """
+    Lleva las cajas y las anotaciones de una página al contenido escalado.
+
+    Args:
+        pagina: Página de pikepdf
+        escala (float): Factor de escala aplicado al contenido
+        dx (float): Desplazamiento horizontal
+        dy (float): Desplazamiento vertical
+    """
+    def punto(x, y):
+        return round(float(x) * escala + dx, 4), round(float(y) * escala + dy, 4)
+
+    for clave in ('/CropBox', '/BleedBox', '/TrimBox', '/ArtBox'):
+        if clave in pagina.obj:
+            x0, y0, x1, y1 = _caja(pagina.obj[clave])
+            pagina.obj[clave] = pikepdf.Array([*punto(x0, y0), *punto(x1, y1)])
+
+    for anotacion in pagina.obj.get('/Annots', []):
+        if '/Rect' in anotacion:
+            x0, y0, x1, y1 = _caja(anotacion.Rect)
+            anotacion.Rect = pikepdf.Array([*punto(x0, y0), *punto(x1, y1)])
+        if '/QuadPoints' in anotacion:
+            valores = list(anotacion.QuadPoints)
+            anotacion.QuadPoints = pikepdf.Array(
+                [v for i in range(0, len(valores) - 1, 2) for v in punto(valores[i], valores[i + 1])]
+            )
+
+
+def normalizar_pagina(pagina, rotacion_grados=90, tamano=TAMANO_CARTA, tolerancia=0.1):
+    """
+    Normaliza la orientación y el tamaño de una página ya copiada al destino.
+
+    Solo modifica el objeto de la página: las páginas que se ven horizontales
+    (región visible con su /Rotate aplicado) reciben /Rotate para verse
+    verticales, los valores de /Rotate inválidos se corrigen y las páginas de
+    tamaño atípico se escalan con una transformación (cm) que envuelve su
+    contenido original, que no se decodifica ni se reescribe. La CropBox, las
+    demás cajas y las anotaciones se transforman con el contenido.
+
+    Args:
+        pagina: Página de pikepdf en el documento destino
+        rotacion_grados (int): Rotación aplicada a las páginas horizontales (90 o 270)
+        tamano (tuple): Ancho y alto de la página vertical normalizada, en puntos
+        tolerancia (float): Diferencia relativa de tamaño que se acepta sin escalar
+
+    Returns:
+        bool: True si la página se modificó
+    """
+    x0, y0, x1, y1 = _caja_visible(pagina)
+    ancho, alto = x1 - x0, y1 - y0
+    if not ancho or not alto:
+        return False
+
+    rotacion_original = int(pagina.obj.get('/Rotate', 0))
+    # /Rotate debe ser múltiplo de 90; otros valores se redondean
+    rotacion = (round(rotacion_original / 90) * 90) % 360
+    # Orientación tal como se ve: con /Rotate 90 o 270 el ancho y el alto se intercambian
+    girada = rotacion % 180 == 90
+    ancho_visible, alto_visible = (alto, ancho) if girada else (ancho, alto)
+    if ancho_visible > alto_visible:
+        rotacion = (rotacion + rotacion_grados) % 360
+        girada = not girada
+
+    modificada = False
+    if rotacion != rotacion_original:
+        pagina.obj.Rotate = rotacion
+        modificada = True
+
+    # Tamaño objetivo en el sistema de coordenadas sin rotar de la página
+    ancho_objetivo, alto_objetivo = (tamano[1], tamano[0]) if girada else tamano
+    if (abs(ancho - ancho_objetivo) / ancho_objetivo > tolerancia
+            or abs(alto - alto_objetivo) / alto_objetivo > tolerancia):
+        escala = min(ancho_objetivo / ancho, alto_objetivo / alto)
+        dx = (ancho_objetivo - ancho * escala) / 2 - x0 * escala
+        dy = (alto_objetivo - alto * escala) / 2 - y0 * escala
+        pagina.contents_add(f"q {escala:.6f} 0 0 {escala:.6f} {dx:.4f} {dy:.4f} cm\n".encode(), prepend=True)
+        pagina.contents_add(b"\nQ", prepend=False)
+        pagina.obj.MediaBox = pikepdf.Array([0, 0, ancho_objetivo, alto_objetivo])
+        _escalar_pagina(pagina, escala, dx, dy)
+        modificada = True
+
+    return modificada
+
+
+def _optimizar_pdf_tarea(tarea):
+    """Optimiza un PDF dentro del grupo de procesos (los errores se devuelven, no se lanzan)"""
+    pdf_path, linearizar = tarea
+    try:
+        return optimizar_pdf(pdf_path, linearizar)
+    except Exception as e:
+        return {'ruta': pdf_path, 'error': str(e)}
+
+
 class PDFManager:
     """
     Clase para gestionar operaciones con archivos PDF.
@@ -21,17 +342,13 @@ class PDFManager:
     
     def __init__(self):
         """Inicializa el gestor de PDFs."""
-        self.temp_dir = None
-        self._create_temp_dir()
+        # Páginas escritas en documentos combinados (para medir páginas por segundo)
+        self.paginas_escritas = 0
+        self.paginas_normalizadas = 0
     
-    def _create_temp_dir(self):
-        """Crea un directorio temporal para operaciones con PDF."""
-        try:
-            self.temp_dir = tempfile.mkdtemp(prefix="pdf_manager_")
-            logger.debug(f"Directorio temporal creado: {self.temp_dir}")
-        except Exception as e:
-            logger.error(f"Error al crear directorio temporal: {str(e)}")
-            raise
+    def _contar_paginas(self, paginas):
+        """Acumula las páginas escritas en documentos combinados"""
+        self.paginas_escritas += paginas
     
     def convert_docx_to_pdf(self, docx_path, output_dir=None):
         """
@@ -56,9 +373,25 @@ class PDFManager:
             # Generar ruta de salida
             pdf_path = os.path.join(output_dir, f"{name_without_ext}.pdf")
             
-            # Convertir DOCX a PDF
+            # Un documento con el mismo contenido ya convertido se toma de la caché
+            clave = None
+            if conversion_cache.habilitado:
+                try:
+                    clave = hash_contenido_docx(docx_path)
+                except Exception as e:
+                    logger.warning(f"No se pudo calcular la clave de caché de {docx_path}: {str(e)}")
+                if clave and conversion_cache.obtener(clave, pdf_path):
+                    logger.info(f"PDF tomado de la caché de conversión: {pdf_path}")
+                    return pdf_path
+            
+            # Convertir DOCX a PDF (en un archivo temporal que se renombra al terminar)
             logger.info(f"Convirtiendo {docx_path} a PDF...")
-            docx2pdf_convert(docx_path, pdf_path)
+            # La conversión corre supervisada: se termina y reintenta si Word se cuelga
+            with ruta_temporal(pdf_path, conservar_extension=True) as pdf_temporal:
+                watchdog.ejecutar('conversion_pdf', _convertir_docx, docx_path, pdf_temporal)
+            
+            if clave and os.path.exists(pdf_path):
+                conversion_cache.guardar(clave, pdf_path)
             
             # Verificar que el archivo PDF se creó correctamente
             if os.path.exists(pdf_path):
@@ -112,8 +445,7 @@ class PDFManager:
             int: Número de páginas
         """
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf = PdfReader(file)
+            with abrir_pdf_origen(pdf_path) as pdf:
                 num_pages = len(pdf.pages)
                 logger.debug(f"PDF {pdf_path} tiene {num_pages} páginas")
                 return num_pages
@@ -132,23 +464,22 @@ class PDFManager:
         Returns:
             str: Ruta al archivo PDF combinado
         """
+        sources = []
         try:
-            pdf_writer = PdfWriter()
-            
-            # Añadir cada PDF
-            for pdf_file in pdf_files:
-                if not os.path.exists(pdf_file):
-                    logger.warning(f"Archivo PDF no encontrado: {pdf_file}")
-                    continue
+            with pikepdf.new() as writer:
+                # Añadir cada PDF
+                for pdf_file in pdf_files:
+                    if not os.path.exists(pdf_file):
+                        logger.warning(f"Archivo PDF no encontrado: {pdf_file}")
+                        continue
+                    
+                    source = abrir_pdf_origen(pdf_file)
+                    sources.append(source)
+                    writer.pages.extend(source.pages)
                 
-                with open(pdf_file, 'rb') as file:
-                    pdf_reader = PdfReader(file)
-                    for page in pdf_reader.pages:
-                        pdf_writer.add_page(page)
-            
-            # Guardar el PDF combinado
-            with open(output_path, 'wb') as output_file:
-                pdf_writer.write(output_file)
+                # Guardar el PDF combinado
+                guardar_combinado(writer, output_path)
+                self._contar_paginas(len(writer.pages))
             
             logger.info(f"PDFs combinados exitosamente en: {output_path}")
             return output_path
@@ -156,6 +487,9 @@ class PDFManager:
         except Exception as e:
             logger.error(f"Error al combinar PDFs: {str(e)}")
             raise
+        finally:
+            for source in sources:
+                source.close()
     
     def create_alternating_pdf(self, output_path, main_pdf, interleaved_pdf):
         """
@@ -172,40 +506,31 @@ class PDFManager:
         """
         try:
             # Abrir PDFs
-            with open(main_pdf, 'rb') as main_file, open(interleaved_pdf, 'rb') as interleaved_file:
-                main_reader = PdfReader(main_file)
-                interleaved_reader = PdfReader(interleaved_file)
+            with abrir_pdf_origen(main_pdf) as main_source, \
+                    abrir_pdf_origen(interleaved_pdf) as interleaved_source, \
+                    pikepdf.new() as writer:
+                main_pages = main_source.pages
+                interleaved_pages = interleaved_source.pages
                 
                 # Comprobar que hay al menos una página en cada documento
-                if len(main_reader.pages) == 0 or len(interleaved_reader.pages) == 0:
+                if len(main_pages) == 0 or len(interleaved_pages) == 0:
                     raise ValueError("Ambos PDFs deben tener al menos una página")
                 
-                # Si el documento intercalado tiene solo una página, la usaremos varias veces
-                single_interleaved_page = len(interleaved_reader.pages) == 1
-                
-                # Crear el nuevo PDF
-                writer = PdfWriter()
-                
                 # Añadir páginas alternadas
-                for i in range(len(main_reader.pages)):
+                for i in range(len(main_pages)):
                     # Añadir página del documento principal
-                    writer.add_page(main_reader.pages[i])
+                    writer.pages.append(main_pages[i])
                     
-                    # Añadir página del documento intercalado
-                    if single_interleaved_page:
-                        # Siempre usar la primera página si solo hay una
-                        writer.add_page(interleaved_reader.pages[0])
-                    else:
-                        # Intentar usar la página correspondiente o la última disponible
-                        interleaved_index = min(i, len(interleaved_reader.pages) - 1)
-                        writer.add_page(interleaved_reader.pages[interleaved_index])
+                    # Página correspondiente o la última disponible (la única si solo hay una)
+                    interleaved_index = min(i, len(interleaved_pages) - 1)
+                    writer.pages.append(interleaved_pages[interleaved_index])
                 
                 # Guardar el resultado
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
+                guardar_combinado(writer, output_path)
+                self._contar_paginas(len(writer.pages))
                 
-                logger.info(f"PDF alternado creado exitosamente: {output_path}")
-                return output_path
+            logger.info(f"PDF alternado creado exitosamente: {output_path}")
+            return output_path
                 
         except Exception as e:
             logger.error(f"Error al crear PDF alternado: {str(e)}")
@@ -215,16 +540,33 @@ class PDFManager:
     def create_complex_document(self, output_path, document_config):
         """
         Crea un documento PDF complejo siguiendo una configuración específica.
+        
+        Las páginas se copian como objetos desde los documentos de origen,
+        abiertos con mmap; sus streams de contenido no se decodifican ni se
+        cargan completos en memoria. Si PDF_CONFIG['aplicar_rotacion_pdf'] está
+        activo, las páginas de los documentos con 'normalize' se normalizan
+        (orientación y tamaño) en esta misma pasada.
         """
+        normalizar = PDF_CONFIG.get('aplicar_rotacion_pdf', False)
+        rotacion_grados = PDF_CONFIG.get('rotacion_grados', 90)
+        if rotacion_grados not in (90, 270):
+            # 180 no endereza una página horizontal
+            logger.warning(f"rotacion_grados={rotacion_grados} no es válido para páginas horizontales; se usa 90")
+            rotacion_grados = 90
+        tamano = tuple(PDF_CONFIG.get('tamano_pagina', TAMANO_CARTA))
+        tolerancia = PDF_CONFIG.get('tolerancia_tamano', 0.1)
+
+        # Documentos de origen abiertos (deben seguir abiertos hasta guardar el resultado)
+        sources = {}
+        
+        def abrir(path):
+            if path not in sources:
+                sources[path] = abrir_pdf_origen(path)
+            return sources[path]
+        
         try:
             # Crear el nuevo PDF
-            writer = PdfWriter()
-            
-            # Lista para mantener las referencias a los objetos de archivo abiertos
-            open_files = []
-            readers = []
-            
-            try:
+            with pikepdf.new() as writer:
                 # Procesar cada documento en la configuración
                 for doc_config in document_config:
                     # Verificar que el archivo existe
@@ -232,70 +574,59 @@ class PDFManager:
                         logger.warning(f"Archivo no encontrado: {doc_config['path']}")
                         continue
                     
-                    # Abrir el PDF y mantenerlo en la lista de archivos abiertos
-                    file = open(doc_config['path'], 'rb')
-                    open_files.append(file)
-                    reader = PdfReader(file)
-                    readers.append(reader)
+                    pages = abrir(doc_config['path']).pages
                     
                     # Determinar qué páginas incluir
                     if doc_config.get('all_pages', True):
-                        pages_to_add = range(len(reader.pages))
+                        pages_to_add = range(len(pages))
                     else:
                         # Ajustar índices a base 0 (los números de página comienzan en 1)
                         pages_to_add = [p-1 for p in doc_config.get('pages', []) 
-                                    if 1 <= p <= len(reader.pages)]
+                                    if 1 <= p <= len(pages)]
                     
                     # Documento para intercalar
-                    interleave_reader = None
+                    interleave_pages = None
                     
                     if 'interleave_with' in doc_config and os.path.exists(doc_config['interleave_with']):
-                        interleave_file = open(doc_config['interleave_with'], 'rb')
-                        open_files.append(interleave_file)
-                        interleave_reader = PdfReader(interleave_file)
-                        readers.append(interleave_reader)
+                        interleave_pages = abrir(doc_config['interleave_with']).pages
                         
                         # Si no hay páginas en el documento para intercalar, omitirlo
-                        if len(interleave_reader.pages) == 0:
-                            interleave_reader = None
+                        if len(interleave_pages) == 0:
+                            interleave_pages = None
+                    
+                    normalize_pages = normalizar and doc_config.get('normalize', False)
                     
                     # Añadir páginas con intercalado si es necesario
                     for i, page_index in enumerate(pages_to_add):
                         # Añadir página del documento principal
-                        writer.add_page(reader.pages[page_index])
+                        writer.pages.append(pages[page_index])
+                        if normalize_pages and normalizar_pagina(writer.pages[-1], rotacion_grados, tamano, tolerancia):
+                            self.paginas_normalizadas += 1
                         
                         # Intercalar después de cada página si está configurado
-                        if interleave_reader and not doc_config.get('interleave_once', False):
-                            # Si hay una sola página para intercalar, usarla para todas
-                            if len(interleave_reader.pages) == 1:
-                                writer.add_page(interleave_reader.pages[0])
-                            else:
-                                # Intentar usar páginas correspondientes o la última disponible
-                                interleave_index = min(i, len(interleave_reader.pages) - 1)
-                                writer.add_page(interleave_reader.pages[interleave_index])
+                        if interleave_pages and not doc_config.get('interleave_once', False):
+                            # Página correspondiente o la última disponible (la única si solo hay una)
+                            interleave_index = min(i, len(interleave_pages) - 1)
+                            writer.pages.append(interleave_pages[interleave_index])
                     
                     # Intercalar una sola vez después de todo el documento si está configurado
-                    if interleave_reader and doc_config.get('interleave_once', False):
-                        writer.add_page(interleave_reader.pages[0])
+                    if interleave_pages and doc_config.get('interleave_once', False):
+                        writer.pages.append(interleave_pages[0])
                 
                 # Guardar el resultado
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
-                
-                logger.info(f"Documento complejo creado exitosamente: {output_path}")
-                return output_path
-                    
-            finally:
-                # Cerrar todos los archivos abiertos
-                for file in open_files:
-                    try:
-                        file.close()
-                    except:
-                        pass
+                guardar_combinado(writer, output_path)
+                self._contar_paginas(len(writer.pages))
+            
+            logger.info(f"Documento complejo creado exitosamente: {output_path}")
+            return output_path
                     
         except Exception as e:
             logger.error(f"Error al crear documento complejo: {str(e)}")
             raise
+        finally:
+            # Cerrar todos los documentos de origen
+            for source in sources.values():
+                source.close()
 
 
 
@@ -325,6 +656,7 @@ class PDFManager:
                 {
                     'path': factura_pdf,
                     'all_pages': True,
+                    'normalize': True,
                     'interleave_with': legalizacion_factura_pdf,
                     'interleave_once': False
                 },
@@ -332,6 +664,7 @@ class PDFManager:
                 {
                     'path': verificacion_sat_pdf,
                     'all_pages': True,
+                    'normalize': True,
                     'interleave_with': legalizacion_verificacion_pdf,
                     'interleave_once': True
                 },
@@ -351,53 +684,41 @@ class PDFManager:
             logger.error(f"Error al crear documento legal de factura: {str(e)}")
             raise
     
-    def rotate_pdf_pages(self, pdf_path, output_path, rotation_angle=90):
+    def optimize_pdfs(self, pdf_paths, linearize=None, procesos=None):
         """
-        Rota las páginas de un PDF.
+        Optimiza varios PDF combinados usando el grupo de procesos.
         
         Args:
-            pdf_path (str): Ruta al archivo PDF original
-            output_path (str): Ruta donde guardar el PDF rotado
-            rotation_angle (int): Ángulo de rotación en grados (90, 180, 270)
+            pdf_paths (list): Rutas de los PDF a optimizar
+            linearize (bool, optional): Linealiza los PDF (por defecto PDF_CONFIG['linearizar_pdf'])
+            procesos (int, optional): Número de procesos (por defecto PDF_CONFIG['procesos_optimizacion'])
             
         Returns:
-            str: Ruta al PDF rotado
+            dict: 'archivos' (resultado por PDF), tamano_original, tamano_final, segundos y errores
         """
-        try:
-            # Verificar que el ángulo de rotación es válido
-            if rotation_angle not in [90, 180, 270]:
-                raise ValueError("El ángulo de rotación debe ser 90, 180 o 270 grados")
-            
-            # Abrir el PDF
-            with open(pdf_path, 'rb') as file:
-                reader = PdfReader(file)
-                writer = PdfWriter()
-                
-                # Rotar cada página
-                for page in reader.pages:
-                    page.rotate(rotation_angle)
-                    writer.add_page(page)
-                
-                # Guardar el resultado
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
-                
-                logger.info(f"PDF rotado creado exitosamente: {output_path}")
-                return output_path
+        if linearize is None:
+            linearize = PDF_CONFIG.get('linearizar_pdf', False)
+        if procesos is None:
+            procesos = PDF_CONFIG.get('procesos_optimizacion')
         
-        except Exception as e:
-            logger.error(f"Error al rotar PDF: {str(e)}")
-            raise
-    
-    def cleanup(self):
-        """Limpia recursos temporales."""
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            try:
-                shutil.rmtree(self.temp_dir)
-                logger.debug(f"Directorio temporal eliminado: {self.temp_dir}")
-            except Exception as e:
-                logger.error(f"Error al eliminar directorio temporal: {str(e)}")
-    
-    def __del__(self):
-        """Destructor que asegura la limpieza de recursos."""
-        self.cleanup()
\ No newline at end of file
+        inicio = time.perf_counter()
+        tareas = [(ruta, linearize) for ruta in pdf_paths if ruta and os.path.exists(ruta)]
+        resultados = ejecutar_en_paralelo(_optimizar_pdf_tarea, tareas, procesos)
+        
+        correctos = [r for r in resultados if 'error' not in r]
+        for resultado in resultados:
+            if 'error' in resultado:
+                logger.warning(f"No se pudo optimizar {resultado['ruta']}: {resultado['error']}")
+        
+        resumen = {
+            'archivos': resultados,
+            'tamano_original': sum(r['tamano_original'] for r in correctos),
+            'tamano_final': sum(r['tamano_final'] for r in correctos),
+            'segundos': time.perf_counter() - inicio,
+            'errores': len(resultados) - len(correctos),
+        }
+        logger.info(
+            f"PDF optimizados: {len(correctos)}, {resumen['tamano_original']} -> "
+            f"{resumen['tamano_final']} bytes en {resumen['segundos']:.2f} s"
+        )
+        return resumen
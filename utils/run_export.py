@@ -0,0 +1,260 @@
+"""
+Exportación consolidada de las facturas procesadas en una corrida.
+
+Cada resultado se escribe en cuanto se obtiene (CSV, o Parquet si pyarrow
+está instalado), así que el archivo queda completo hasta la última factura
+aunque el proceso se interrumpa. Al cerrar se genera además un resumen XLSX
+con una hoja por partida y el detalle de todas las facturas, para auditar o
+comparar un mes contra otro sin abrir los documentos generados.
+"""
+import os
+import csv
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from openpyxl import Workbook
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional
+    pa = None
+    pq = None
+
+# Etapas medidas por factura (ver FacturaController.procesar_factura)
+ETAPAS_EXPORTACION = ['lectura_xml', 'conceptos', 'documentos_word', 'documentos_pdf', 'total']
+
+COLUMNAS_EXPORTACION = [
+    'partida', 'uuid', 'serie_numero', 'rfc_emisor', 'rfc_receptor', 'emisor',
+    'fecha_factura', 'total', 'conceptos', 'xml_path', 'documentos', 'pdf_combinado',
+] + [f'tiempo_{etapa}' for etapa in ETAPAS_EXPORTACION] + ['errores']
+
+
+def _total_texto(valor):
+    """Convierte el total a texto con dos decimales (exacto para Decimal)"""
+    if valor is None or valor == '':
+        return ''
+    try:
+        return str(Decimal(str(valor)).quantize(Decimal('0.01')))
+    except InvalidOperation:
+        return str(valor)
+
+
+def fila_exportacion(resultado=None, partida='', xml_path='', error=''):
+    """
+    Construye la fila de exportación de una factura.
+
+    Args:
+        resultado: FacturaResult devuelto por procesar_factura (None si falló)
+        partida (str): Partida de la factura (si no hay resultado)
+        xml_path (str): Ruta del XML (si no hay resultado)
+        error (str): Error a registrar además de los del resultado
+
+    Returns:
+        dict: Valores de cada columna de COLUMNAS_EXPORTACION
+    """
+    fila = dict.fromkeys(COLUMNAS_EXPORTACION, '')
+    fila['partida'] = partida
+    fila['xml_path'] = xml_path
+    errores = []
+
+    if resultado is not None:
+        documentos = dict(resultado.get('documentos') or {})
+        pdf_combinado = documentos.pop('pdf_combinado', None)
+        documentos.pop('pdf_files', None)
+        tiempos = resultado.get('tiempos') or {}
+
+        fila.update({
+            'partida': resultado.get('partida') or partida,
+            'uuid': resultado.get('uuid', ''),
+            'serie_numero': resultado.get('serie_numero', ''),
+            'rfc_emisor': resultado.get('rfc_emisor', ''),
+            'rfc_receptor': resultado.get('rfc_receptor', ''),
+            'emisor': resultado.get('emisor', ''),
+            'fecha_factura': resultado.get('fecha_factura', ''),
+            'total': _total_texto(resultado.get('monto_decimal')),
+            'conceptos': resultado.get('conceptos', ''),
+            'xml_path': resultado.get('xml_path') or xml_path,
+            'documentos': '; '.join(f"{clave}={ruta}" for clave, ruta in documentos.items() if ruta),
+            'pdf_combinado': pdf_combinado or '',
+        })
+        for etapa in ETAPAS_EXPORTACION:
+            if etapa in tiempos:
+                fila[f'tiempo_{etapa}'] = round(tiempos[etapa], 3)
+        errores.extend(resultado.get('errores') or [])
+
+    if error:
+        errores.append(error)
+    fila['errores'] = ' | '.join(errores)
+    return fila
+
+
+class RunExporter:
+    """
+    Exporta de forma incremental los resultados de todas las facturas de una corrida.
+    """
+
+    def __init__(self, directorio, nombre_base=None, formato='csv', resumen_xlsx=True, lote_parquet=500):
+        """
+        Crea los archivos de exportación
+
+        Args:
+            directorio (str): Directorio donde se guardan los archivos
+            nombre_base (str, optional): Nombre sin extensión (por defecto con fecha y hora)
+            formato (str): 'csv' o 'parquet' (requiere pyarrow; si no, se usa CSV)
+            resumen_xlsx (bool): Genera el resumen XLSX al cerrar
+            lote_parquet (int): Filas por grupo al escribir Parquet
+        """
+        os.makedirs(directorio, exist_ok=True)
+        if nombre_base is None:
+            nombre_base = f"facturas_procesadas_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+        if formato == 'parquet' and pq is None:
+            logger.warning("pyarrow no está instalado; la exportación se escribirá en CSV")
+            formato = 'csv'
+
+        self.formato = formato
+        self.resumen_xlsx = resumen_xlsx
+        self.lote_parquet = max(1, int(lote_parquet))
+        self.ruta = os.path.join(directorio, f"{nombre_base}.{formato}")
+        self.ruta_resumen = os.path.join(directorio, f"{nombre_base}_resumen.xlsx")
+
+        self.total_filas = 0
+        self.total_errores = 0
+        # Totales por partida en centavos: {partida: [facturas, errores, centavos]}
+        self._por_partida = {}
+        self._cerrado = False
+
+        if self.formato == 'parquet':
+            self._esquema = pa.schema([(columna, pa.string()) for columna in COLUMNAS_EXPORTACION])
+            self._escritor = pq.ParquetWriter(self.ruta, self._esquema)
+            self._pendientes = []
+        else:
+            # utf-8-sig para que Excel reconozca los acentos al abrir el CSV
+            self._archivo = open(self.ruta, 'w', newline='', encoding='utf-8-sig')
+            self._escritor = csv.DictWriter(self._archivo, fieldnames=COLUMNAS_EXPORTACION)
+            self._escritor.writeheader()
+            self._archivo.flush()
+
+        logger.info(f"Exportación de facturas en: {self.ruta}")
+
+    def _escribir(self, fila):
+        """Escribe una fila en el archivo incremental y actualiza los totales"""
+        if self._cerrado:
+            raise RuntimeError("La exportación ya fue cerrada")
+
+        if self.formato == 'parquet':
+            self._pendientes.append(fila)
+            if len(self._pendientes) >= self.lote_parquet:
+                self._vaciar_parquet()
+        else:
+            self._escritor.writerow(fila)
+            self._archivo.flush()
+
+        totales = self._por_partida.setdefault(fila['partida'], [0, 0, 0])
+        if fila['errores']:
+            totales[1] += 1
+            self.total_errores += 1
+        if fila['uuid']:
+            totales[0] += 1
+            if fila['total']:
+                totales[2] += int(Decimal(fila['total']) * 100)
+        self.total_filas += 1
+
+    def _vaciar_parquet(self):
+        """Escribe las filas pendientes como un grupo de filas de Parquet"""
+        if not self._pendientes:
+            return
+        columnas = {
+            columna: [str(fila[columna]) for fila in self._pendientes]
+            for columna in COLUMNAS_EXPORTACION
+        }
+        self._escritor.write_table(pa.table(columnas, schema=self._esquema))
+        self._pendientes = []
+
+    def registrar(self, resultado):
+        """
+        Registra una factura procesada.
+
+        Args:
+            resultado: FacturaResult devuelto por procesar_factura
+        """
+        self._escribir(fila_exportacion(resultado))
+
+    def registrar_error(self, partida, xml_path, error):
+        """
+        Registra una factura que no se pudo procesar.
+
+        Args:
+            partida (str): Número de partida
+            xml_path (str): Ruta del XML
+            error (str): Descripción del error
+        """
+        self._escribir(fila_exportacion(None, partida, xml_path, error or "Error al procesar la factura"))
+
+    def _leer_filas(self):
+        """Lee de nuevo las filas exportadas sin cargarlas todas en memoria"""
+        if self.formato == 'parquet':
+            for lote in pq.ParquetFile(self.ruta).iter_batches():
+                yield from lote.to_pylist()
+        else:
+            with open(self.ruta, newline='', encoding='utf-8-sig') as archivo:
+                yield from csv.DictReader(archivo)
+
+    def _escribir_resumen(self):
+        """Genera el resumen XLSX (por partida y detalle de facturas) en modo write_only"""
+        wb = Workbook(write_only=True)
+
+        ws = wb.create_sheet("Resumen")
+        ws.append(["Partida", "Facturas", "Con error", "Total"])
+        for partida, (facturas, errores, centavos) in self._por_partida.items():
+            ws.append([partida, facturas, errores, Decimal(centavos) / 100])
+        ws.append([])
+        ws.append([
+            "Total",
+            sum(t[0] for t in self._por_partida.values()),
+            self.total_errores,
+            Decimal(sum(t[2] for t in self._por_partida.values())) / 100
+        ])
+
+        ws = wb.create_sheet("Facturas")
+        ws.append(COLUMNAS_EXPORTACION)
+        indice_total = COLUMNAS_EXPORTACION.index('total')
+        for fila in self._leer_filas():
+            valores = [fila.get(columna, '') for columna in COLUMNAS_EXPORTACION]
+            if valores[indice_total]:
+                valores[indice_total] = Decimal(valores[indice_total])
+            ws.append(valores)
+
+        wb.save(self.ruta_resumen)
+        logger.info(f"Resumen de la exportación generado: {self.ruta_resumen}")
+
+    def cerrar(self):
+        """
+        Cierra el archivo incremental y genera el resumen XLSX.
+
+        Returns:
+            dict: Rutas generadas ('datos' y 'resumen') y número de filas
+        """
+        if self._cerrado:
+            return {'datos': self.ruta, 'resumen': None, 'filas': self.total_filas}
+
+        if self.formato == 'parquet':
+            self._vaciar_parquet()
+            self._escritor.close()
+        else:
+            self._archivo.close()
+        self._cerrado = True
+
+        ruta_resumen = None
+        if self.resumen_xlsx:
+            try:
+                self._escribir_resumen()
+                ruta_resumen = self.ruta_resumen
+            except Exception as e:
+                logger.error(f"No se pudo generar el resumen XLSX: {str(e)}")
+
+        return {'datos': self.ruta, 'resumen': ruta_resumen, 'filas': self.total_filas}
@@ -0,0 +1,272 @@
+"""
+Espacio temporal de la corrida compartido por todas las etapas.
+
+Hay un solo directorio por corrida (opcionalmente en memoria, /dev/shm o un
+disco RAM configurado) con un subdirectorio por etapa. Los archivos
+intermedios se crean en directorios temporales que se eliminan al salir del
+bloque que los usa, y todo el espacio se elimina al cerrar la corrida. Al
+iniciar se borran los directorios que dejaron corridas anteriores que ya no
+están en ejecución. Si el espacio principal supera su tamaño máximo, los
+nuevos directorios se crean en el directorio temporal del sistema. Para
+cada etapa se registra cuánto espacio ocupó.
+"""
+import os
+import time
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from config import SCRATCH_CONFIG
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:  # psutil es opcional: sin él los huérfanos se detectan por antigüedad
+    psutil = None
+
+PREFIJO_CORRIDA = "corrida_"
+
+# Antigüedad a partir de la cual se elimina un directorio huérfano si no se puede comprobar su proceso
+ANTIGUEDAD_HUERFANO = 24 * 3600
+
+# Directorio de memoria compartida de Linux (tmpfs)
+DIRECTORIO_MEMORIA = "/dev/shm"
+
+
+def tamano_directorio(ruta):
+    """
+    Calcula el espacio que ocupan los archivos de un directorio (recursivo).
+
+    Args:
+        ruta (str): Directorio
+
+    Returns:
+        int: Tamaño en bytes (0 si no existe)
+    """
+    total = 0
+    for raiz, _, archivos in os.walk(ruta):
+        for nombre in archivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nombre))
+            except OSError:
+                pass
+    return total
+
+
+def _es_huerfano(ruta, nombre):
+    """Indica si un directorio de corrida pertenece a un proceso que ya terminó"""
+    partes = nombre[len(PREFIJO_CORRIDA):].split('_', 1)
+    if psutil is not None and partes[0].isdigit():
+        pid = int(partes[0])
+        return pid != os.getpid() and not psutil.pid_exists(pid)
+    try:
+        return time.time() - os.path.getmtime(ruta) > ANTIGUEDAD_HUERFANO
+    except OSError:
+        return False
+
+
+class ScratchSpace:
+    """
+    Directorio temporal de una corrida con un subdirectorio por etapa.
+    """
+
+    def __init__(self, config=None):
+        """
+        Inicializa el espacio temporal (el directorio se crea en iniciar() o al primer uso)
+
+        Args:
+            config (dict, optional): Configuración (por defecto SCRATCH_CONFIG)
+        """
+        self.config = SCRATCH_CONFIG if config is None else config
+        self.raiz = None
+        self._raiz_respaldo = None
+        self._lock = threading.Lock()
+        self.estadisticas = {}
+        self.huerfanos_eliminados = 0
+        self.desbordes = 0
+
+    def _base(self):
+        """Directorio donde se crean los espacios de las corridas"""
+        if self.config.get('directorio'):
+            return self.config['directorio']
+        if self.config.get('usar_memoria', False) and os.path.isdir(DIRECTORIO_MEMORIA):
+            return DIRECTORIO_MEMORIA
+        return tempfile.gettempdir()
+
+    def _limpiar_huerfanos(self, base):
+        """Elimina los directorios de corridas anteriores que ya no están en ejecución"""
+        try:
+            nombres = os.listdir(base)
+        except OSError:
+            return
+        for nombre in nombres:
+            ruta = os.path.join(base, nombre)
+            if nombre.startswith(PREFIJO_CORRIDA) and os.path.isdir(ruta) and _es_huerfano(ruta, nombre):
+                shutil.rmtree(ruta, ignore_errors=True)
+                self.huerfanos_eliminados += 1
+                logger.info(f"Espacio temporal huérfano eliminado: {ruta}")
+
+    def _crear_raiz(self, base):
+        os.makedirs(base, exist_ok=True)
+        return tempfile.mkdtemp(prefix=f"{PREFIJO_CORRIDA}{os.getpid()}_", dir=base)
+
+    def iniciar(self):
+        """
+        Crea el espacio de una corrida nueva (cierra el anterior si sigue abierto).
+
+        Returns:
+            str: Directorio de la corrida
+        """
+        self.cerrar()
+        base = self._base()
+        with self._lock:
+            self._limpiar_huerfanos(base)
+            self.raiz = self._crear_raiz(base)
+            self.estadisticas = {}
+            self.desbordes = 0
+        logger.debug(f"Espacio temporal de la corrida: {self.raiz}")
+        return self.raiz
+
+    def _asegurar_raiz(self):
+        if self.raiz is None or not os.path.isdir(self.raiz):
+            self.iniciar()
+        return self.raiz
+
+    def _registro(self, etapa):
+        return self.estadisticas.setdefault(etapa, {'directorios': 0, 'bytes': 0, 'pico_bytes': 0})
+
+    def _contabilizar(self, etapa, ruta, omitir_vacio=False):
+        """Suma a la etapa el espacio que ocupó un directorio antes de eliminarlo"""
+        tamano = tamano_directorio(ruta)
+        if omitir_vacio and not tamano:
+            return
+        with self._lock:
+            registro = self._registro(etapa)
+            registro['directorios'] += 1
+            registro['bytes'] += tamano
+            registro['pico_bytes'] = max(registro['pico_bytes'], tamano)
+
+    def _raiz_disponible(self):
+        """Raíz donde crear un directorio nuevo: la principal o, si superó el límite, la de respaldo"""
+        raiz = self._asegurar_raiz()
+        limite_mb = self.config.get('tamano_maximo_mb')
+        if not limite_mb or tamano_directorio(raiz) < limite_mb * 1024 * 1024:
+            return raiz
+
+        with self._lock:
+            self.desbordes += 1
+            if self._raiz_respaldo is None or not os.path.isdir(self._raiz_respaldo):
+                self._raiz_respaldo = self._crear_raiz(tempfile.gettempdir())
+                logger.warning(
+                    f"El espacio temporal superó {limite_mb} MB; los archivos nuevos se crean en {self._raiz_respaldo}"
+                )
+        return self._raiz_respaldo
+
+    def directorio(self, etapa):
+        """
+        Obtiene el subdirectorio de una etapa (se conserva hasta liberar la etapa o cerrar la corrida).
+
+        Args:
+            etapa (str): Nombre de la etapa
+
+        Returns:
+            str: Directorio de la etapa
+        """
+        ruta = os.path.join(self._asegurar_raiz(), etapa)
+        os.makedirs(ruta, exist_ok=True)
+        return ruta
+
+    @contextmanager
+    def temporal(self, etapa):
+        """
+        Crea un directorio temporal de la etapa que se elimina al salir del bloque.
+
+        Args:
+            etapa (str): Nombre de la etapa (para contabilizar su espacio)
+
+        Yields:
+            str: Directorio temporal
+        """
+        directorio_etapa = os.path.join(self._raiz_disponible(), etapa)
+        os.makedirs(directorio_etapa, exist_ok=True)
+        ruta = tempfile.mkdtemp(dir=directorio_etapa)
+        try:
+            yield ruta
+        finally:
+            self._contabilizar(etapa, ruta)
+            shutil.rmtree(ruta, ignore_errors=True)
+
+    def contiene(self, ruta):
+        """
+        Indica si una ruta está dentro del espacio temporal (sus archivos no sobreviven a la corrida).
+
+        Args:
+            ruta (str): Ruta de un archivo
+
+        Returns:
+            bool: True si la ruta es temporal
+        """
+        if not ruta:
+            return False
+        ruta = os.path.abspath(ruta)
+        for raiz in (self.raiz, self._raiz_respaldo):
+            if not raiz:
+                continue
+            raiz = os.path.abspath(raiz)
+            try:
+                if os.path.commonpath([ruta, raiz]) == raiz:
+                    return True
+            except ValueError:  # Unidades distintas en Windows
+                continue
+        return False
+
+    def liberar(self, etapa):
+        """
+        Elimina el subdirectorio de una etapa registrando el espacio que ocupó.
+
+        Args:
+            etapa (str): Nombre de la etapa
+        """
+        for raiz in (self.raiz, self._raiz_respaldo):
+            ruta = os.path.join(raiz, etapa) if raiz else None
+            if ruta and os.path.isdir(ruta):
+                self._contabilizar(etapa, ruta, omitir_vacio=True)
+                shutil.rmtree(ruta, ignore_errors=True)
+
+    def cerrar(self):
+        """Elimina todo el espacio de la corrida"""
+        with self._lock:
+            raices = [r for r in (self.raiz, self._raiz_respaldo) if r]
+            self.raiz = None
+            self._raiz_respaldo = None
+        for raiz in raices:
+            if not os.path.isdir(raiz):
+                continue
+            # Contabilizar lo que quedaba en cada etapa
+            for etapa in os.listdir(raiz):
+                ruta = os.path.join(raiz, etapa)
+                if os.path.isdir(ruta):
+                    self._contabilizar(etapa, ruta, omitir_vacio=True)
+            shutil.rmtree(raiz, ignore_errors=True)
+            logger.debug(f"Espacio temporal eliminado: {raiz}")
+
+    def resumen(self):
+        """
+        Obtiene el espacio ocupado por etapa.
+
+        Returns:
+            dict: {etapa: {directorios, bytes, pico_bytes}}
+        """
+        with self._lock:
+            return {etapa: dict(registro) for etapa, registro in self.estadisticas.items()}
+
+
+# Espacio temporal compartido por todas las etapas de la corrida
+scratch_space = ScratchSpace()
+
+# Si se usó fuera de una corrida (o la corrida no llegó a cerrarlo), se elimina al salir
+atexit.register(scratch_space.cerrar)
@@ -0,0 +1,278 @@
+"""
+Generación local de las partidas y publicación en la carpeta compartida.
+
+Las carpetas de las partidas suelen estar en una unidad de red. En modo
+staging, los archivos de entrada de la partida (XML y PDF) se copian al
+espacio temporal de la corrida, todos los documentos se generan ahí y al
+terminar la partida solo los archivos nuevos o modificados se publican en
+la carpeta original. La publicación es en dos fases: primero se copian
+todos con nombres temporales (en paralelo con un grupo de hilos) y después
+se renombran; si falla alguna copia no se publica nada de la partida. Los
+bytes y segundos de lectura y publicación en red se acumulan aparte del
+tiempo de generación.
+"""
+import os
+import time
+import shutil
+import fnmatch
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+from config import STAGING_CONFIG
+from utils.artifact_registry import artifact_registry
+from utils.scratch_space import scratch_space
+
+logger = logging.getLogger(__name__)
+
+# Operaciones de red que se miden
+OPERACIONES_RED = ('lectura', 'publicacion')
+
+
+def _copiar_archivo(origen, destino):
+    """Copia un archivo creando su directorio y devuelve los bytes copiados"""
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    shutil.copyfile(origen, destino)
+    return os.path.getsize(destino)
+
+
+class PartidaStaging:
+    """
+    Copia local de una partida y publicación de sus documentos generados.
+    """
+
+    def __init__(self, partida_dir, gestor):
+        """
+        Inicializa el área de trabajo (los archivos se copian en preparar())
+
+        Args:
+            partida_dir (str): Carpeta de la partida en la unidad compartida
+            gestor: Staging que acumula las métricas de red
+        """
+        self.partida_dir = os.path.abspath(partida_dir)
+        self.gestor = gestor
+        self.local_dir = None
+        self._contexto = None
+        self._entradas = {}
+
+    def _firma(self, ruta):
+        estado = os.stat(ruta)
+        return estado.st_size, estado.st_mtime_ns
+
+    def _es_entrada(self, nombre):
+        if nombre.startswith('~'):
+            return False
+        if any(fnmatch.fnmatch(nombre, patron) for patron in self.gestor.config.get('excluir', [])):
+            return False
+        # El registro de artefactos acompaña a los archivos ya descargados o generados
+        if nombre == artifact_registry.archivo_registro:
+            return True
+        extensiones = self.gestor.config.get('extensiones_entrada', ['.xml', '.pdf'])
+        return os.path.splitext(nombre)[1].lower() in extensiones
+
+    def preparar(self):
+        """
+        Copia los archivos de entrada de la partida al espacio temporal.
+
+        Returns:
+            str: Directorio local donde se debe generar la partida
+        """
+        self._contexto = scratch_space.temporal('staging')
+        raiz = self._contexto.__enter__()
+        self.local_dir = os.path.join(raiz, os.path.basename(self.partida_dir))
+        os.makedirs(self.local_dir, exist_ok=True)
+
+        copias = []
+        for directorio, _, archivos in os.walk(self.partida_dir):
+            for nombre in archivos:
+                if self._es_entrada(nombre):
+                    origen = os.path.join(directorio, nombre)
+                    copias.append((origen, self.local(origen)))
+
+        inicio = time.perf_counter()
+        total = sum(self.gestor.copiar(copias))
+        self.gestor.contar('lectura', len(copias), total, time.perf_counter() - inicio)
+
+        self._entradas = {destino: self._firma(destino) for _, destino in copias}
+        return self.local_dir
+
+    def local(self, ruta_remota):
+        """Ruta en el área local de un archivo de la partida"""
+        return os.path.join(self.local_dir, os.path.relpath(os.path.abspath(ruta_remota), self.partida_dir))
+
+    def remota(self, ruta_local):
+        """
+        Ruta definitiva en la carpeta compartida de un archivo del área local.
+
+        Args:
+            ruta_local (str): Ruta dentro del área local
+
+        Returns:
+            str: Ruta en la carpeta de la partida (o la misma ruta si no es local)
+        """
+        if not ruta_local or not self.local_dir:
+            return ruta_local
+        relativa = os.path.relpath(os.path.abspath(ruta_local), self.local_dir)
+        if relativa.startswith(os.pardir):
+            return ruta_local
+        return os.path.normpath(os.path.join(self.partida_dir, relativa))
+
+    def _traducir(self, valor):
+        if isinstance(valor, str):
+            return self.remota(valor)
+        if isinstance(valor, dict):
+            return {clave: self._traducir(v) for clave, v in valor.items()}
+        return valor
+
+    def traducir_resultado(self, resultado):
+        """
+        Cambia las rutas de un FacturaResult a sus rutas definitivas.
+
+        Args:
+            resultado: FacturaResult generado en el área local
+
+        Returns:
+            FacturaResult: Copia con las rutas de la carpeta compartida
+        """
+        return replace(
+            resultado,
+            xml_path=self.remota(resultado.xml_path),
+            documentos=self._traducir(resultado.documentos)
+        )
+
+    def archivos_generados(self):
+        """
+        Obtiene los archivos del área local que no son entradas sin cambios.
+
+        Returns:
+            list: Rutas locales a publicar
+        """
+        generados = []
+        for directorio, _, archivos in os.walk(self.local_dir):
+            for nombre in archivos:
+                ruta = os.path.join(directorio, nombre)
+                if nombre.startswith('~') or self._entradas.get(ruta) == self._firma(ruta):
+                    continue
+                generados.append(ruta)
+        return generados
+
+    def publicar(self):
+        """
+        Publica los archivos generados en la carpeta de la partida.
+
+        Todos se copian primero con un nombre temporal junto a su destino y
+        solo se renombran cuando todas las copias terminaron; si alguna falla
+        se eliminan las copias temporales y no se publica ningún archivo.
+
+        Returns:
+            dict: archivos, bytes y segundos de la publicación
+        """
+        inicio = time.perf_counter()
+        marca = uuid.uuid4().hex[:8]
+        destinos = []
+        for ruta in self.archivos_generados():
+            final = self.remota(ruta)
+            directorio, nombre = os.path.split(final)
+            destinos.append((ruta, os.path.join(directorio, f"~{nombre}.{marca}.tmp"), final))
+
+        try:
+            total = sum(self.gestor.copiar([(ruta, temporal) for ruta, temporal, _ in destinos]))
+            for _, temporal, final in destinos:
+                os.replace(temporal, final)
+        except Exception:
+            for _, temporal, _ in destinos:
+                if os.path.exists(temporal):
+                    try:
+                        os.remove(temporal)
+                    except OSError:
+                        pass
+            raise
+
+        segundos = time.perf_counter() - inicio
+        self.gestor.contar('publicacion', len(destinos), total, segundos)
+        logger.info(f"Partida publicada en {self.partida_dir}: {len(destinos)} archivos, {total} bytes")
+        return {'archivos': len(destinos), 'bytes': total, 'segundos': segundos}
+
+    def cerrar(self):
+        """Elimina el área local de la partida"""
+        if self._contexto is not None:
+            self._contexto.__exit__(None, None, None)
+            self._contexto = None
+
+
+class Staging:
+    """
+    Configuración y métricas de red del modo staging.
+    """
+
+    def __init__(self, config=None):
+        """
+        Inicializa el gestor
+
+        Args:
+            config (dict, optional): Configuración (por defecto STAGING_CONFIG)
+        """
+        self.config = STAGING_CONFIG if config is None else config
+        self._lock = threading.Lock()
+        self.metricas = {}
+
+    @property
+    def habilitado(self):
+        return self.config.get('habilitado', False)
+
+    def partida(self, partida_dir):
+        """
+        Crea el área de trabajo local de una partida.
+
+        Args:
+            partida_dir (str): Carpeta de la partida
+
+        Returns:
+            PartidaStaging: Área de trabajo (llamar a preparar() antes de usarla)
+        """
+        return PartidaStaging(partida_dir, self)
+
+    def copiar(self, copias):
+        """
+        Copia archivos con el grupo de hilos configurado.
+
+        Args:
+            copias (list): Tuplas (origen, destino)
+
+        Returns:
+            list: Bytes copiados de cada archivo
+        """
+        hilos = max(1, int(self.config.get('hilos_copia') or 1))
+        if hilos == 1 or len(copias) <= 1:
+            return [_copiar_archivo(origen, destino) for origen, destino in copias]
+        with ThreadPoolExecutor(max_workers=min(hilos, len(copias))) as executor:
+            return list(executor.map(lambda copia: _copiar_archivo(*copia), copias))
+
+    def contar(self, operacion, archivos, bytes_copiados, segundos):
+        """Acumula una operación de red"""
+        with self._lock:
+            metricas = self.metricas.setdefault(operacion, {'archivos': 0, 'bytes': 0, 'segundos': 0.0})
+            metricas['archivos'] += archivos
+            metricas['bytes'] += bytes_copiados
+            metricas['segundos'] += segundos
+
+    def reiniciar_metricas(self):
+        """Descarta las métricas acumuladas (al iniciar una corrida)"""
+        with self._lock:
+            self.metricas = {}
+
+    def resumen(self):
+        """
+        Obtiene las métricas de red acumuladas.
+
+        Returns:
+            dict: {operación: {archivos, bytes, segundos}}
+        """
+        with self._lock:
+            return {operacion: dict(valores) for operacion, valores in self.metricas.items()}
+
+
+# Gestor compartido del modo staging
+staging = Staging()
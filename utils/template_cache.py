@@ -0,0 +1,115 @@
+"""
+Caché en memoria de plantillas Word ya preparadas
+"""
+import os
+import io
+import logging
+import threading
+from collections import OrderedDict
+from docx import Document
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateCache:
+    """
+    Guarda el contenido serializado de cada plantilla después de prepararla.
+
+    La preparación (por ejemplo, fijar las fuentes en los estilos) se hace
+    una sola vez por plantilla; cada documento nuevo se abre desde los bytes
+    en memoria sin volver a leer el disco. La entrada se invalida si cambia
+    la fecha de modificación del archivo.
+    """
+
+    def __init__(self, max_plantillas=32):
+        """
+        Inicializa la caché de plantillas
+
+        Args:
+            max_plantillas: Número máximo de plantillas preparadas en memoria
+        """
+        self.max_plantillas = max_plantillas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener_bytes(self, template_path, preparar=None, variante=None):
+        """
+        Obtiene el contenido de la plantilla preparada.
+
+        Args:
+            template_path (str): Ruta a la plantilla .docx
+            preparar: Función opcional que recibe el Document y lo modifica una vez
+            variante: Parte adicional de la clave (p. ej. fuente y tamaño usados al preparar)
+
+        Returns:
+            bytes: Contenido .docx preparado
+        """
+        ruta = os.path.abspath(template_path)
+        clave = (ruta, variante)
+        mtime = os.path.getmtime(ruta)
+
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] == mtime:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+
+        # Preparar fuera del candado; si dos hilos coinciden el resultado es el mismo
+        doc = Document(ruta)
+        if preparar is not None:
+            preparar(doc)
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        contenido = buffer.getvalue()
+
+        with self._lock:
+            self._entradas[clave] = (mtime, contenido)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_plantillas:
+                self._entradas.popitem(last=False)
+
+        logger.debug(f"Plantilla preparada y guardada en caché: {ruta}")
+        return contenido
+
+    def obtener_documento(self, template_path, preparar=None, variante=None):
+        """
+        Abre un documento nuevo a partir de la plantilla preparada.
+
+        Args:
+            template_path (str): Ruta a la plantilla .docx
+            preparar: Función opcional que recibe el Document y lo modifica una vez
+            variante: Parte adicional de la clave de caché
+
+        Returns:
+            Document: Documento independiente listo para llenarse
+        """
+        return Document(io.BytesIO(self.obtener_bytes(template_path, preparar, variante)))
+
+    def get_stats(self):
+        """
+        Obtiene las estadísticas de uso de la caché
+
+        Returns:
+            dict: Aciertos, fallos y plantillas en memoria
+        """
+        with self._lock:
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'plantillas': len(self._entradas),
+            }
+
+    def limpiar(self):
+        """Vacía la caché y reinicia las estadísticas"""
+        with self._lock:
+            self._entradas.clear()
+            self.aciertos = 0
+            self.fallos = 0
+
+
+# Caché compartida por todos los generadores del proceso
+template_cache = TemplateCache()
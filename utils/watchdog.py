@@ -0,0 +1,321 @@
+"""
+Supervisión de las etapas externas (Word/docx2pdf y el navegador de Selenium).
+
+Cada etapa tiene un proceso trabajador que se reutiliza en todas sus
+ejecuciones de la corrida y que se puede matar: si una ejecución no termina
+dentro del tiempo límite de su etapa, el trabajador se termina junto con los
+procesos que haya abierto (Word, chromedriver, Chrome), se inicia otro y se
+reintenta con espera exponencial hasta el número de reintentos configurado. Si se agotan los
+intentos se lanza EtapaAgotadaError, de modo que la factura se registra como
+fallida y el resto de la partida continúa. Los tiempos agotados, procesos
+terminados y reintentos se acumulan como métricas para el resumen de la
+corrida.
+"""
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+
+from config import WATCHDOG_CONFIG
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:  # psutil es opcional: sin él solo se termina el proceso hijo
+    psutil = None
+
+# Métricas acumuladas por etapa
+METRICAS_ETAPA = ('ejecuciones', 'exitos', 'errores', 'timeouts', 'terminados', 'reintentos', 'fallidas')
+
+
+class TiempoAgotadoError(TimeoutError):
+    """Un intento de la etapa no terminó dentro de su tiempo límite"""
+
+
+class EtapaAgotadaError(RuntimeError):
+    """La etapa falló en todos sus intentos"""
+
+    def __init__(self, etapa, intentos, ultimo_error):
+        super().__init__(f"La etapa '{etapa}' falló después de {intentos} intentos: {ultimo_error}")
+        self.etapa = etapa
+        self.intentos = intentos
+        self.ultimo_error = ultimo_error
+
+
+def _bucle_trabajador(conexion):
+    """
+    Punto de entrada del proceso trabajador de una etapa.
+
+    Recibe tareas (función, args, kwargs) hasta recibir None o perder la
+    conexión, y envía el resultado de cada una.
+    """
+    try:
+        while True:
+            try:
+                tarea = conexion.recv()
+            except EOFError:
+                break
+            if tarea is None:
+                break
+            funcion, args, kwargs = tarea
+            try:
+                resultado = ('ok', funcion(*args, **kwargs))
+            except BaseException as e:
+                resultado = ('error', f"{type(e).__name__}: {e}")
+            conexion.send(resultado)
+    finally:
+        conexion.close()
+
+
+def _terminar_arbol(proceso):
+    """
+    Termina un proceso hijo y todos los procesos que abrió.
+
+    Args:
+        proceso: multiprocessing.Process a terminar
+    """
+    hijos = []
+    if psutil is not None:
+        try:
+            hijos = psutil.Process(proceso.pid).children(recursive=True)
+        except psutil.Error:
+            hijos = []
+
+    proceso.kill()
+    for hijo in hijos:
+        try:
+            hijo.kill()
+        except psutil.Error:
+            pass
+    proceso.join(5)
+
+
+class _Trabajador:
+    """Proceso trabajador de una etapa, reutilizado por todas sus ejecuciones"""
+
+    def __init__(self, contexto):
+        self.conexion, extremo_hijo = contexto.Pipe(duplex=True)
+        self.proceso = contexto.Process(target=_bucle_trabajador, args=(extremo_hijo,), daemon=True)
+        self.proceso.start()
+        extremo_hijo.close()
+
+    def vivo(self):
+        return self.proceso.is_alive()
+
+    def terminar(self):
+        """Termina el trabajador y los procesos que haya abierto"""
+        self.conexion.close()
+        _terminar_arbol(self.proceso)
+
+    def cerrar(self):
+        """Pide al trabajador que termine y, si no lo hace, lo termina"""
+        try:
+            self.conexion.send(None)
+        except (OSError, ValueError):
+            pass
+        self.proceso.join(5)
+        if self.proceso.is_alive():
+            _terminar_arbol(self.proceso)
+        self.conexion.close()
+
+
+class Watchdog:
+    """
+    Ejecuta etapas externas con tiempo límite, reintentos y métricas.
+    """
+
+    def __init__(self, config=None):
+        """
+        Inicializa el supervisor
+
+        Args:
+            config (dict, optional): Configuración (por defecto WATCHDOG_CONFIG)
+        """
+        self.config = WATCHDOG_CONFIG if config is None else config
+        self._limpiezas = {}
+        self._lock = threading.Lock()
+        self._trabajadores = {}
+        self._locks_etapa = {}
+        self.metricas = {}
+
+    def _config_etapa(self, etapa):
+        """Obtiene la configuración de una etapa completando los valores por defecto"""
+        etapa_config = self.config.get('etapas', {}).get(etapa, {})
+        return {
+            'timeout': etapa_config.get('timeout', self.config.get('timeout', 120)),
+            'reintentos': etapa_config.get('reintentos', self.config.get('reintentos', 2)),
+            'reintentar_errores': etapa_config.get('reintentar_errores', self.config.get('reintentar_errores', True)),
+        }
+
+    def _contar(self, etapa, metrica, cantidad=1):
+        with self._lock:
+            metricas = self.metricas.setdefault(etapa, dict.fromkeys(METRICAS_ETAPA, 0))
+            metricas[metrica] += cantidad
+
+    def registrar_limpieza(self, etapa, funcion):
+        """
+        Registra una función que se llama después de matar un intento de la etapa.
+
+        Sirve para cerrar procesos que no son hijos del proceso supervisado
+        (p. ej. Word abierto por COM).
+
+        Args:
+            etapa (str): Nombre de la etapa
+            funcion: Función que recibe el momento (time.time()) en que empezó el intento
+        """
+        self._limpiezas.setdefault(etapa, []).append(funcion)
+
+    def _limpiar(self, etapa, inicio):
+        for funcion in self._limpiezas.get(etapa, []):
+            try:
+                funcion(inicio)
+            except Exception as e:
+                logger.warning(f"Error al limpiar la etapa '{etapa}': {str(e)}")
+
+    def _lock_etapa(self, etapa):
+        with self._lock:
+            return self._locks_etapa.setdefault(etapa, threading.Lock())
+
+    def _trabajador(self, etapa):
+        """Obtiene el trabajador de la etapa (lo inicia si no existe o terminó). Requiere el candado de la etapa."""
+        trabajador = self._trabajadores.get(etapa)
+        if trabajador is None or not trabajador.vivo():
+            contexto = multiprocessing.get_context(self.config.get('metodo_inicio'))
+            trabajador = _Trabajador(contexto)
+            self._trabajadores[etapa] = trabajador
+        return trabajador
+
+    def _descartar(self, etapa, trabajador):
+        """Termina un trabajador que ya no se puede reutilizar"""
+        trabajador.terminar()
+        if self._trabajadores.get(etapa) is trabajador:
+            del self._trabajadores[etapa]
+
+    def _intentar(self, etapa, timeout, funcion, args, kwargs):
+        """
+        Ejecuta un intento en el proceso trabajador de la etapa.
+
+        El trabajador se reutiliza entre ejecuciones; solo se termina (y se
+        inicia otro en el siguiente intento) si agota su tiempo o muere.
+
+        Returns:
+            Resultado de la función
+
+        Raises:
+            TiempoAgotadoError: Si el intento no termina a tiempo
+            RuntimeError: Si la función lanzó una excepción en el trabajador
+        """
+        with self._lock_etapa(etapa):
+            inicio = time.time()
+            trabajador = self._trabajador(etapa)
+            try:
+                trabajador.conexion.send((funcion, args, kwargs))
+                terminado = trabajador.conexion.poll(timeout)
+                if terminado:
+                    estado, valor = trabajador.conexion.recv()
+            except (EOFError, OSError):
+                trabajador.proceso.join(1)
+                codigo = trabajador.proceso.exitcode
+                self._descartar(etapa, trabajador)
+                raise RuntimeError(f"El proceso terminó sin resultado (código {codigo})") from None
+
+            if not terminado:
+                self._descartar(etapa, trabajador)
+                self._contar(etapa, 'timeouts')
+                self._contar(etapa, 'terminados')
+                self._limpiar(etapa, inicio)
+                raise TiempoAgotadoError(f"La etapa '{etapa}' no terminó en {timeout} segundos")
+
+        if estado == 'error':
+            raise RuntimeError(valor)
+        return valor
+
+    def ejecutar(self, etapa, funcion, *args, **kwargs):
+        """
+        Ejecuta una etapa supervisada con tiempo límite y reintentos.
+
+        La función y sus argumentos deben poder enviarse a otro proceso
+        (función de nivel de módulo); su resultado también.
+
+        Args:
+            etapa (str): Nombre de la etapa (clave de WATCHDOG_CONFIG['etapas'])
+            funcion: Función a ejecutar
+            *args, **kwargs: Argumentos de la función
+
+        Returns:
+            Resultado de la función
+
+        Raises:
+            EtapaAgotadaError: Si todos los intentos fallan o agotan su tiempo
+        """
+        self._contar(etapa, 'ejecuciones')
+        if not self.config.get('habilitado', True):
+            try:
+                resultado = funcion(*args, **kwargs)
+            except Exception:
+                self._contar(etapa, 'errores')
+                raise
+            self._contar(etapa, 'exitos')
+            return resultado
+
+        config = self._config_etapa(etapa)
+        intentos = 1 + max(0, int(config['reintentos']))
+        espera_base = self.config.get('espera_base', 2)
+        espera_maxima = self.config.get('espera_maxima', 30)
+
+        ultimo_error = None
+        for intento in range(1, intentos + 1):
+            try:
+                resultado = self._intentar(etapa, config['timeout'], funcion, args, kwargs)
+                self._contar(etapa, 'exitos')
+                return resultado
+            except TiempoAgotadoError as e:
+                ultimo_error = str(e)
+                logger.warning(f"{ultimo_error} (intento {intento}/{intentos}); se terminó el proceso")
+            except Exception as e:
+                self._contar(etapa, 'errores')
+                ultimo_error = str(e)
+                logger.warning(f"Error en la etapa '{etapa}' (intento {intento}/{intentos}): {ultimo_error}")
+                if not config['reintentar_errores']:
+                    break
+
+            if intento < intentos:
+                espera = min(espera_maxima, espera_base * 2 ** (intento - 1))
+                self._contar(etapa, 'reintentos')
+                logger.info(f"Reintentando la etapa '{etapa}' en {espera} segundos")
+                time.sleep(espera)
+
+        self._contar(etapa, 'fallidas')
+        raise EtapaAgotadaError(etapa, intento, ultimo_error)
+
+    def cerrar(self):
+        """Termina los procesos trabajadores de todas las etapas (al terminar la corrida)"""
+        with self._lock:
+            trabajadores = list(self._trabajadores.values())
+            self._trabajadores = {}
+        for trabajador in trabajadores:
+            trabajador.cerrar()
+
+    def reiniciar_metricas(self):
+        """Descarta las métricas acumuladas (al iniciar una corrida)"""
+        with self._lock:
+            self.metricas = {}
+
+    def resumen(self):
+        """
+        Obtiene las métricas acumuladas por etapa.
+
+        Returns:
+            dict: {etapa: {métrica: cantidad}}
+        """
+        with self._lock:
+            return {etapa: dict(metricas) for etapa, metricas in self.metricas.items()}
+
+
+# Supervisor compartido por las etapas externas del proceso
+watchdog = Watchdog()
+
+# Los trabajadores que sigan abiertos se terminan al salir
+atexit.register(watchdog.cerrar)
@@ -1,5 +1,7 @@
 import json
 import os
+import shutil
+import tempfile
 import time
 import traceback
 from selenium import webdriver
@@ -11,6 +13,79 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
 from webdriver_manager.chrome import ChromeDriverManager
 
+from config import ARTEFACTOS_CONFIG
+from utils.artifact_registry import artifact_registry, clave_archivo
+
+# Extensiones de las descargas de Chrome que aún no terminan
+EXTENSIONES_DESCARGA_PARCIAL = ('.crdownload', '.tmp', '.part')
+
+
+def prefijo_descarga(folio_fiscal):
+    """
+    Prefijo del directorio privado de descarga de una factura.
+
+    Args:
+        folio_fiscal (str): UUID de la factura
+
+    Returns:
+        str: Prefijo ('~descarga_<UUID>_')
+    """
+    return f"~descarga_{clave_archivo(folio_fiscal)}_"
+
+
+def limpiar_descargas(carpeta_contenedora, folio_fiscal):
+    """
+    Elimina los directorios de descarga que dejó un intento terminado a la fuerza.
+
+    Cuando el watchdog mata el proceso de la descarga, su bloque finally no
+    llega a ejecutarse; el proceso principal llama a esta función para no
+    dejar directorios '~descarga_*' en la carpeta de la factura.
+
+    Args:
+        carpeta_contenedora (str): Carpeta donde se guarda la verificación
+        folio_fiscal (str): UUID de la factura
+    """
+    prefijo = prefijo_descarga(folio_fiscal)
+    try:
+        nombres = os.listdir(carpeta_contenedora)
+    except OSError:
+        return
+    for nombre in nombres:
+        ruta = os.path.join(carpeta_contenedora, nombre)
+        if nombre.startswith(prefijo) and os.path.isdir(ruta):
+            shutil.rmtree(ruta, ignore_errors=True)
+
+
+def esperar_descarga(directorio, tiempo_maximo):
+    """
+    Espera a que termine la descarga de un PDF en un directorio privado.
+    
+    La descarga se da por terminada cuando hay un PDF, no quedan archivos
+    parciales y su tamaño no cambió entre dos revisiones.
+    
+    Args:
+        directorio (str): Directorio donde descarga el navegador
+        tiempo_maximo (float): Segundos máximos de espera
+        
+    Returns:
+        str or None: Ruta del PDF descargado o None si no terminó a tiempo
+    """
+    limite = time.monotonic() + tiempo_maximo
+    tamano_anterior = None
+    while time.monotonic() < limite:
+        archivos = os.listdir(directorio)
+        parciales = [a for a in archivos if a.lower().endswith(EXTENSIONES_DESCARGA_PARCIAL)]
+        pdfs = [a for a in archivos if a.lower().endswith('.pdf')]
+        if pdfs and not parciales:
+            ruta = os.path.join(directorio, pdfs[0])
+            tamano = os.path.getsize(ruta)
+            if tamano and tamano == tamano_anterior:
+                return ruta
+            tamano_anterior = tamano
+        time.sleep(0.5)
+    return None
+
+
 def descargar_verificacion(data, carpeta_contenedora):
     """
     Descarga la verificación del SAT para una factura.
@@ -25,12 +100,13 @@ def descargar_verificacion(data, carpeta_contenedora):
     # Configurar opciones de Chrome
     chrome_options = Options()
     
-    # Nombre del archivo a generar
-    nombre_archivo = f"verificacion_{data['Serie']}{data['Numero']}.pdf"
+    # Nombre definitivo por UUID (otros trabajadores pueden estar descargando en la misma carpeta)
+    ruta_final = artifact_registry.ruta(carpeta_contenedora, 'verificacion_sat', data['Folio_Fiscal'])
+    nombre_archivo = os.path.basename(ruta_final)
     
-    # Asegurarse que el nombre del archivo termine en .pdf
-    if not nombre_archivo.lower().endswith('.pdf'):
-        nombre_archivo += '.pdf'
+    # Chrome descarga en un directorio privado junto a la carpeta; el archivo solo
+    # aparece con su nombre definitivo cuando la descarga terminó
+    directorio_descarga = tempfile.mkdtemp(prefix=prefijo_descarga(data['Folio_Fiscal']), dir=carpeta_contenedora)
     
     # Configurar las preferencias de impresión para guardar como PDF
     settings = {
@@ -48,8 +124,8 @@ def descargar_verificacion(data, carpeta_contenedora):
     # Configurar las preferencias del navegador
     prefs = {
         'printing.print_preview_sticky_settings.appState': json.dumps(settings),
-        'savefile.default_directory': carpeta_contenedora,
-        'download.default_directory': carpeta_contenedora,
+        'savefile.default_directory': directorio_descarga,
+        'download.default_directory': directorio_descarga,
         'download.prompt_for_download': False,
         'download.directory_upgrade': True,
         'safebrowsing.enabled': True,
@@ -105,23 +181,15 @@ def descargar_verificacion(data, carpeta_contenedora):
         
         # Hacer clic en el botón de imprimir
         btn_imprimir.click()
-        time.sleep(2)  # Esperar a que se inicie la descarga
-        
-        # Obtener el nombre del archivo descargado (el más reciente en la carpeta)
-        time.sleep(5)  # Dar tiempo para que se complete la descarga
-        archivos_descargados = os.listdir(carpeta_contenedora)
         
-        if not archivos_descargados:
+        # El único PDF del directorio privado es el de esta factura
+        archivo_descargado = esperar_descarga(directorio_descarga, ARTEFACTOS_CONFIG.get('espera_descarga', 60))
+        if not archivo_descargado:
             return None
-            
-        # Ordenar archivos por fecha de modificación (el más reciente primero)
-        archivos_descargados.sort(
-            key=lambda x: os.path.getmtime(os.path.join(carpeta_contenedora, x)), 
-            reverse=True
-        )
         
-        archivo_descargado = archivos_descargados[0]
-        return os.path.join(carpeta_contenedora, archivo_descargado)
+        os.replace(archivo_descargado, ruta_final)
+        artifact_registry.registrar(ruta_final, 'verificacion_sat', data['Folio_Fiscal'])
+        return ruta_final
         
     except Exception as e:
         print(f"Error durante la verificación: {e}")
@@ -132,3 +200,4 @@ def descargar_verificacion(data, carpeta_contenedora):
         # Cerrar el navegador
         if driver:
             driver.quit()
+        shutil.rmtree(directorio_descarga, ignore_errors=True)
@@ -0,0 +1,57 @@
+"""
+Ejecución de tareas independientes en un grupo de procesos
+"""
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+def obtener_num_procesos(procesos=None, num_tareas=None):
+    """
+    Calcula cuántos procesos usar para un lote de tareas.
+
+    Args:
+        procesos (int, optional): Número de procesos solicitado (None = núcleos disponibles)
+        num_tareas (int, optional): Número de tareas del lote
+
+    Returns:
+        int: Número de procesos (al menos 1)
+    """
+    if not procesos:
+        procesos = os.cpu_count() or 1
+    if num_tareas is not None:
+        procesos = min(procesos, num_tareas)
+    return max(1, int(procesos))
+
+
+def ejecutar_en_paralelo(funcion, tareas, procesos=None):
+    """
+    Ejecuta una función sobre cada tarea usando un grupo de procesos.
+
+    La función y sus argumentos deben poder serializarse (funciones definidas
+    a nivel de módulo). Si solo hay un proceso disponible o el grupo no puede
+    crearse, las tareas se ejecutan en secuencia en el proceso actual.
+
+    Args:
+        funcion: Función de nivel de módulo que recibe una tarea
+        tareas (list): Argumento de cada ejecución
+        procesos (int, optional): Número máximo de procesos
+
+    Returns:
+        list: Resultados en el mismo orden que las tareas
+    """
+    tareas = list(tareas)
+    num_procesos = obtener_num_procesos(procesos, len(tareas))
+
+    if num_procesos <= 1:
+        return [funcion(tarea) for tarea in tareas]
+
+    try:
+        with ProcessPoolExecutor(max_workers=num_procesos) as executor:
+            return list(executor.map(funcion, tareas))
+    except (BrokenProcessPool, OSError) as e:
+        logger.warning(f"No se pudo usar el grupo de procesos ({str(e)}); se ejecutará en secuencia")
+        return [funcion(tarea) for tarea in tareas]